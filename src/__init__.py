@@ -1 +1,18 @@
-from .intermediary import *
\ No newline at end of file
+#
+#  src/__init__.py
+#  Authors:
+#       Samuel Vargas
+#
+# The Flask app (src.app, src.start...) is only loaded once one of its names
+# is used, importing a single module of the package (src.time_manager, a
+# worker process unpickling src.crypto_flow.verify_signature) doesn't load
+# Flask and every blueprint. See src/import_benchmark.py.
+
+_INTERMEDIARY_NAMES = ("app", "configure", "start", "start_test", "wrap_backend_io")
+
+
+def __getattr__(name: str):
+    if name in _INTERMEDIARY_NAMES:
+        from . import intermediary
+        return getattr(intermediary, name)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
@@ -8,3 +8,4 @@ from .authentication import *
 from .election import *
 from .vote import *
 from .tally import *
+from .server import *
@@ -4,13 +4,21 @@
 #       Samuel Vargas
 #
 
-from flask import Blueprint, request, jsonify
-from src import httpcode, required_keys
+from flask import Blueprint, Response, request
+from src import httpcode, etag
 from src.settings import SETTINGS
-from src.crypto_flow import CryptoFlow
-from src.account_types import AccountType
+from src.crypto_flow import CryptoFlow, verify_signature, generate_election_keys
+from src.worker_pool import parallel_map
 from src.authentication_cookie import AuthenticationCookie
 from src.time_manager import TimeManager
+from src.election_phase import ElectionPhase
+from src.api.election_checks import check_election_create, signed_master_ballot, new_election, \
+    check_election_create_in_bulk, check_bulk_elections, pending_indexes, pending_titles, reject_taken_titles, \
+    reject_unsigned, accept_elections, bulk_results, check_get_by_title, election_etag, \
+    check_get_by_titles, elections_by_titles, serialize_election, check_search, search_page, \
+    check_listing, listing_body, check_changes, created_titles, changes_page, set_event_stream_headers, \
+    KEEPALIVE
+from typing import Iterator
 import json
 
 election = Blueprint("election", __name__)
@@ -25,35 +33,9 @@ def election_create() -> httpcode.HttpCode:
     test/test_election_json_validator.py for details
     about the expected json election format.
     """
-
-    # Verify the user's provided authentication cookie.
-    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS['SHARED_PASSWORD'], request.cookies):
-        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
-
-    # Check if a voter is logged in, report an error if they are
-    if AuthenticationCookie.get_account_type(request.cookies) == AccountType.voter:
-        return httpcode.VOTER_CANNOT_CREATE_ELECTION
-
-    # Check if any JSON was supplied at all
-    content = request.get_json(silent=True, force=True)
-    if content is None:
-        return httpcode.MISSING_OR_MALFORMED_JSON
-
-    # Verify that master_ballot, public_key, and signature are present
-    for key in required_keys.REQUIRED_ELECTION_KEYS:
-        if key not in content:
-            return httpcode.ELECTION_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE
-
-    # Verify that master_ballot is a valid JSON string
-    try:
-        master_ballot = json.loads(content['master_ballot'])
-    except ValueError:
-        return httpcode.ELECTION_BALLOT_JSON_MALFORMED
-
-    # Verify that master_ballot contains all the required keys
-    for key in required_keys.REQUIRED_ELECTION_MASTER_BALLOT_KEYS:
-        if key not in master_ballot:
-            return httpcode.ELECTION_BALLOT_MISSING_TITLE_DESCRIPTION_DATE_OR_QUESTIONS
+    result, content, master_ballot = check_election_create(request)
+    if result is not None:
+        return result
 
     # TODO: Verify that the master_ballot itself contains valid data only!
 
@@ -63,24 +45,13 @@ def election_create() -> httpcode.HttpCode:
 
     # Verify that the election creator correctly signed their 'master_ballot_signature' using
     # their 'creator_public_key'
-    if not CryptoFlow.verify_data_is_signed_ecdsa(
-            content['master_ballot'],
-            content['master_ballot_signature'],
-            content['creator_public_key']
-    ):
+    if not CryptoFlow.verify_data_is_signed_ecdsa(*signed_master_ballot(content)):
         return httpcode.ELECTION_BALLOT_SIGNING_MISMATCH
 
     election_crypto = CryptoFlow.generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict()
-    master_ballot['questions'] = json.dumps(master_ballot['questions'])
-    SETTINGS['BACKEND_IO'].create_election(
-        master_ballot,
-        creator_username=AuthenticationCookie.get_username(request.cookies),
-        creator_master_ballot_signature=content['master_ballot_signature'],
-        creator_public_key_b64=content['creator_public_key'],
-        election_private_rsa_key=election_crypto['election_private_key'],
-        election_public_rsa_key=election_crypto['election_public_key'],
-        election_encrypted_fernet_key=election_crypto['election_encrypted_fernet_key']
-    )
+    SETTINGS['BACKEND_IO'].create_election(**new_election(
+        master_ballot, content, AuthenticationCookie.get_username(request.cookies), election_crypto))
+    SETTINGS['RESPONSE_CACHE'].invalidate_election(master_ballot["election_title"])
 
     return httpcode.ELECTION_CREATED_SUCCESSFULLY
 
@@ -91,86 +62,262 @@ def election_create() -> httpcode.HttpCode:
     # 4) Stick the private key, public key, and encrypted fernet key into the database
 
 
-# TODO: This is an EXACT search method, the title has to be the same
-#       or the search will fail. Modify it to be an actual search function that
-#       returns a list of potential elections
+@election.route("/api/election/create/bulk", methods=["POST"])
+def election_create_in_bulk():
+    """
+    Creates many elections at once:
+
+    {
+        "elections": [
+            {"master_ballot": "...", "creator_public_key": "...", "master_ballot_signature": "..."}
+            (same as /api/election/create),
+            ...
+        ]
+    }
 
+    The signatures are verified and the election keys generated in parallel,
+    every accepted election is stored in one transaction.
+
+    :return: {"results": [{"election_title": "..." or null, "code": 201, "message": "..."}, ...]}
+             in the same order as "elections".
+    """
+    result, items = check_election_create_in_bulk(request)
+    if result is not None:
+        return result
+
+    # Check each election, 'results' holds an HttpCode for the rejected ones.
+    results, master_ballots = check_bulk_elections(items)
+
+    # Verify none of the titles exist yet (one backend call) or appear twice in the batch
+    existing = SETTINGS['BACKEND_IO'].get_elections_by_titles(pending_titles(results, master_ballots))
+    reject_taken_titles(results, master_ballots, existing)
+
+    # Verify the signatures in parallel
+    pending = pending_indexes(results)
+    signed = parallel_map(verify_signature, [signed_master_ballot(items[index]) for index in pending])
+    reject_unsigned(results, pending, signed)
+
+    # Generate the RSA / Fernet keys of every accepted election in parallel and store them together
+    pending = pending_indexes(results)
+    elections = accept_elections(results, master_ballots, items, pending,
+                                  AuthenticationCookie.get_username(request.cookies),
+                                  parallel_map(generate_election_keys, pending))
+    if elections:
+        SETTINGS['BACKEND_IO'].create_elections(elections)
+        for election in elections:
+            SETTINGS['RESPONSE_CACHE'].invalidate_election(election['master_ballot']['election_title'])
+
+    body = json.dumps(bulk_results(results, master_ballots))
+    return Response(body, status=200, mimetype='application/json')
+
+
+# This is an EXACT lookup, the title has to be the same.
+# Use /api/election/search to find elections by part of their title / description.
 @election.route("/api/election/get_by_title", methods=["GET"])
 def election_get_by_title():
-    # Verify the user's provided authentication cookie.
-    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
-        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
+    result, election_title = check_get_by_title(request)
+    if result is not None:
+        return result
+
+    # Check if the election was found, the dates are all that's
+    # needed to pick the right version / cached body.
+    election = None
+    dates = SETTINGS['RESPONSE_CACHE'].get_election_dates(election_title)
+    if dates is None:
+        election = SETTINGS['BACKEND_IO'].get_election_by_title(election_title)
+        if election is None:
+            return httpcode.ELECTION_NOT_FOUND
+        dates = (election['start_date'], election['end_date'])
+
+    # Nothing changed since the client last asked.
+    redacted, tag = election_etag(SETTINGS['BACKEND_IO'], election_title, dates)
+    if etag.is_not_modified(tag, request):
+        return etag.not_modified(tag)
+
+    body = SETTINGS['RESPONSE_CACHE'].get_election(election_title, redacted)
+    if body is None:
+        if election is None:
+            election = SETTINGS['BACKEND_IO'].get_election_by_title(election_title)
+            if election is None:
+                return httpcode.ELECTION_NOT_FOUND
+        body = serialize_election(election_title, redacted, election)
+
+    return etag.with_etag(Response(body, status=200, mimetype='application/json'), tag)
+
+
+@election.route("/api/election/get_by_titles", methods=["GET", "POST"])
+def election_get_by_titles():
+    """
+    Batch version of get_by_title, expects:
 
-    # Check if any JSON was supplied at all
-    content = request.get_json(silent=True, force=True)
-    if content is None:
-        return httpcode.MISSING_OR_MALFORMED_JSON
+    {
+        "election_titles": ["Title A", "Title B", ...]   (at most MAX_BATCH_TITLES)
+    }
 
-    # Verify election_key is present
-    for key in required_keys.REQUIRED_ELECTION_SEARCH_BY_TITLE_KEYS:
-        if key not in content:
-            return httpcode.ELECTION_SEARCH_BY_TITLE_MISSING_ELECTION_TITLE
+    :return: {"Title A": { ... same as get_by_title ... }, "Title B": null, ...}
+             null for the titles that don't exist. The election_private_key
+             is only included for elections that have ended.
+    """
+    result, election_titles = check_get_by_titles(request)
+    if result is not None:
+        return result
 
-    # Check if the election was found.
-    result = SETTINGS['BACKEND_IO'].get_election_by_title(content["election_title"])
-    if result is None:
-        return httpcode.ELECTION_NOT_FOUND
+    # A single backend call for every title
+    elections = SETTINGS['BACKEND_IO'].get_elections_by_titles(election_titles)
 
-    # Remove the private_key if the election hasn't ended yet.
-    if TimeManager.election_in_progress(result["start_date"], result['end_date']):
-        result.pop('election_private_key')
+    body = json.dumps(elections_by_titles(election_titles, elections))
+    return Response(body, status=200, mimetype='application/json')
 
-    return jsonify(result), 200
 
-@election.route("/api/election/past", methods=["GET"])
-def get_past_elections():
-    # Verify the user's provided authentication cookie.
-    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
-        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
+@election.route("/api/election/search", methods=["GET"])
+def election_search():
+    """
+    Searches the election titles and descriptions, ?q=pres elec matches
+    "Presidential Election". Every word has to match the start of a word,
+    the best matches (in the title first) are returned first:
 
-    # Retrieve all elections
-    all_elections = SETTINGS["BACKEND_IO"].get_all_elections()
+    {
+        "items": [ ... at most 'limit' elections with the requested 'fields' ... ],
+        "next": "Opaque cursor to send as 'after'" or null on the last page
+    }
 
-    # Remove any election from the list that fails the test
-    pruned = [
-        election for election in all_elections
-        if TimeManager.election_in_past(election['end_date'])
-    ]
+    The election_private_key is never included, use get_by_title for ended elections.
+    """
+    result, query, offset, limit, fields = check_search(request)
+    if result is not None:
+        return result
 
-    return jsonify(pruned), 200
+    try:
+        elections = SETTINGS['BACKEND_IO'].search_elections(query, offset, limit + 1, fields)
+    except NotImplementedError:
+        return httpcode.ELECTION_SEARCH_NOT_SUPPORTED
 
+    body = json.dumps(search_page(elections, offset, limit))
+    return Response(body, status=200, mimetype='application/json')
 
-@election.route("/api/election/present", methods=["GET"])
-def get_present_elections():
-    # Verify the user's provided authentication cookie.
-    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
-        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
 
-    # Retrieve all elections
-    all_elections = SETTINGS["BACKEND_IO"].get_all_elections()
+@election.route("/api/election/past", methods=["GET"])
+def get_past_elections():
+    return _list_elections_in_phase(ElectionPhase.past)
 
-    # Remove any election from the list that fails the test
-    pruned = [
-        election for election in all_elections
-        if TimeManager.election_in_progress(election["start_date"], election['end_date'])
-    ]
 
-    return jsonify(pruned), 200
+@election.route("/api/election/present", methods=["GET"])
+def get_present_elections():
+    return _list_elections_in_phase(ElectionPhase.present)
 
 
 @election.route("/api/election/future", methods=["GET"])
 def get_future_elections():
+    return _list_elections_in_phase(ElectionPhase.future)
+
+
+def _list_elections_in_phase(phase: ElectionPhase):
+    """
+    Returns every election in 'phase' as a JSON array, or a single page
+    of them if the client sent a 'limit' / 'after' query parameter:
+
+    {
+        "items": [ ... at most 'limit' elections ... ],
+        "next": "Opaque cursor to send as 'after'" or null on the last page
+    }
+
+    Each election only contains the 'fields' the client asked for
+    (see src/fieldsets.py), the title, description and dates by default.
+
+    The filtering is done by the backend, the election_private_key
+    is only included in the past elections listing.
+    """
+    now = TimeManager.get_current_time_as_epoch()
+    result, listing, tag = check_listing(request, SETTINGS['BACKEND_IO'], phase, now)
+    if result is not None:
+        return result
+
+    # Without a version nothing tells when another process created an election
+    cached = listing.version is not None
+    body = SETTINGS['RESPONSE_CACHE'].get_listing(listing, now) if cached else None
+    if body is None:
+        elections = SETTINGS["BACKEND_IO"].get_elections_in_phase(
+            phase, now, listing.after, listing.limit + 1 if listing.paginated else None, listing.fields)
+        body = listing_body(listing, elections)
+        if cached:
+            SETTINGS['RESPONSE_CACHE'].put_listing(listing, body, SETTINGS['BACKEND_IO'].get_next_phase_transition(now))
+
+    return etag.with_etag(Response(body, status=200, mimetype='application/json'), tag)
+
+
+@election.route("/api/election/changes", methods=["GET"])
+def get_election_changes():
+    """
+    Change feed for clients that keep their own copy of the election list.
+    The client sends the last 'seq' it has seen as 'since' (0 the first time):
+
+    {
+        "items": [
+            {"seq": 7, "event": "election_created", "election_title": "...", "epoch": 1521507388,
+             "election": { ... same as get_by_title ... }},
+            {"seq": 8, "event": "election_opened" or "election_closed", "election_title": "...", "epoch": ...},
+            ...
+        ],
+        "since": The 'since' to send next time,
+        "more": true if more changes are immediately available
+    }
+    """
+    result, since, limit = check_changes(request)
+    if result is not None:
+        return result
+
+    now = TimeManager.get_current_time_as_epoch()
+    try:
+        changes = SETTINGS['BACKEND_IO'].get_changes(since, now, limit + 1)
+    except NotImplementedError:
+        return httpcode.CHANGE_FEED_NOT_SUPPORTED
+
+    # New elections are sent along so the client doesn't need a request per election,
+    # all of them are retrieved with a single backend call.
+    titles = created_titles(changes[:limit])
+    elections = SETTINGS['BACKEND_IO'].get_elections_by_titles(titles) if titles else {}
+
+    body = json.dumps(changes_page(changes, since, limit, elections, now))
+    return Response(body, status=200, mimetype='application/json')
+
+
+@election.route("/api/election/events", methods=["GET"])
+def get_election_events():
+    """
+    Server-sent events (text/event-stream) for clients that would otherwise poll
+    the listings. Each event's 'data' is a JSON object:
+
+    event: election_created / election_opened / election_closed
+    data: {"election_title": "...", "description": "...", "start_date": "...", "end_date": "..."}
+
+    event: turnout
+    data: {"election_title": "...", "ballot_count": 42}
+
+    Turnout is sent at most every couple of seconds per election. Clients that fall
+    too far behind are disconnected and should resync with /api/election/changes.
+    """
     # Verify the user's provided authentication cookie.
     if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
         return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
 
-    # Retrieve all elections
-    all_elections = SETTINGS["BACKEND_IO"].get_all_elections()
+    # Subscribe now rather than when the stream is first read so no event is missed.
+    publisher = SETTINGS['EVENT_PUBLISHER']
+    subscription = publisher.subscribe()
+    response = Response(_stream_events(subscription, publisher.keepalive_interval),
+                        status=200, mimetype='text/event-stream')
+    set_event_stream_headers(response)
+    response.call_on_close(subscription.close)
+    return response
 
-    # Remove any election from the list that fails the test
-    pruned = [
-        election for election in all_elections
-        if TimeManager.election_in_future(election["start_date"])
-    ]
 
-    return jsonify(pruned), 200
+def _stream_events(subscription, keepalive_interval: float) -> Iterator[str]:
+    try:
+        while not subscription.ended:
+            message = subscription.get(keepalive_interval)
+            if message is None:
+                if subscription.ended:
+                    break
+                message = KEEPALIVE
+            yield message
+    finally:
+        subscription.close()
@@ -0,0 +1,437 @@
+#
+#  src/api/election_checks.py
+#  Authors:
+#       Samuel Vargas
+#
+#  The request checks and response bodies of the election routes, used by
+#  both src/api/election.py and src/async_api/election.py so the two only
+#  differ in how they call the backend.
+#
+
+from src import httpcode, required_keys, pagination, etag, fieldsets
+from src.settings import SETTINGS
+from src.account_types import AccountType
+from src.authentication_cookie import AuthenticationCookie
+from src.time_manager import TimeManager
+from src.election_phase import ElectionPhase, ELECTION_CREATED
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import json
+
+# Most titles accepted by /api/election/get_by_titles in one request
+MAX_BATCH_TITLES = 100
+
+# Most elections accepted by /api/election/create/bulk in one request
+MAX_BULK_ELECTIONS = 100
+
+# Sent on the event stream after keepalive_interval seconds of silence
+KEEPALIVE = ": keep-alive\n\n"
+
+
+def check_election_create(request):
+    """
+    The checks of /api/election/create that don't need the backend.
+    :return: (HttpCode or None if the election may be created, the JSON sent, the parsed master_ballot)
+    """
+
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS['SHARED_PASSWORD'], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None, None
+
+    # Check if a voter is logged in, report an error if they are
+    if AuthenticationCookie.get_account_type(request.cookies) == AccountType.voter:
+        return httpcode.VOTER_CANNOT_CREATE_ELECTION, None, None
+
+    # Check if any JSON was supplied at all
+    content = request.get_json(silent=True, force=True)
+    if content is None:
+        return httpcode.MISSING_OR_MALFORMED_JSON, None, None
+
+    # Verify that master_ballot, public_key, and signature are present
+    for key in required_keys.REQUIRED_ELECTION_KEYS:
+        if key not in content:
+            return httpcode.ELECTION_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE, None, None
+
+    # Verify that master_ballot is a valid JSON string
+    try:
+        master_ballot = json.loads(content['master_ballot'])
+    except ValueError:
+        return httpcode.ELECTION_BALLOT_JSON_MALFORMED, None, None
+
+    # Verify that master_ballot contains all the required keys
+    for key in required_keys.REQUIRED_ELECTION_MASTER_BALLOT_KEYS:
+        if key not in master_ballot:
+            return httpcode.ELECTION_BALLOT_MISSING_TITLE_DESCRIPTION_DATE_OR_QUESTIONS, None, None
+
+    # Verify that the dates can be parsed, the backend stores them as timestamps too
+    for key in ('start_date', 'end_date'):
+        if not TimeManager.is_iso_8601_str(master_ballot[key]):
+            return httpcode.ELECTION_BALLOT_DATE_MALFORMED, None, None
+
+    return None, content, master_ballot
+
+
+def signed_master_ballot(item: Dict):
+    """
+    :return: The arguments of verify_signature for an election sent to /api/election/create(/bulk).
+    """
+    return item['master_ballot'], item['master_ballot_signature'], item['creator_public_key']
+
+
+def new_election(master_ballot: Dict, item: Dict, creator_username: str, election_crypto: Dict) -> Dict:
+    """
+    :return: The arguments of BackendIO.create_election, one of the elections of create_elections.
+    """
+    master_ballot['questions'] = json.dumps(master_ballot['questions'])
+    return {
+        "master_ballot": master_ballot,
+        "creator_username": creator_username,
+        "creator_master_ballot_signature": item['master_ballot_signature'],
+        "creator_public_key_b64": item['creator_public_key'],
+        "election_private_rsa_key": election_crypto['election_private_key'],
+        "election_public_rsa_key": election_crypto['election_public_key'],
+        "election_encrypted_fernet_key": election_crypto['election_encrypted_fernet_key']
+    }
+
+
+def check_election_create_in_bulk(request):
+    """
+    The checks of /api/election/create/bulk done once for the whole batch.
+    :return: (HttpCode or None, the elections sent)
+    """
+
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS['SHARED_PASSWORD'], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None
+
+    # Check if a voter is logged in, report an error if they are
+    if AuthenticationCookie.get_account_type(request.cookies) == AccountType.voter:
+        return httpcode.VOTER_CANNOT_CREATE_ELECTION, None
+
+    # Check if any JSON was supplied at all
+    content = request.get_json(silent=True, force=True)
+    if content is None:
+        return httpcode.MISSING_OR_MALFORMED_JSON, None
+
+    # Verify that a list of elections was provided
+    for key in required_keys.REQUIRED_ELECTION_BULK_CREATE_KEYS:
+        if key not in content or not isinstance(content[key], list):
+            return httpcode.ELECTION_BULK_CREATE_MISSING_ELECTIONS, None
+    if len(content['elections']) > MAX_BULK_ELECTIONS:
+        return httpcode.ELECTION_BULK_CREATE_TOO_LARGE, None
+
+    return None, content['elections']
+
+
+def check_bulk_elections(items: List) -> Tuple[List, List]:
+    """
+    :return: (an HttpCode or None per election, the parsed master_ballots)
+    """
+    results, master_ballots = [], []
+    for item in items:
+        result, master_ballot = _check_bulk_election(item)
+        results.append(result)
+        master_ballots.append(master_ballot)
+    return results, master_ballots
+
+
+def _check_bulk_election(item):
+    """
+    The checks /api/election/create does for a single election, except for the
+    title being taken and the signature.
+    :return: (HttpCode or None if the election may be created, the parsed master_ballot or None)
+    """
+
+    # Verify that master_ballot, public_key, and signature are present
+    if not isinstance(item, dict):
+        return httpcode.ELECTION_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE, None
+    for key in required_keys.REQUIRED_ELECTION_KEYS:
+        if not isinstance(item.get(key), str):
+            return httpcode.ELECTION_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE, None
+
+    # Verify that master_ballot is a valid JSON string
+    try:
+        master_ballot = json.loads(item['master_ballot'])
+    except ValueError:
+        return httpcode.ELECTION_BALLOT_JSON_MALFORMED, None
+    if not isinstance(master_ballot, dict):
+        return httpcode.ELECTION_BALLOT_JSON_MALFORMED, None
+
+    # Verify that master_ballot contains all the required keys
+    for key in required_keys.REQUIRED_ELECTION_MASTER_BALLOT_KEYS:
+        if key not in master_ballot:
+            return httpcode.ELECTION_BALLOT_MISSING_TITLE_DESCRIPTION_DATE_OR_QUESTIONS, None
+    if not isinstance(master_ballot['election_title'], str):
+        return httpcode.ELECTION_BALLOT_JSON_MALFORMED, None
+
+    # Verify that the dates can be parsed, one bad election mustn't fail the whole batch
+    for key in ('start_date', 'end_date'):
+        if not TimeManager.is_iso_8601_str(master_ballot[key]):
+            return httpcode.ELECTION_BALLOT_DATE_MALFORMED, master_ballot
+
+    return None, master_ballot
+
+
+def pending_indexes(results: List) -> List[int]:
+    """
+    :return: The indexes of the items nothing was reported for yet.
+    """
+    return [index for index, result in enumerate(results) if result is None]
+
+
+def pending_titles(results: List, master_ballots: List) -> List[str]:
+    return list(dict.fromkeys(master_ballots[index]['election_title'] for index in pending_indexes(results)))
+
+
+def reject_taken_titles(results: List, master_ballots: List, existing: Dict):
+    """
+    :param existing: The elections already stored, by title.
+    """
+    seen = set()
+    for index in pending_indexes(results):
+        election_title = master_ballots[index]['election_title']
+        if election_title in existing or election_title in seen:
+            results[index] = httpcode.ELECTION_WITH_TITLE_ALREADY_EXISTS
+        seen.add(election_title)
+
+
+def reject_unsigned(results: List, indexes: List[int], signed: List[bool]):
+    for index, valid in zip(indexes, signed):
+        if not valid:
+            results[index] = httpcode.ELECTION_BALLOT_SIGNING_MISMATCH
+
+
+def accept_elections(results: List, master_ballots: List, items: List, indexes: List[int],
+                      creator_username: str, election_cryptos: List[Dict]) -> List[Dict]:
+    """
+    :return: The elections to pass to BackendIO.create_elections, 'results' reports them as created.
+    """
+    elections = []
+    for index, election_crypto in zip(indexes, election_cryptos):
+        elections.append(new_election(master_ballots[index], items[index], creator_username, election_crypto))
+        results[index] = httpcode.ELECTION_CREATED_SUCCESSFULLY
+    return elections
+
+
+def bulk_results(results: List, master_ballots: List) -> Dict:
+    return {"results": [{
+        "election_title": master_ballot['election_title'] if master_ballot is not None else None,
+        "code": result.code,
+        "message": result.message
+    } for master_ballot, result in zip(master_ballots, results)]}
+
+
+def check_get_by_title(request):
+    """
+    :return: (HttpCode or None, the election_title asked for)
+    """
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None
+
+    # Check if any JSON was supplied at all
+    content = request.get_json(silent=True, force=True)
+    if content is None:
+        return httpcode.MISSING_OR_MALFORMED_JSON, None
+
+    # Verify election_key is present
+    for key in required_keys.REQUIRED_ELECTION_SEARCH_BY_TITLE_KEYS:
+        if key not in content:
+            return httpcode.ELECTION_SEARCH_BY_TITLE_MISSING_ELECTION_TITLE, None
+
+    return None, content["election_title"]
+
+
+def election_etag(backend_io, election_title: str, dates: Tuple) -> Tuple[bool, Optional[str]]:
+    """
+    :param backend_io: The BackendIO or AsyncBackendIO, get_election_version is synchronous for both.
+    :param dates: The election's (start_date, end_date).
+    :return: (whether the private_key is removed, the ETag of the election)
+    """
+    # The private_key is removed if the election hasn't ended yet.
+    redacted = fieldsets.is_redacted(dates[1], TimeManager.get_current_time_as_epoch())
+    version = backend_io.get_election_version(election_title)
+    return redacted, etag.make_etag(version, "redacted" if redacted else "full")
+
+
+def check_get_by_titles(request):
+    """
+    :return: (HttpCode or None, the election_titles asked for without duplicates)
+    """
+    # Verify the user's provided authentication cookie, once for the whole batch.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None
+
+    # Check if any JSON was supplied at all
+    content = request.get_json(silent=True, force=True)
+    if content is None:
+        return httpcode.MISSING_OR_MALFORMED_JSON, None
+
+    # Verify election_titles is present and is a list of titles
+    for key in required_keys.REQUIRED_ELECTION_GET_BY_TITLES_KEYS:
+        if key not in content:
+            return httpcode.ELECTION_BATCH_MISSING_ELECTION_TITLES, None
+
+    election_titles = content['election_titles']
+    if not isinstance(election_titles, list) or not all(isinstance(title, str) for title in election_titles):
+        return httpcode.ELECTION_BATCH_MISSING_ELECTION_TITLES, None
+
+    # Duplicates are only looked up once
+    election_titles = list(dict.fromkeys(election_titles))
+    if len(election_titles) > MAX_BATCH_TITLES:
+        return httpcode.ELECTION_BATCH_TOO_LARGE, None
+
+    return None, election_titles
+
+
+def elections_by_titles(election_titles: List[str], elections: Dict) -> Dict:
+    now = TimeManager.get_current_time_as_epoch()
+    output = {}
+    for election_title in election_titles:
+        found = elections.get(election_title)
+        output[election_title] = fieldsets.redact(found, now) if found is not None else None
+    return output
+
+
+def serialize_election(election_title: str, redacted: bool, election: Dict) -> bytes:
+    """
+    :return: The election as JSON, without the private_key if 'redacted'. The body is cached.
+    """
+    # Remove the private_key if the election hasn't ended yet.
+    if redacted:
+        election.pop('election_private_key')
+
+    body = json.dumps(election).encode('utf-8')
+    SETTINGS['RESPONSE_CACHE'].put_election(election_title, election['start_date'], election['end_date'],
+                                            redacted, body)
+    return body
+
+
+def check_search(request):
+    """
+    :return: (HttpCode or None, query, offset, limit, fields)
+    """
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None, None, None, None
+
+    query = request.args.get('q')
+    if not query or not query.strip():
+        return httpcode.ELECTION_SEARCH_MISSING_QUERY, None, None, None, None
+
+    # Search results are ranked rather than ordered by a column, the cursor is an offset.
+    try:
+        limit, after = pagination.get_page_parameters(request.args)
+        offset = int(after) if after is not None else 0
+        if offset < 0:
+            raise ValueError("Negative offset")
+    except ValueError:
+        return httpcode.INVALID_PAGINATION_PARAMETERS, None, None, None, None
+
+    try:
+        fields = fieldsets.get_fields(request.args)
+    except ValueError:
+        return httpcode.INVALID_ELECTION_FIELDS, None, None, None, None
+
+    return None, query, offset, limit, fields
+
+
+def search_page(elections: List[Dict], offset: int, limit: int) -> Dict:
+    return {
+        "items": elections[:limit],
+        "next": pagination.encode_cursor(str(offset + limit)) if len(elections) > limit else None
+    }
+
+
+class Listing(NamedTuple):
+    """
+    A listing asked for, also its key in the ResponseCache.
+    """
+    phase: ElectionPhase
+    paginated: bool
+    limit: Optional[int]
+    after: Optional[str]
+    fields: Tuple[str, ...]
+    # The version is part of the key, elections created by other processes are then never
+    # hidden by a listing cached before this process synced them.
+    version: Optional[str]
+
+
+def check_listing(request, backend_io, phase: ElectionPhase, now: int):
+    """
+    :param backend_io: The BackendIO or AsyncBackendIO, get_catalog_version is synchronous for both.
+    :return: (HttpCode, 304 response or None, the Listing, its ETag)
+    """
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None, None
+
+    paginated = pagination.is_paginated(request.args)
+    limit, after = None, None
+    if paginated:
+        try:
+            limit, after = pagination.get_page_parameters(request.args)
+        except ValueError:
+            return httpcode.INVALID_PAGINATION_PARAMETERS, None, None
+
+    try:
+        fields = fieldsets.get_fields(request.args)
+    except ValueError:
+        return httpcode.INVALID_ELECTION_FIELDS, None, None
+
+    # Nothing was created / opened / closed since the client last asked.
+    version = backend_io.get_catalog_version(now)
+    tag = etag.make_etag(version, ".".join(fields))
+    if etag.is_not_modified(tag, request):
+        return etag.not_modified(tag), None, tag
+
+    return None, Listing(phase, paginated, limit, after, fields, version), tag
+
+
+def listing_body(listing: Listing, elections: List[Dict]) -> bytes:
+    if listing.paginated:
+        return json.dumps(pagination.make_page(elections, listing.limit, 'election_title')).encode('utf-8')
+    return json.dumps(elections).encode('utf-8')
+
+
+def check_changes(request):
+    """
+    :return: (HttpCode or None, since, limit)
+    """
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None, None
+
+    try:
+        since, limit = pagination.get_change_feed_parameters(request.args)
+    except ValueError:
+        return httpcode.INVALID_CHANGE_FEED_PARAMETERS, None, None
+
+    return None, since, limit
+
+
+def created_titles(changes: List[Dict]) -> List[str]:
+    return list(dict.fromkeys(change['election_title'] for change in changes if change['event'] == ELECTION_CREATED))
+
+
+def changes_page(changes: List[Dict], since: int, limit: int, elections: Dict, now: int) -> Dict:
+    """
+    :param changes: Up to limit + 1 changes, the last one only tells whether there are more.
+    :param elections: The created elections by title, the private_key is removed unless the election has ended.
+    """
+    more = len(changes) > limit
+    changes = changes[:limit]
+    for change in changes:
+        if change['event'] == ELECTION_CREATED:
+            found = elections.get(change['election_title'])
+            change['election'] = fieldsets.redact(dict(found), now) if found is not None else None
+
+    return {
+        "items": changes,
+        "since": changes[-1]['seq'] if changes else since,
+        "more": more
+    }
+
+
+def set_event_stream_headers(response):
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
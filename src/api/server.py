@@ -0,0 +1,37 @@
+#
+#  src/api/server.py
+#  Authors:
+#       Samuel Vargas
+
+from flask import Blueprint, request, Response
+from src import httpcode
+from src.settings import SETTINGS
+from src.authentication_cookie import AuthenticationCookie
+import json
+
+server = Blueprint("server", __name__)
+
+
+@server.route("/api/server/workers", methods=["GET"])
+def get_worker_stats():
+    """
+    Load of the processes serving the API (see src/prefork_server.py):
+
+    {
+        "workers": 4,
+        "requests_per_second": 310.5,
+        "worker_processes": [
+            {"worker": 0, "pid": 4121, "requests": 10234, "requests_per_second": 80.0},
+            ...
+        ]
+    }
+    """
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
+
+    get_stats = SETTINGS.get('WORKER_STATS')
+    if get_stats is None:
+        return httpcode.WORKER_STATS_NOT_AVAILABLE
+
+    return Response(json.dumps(get_stats()), status=200, mimetype='application/json')
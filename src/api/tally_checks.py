@@ -0,0 +1,77 @@
+#
+#  src/api/tally_checks.py
+#  Authors:
+#       Samuel Vargas
+#
+#  The request checks and the tally of /api/election/tally, used by both
+#  src/api/tally.py and src/async_api/tally.py.
+#
+
+from src import httpcode, required_keys, etag
+from src.crypto_flow import CryptoFlow
+from src.settings import SETTINGS
+from src.authentication_cookie import AuthenticationCookie
+from src.time_manager import TimeManager
+from src.tally_machine import TallyMachine
+from typing import Dict, List, Optional
+import json
+
+
+def check_tally(request):
+    """
+    :return: (an error response or None, the election_title asked for)
+    """
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None
+
+    # 1) Check if any JSON was supplied at all
+    content = request.get_json(silent=True, force=True)
+    if content is None:
+        return httpcode.MISSING_OR_MALFORMED_JSON, None
+
+    # 2) Verify that the "election_title" key was provided
+    for key in required_keys.REQUIRED_ELECTION_TALLY_RESULTS_KEYS:
+        if key not in content:
+            return ("Missing key: '{0}' in sent JSON".format(key), 400), None
+
+    return None, content['election_title']
+
+
+def check_tally_election(request, backend_io, election: Optional[Dict]):
+    """
+    :param backend_io: The BackendIO or AsyncBackendIO, get_election_version is synchronous for both.
+    :param election: The election to tally, None if it doesn't exist.
+    :return: (HttpCode, 304 response or None, the ETag of the results, their Cache-Control)
+    """
+    if election is None:
+        return httpcode.ELECTION_NOT_FOUND, None, None
+
+    # 4) If the election is still in process return an error
+    if TimeManager.election_in_progress(election["start_date"], election['end_date']):
+        return httpcode.ELECTION_CANT_TALLY_VOTING_STILL_IN_PROGRESS, None, None
+
+    # 5) The results of a closed election never change, the client keeps them and revalidates.
+    tag, cache_control = None, None
+    if TimeManager.election_in_past(election['end_date']):
+        tag = etag.make_etag(backend_io.get_election_version(election['election_title']), "tally")
+        cache_control = etag.REVALIDATE_CACHE_CONTROL
+        if etag.is_not_modified(tag, request):
+            return etag.not_modified(tag, cache_control), tag, cache_control
+
+    return None, tag, cache_control
+
+
+def tally_ballots(election: Dict, all_ballots: List[Dict]) -> Dict:
+    # 7) Decrypt each ballot.
+    decrypt = CryptoFlow.get_ballot_decryptor(
+        election_rsa_public_key_b64=election['election_public_key'],
+        election_rsa_private_key_b64=election['election_private_key'],
+        election_encrypted_fernet_key_b64=election['election_encrypted_fernet_key'],
+    )
+    for ballot in all_ballots:
+        ballot['ballot'] = decrypt(ballot['ballot'])
+
+    # 8) Calculate the results of the election
+    questions = json.loads(election['questions'])
+    return TallyMachine.tally_election_ballots(questions, all_ballots)
@@ -4,125 +4,136 @@
 #       Samuel Vargas
 #
 
-from flask import Blueprint, request, jsonify
-from src import httpcode, required_keys
+from flask import Blueprint, Response, request, jsonify
+from src import httpcode, pagination
 from src.settings import SETTINGS
-from src.crypto_flow import CryptoFlow
+from src.crypto_flow import CryptoFlow, verify_signature
+from src.api.election_checks import pending_indexes
+from src.api.vote_checks import check_vote, check_vote_election, signed_ballot, new_ballot, encrypt_all, \
+    check_vote_in_bulk, check_bulk_ballots, reject, reject_repeated_voters, accept_ballots, bulk_results, \
+    VOTER_BALLOT_NOT_FOUND, check_ballot_get, decrypt_ballot, check_all_ballots, is_streamed, \
+    check_ballot_page, ballot_decryptor, decrypt_all
+from src.worker_pool import parallel_map
 from src.authentication_cookie import AuthenticationCookie
 from src.time_manager import TimeManager
+from typing import Callable, Dict, Iterator, Optional
 import json
-import uuid
 
 vote = Blueprint("vote", __name__)
 
+
 @vote.route("/api/election/vote", methods=["POST"])
 def election_cast_vote():
-    # Verify the user's provided authentication cookie.
-    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
-        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
-
-    # Check if any JSON was supplied at all
-    content = request.get_json(silent=True, force=True)
-    if content is None:
-        return httpcode.MISSING_OR_MALFORMED_JSON
-
-    # Verify that 'public_key', 'ballot', and 'ballot_signature' were provided
-    for key in required_keys.REQUIRED_ELECTION_VOTE_KEYS:
-        if key not in content:
-            return httpcode.ELECTION_VOTER_BALLOT_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE
-
-    # Verify that 'ballot' is valid JSON
-    try:
-        ballot = json.loads(content['ballot'])
-    except ValueError:
-        return httpcode.ELECTION_VOTER_BALLOT_JSON_IS_MALFORMED
-
-    # Verify that the 'election_title' and 'answers' were provided in the ballot
-    for key in required_keys.REQUIRED_ELECTION_VOTE_BALLOT_KEYS:
-        if key not in ballot:
-            return httpcode.ELECTION_VOTER_BALLOT_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE
-
-    # Verify that this election actually exists
-    election = SETTINGS['BACKEND_IO'].get_election_by_title(ballot['election_title'])
-    if election is None:
-        return httpcode.ELECTION_NOT_FOUND
+    result, content, ballot = check_vote(request)
+    if result is not None:
+        return result
 
-    # Verify the user has not already participated in this election
+    # Verify that this election actually exists and that the user has not already participated in it
+    election = SETTINGS['BACKEND_IO'].get_election_by_title(ballot['election_title'])
     username = AuthenticationCookie.get_username(request.cookies)
-    if SETTINGS['BACKEND_IO'].has_user_participated_in_election(username, ballot['election_title']):
-        return httpcode.ELECTION_VOTER_VOTED_ALREADY
-
-    # Verify that the election is still in progress
-    if not TimeManager.election_in_progress(election['start_date'], election['end_date']):
-        return httpcode.ELECTION_IS_INACTIVE
+    participated = election is not None and \
+        SETTINGS['BACKEND_IO'].has_user_participated_in_election(username, ballot['election_title'])
+    result = check_vote_election(election, participated)
+    if result is not None:
+        return result
 
     # TODO: Verify that the provided answers match the question options!
 
     # Verify that the user signed their ballot data correctly
-    if not CryptoFlow.verify_data_is_signed_ecdsa(
-            content['ballot'],
-            content['ballot_signature'],
-            content['voter_public_key']
-    ):
+    if not CryptoFlow.verify_data_is_signed_ecdsa(*signed_ballot(content)):
         return httpcode.ELECTION_BALLOT_SIGNING_MISMATCH
 
-    # Decrypt the encrypted Fernet key and then encrypt the user's ballot with the Fernet key
-    encrypted_ballot = CryptoFlow.encrypt_vote_with_election_creator_rsa_keys_and_encrypted_fernet_key(
-        ballot_str=content['ballot'],
-        rsa_private_key_b64=election["election_private_key"],
-        rsa_public_key_b64=election["election_public_key"],
-        encrypted_fernet_key=election["election_encrypted_fernet_key"]
-    )
-
-    # Generate a per election voter UUID so the user can retrieve this ballot again.
-    voter_uuid = str(uuid.uuid4())
-    SETTINGS['BACKEND_IO'].create_ballot(
-        encrypted_ballot,
-        election_title=election['election_title'],
-        voter_uuid=voter_uuid,
-        ballot_signature=content['ballot_signature'],
-        voter_public_key_b64=content['voter_public_key'],
-    )
+    # Decrypt the encrypted Fernet key (cached per election) and then encrypt the user's ballot with the Fernet key
+    voter_ballot = new_ballot(content, encrypt_all(election, [content['ballot']])[0])
+    SETTINGS['BACKEND_IO'].create_ballot(election_title=election['election_title'], **voter_ballot)
 
     SETTINGS['BACKEND_IO'].register_user_as_participated_in_election(username, ballot['election_title'])
+    SETTINGS['EVENT_PUBLISHER'].ballot_cast(ballot['election_title'])
 
-    return str(voter_uuid), 201
+    return voter_ballot['voter_uuid'], 201
 
-@vote.route("/api/ballot/get", methods=["GET", "POST"])
-def get_voter_ballot_by_voter_uuid():
-    # Verify the user's provided authentication cookie.
-    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS['SHARED_PASSWORD'], request.cookies):
-        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
 
-    # Check if any JSON was supplied at all
-    content = request.get_json(silent=True, force=True)
-    if content is None:
-        return httpcode.MISSING_OR_MALFORMED_JSON
+@vote.route("/api/election/vote/bulk", methods=["POST"])
+def election_cast_votes_in_bulk():
+    """
+    Lets a kiosk / proxy forward many signed ballots of the same election at once:
+
+    {
+        "election_title": "Election_Title",
+        "ballots": [
+            {
+                "token": "The voter's authentication cookie",
+                "ballot": "...", "voter_public_key": "...", "ballot_signature": "..."
+                (same as /api/election/vote)
+            },
+            ...
+        ]
+    }
 
-    # Verify the voter UUID is present
-    if "voter_uuid" not in content:
-        return "Missing voter_uuid", 400
+    Each ballot goes through the same checks as /api/election/vote, the signatures
+    are verified in parallel and every accepted ballot is stored in one transaction.
+
+    :return: {"results": [{"voter_uuid": "..."} or {"error": "Message", "code": 400}, ...]}
+             in the same order as "ballots".
+    """
+    result, election_title, items = check_vote_in_bulk(request)
+    if result is not None:
+        return result
+
+    # Verify that this election actually exists and is still in progress
+    election = SETTINGS['BACKEND_IO'].get_election_by_title(election_title)
+    result = check_vote_election(election, False)
+    if result is not None:
+        return result
+
+    # Check each ballot, 'results' holds an HttpCode for the rejected ones.
+    results, usernames = check_bulk_ballots(items, election_title)
+
+    # Verify the voters haven't participated yet
+    pending = pending_indexes(results)
+    reject(results, pending, [
+        SETTINGS['BACKEND_IO'].has_user_participated_in_election(usernames[index], election_title)
+        for index in pending
+    ], httpcode.ELECTION_VOTER_VOTED_ALREADY)
+
+    # Verify the signatures of the remaining ballots in parallel
+    pending = pending_indexes(results)
+    signed = parallel_map(verify_signature, [signed_ballot(items[index]) for index in pending])
+    reject(results, pending, [not valid for valid in signed], httpcode.ELECTION_BALLOT_SIGNING_MISMATCH)
+    reject_repeated_voters(results, pending, usernames)
+
+    # Encrypt every accepted ballot with the same election key and store them together
+    accepted = pending_indexes(results)
+    ballots = accept_ballots(results, items, usernames, accepted,
+                              encrypt_all(election, [items[index]['ballot'] for index in accepted]))
+    if ballots:
+        SETTINGS['BACKEND_IO'].create_ballots(election_title, ballots)
+        SETTINGS['EVENT_PUBLISHER'].ballot_cast(election_title)
+
+    return jsonify(bulk_results(results)), 200
+
+
+@vote.route("/api/ballot/get", methods=["GET", "POST"])
+def get_voter_ballot_by_voter_uuid():
+    result, voter_uuid = check_ballot_get(request)
+    if result is not None:
+        return result
 
     # Ask the backend if this voter exists
-    result = SETTINGS['BACKEND_IO'].get_ballot_by_voter_uuid(content['voter_uuid'])
-    if result is None:
-        return "Could not find a voter_ballot with this uuid", 404
+    ballot = SETTINGS['BACKEND_IO'].get_ballot_by_voter_uuid(voter_uuid)
+    if ballot is None:
+        return VOTER_BALLOT_NOT_FOUND
 
     # Get the corresponding election
-    election = SETTINGS['BACKEND_IO'].get_election_by_title(result['election_title'])
+    election = SETTINGS['BACKEND_IO'].get_election_by_title(ballot['election_title'])
 
     # If the election has ended, decrypt the users ballot and return
     # that instead.
     if not TimeManager.election_in_progress(election["start_date"], election['end_date']):
-        result['ballot'] = CryptoFlow.decrypt_ballot(
-            encrypted_ballot_str=result['ballot'],
-            election_rsa_public_key_b64=election['election_public_key'],
-            election_rsa_private_key_b64=election['election_private_key'],
-            election_encrypted_fernet_key_b64=election['election_encrypted_fernet_key'],
-        )
+        decrypt_ballot(ballot, election)
 
     # Return the found content
-    return jsonify(result), 200
+    return jsonify(ballot), 200
 
 
 @vote.route("/api/ballot/all", methods=["GET"])
@@ -153,41 +164,62 @@ def get_all_ballots_in_election():
 
                 ...
              ]
-    """
 
-    # TODO: Return an error if the election hasn't started yet.
+             If 'limit' and / or 'after' are sent as query parameters a single page
+             is returned instead: {"items": [ ... ], "next": "cursor" or null}
 
-    # 0) Verify the user's provided authentication cookie.
-    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
-        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
+             If '?stream=1' is sent (and the request isn't paginated) the same JSON
+             array is sent using a chunked response, so the server never holds
+             every ballot in memory at once.
+    """
 
-    # 1) Check if any JSON was supplied at all
-    content = request.get_json(silent=True, force=True)
-    if content is None:
-        return httpcode.MISSING_OR_MALFORMED_JSON
+    # TODO: Return an error if the election hasn't started yet.
 
-    # 2) Verify that the "election_title" key was provided
-    for key in required_keys.REQUIRED_ELECTION_GET_ALL_BALLOTS_KEYS:
-        if key not in content:
-            return "Missing key: '{0}' in sent JSON".format(key), 400
+    # 0-2) Verify the cookie and the JSON sent
+    result, election_title = check_all_ballots(request)
+    if result is not None:
+        return result
 
     # 3) Verify that the election actually exists
-    election = SETTINGS['BACKEND_IO'].get_election_by_title(content['election_title'])
+    election = SETTINGS['BACKEND_IO'].get_election_by_title(election_title)
     if election is None:
         return httpcode.ELECTION_NOT_FOUND
 
-    # 4) Request each ballot from the backend (no order is required)
-    all_ballots = SETTINGS['BACKEND_IO'].get_all_ballots(content['election_title'])
-
-    # 5) If the election is over, decrypt all ballots.
-    if not TimeManager.election_in_progress(election["start_date"], election['end_date']):
-        for ballot in all_ballots:
-            ballot['ballot'] = CryptoFlow.decrypt_ballot(
-                encrypted_ballot_str=ballot['ballot'],
-                election_rsa_public_key_b64=election['election_public_key'],
-                election_rsa_private_key_b64=election['election_private_key'],
-                election_encrypted_fernet_key_b64=election['election_encrypted_fernet_key'],
-            )
-
-    # 6) Convert it to JSON and return it to the user, indicate 200 for OK
-    return jsonify(all_ballots), 200
+    # 4) If the election is over the ballots are sent decrypted.
+    decrypt = ballot_decryptor(election)
+
+    # 5) In streaming mode the JSON array is written one ballot at a time straight
+    #    from the backend, each ballot is only decrypted right before it's sent.
+    if is_streamed(request):
+        ballots = SETTINGS['BACKEND_IO'].iter_ballots(election_title)
+        return Response(_stream_json_array(ballots, decrypt), status=200, mimetype='application/json')
+
+    # 6) Request each ballot from the backend (no order is required), or a single
+    #    page of them ordered by voter_uuid if the client sent 'limit' / 'after'
+    result, limit, after = check_ballot_page(request)
+    if result is not None:
+        return result
+
+    page = None
+    if limit is not None:
+        page = pagination.make_page(SETTINGS['BACKEND_IO'].get_ballots_page(election_title, after, limit + 1),
+                                    limit, 'voter_uuid')
+        all_ballots = page['items']
+    else:
+        all_ballots = SETTINGS['BACKEND_IO'].get_all_ballots(election_title)
+
+    # 7) If the election is over, decrypt all ballots.
+    if decrypt is not None:
+        decrypt_all(decrypt, all_ballots)
+
+    # 8) Convert it to JSON and return it to the user, indicate 200 for OK
+    return jsonify(page if page is not None else all_ballots), 200
+
+
+def _stream_json_array(rows: Iterator[Dict], decrypt: Optional[Callable[[str], str]]) -> Iterator[str]:
+    yield '['
+    for index, row in enumerate(rows):
+        if decrypt is not None:
+            row['ballot'] = decrypt(row['ballot'])
+        yield (',' if index else '') + json.dumps(row)
+    yield ']'
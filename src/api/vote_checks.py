@@ -0,0 +1,298 @@
+#
+#  src/api/vote_checks.py
+#  Authors:
+#       Samuel Vargas
+#
+#  The request checks and response bodies of the vote and ballot routes,
+#  used by both src/api/vote.py and src/async_api/vote.py.
+#
+
+from src import httpcode, required_keys, pagination
+from src.settings import SETTINGS
+from src.crypto_flow import CryptoFlow
+from src.authentication_cookie import AuthenticationCookie
+from src.time_manager import TimeManager
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import uuid
+
+_TRUTHY = ("1", "true", "yes")
+
+# Most ballots accepted by /api/election/vote/bulk in one request
+MAX_BULK_BALLOTS = 500
+
+VOTER_BALLOT_NOT_FOUND = ("Could not find a voter_ballot with this uuid", 404)
+
+
+def check_vote(request):
+    """
+    The checks of /api/election/vote that don't need the backend.
+    :return: (HttpCode or None, the JSON sent, the parsed ballot)
+    """
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None, None
+
+    # Check if any JSON was supplied at all
+    content = request.get_json(silent=True, force=True)
+    if content is None:
+        return httpcode.MISSING_OR_MALFORMED_JSON, None, None
+
+    # Verify that 'public_key', 'ballot', and 'ballot_signature' were provided
+    for key in required_keys.REQUIRED_ELECTION_VOTE_KEYS:
+        if key not in content:
+            return httpcode.ELECTION_VOTER_BALLOT_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE, None, None
+
+    # Verify that 'ballot' is valid JSON
+    try:
+        ballot = json.loads(content['ballot'])
+    except ValueError:
+        return httpcode.ELECTION_VOTER_BALLOT_JSON_IS_MALFORMED, None, None
+
+    # Verify that the 'election_title' and 'answers' were provided in the ballot
+    for key in required_keys.REQUIRED_ELECTION_VOTE_BALLOT_KEYS:
+        if key not in ballot:
+            return httpcode.ELECTION_VOTER_BALLOT_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE, None, None
+
+    return None, content, ballot
+
+
+def check_vote_election(election: Optional[Dict], participated: bool) -> Optional[httpcode.HttpCode]:
+    """
+    :param election: The election voted in, None if it doesn't exist.
+    :param participated: Whether the voter already voted in it.
+    """
+    if election is None:
+        return httpcode.ELECTION_NOT_FOUND
+    if participated:
+        return httpcode.ELECTION_VOTER_VOTED_ALREADY
+
+    # Verify that the election is still in progress
+    if not TimeManager.election_in_progress(election['start_date'], election['end_date']):
+        return httpcode.ELECTION_IS_INACTIVE
+
+    return None
+
+
+def signed_ballot(item: Dict):
+    """
+    :return: The arguments of verify_signature for a ballot sent to /api/election/vote(/bulk).
+    """
+    return item['ballot'], item['ballot_signature'], item['voter_public_key']
+
+
+def new_ballot(item: Dict, encrypted_ballot: str) -> Dict:
+    """
+    :return: The keyword arguments of BackendIO.create_ballot, besides the election_title.
+             A per election voter UUID is generated so the user can retrieve this ballot again.
+    """
+    return {
+        "ballot": encrypted_ballot,
+        "voter_uuid": str(uuid.uuid4()),
+        "ballot_signature": item['ballot_signature'],
+        "voter_public_key_b64": item['voter_public_key'],
+    }
+
+
+def encrypt_all(election: Dict, ballots: List[str]) -> List[str]:
+    encrypt = CryptoFlow.get_ballot_encryptor(
+        rsa_public_key_b64=election["election_public_key"],
+        rsa_private_key_b64=election["election_private_key"],
+        encrypted_fernet_key=election["election_encrypted_fernet_key"]
+    )
+    return [encrypt(ballot) for ballot in ballots]
+
+
+def check_vote_in_bulk(request):
+    """
+    The checks of /api/election/vote/bulk done once for the whole batch.
+    :return: (HttpCode or None, the election_title, the ballots sent)
+    """
+    # Verify the kiosk's authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None, None
+
+    # Check if any JSON was supplied at all
+    content = request.get_json(silent=True, force=True)
+    if content is None:
+        return httpcode.MISSING_OR_MALFORMED_JSON, None, None
+
+    # Verify that 'election_title' and a list of 'ballots' were provided
+    for key in required_keys.REQUIRED_ELECTION_BULK_VOTE_KEYS:
+        if key not in content:
+            return httpcode.ELECTION_BULK_VOTE_MISSING_TITLE_OR_BALLOTS, None, None
+    if not isinstance(content['ballots'], list):
+        return httpcode.ELECTION_BULK_VOTE_MISSING_TITLE_OR_BALLOTS, None, None
+    if len(content['ballots']) > MAX_BULK_BALLOTS:
+        return httpcode.ELECTION_BULK_VOTE_TOO_LARGE, None, None
+
+    return None, content['election_title'], content['ballots']
+
+
+def check_bulk_ballots(items: List, election_title: str) -> Tuple[List, List]:
+    """
+    :return: (an HttpCode or None per ballot, the voters' usernames)
+    """
+    results, usernames = [], []
+    for item in items:
+        result, username = _check_bulk_ballot(item, election_title)
+        results.append(result)
+        usernames.append(username)
+    return results, usernames
+
+
+def _check_bulk_ballot(item, election_title: str):
+    """
+    The checks /api/election/vote does for a single ballot, except for the ones
+    that need the backend, the signature and duplicates within the batch.
+    :return: (HttpCode or None, the voter's username)
+    """
+    if not isinstance(item, dict):
+        return httpcode.ELECTION_VOTER_BALLOT_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE, None
+    for key in required_keys.REQUIRED_ELECTION_BULK_VOTE_BALLOT_KEYS:
+        if not isinstance(item.get(key), str):
+            return httpcode.ELECTION_VOTER_BALLOT_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE, None
+
+    # The voter's own cookie, as forwarded by the kiosk
+    cookies = {"token": item['token']}
+    try:
+        authenticated = AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], cookies)
+    except (TypeError, AttributeError):
+        authenticated = False
+    if not authenticated:
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None
+
+    try:
+        ballot = json.loads(item['ballot'])
+    except ValueError:
+        return httpcode.ELECTION_VOTER_BALLOT_JSON_IS_MALFORMED, None
+    if not isinstance(ballot, dict):
+        return httpcode.ELECTION_VOTER_BALLOT_JSON_IS_MALFORMED, None
+
+    for key in required_keys.REQUIRED_ELECTION_VOTE_BALLOT_KEYS:
+        if key not in ballot:
+            return httpcode.ELECTION_VOTER_BALLOT_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE, None
+    if ballot['election_title'] != election_title:
+        return httpcode.ELECTION_BULK_VOTE_BALLOT_FOR_OTHER_ELECTION, None
+
+    return None, AuthenticationCookie.get_username(cookies)
+
+
+def reject(results: List, indexes: List[int], rejected: List[bool], result: httpcode.HttpCode):
+    for index, is_rejected in zip(indexes, rejected):
+        if is_rejected:
+            results[index] = result
+
+
+def reject_repeated_voters(results: List, indexes: List[int], usernames: List[str]):
+    # Only the first valid ballot of a voter within the batch counts
+    seen = set()
+    for index in indexes:
+        if results[index] is None:
+            if usernames[index] in seen:
+                results[index] = httpcode.ELECTION_VOTER_VOTED_ALREADY
+            seen.add(usernames[index])
+
+
+def accept_ballots(results: List, items: List, usernames: List, indexes: List[int],
+                    encrypted: List[str]) -> List[Dict]:
+    """
+    :return: The ballots to pass to BackendIO.create_ballots, 'results' holds their voter_uuid.
+    """
+    ballots = []
+    for index, encrypted_ballot in zip(indexes, encrypted):
+        ballots.append(dict(new_ballot(items[index], encrypted_ballot), username=usernames[index]))
+        results[index] = ballots[-1]['voter_uuid']
+    return ballots
+
+
+def bulk_results(results: List) -> Dict:
+    return {"results": [
+        {"voter_uuid": result} if isinstance(result, str) else {"error": result.message, "code": result.code}
+        for result in results
+    ]}
+
+
+def check_ballot_get(request):
+    """
+    :return: (an error response or None, the voter_uuid asked for)
+    """
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS['SHARED_PASSWORD'], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None
+
+    # Check if any JSON was supplied at all
+    content = request.get_json(silent=True, force=True)
+    if content is None:
+        return httpcode.MISSING_OR_MALFORMED_JSON, None
+
+    # Verify the voter UUID is present
+    if "voter_uuid" not in content:
+        return ("Missing voter_uuid", 400), None
+
+    return None, content['voter_uuid']
+
+
+def decrypt_ballot(ballot: Dict, election: Dict):
+    ballot['ballot'] = CryptoFlow.decrypt_ballot(
+        encrypted_ballot_str=ballot['ballot'],
+        election_rsa_public_key_b64=election['election_public_key'],
+        election_rsa_private_key_b64=election['election_private_key'],
+        election_encrypted_fernet_key_b64=election['election_encrypted_fernet_key'],
+    )
+
+
+def check_all_ballots(request):
+    """
+    :return: (an error response or None, the election_title asked for)
+    """
+    # 0) Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE, None
+
+    # 1) Check if any JSON was supplied at all
+    content = request.get_json(silent=True, force=True)
+    if content is None:
+        return httpcode.MISSING_OR_MALFORMED_JSON, None
+
+    # 2) Verify that the "election_title" key was provided
+    for key in required_keys.REQUIRED_ELECTION_GET_ALL_BALLOTS_KEYS:
+        if key not in content:
+            return ("Missing key: '{0}' in sent JSON".format(key), 400), None
+
+    return None, content['election_title']
+
+
+def is_streamed(request) -> bool:
+    return request.args.get('stream') in _TRUTHY and not pagination.is_paginated(request.args)
+
+
+def check_ballot_page(request):
+    """
+    :return: (HttpCode or None, limit, after), limit is None if the request isn't paginated.
+    """
+    if not pagination.is_paginated(request.args):
+        return None, None, None
+    try:
+        limit, after = pagination.get_page_parameters(request.args)
+    except ValueError:
+        return httpcode.INVALID_PAGINATION_PARAMETERS, None, None
+    return None, limit, after
+
+
+def ballot_decryptor(election: Dict) -> Optional[Callable[[str], str]]:
+    """
+    :return: Decrypts the ballots of the election, None while it's in progress.
+    """
+    if TimeManager.election_in_progress(election["start_date"], election['end_date']):
+        return None
+    return CryptoFlow.get_ballot_decryptor(
+        election_rsa_public_key_b64=election['election_public_key'],
+        election_rsa_private_key_b64=election['election_private_key'],
+        election_encrypted_fernet_key_b64=election['election_encrypted_fernet_key'],
+    )
+
+
+def decrypt_all(decrypt: Callable[[str], str], ballots: List[Dict]):
+    for ballot in ballots:
+        ballot['ballot'] = decrypt(ballot['ballot'])
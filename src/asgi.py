@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+#
+# src/asgi.py
+# Authors:
+#   Samuel Vargas
+#
+# AsyncBlueprint and AsgiApp are the little of Flask the asyncio API
+# (src/async_api) needs, packaged as an ASGI application so any ASGI server
+# can run it: src/asgi_server.py, or uvicorn src.async_intermediary:app.
+#
+# Views are coroutines called with the request, a werkzeug Request, so
+# request.args, request.cookies and request.get_json work the same as in
+# the Flask views. They return what a Flask view returns (a Response, an
+# HttpCode or a (body, status) tuple) or a StreamingResponse, whose body is
+# an async iterator sent as it's produced.
+#
+# Every origin is allowed, the same as CORS(app) in intermediary.py.
+#
+
+from typing import AsyncIterator, Callable, Dict, Iterable, Union
+from io import BytesIO
+from werkzeug.datastructures import Headers
+from werkzeug.wrappers import Request, Response
+import asyncio
+import json
+import logging
+import sys
+
+
+class StreamingResponse:
+
+    def __init__(self, body: AsyncIterator[Union[str, bytes]], status: int = 200, mimetype: str = None,
+                 on_close: Callable[[], None] = None):
+        """
+        :param body: Sent chunk by chunk, str chunks are encoded as UTF-8.
+        :param on_close: Called once the response is over, sent or not.
+        """
+        self.body = body
+        self.status_code = status
+        self.headers = Headers()
+        if mimetype is not None:
+            self.headers['Content-Type'] = mimetype
+        self.on_close = on_close
+
+
+class AsyncBlueprint:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.routes = []  # (rule, methods, view)
+
+    def route(self, rule: str, methods: Iterable[str] = ("GET",)):
+        def decorator(view):
+            self.routes.append((rule, tuple(methods), view))
+            return view
+
+        return decorator
+
+
+def json_response(content, status: int = 200) -> Response:
+    """
+    jsonify for the asyncio API
+    """
+    return Response(json.dumps(content), status=status, mimetype='application/json')
+
+
+def make_response(rv) -> Union[Response, StreamingResponse]:
+    """
+    Turns whatever a view returned into a response, the same as Flask does.
+    """
+    if isinstance(rv, (Response, StreamingResponse)):
+        return rv
+
+    status = 200
+    if isinstance(rv, tuple):
+        rv, status = rv
+    if isinstance(rv, Response):
+        rv.status_code = status
+        return rv
+    return Response(rv, status=status, mimetype='text/html')
+
+
+class AsgiApp:
+
+    def __init__(self):
+        self.loop = None     # The loop the app is served on, once it got its first request
+        self.__views = {}    # rule -> {method: view}
+
+    def register_blueprint(self, blueprint: AsyncBlueprint):
+        for rule, methods, view in blueprint.routes:
+            for method in methods:
+                self.__views.setdefault(rule, {})[method] = view
+
+    async def __call__(self, scope: Dict, receive, send):
+        self.loop = asyncio.get_event_loop()
+        if scope["type"] == "lifespan":
+            await _lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        body = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+
+        request = Request(_environ(scope, b"".join(body)))
+        await _send_response(await self.__dispatch(request), send)
+
+    async def __dispatch(self, request: Request) -> Union[Response, StreamingResponse]:
+        views = self.__views.get(request.path)
+        if views is None:
+            return Response("Not Found", status=404, mimetype='text/html')
+
+        if request.method == "OPTIONS":
+            return _preflight(request, views)
+
+        view = views.get(request.method)
+        if view is None:
+            response = Response("Method Not Allowed", status=405, mimetype='text/html')
+            response.headers['Allow'] = ", ".join(sorted(views))
+            return response
+
+        try:
+            return make_response(await view(request))
+        except Exception:
+            logging.getLogger(__name__).exception("Exception on %s [%s]", request.path, request.method)
+            return Response("Internal Server Error", status=500, mimetype='text/html')
+
+
+async def _lifespan(receive, send):
+    # Nothing to set up, the app is configured before it's served
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def _environ(scope: Dict, body: bytes) -> Dict:
+    """
+    The WSGI environ of an ASGI http request, for werkzeug's Request
+    """
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", ()):
+        # The whole body was already received (and de-chunked), its length is the one above
+        if name in (b"content-length", b"transfer-encoding"):
+            continue
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = "HTTP_" + key
+        value = value.decode("latin-1")
+        if key in environ:
+            value = environ[key] + ("; " if key == "HTTP_COOKIE" else ",") + value
+        environ[key] = value
+    return environ
+
+
+def _preflight(request: Request, views: Dict) -> Response:
+    response = Response(status=200)
+    response.headers['Access-Control-Allow-Methods'] = ", ".join(sorted(views))
+    requested = request.headers.get('Access-Control-Request-Headers')
+    if requested:
+        response.headers['Access-Control-Allow-Headers'] = requested
+    return response
+
+
+async def _send_response(response: Union[Response, StreamingResponse], send):
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in response.headers.items()],
+    })
+
+    if not isinstance(response, StreamingResponse):
+        await send({"type": "http.response.body", "body": response.get_data()})
+        return
+
+    try:
+        # Sends the headers before the first chunk is produced, which may take a while (events)
+        await send({"type": "http.response.body", "body": b"", "more_body": True})
+        async for chunk in response.body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        # Right away rather than whenever the generator is collected, e.g. when the client left
+        close = getattr(response.body, "aclose", None)
+        if close is not None:
+            await close()
+        if response.on_close is not None:
+            response.on_close()
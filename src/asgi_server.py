@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+#
+# src/asgi_server.py
+# Authors:
+#   Samuel Vargas
+#
+# AsgiServer is a small HTTP/1.1 server running an ASGI application on
+# asyncio streams, so the asyncio API (src/async_intermediary.py) can be
+# served without installing an ASGI server. uvicorn or hypercorn serve the
+# same application if they're available.
+#
+# Every connection is a task on the event loop, kept alive between
+# requests. Request bodies may be sent with a Content-Length or chunked.
+# A response sent in a single message gets a Content-Length, one sent in
+# several (a StreamingResponse) is sent chunked.
+#
+
+from typing import Dict, List, Tuple
+from http import HTTPStatus
+from email.utils import formatdate
+from urllib.parse import unquote
+import asyncio
+import logging
+
+# Largest request line + headers accepted
+MAX_HEADER_SIZE = 64 * 1024
+
+# Largest request body accepted
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+# Seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 75.0
+
+
+class _BadRequest(Exception):
+
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+class _ResponseWriter:
+    """
+    The 'send' of one request, writes the ASGI response messages as HTTP/1.1
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, keep_alive: bool, head: bool):
+        self.writer = writer
+        self.keep_alive = keep_alive
+        self.head = head
+        self.disconnected = asyncio.Event()
+        self.started = False
+        self.finished = False
+        self.__chunked = False
+        self.__status = None
+        self.__headers = []
+
+    async def send(self, message: Dict):
+        if self.writer.is_closing():
+            self.disconnected.set()
+            raise ConnectionResetError("The client closed the connection")
+
+        if message["type"] == "http.response.start":
+            # Written along with the first body message, whose 'more_body' decides the framing
+            self.__status = message["status"]
+            self.__headers = list(message.get("headers", ()))
+            return
+        if message["type"] != "http.response.body" or self.finished:
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.started:
+            self.started = True
+            self.writer.write(self.__head(len(body), more_body))
+        if body and not self.head:
+            self.writer.write(b"%x\r\n%s\r\n" % (len(body), body) if self.__chunked else body)
+        if not more_body:
+            self.finished = True
+            if self.__chunked and not self.head:
+                self.writer.write(b"0\r\n\r\n")
+
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            self.disconnected.set()
+            raise
+
+    def __head(self, length: int, more_body: bool) -> bytes:
+        status = self.__status
+        headers = self.__headers
+        names = {name.lower() for name, _ in headers}
+        if b"content-length" not in names and status >= 200 and status not in (204, 304):
+            if more_body:
+                self.__chunked = True
+                headers.append((b"transfer-encoding", b"chunked"))
+            else:
+                headers.append((b"content-length", str(length).encode("latin-1")))
+        headers.append((b"date", formatdate(usegmt=True).encode("latin-1")))
+        headers.append((b"connection", b"keep-alive" if self.keep_alive else b"close"))
+
+        try:
+            phrase = HTTPStatus(status).phrase
+        except ValueError:
+            phrase = ""
+        lines = ["HTTP/1.1 {0} {1}".format(status, phrase).encode("latin-1")]
+        lines.extend(name + b": " + value for name, value in headers)
+        return b"\r\n".join(lines) + b"\r\n\r\n"
+
+
+class AsgiServer:
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 8080):
+        """
+        :param app: An ASGI 3 application.
+        :param port: 0 picks a free port, see 'port' once started.
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.server = None
+        self.__connections = set()  # The task of every open connection
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.__handle, self.host, self.port, limit=MAX_HEADER_SIZE)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        await self.server.serve_forever()
+
+    async def close(self):
+        """
+        Stops accepting connections and closes the open ones, whatever they're doing
+        """
+        self.server.close()
+        for task in list(self.__connections):
+            task.cancel()
+        await asyncio.gather(*self.__connections, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self.__connections.add(task)
+        try:
+            while await self.__handle_request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        except _BadRequest as error:
+            writer.write("HTTP/1.1 {0} {1}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".format(
+                error.status, HTTPStatus(error.status).phrase).encode("latin-1"))
+        finally:
+            self.__connections.discard(task)
+            writer.close()
+
+    async def __handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """
+        :return: Whether the connection may be used for another request.
+        """
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+        except asyncio.LimitOverrunError:
+            raise _BadRequest(431)
+
+        method, target, version, headers = _parse_head(head)
+        fields = {name: value for name, value in headers}
+        if version not in ("HTTP/1.0", "HTTP/1.1"):
+            raise _BadRequest(505)
+
+        if fields.get(b"expect", b"").lower() == b"100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        if b"chunked" in fields.get(b"transfer-encoding", b"").lower():
+            body = await _read_chunked(reader)
+        else:
+            try:
+                length = int(fields.get(b"content-length", b"0"))
+            except ValueError:
+                raise _BadRequest(400)
+            if length < 0:
+                raise _BadRequest(400)
+            if length > MAX_BODY_SIZE:
+                raise _BadRequest(413)
+            body = await reader.readexactly(length)
+
+        connection = fields.get(b"connection", b"").lower()
+        keep_alive = connection == b"keep-alive" if version == "HTTP/1.0" else connection != b"close"
+
+        path, _, query = target.partition("?")
+        peer = writer.get_extra_info("peername")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.3"},
+            "http_version": version[len("HTTP/"):],
+            "method": method,
+            "scheme": "http",
+            "path": unquote(path),
+            "raw_path": path.encode("latin-1"),
+            "query_string": query.encode("latin-1"),
+            "root_path": "",
+            "headers": headers,
+            "client": tuple(peer[:2]) if peer else None,
+            "server": (self.host, self.port),
+        }
+
+        response = _ResponseWriter(writer, keep_alive, method == "HEAD")
+        received = False
+
+        async def receive() -> Dict:
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await response.disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        try:
+            await self.app(scope, receive, response.send)
+        except ConnectionError:
+            return False
+        except Exception:
+            logging.getLogger(__name__).exception("Exception on %s [%s]", path, method)
+            if not response.started:
+                await response.send({"type": "http.response.start", "status": 500,
+                                     "headers": [(b"content-type", b"text/plain")]})
+                await response.send({"type": "http.response.body", "body": b"Internal Server Error"})
+            return False
+
+        # An application that didn't finish its response leaves the connection unusable
+        return response.finished and keep_alive
+
+
+def _parse_head(head: bytes) -> Tuple[str, str, str, List[Tuple[bytes, bytes]]]:
+    request_line, *header_lines = head[:-4].split(b"\r\n")
+    try:
+        method, target, version = request_line.decode("latin-1").split(" ")
+    except ValueError:
+        raise _BadRequest(400)
+
+    headers = []
+    for line in header_lines:
+        name, separator, value = line.partition(b":")
+        if not separator:
+            raise _BadRequest(400)
+        headers.append((name.strip().lower(), value.strip()))
+    return method.upper(), target, version, headers
+
+
+async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+    chunks = []
+    size = 0
+    while True:
+        line = await reader.readuntil(b"\r\n")
+        try:
+            length = int(line.split(b";")[0], 16)
+        except ValueError:
+            raise _BadRequest(400)
+        size += length
+        if size > MAX_BODY_SIZE:
+            raise _BadRequest(413)
+        if length == 0:
+            # Trailers are ignored
+            while await reader.readuntil(b"\r\n") != b"\r\n":
+                pass
+            return b"".join(chunks)
+        chunks.append(await reader.readexactly(length))
+        await reader.readexactly(2)
+
+
+def serve(app, host: str = "127.0.0.1", port: int = 8080):
+    """
+    Serves 'app' until interrupted (Ctrl+C)
+    """
+    async def run():
+        server = AsgiServer(app, host, port)
+        await server.start()
+        print("Serving on http://{0}:{1}".format(host, server.port), flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,12 @@
+#
+#  src/async_api/__init__.py
+#  Authors:
+#       Samuel Vargas
+#
+#  The routes of src/api as coroutines, served by src/async_intermediary.py.
+#
+
+from .authentication import *
+from .election import *
+from .vote import *
+from .tally import *
@@ -0,0 +1,21 @@
+#
+#  src/async_api/authentication.py
+#  Authors:
+#       Samuel Vargas
+#
+
+from src.asgi import AsyncBlueprint
+from src.authentication_cookie import AuthenticationCookie
+from src import httpcode
+from src.settings import SETTINGS
+
+authentication = AsyncBlueprint("authentication")
+
+
+@authentication.route("/api/authentication", methods=["POST"])
+async def cookie_has_valid_authentication(request):
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
+
+    return httpcode.VALID_AUTHENTICATION_COOKIE
@@ -0,0 +1,265 @@
+#
+#  src/async_api/election.py
+#  Authors:
+#       Samuel Vargas
+#
+#  The checks and the response bodies are the ones of src/api/election_checks.py,
+#  only the backend calls differ.
+#
+
+from src.asgi import AsyncBlueprint, StreamingResponse, json_response
+from src import httpcode, etag
+from src.settings import SETTINGS
+from src.crypto_flow import verify_signature, generate_election_keys
+from src.worker_pool import run_in_pool, parallel_map_async
+from src.authentication_cookie import AuthenticationCookie
+from src.time_manager import TimeManager
+from src.election_phase import ElectionPhase
+from src.api.election_checks import check_election_create, signed_master_ballot, new_election, \
+    check_election_create_in_bulk, check_bulk_elections, pending_indexes, pending_titles, reject_taken_titles, \
+    reject_unsigned, accept_elections, bulk_results, check_get_by_title, election_etag, \
+    check_get_by_titles, elections_by_titles, serialize_election, check_search, search_page, \
+    check_listing, listing_body, check_changes, created_titles, changes_page, set_event_stream_headers, \
+    KEEPALIVE
+from werkzeug.wrappers import Response
+from typing import AsyncIterator
+import asyncio
+
+election = AsyncBlueprint("election")
+
+
+@election.route("/api/election/create", methods=["POST"])
+async def election_create(request):
+    """
+    See /api/election/create in src/api/election.py
+    """
+    result, content, master_ballot = check_election_create(request)
+    if result is not None:
+        return result
+
+    # Verify an election with this name does not already exist
+    backend_io = SETTINGS['ASYNC_BACKEND_IO']
+    if await backend_io.get_election_by_title(master_ballot["election_title"]) is not None:
+        return httpcode.ELECTION_WITH_TITLE_ALREADY_EXISTS
+
+    # Verify that the election creator correctly signed their 'master_ballot_signature' using
+    # their 'creator_public_key', in another process as ECDSA is pure Python
+    if not await run_in_pool(verify_signature, signed_master_ballot(content)):
+        return httpcode.ELECTION_BALLOT_SIGNING_MISMATCH
+
+    # Generating the RSA key takes seconds, the event loop keeps serving other requests meanwhile
+    election_crypto = await run_in_pool(generate_election_keys)
+    await backend_io.create_election(**new_election(
+        master_ballot, content, AuthenticationCookie.get_username(request.cookies), election_crypto))
+    SETTINGS['RESPONSE_CACHE'].invalidate_election(master_ballot["election_title"])
+
+    return httpcode.ELECTION_CREATED_SUCCESSFULLY
+
+
+@election.route("/api/election/create/bulk", methods=["POST"])
+async def election_create_in_bulk(request):
+    """
+    See /api/election/create/bulk in src/api/election.py
+    """
+    result, items = check_election_create_in_bulk(request)
+    if result is not None:
+        return result
+
+    # Check each election, 'results' holds an HttpCode for the rejected ones.
+    results, master_ballots = check_bulk_elections(items)
+
+    # Verify none of the titles exist yet (one backend call) or appear twice in the batch
+    backend_io = SETTINGS['ASYNC_BACKEND_IO']
+    existing = await backend_io.get_elections_by_titles(pending_titles(results, master_ballots))
+    reject_taken_titles(results, master_ballots, existing)
+
+    # Verify the signatures in parallel
+    pending = pending_indexes(results)
+    signed = await parallel_map_async(verify_signature, [signed_master_ballot(items[index]) for index in pending])
+    reject_unsigned(results, pending, signed)
+
+    # Generate the RSA / Fernet keys of every accepted election in parallel and store them together
+    pending = pending_indexes(results)
+    elections = accept_elections(results, master_ballots, items, pending,
+                                  AuthenticationCookie.get_username(request.cookies),
+                                  await parallel_map_async(generate_election_keys, pending))
+    if elections:
+        await backend_io.create_elections(elections)
+        for created in elections:
+            SETTINGS['RESPONSE_CACHE'].invalidate_election(created['master_ballot']['election_title'])
+
+    return json_response(bulk_results(results, master_ballots))
+
+
+@election.route("/api/election/get_by_title", methods=["GET"])
+async def election_get_by_title(request):
+    """
+    See /api/election/get_by_title in src/api/election.py
+    """
+    result, election_title = check_get_by_title(request)
+    if result is not None:
+        return result
+
+    # Check if the election was found, the dates are all that's
+    # needed to pick the right version / cached body.
+    backend_io = SETTINGS['ASYNC_BACKEND_IO']
+    found = None
+    dates = SETTINGS['RESPONSE_CACHE'].get_election_dates(election_title)
+    if dates is None:
+        found = await backend_io.get_election_by_title(election_title)
+        if found is None:
+            return httpcode.ELECTION_NOT_FOUND
+        dates = (found['start_date'], found['end_date'])
+
+    # Nothing changed since the client last asked.
+    redacted, tag = election_etag(backend_io, election_title, dates)
+    if etag.is_not_modified(tag, request):
+        return etag.not_modified(tag)
+
+    body = SETTINGS['RESPONSE_CACHE'].get_election(election_title, redacted)
+    if body is None:
+        if found is None:
+            found = await backend_io.get_election_by_title(election_title)
+            if found is None:
+                return httpcode.ELECTION_NOT_FOUND
+        body = serialize_election(election_title, redacted, found)
+
+    return etag.with_etag(Response(body, status=200, mimetype='application/json'), tag)
+
+
+@election.route("/api/election/get_by_titles", methods=["GET", "POST"])
+async def election_get_by_titles(request):
+    """
+    See /api/election/get_by_titles in src/api/election.py
+    """
+    result, election_titles = check_get_by_titles(request)
+    if result is not None:
+        return result
+
+    # A single backend call for every title
+    elections = await SETTINGS['ASYNC_BACKEND_IO'].get_elections_by_titles(election_titles)
+
+    return json_response(elections_by_titles(election_titles, elections))
+
+
+@election.route("/api/election/search", methods=["GET"])
+async def election_search(request):
+    """
+    See /api/election/search in src/api/election.py
+    """
+    result, query, offset, limit, fields = check_search(request)
+    if result is not None:
+        return result
+
+    try:
+        elections = await SETTINGS['ASYNC_BACKEND_IO'].search_elections(query, offset, limit + 1, fields)
+    except NotImplementedError:
+        return httpcode.ELECTION_SEARCH_NOT_SUPPORTED
+
+    return json_response(search_page(elections, offset, limit))
+
+
+@election.route("/api/election/past", methods=["GET"])
+async def get_past_elections(request):
+    return await _list_elections_in_phase(request, ElectionPhase.past)
+
+
+@election.route("/api/election/present", methods=["GET"])
+async def get_present_elections(request):
+    return await _list_elections_in_phase(request, ElectionPhase.present)
+
+
+@election.route("/api/election/future", methods=["GET"])
+async def get_future_elections(request):
+    return await _list_elections_in_phase(request, ElectionPhase.future)
+
+
+async def _list_elections_in_phase(request, phase: ElectionPhase):
+    """
+    See _list_elections_in_phase in src/api/election.py
+    """
+    backend_io = SETTINGS['ASYNC_BACKEND_IO']
+    now = TimeManager.get_current_time_as_epoch()
+    result, listing, tag = check_listing(request, backend_io, phase, now)
+    if result is not None:
+        return result
+
+    # Without a version nothing tells when another process created an election
+    cached = listing.version is not None
+    body = SETTINGS['RESPONSE_CACHE'].get_listing(listing, now) if cached else None
+    if body is None:
+        elections = await backend_io.get_elections_in_phase(
+            phase, now, listing.after, listing.limit + 1 if listing.paginated else None, listing.fields)
+        body = listing_body(listing, elections)
+        if cached:
+            SETTINGS['RESPONSE_CACHE'].put_listing(listing, body, await backend_io.get_next_phase_transition(now))
+
+    return etag.with_etag(Response(body, status=200, mimetype='application/json'), tag)
+
+
+@election.route("/api/election/changes", methods=["GET"])
+async def get_election_changes(request):
+    """
+    See /api/election/changes in src/api/election.py
+    """
+    result, since, limit = check_changes(request)
+    if result is not None:
+        return result
+
+    backend_io = SETTINGS['ASYNC_BACKEND_IO']
+    now = TimeManager.get_current_time_as_epoch()
+    try:
+        changes = await backend_io.get_changes(since, now, limit + 1)
+    except NotImplementedError:
+        return httpcode.CHANGE_FEED_NOT_SUPPORTED
+
+    # New elections are sent along so the client doesn't need a request per election,
+    # all of them are retrieved with a single backend call.
+    titles = created_titles(changes[:limit])
+    elections = await backend_io.get_elections_by_titles(titles) if titles else {}
+
+    return json_response(changes_page(changes, since, limit, elections, now))
+
+
+@election.route("/api/election/events", methods=["GET"])
+async def get_election_events(request):
+    """
+    See /api/election/events in src/api/election.py
+    """
+    # Verify the user's provided authentication cookie.
+    if not AuthenticationCookie.is_encrypted_by_registration_server(SETTINGS["SHARED_PASSWORD"], request.cookies):
+        return httpcode.MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
+
+    # The publisher thread wakes the stream up through the event loop rather
+    # than the stream holding a thread while it waits.
+    loop = asyncio.get_event_loop()
+    wakeup = asyncio.Event()
+
+    # Subscribe now rather than when the stream is first read so no event is missed.
+    publisher = SETTINGS['EVENT_PUBLISHER']
+    subscription = publisher.subscribe(on_message=lambda: loop.call_soon_threadsafe(wakeup.set))
+    response = StreamingResponse(_stream_events(subscription, wakeup, publisher.keepalive_interval),
+                                 status=200, mimetype='text/event-stream', on_close=subscription.close)
+    set_event_stream_headers(response)
+    return response
+
+
+async def _stream_events(subscription, wakeup: asyncio.Event, keepalive_interval: float) -> AsyncIterator[str]:
+    try:
+        while not subscription.ended:
+            message = subscription.get_nowait()
+            if message is None:
+                # Only wait if nothing was queued between the check and clearing the flag
+                wakeup.clear()
+                message = subscription.get_nowait()
+            if message is None:
+                if subscription.ended:
+                    break
+                try:
+                    await asyncio.wait_for(wakeup.wait(), keepalive_interval)
+                    continue
+                except asyncio.TimeoutError:
+                    message = KEEPALIVE
+            yield message
+    finally:
+        subscription.close()
@@ -0,0 +1,38 @@
+#
+#  src/async_api/tally.py
+#  Authors:
+#       Samuel Vargas
+
+from src.asgi import AsyncBlueprint, json_response
+from src import etag
+from src.settings import SETTINGS
+from src.worker_pool import run_in_thread
+from src.api.tally_checks import check_tally, check_tally_election, tally_ballots
+
+tally = AsyncBlueprint("tally")
+
+
+@tally.route("/api/election/tally", methods=["GET"])
+async def tally_results_for_given_election(request):
+    """
+    See /api/election/tally in src/api/tally.py
+    """
+    result, election_title = check_tally(request)
+    if result is not None:
+        return result
+
+    # 3) Verify that the election actually exists
+    backend_io = SETTINGS["ASYNC_BACKEND_IO"]
+    election = await backend_io.get_election_by_title(election_title)
+
+    # 4-5) The election is over, the client may already have its results
+    result, tag, cache_control = check_tally_election(request, backend_io, election)
+    if result is not None:
+        return result
+
+    # 6) Request each ballot from the backend (no order is required)
+    all_ballots = await backend_io.get_all_ballots(election_title)
+
+    # 7) Decrypt each ballot and calculate the results, away from the event loop
+    result = await run_in_thread(tally_ballots, election, all_ballots)
+    return etag.with_etag(json_response(result), tag, cache_control)
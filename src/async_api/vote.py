@@ -0,0 +1,200 @@
+#
+#  src/async_api/vote.py
+#  Authors:
+#       Samuel Vargas
+#
+#  The checks and the response bodies are the ones of src/api/vote_checks.py,
+#  only the backend calls differ.
+#
+
+from src.asgi import AsyncBlueprint, StreamingResponse, json_response
+from src import httpcode, pagination
+from src.settings import SETTINGS
+from src.crypto_flow import verify_signature
+from src.worker_pool import run_in_pool, run_in_thread, parallel_map_async
+from src.authentication_cookie import AuthenticationCookie
+from src.time_manager import TimeManager
+from src.api.election_checks import pending_indexes
+from src.api.vote_checks import check_vote, check_vote_election, signed_ballot, new_ballot, encrypt_all, \
+    check_vote_in_bulk, check_bulk_ballots, reject, reject_repeated_voters, accept_ballots, bulk_results, \
+    VOTER_BALLOT_NOT_FOUND, check_ballot_get, decrypt_ballot, check_all_ballots, is_streamed, \
+    check_ballot_page, ballot_decryptor, decrypt_all
+from typing import AsyncIterator, Callable, Dict, Optional
+import asyncio
+import json
+
+vote = AsyncBlueprint("vote")
+
+
+@vote.route("/api/election/vote", methods=["POST"])
+async def election_cast_vote(request):
+    """
+    See /api/election/vote in src/api/vote.py
+    """
+    result, content, ballot = check_vote(request)
+    if result is not None:
+        return result
+
+    # Verify that this election actually exists and that the user has not already
+    # participated in it, both lookups are sent together
+    backend_io = SETTINGS['ASYNC_BACKEND_IO']
+    username = AuthenticationCookie.get_username(request.cookies)
+    election, participated = await asyncio.gather(
+        backend_io.get_election_by_title(ballot['election_title']),
+        _has_participated(username, ballot['election_title']),
+    )
+    result = check_vote_election(election, participated)
+    if result is not None:
+        return result
+
+    # Verify that the user signed their ballot data correctly, ECDSA is pure Python so it's done in another process
+    if not await run_in_pool(verify_signature, signed_ballot(content)):
+        return httpcode.ELECTION_BALLOT_SIGNING_MISMATCH
+
+    # Decrypt the encrypted Fernet key (cached per election) and then encrypt the user's ballot with the Fernet key
+    encrypted = await run_in_thread(encrypt_all, election, [content['ballot']])
+    voter_ballot = new_ballot(content, encrypted[0])
+    await backend_io.create_ballot(election_title=election['election_title'], **voter_ballot)
+
+    await backend_io.register_user_as_participated_in_election(username, ballot['election_title'])
+    SETTINGS['EVENT_PUBLISHER'].ballot_cast(ballot['election_title'])
+
+    return voter_ballot['voter_uuid'], 201
+
+
+async def _has_participated(username: str, election_title: str) -> bool:
+    # The backend may refuse to check an election that doesn't exist, the caller reports that instead
+    try:
+        return await SETTINGS['ASYNC_BACKEND_IO'].has_user_participated_in_election(username, election_title)
+    except ValueError:
+        return False
+
+
+@vote.route("/api/election/vote/bulk", methods=["POST"])
+async def election_cast_votes_in_bulk(request):
+    """
+    See /api/election/vote/bulk in src/api/vote.py
+    """
+    result, election_title, items = check_vote_in_bulk(request)
+    if result is not None:
+        return result
+
+    # Verify that this election actually exists and is still in progress
+    backend_io = SETTINGS['ASYNC_BACKEND_IO']
+    election = await backend_io.get_election_by_title(election_title)
+    result = check_vote_election(election, False)
+    if result is not None:
+        return result
+
+    # Check each ballot, 'results' holds an HttpCode for the rejected ones.
+    results, usernames = check_bulk_ballots(items, election_title)
+
+    # Verify the voters haven't participated yet, every lookup at once
+    pending = pending_indexes(results)
+    reject(results, pending, await asyncio.gather(*(
+        backend_io.has_user_participated_in_election(usernames[index], election_title) for index in pending
+    )), httpcode.ELECTION_VOTER_VOTED_ALREADY)
+
+    # Verify the signatures of the remaining ballots in parallel
+    pending = pending_indexes(results)
+    signed = await parallel_map_async(verify_signature, [signed_ballot(items[index]) for index in pending])
+    reject(results, pending, [not valid for valid in signed], httpcode.ELECTION_BALLOT_SIGNING_MISMATCH)
+    reject_repeated_voters(results, pending, usernames)
+
+    # Encrypt every accepted ballot with the same election key and store them together
+    accepted = pending_indexes(results)
+    ballots = accept_ballots(results, items, usernames, accepted, await run_in_thread(
+        encrypt_all, election, [items[index]['ballot'] for index in accepted]))
+    if ballots:
+        await backend_io.create_ballots(election_title, ballots)
+        SETTINGS['EVENT_PUBLISHER'].ballot_cast(election_title)
+
+    return json_response(bulk_results(results))
+
+
+@vote.route("/api/ballot/get", methods=["GET", "POST"])
+async def get_voter_ballot_by_voter_uuid(request):
+    """
+    See /api/ballot/get in src/api/vote.py
+    """
+    result, voter_uuid = check_ballot_get(request)
+    if result is not None:
+        return result
+
+    # Ask the backend if this voter exists
+    backend_io = SETTINGS['ASYNC_BACKEND_IO']
+    ballot = await backend_io.get_ballot_by_voter_uuid(voter_uuid)
+    if ballot is None:
+        return VOTER_BALLOT_NOT_FOUND
+
+    # Get the corresponding election
+    election = await backend_io.get_election_by_title(ballot['election_title'])
+
+    # If the election has ended, decrypt the users ballot and return
+    # that instead.
+    if not TimeManager.election_in_progress(election["start_date"], election['end_date']):
+        await run_in_thread(decrypt_ballot, ballot, election)
+
+    # Return the found content
+    return json_response(ballot)
+
+
+@vote.route("/api/ballot/all", methods=["GET"])
+async def get_all_ballots_in_election(request):
+    """
+    See /api/ballot/all in src/api/vote.py
+    """
+
+    # 0-2) Verify the cookie and the JSON sent
+    result, election_title = check_all_ballots(request)
+    if result is not None:
+        return result
+
+    # 3) Verify that the election actually exists
+    backend_io = SETTINGS['ASYNC_BACKEND_IO']
+    election = await backend_io.get_election_by_title(election_title)
+    if election is None:
+        return httpcode.ELECTION_NOT_FOUND
+
+    # 4) If the election is over the ballots are sent decrypted, the (RSA) decryption
+    #    of the election's key is done on a thread.
+    decrypt = await run_in_thread(ballot_decryptor, election)
+
+    # 5) In streaming mode the JSON array is written one ballot at a time straight
+    #    from the backend, each ballot is only decrypted right before it's sent.
+    if is_streamed(request):
+        ballots = backend_io.iter_ballots(election_title)
+        return StreamingResponse(_stream_json_array(ballots, decrypt), status=200, mimetype='application/json')
+
+    # 6) Request each ballot from the backend (no order is required), or a single
+    #    page of them ordered by voter_uuid if the client sent 'limit' / 'after'
+    result, limit, after = check_ballot_page(request)
+    if result is not None:
+        return result
+
+    page = None
+    if limit is not None:
+        page = pagination.make_page(await backend_io.get_ballots_page(election_title, after, limit + 1),
+                                    limit, 'voter_uuid')
+        all_ballots = page['items']
+    else:
+        all_ballots = await backend_io.get_all_ballots(election_title)
+
+    # 7) If the election is over, decrypt all ballots.
+    if decrypt is not None:
+        await run_in_thread(decrypt_all, decrypt, all_ballots)
+
+    # 8) Convert it to JSON and return it to the user, indicate 200 for OK
+    return json_response(page if page is not None else all_ballots)
+
+
+async def _stream_json_array(rows: AsyncIterator[Dict], decrypt: Optional[Callable[[str], str]]) -> AsyncIterator[str]:
+    # A single ballot is decrypted inline, Fernet takes microseconds
+    yield '['
+    index = 0
+    async for row in rows:
+        if decrypt is not None:
+            row['ballot'] = decrypt(row['ballot'])
+        yield (',' if index else '') + json.dumps(row)
+        index += 1
+    yield ']'
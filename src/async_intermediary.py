@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+#
+# src/async_intermediary.py
+# Authors:
+#   Samuel Vargas
+#
+# The asyncio counterpart of src/intermediary.py: the same authentication,
+# election, vote and tally routes (src/async_api) as an ASGI application,
+# served by a single event loop instead of a thread per request.
+#
+# The views await an AsyncBackendIO (SETTINGS['ASYNC_BACKEND_IO']):
+#   - AsyncHyperledgerBackendIO is awaited directly, so a request waiting
+#     on the ledger doesn't hold a thread of its own. Its ledger requests
+#     still run on a pool of --pool-size threads (one connection each),
+#     which caps the ledger requests in flight at once. Listings are read
+#     from the ledger every time (there are no versions to cache them by)
+#     and the publisher finds new elections by reading them again every
+#     second while clients listen to /api/election/events
+#   - a synchronous BackendIO is wrapped the same way intermediary.py does
+#     (wrap_backend_io) and run on its own thread by ThreadedBackendIO
+#
+# Signature checks and key generation run on the worker_pool processes,
+# RSA / Fernet work on the default executor, so the event loop only ever
+# parses requests and waits.
+#
+#   python -m src.async_intermediary --db ballotblock.db
+#   python -m src.async_intermediary --hyperledger http://localhost:3000/api/
+#
+# or with any ASGI server, once configure() was called:
+#
+#   uvicorn src.async_intermediary:app
+#
+
+from typing import Union
+from src.interfaces import AsyncBackendIO, BackendIO
+from src.asgi import AsgiApp
+from src.intermediary import wrap_backend_io
+from src.election_phase_index import ElectionPhaseIndex
+from src.threaded_backend_io import ThreadedBackendIO
+from src.response_cache import ResponseCache
+from src.event_publisher import EventPublisher
+from src.settings import SETTINGS
+from src.time_manager import TimeManager
+from src.async_api import authentication, election, vote, tally
+from src import asgi_server, import_benchmark
+import argparse
+import asyncio
+
+# Seconds between two reads of a native AsyncBackendIO for the elections to publish
+_SYNC_INTERVAL = 1.0
+
+app = AsgiApp()
+
+# Register Blueprints
+app.register_blueprint(authentication)
+app.register_blueprint(election)
+app.register_blueprint(vote)
+app.register_blueprint(tally)
+
+
+def configure(backend_io: Union[AsyncBackendIO, BackendIO], shared_password: str = None, url: str = None,
+              port: int = None):
+    """
+    Sets up SETTINGS for serving with 'backend_io', without starting a server.
+    """
+    assert backend_io, "'backend_io' cannot be None"
+
+    SETTINGS['RESPONSE_CACHE'] = ResponseCache()
+
+    if isinstance(backend_io, AsyncBackendIO):
+        SETTINGS['ASYNC_BACKEND_IO'] = backend_io
+
+        # The views have no versions to go by (so listings aren't cached), the
+        # publisher thread keeps an index of its own, read through the event loop.
+        # Other instances may write to the same backend, and the elections this
+        # one creates don't go through the index either, it syncs them.
+        publisher_backend_io = ElectionPhaseIndex(_LoopBackendIO(backend_io), sync_interval=_SYNC_INTERVAL)
+        SETTINGS['EVENT_PUBLISHER'] = EventPublisher(publisher_backend_io, shared=True)
+    else:
+        publisher_backend_io = wrap_backend_io(backend_io)
+        SETTINGS['ASYNC_BACKEND_IO'] = ThreadedBackendIO(publisher_backend_io)
+
+        # Load the election index now, the versions are then answered from memory
+        # on the event loop without touching the backend's thread.
+        publisher_backend_io.get_catalog_version(TimeManager.get_current_time_as_epoch())
+
+        # The publisher thread counts ballots through the event loop, the
+        # synchronous stack is only used for the phase transitions.
+        SETTINGS['EVENT_PUBLISHER'] = EventPublisher(publisher_backend_io, count_ballots=_count_ballots)
+
+    if shared_password:
+        SETTINGS['SHARED_PASSWORD'] = shared_password
+
+    if url:
+        SETTINGS['URL'] = url
+
+    if port:
+        SETTINGS['PORT'] = port
+
+
+def _count_ballots(election_title: str) -> int:
+    # Called on the publisher thread
+    return asyncio.run_coroutine_threadsafe(
+        SETTINGS['ASYNC_BACKEND_IO'].count_ballots(election_title), app.loop).result()
+
+
+class _LoopBackendIO:
+    """
+    The publisher thread's view of an AsyncBackendIO: every coroutine method
+    is run on the app's event loop and waited for. Never call it on the loop.
+    """
+
+    def __init__(self, async_backend_io: AsyncBackendIO):
+        self.async_backend_io = async_backend_io
+
+    def __getattr__(self, item):
+        method = getattr(self.async_backend_io, item)
+        if not asyncio.iscoroutinefunction(method):
+            return method
+
+        def call(*args, **kwargs):
+            return asyncio.run_coroutine_threadsafe(method(*args, **kwargs), app.loop).result()
+        return call
+
+
+def start(backend_io: Union[AsyncBackendIO, BackendIO], shared_password: str = None, url: str = None,
+          port: int = None):
+    """
+    Serves the asyncio API from this process, see src/asgi_server.py
+    """
+    configure(backend_io, shared_password, url, port)
+    import_benchmark.run_in_background()
+    asgi_server.serve(app, SETTINGS['URL'], SETTINGS['PORT'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves the API from a single asyncio event loop")
+    backend = parser.add_mutually_exclusive_group(required=True)
+    backend.add_argument("--db", help="SQLite database file, opened in WAL mode")
+    backend.add_argument("--hyperledger", help="The Composer rest server's api root, e.g. http://localhost:3000/api/")
+    parser.add_argument("--url", default=SETTINGS['URL'])
+    parser.add_argument("--port", type=int, default=SETTINGS['PORT'])
+    parser.add_argument("--shared-password", default=None)
+    parser.add_argument("--pool-size", type=int, default=SETTINGS['HYPERLEDGER_POOL_SIZE'],
+                        help="Ledger requests in flight at once, a thread and a connection each")
+    arguments = parser.parse_args()
+
+    if arguments.db:
+        from src.sqlite import SQLiteBackendIO
+        backend_io = SQLiteBackendIO(arguments.db, journal_mode="wal")
+    else:
+        from src.hyperledger.async_hyperledger_backend_io import AsyncHyperledgerBackendIO
+        backend_io = AsyncHyperledgerBackendIO(arguments.hyperledger, pool_size=arguments.pool_size)
+
+    start(backend_io, arguments.shared_password, arguments.url, arguments.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+#
+# src/caching_backend_io.py
+# Authors:
+#   Samuel Vargas
+#
+# CachingBackendIO wraps any BackendIO (SQLite, Hyperledger, ...) and caches
+# the lookups the API performs several times per request.
+#
+# Elections and ballots are never modified once they're stored so they can
+# be cached until they're evicted. A lookup that found nothing is only cached
+# for a short time (negative_ttl) because the record may be created later,
+# creating a record through this class always invalidates the cached miss.
+#
+# A user having participated in an election is also permanent, but the
+# opposite isn't, so only positive answers are cached for that method.
+#
+
+from typing import Dict, List, NamedTuple, Optional, Sequence
+from collections import OrderedDict
+from src.interfaces.backend_io import BackendIO
+import threading
+import time
+
+
+class CachePolicy(NamedTuple):
+    max_size: int                  # Least recently used entries are evicted past this size
+    negative_ttl: Optional[float]  # Seconds to remember a lookup that found nothing, None to never cache it
+    cache_false: bool = True       # Whether a False result may be cached (for boolean methods)
+
+
+DEFAULT_POLICIES = {
+    "get_election_by_title": CachePolicy(max_size=1024, negative_ttl=2.0),
+    "get_ballot_by_voter_uuid": CachePolicy(max_size=4096, negative_ttl=2.0),
+    "has_user_participated_in_election": CachePolicy(max_size=8192, negative_ttl=None, cache_false=False),
+}
+
+_MISSING = object()
+
+
+class _LRUCache:
+    def __init__(self, policy: CachePolicy):
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()  # key -> (value, expires_at or None)
+
+    def get(self, key):
+        entry = self.__entries.get(key, _MISSING)
+        if entry is not _MISSING:
+            value, expires_at = entry
+            if expires_at is None or expires_at > time.monotonic():
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.__entries[key]
+
+        self.misses += 1
+        return _MISSING
+
+    def put(self, key, value):
+        expires_at = None
+        if value is None or value is False:
+            if value is False and not self.policy.cache_false:
+                return
+            if self.policy.negative_ttl is None:
+                return
+            expires_at = time.monotonic() + self.policy.negative_ttl
+
+        self.__entries[key] = (value, expires_at)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.policy.max_size:
+            self.__entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.__entries.pop(key, None)
+
+    def clear(self):
+        self.__entries.clear()
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+class CachingBackendIO(BackendIO):
+
+    def __init__(self, backend_io: BackendIO, policies: Dict[str, CachePolicy] = None):
+        """
+        :param backend_io: The backend to cache.
+        :param policies: Overrides for DEFAULT_POLICIES, keyed by method name.
+        """
+        super().__init__()
+        self.backend_io = backend_io
+        self.__lock = threading.Lock()
+        self.__caches = {
+            method: _LRUCache(policy)
+            for method, policy in dict(DEFAULT_POLICIES, **(policies or {})).items()
+        }
+
+    def get_cache_stats(self) -> Dict[str, Dict]:
+        """
+        :return: {"method_name": {"hits": 10, "misses": 2, "hit_rate": 0.83, "size": 2}, ...}
+        """
+        with self.__lock:
+            return {
+                method: {
+                    "hits": cache.hits,
+                    "misses": cache.misses,
+                    "hit_rate": cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0.0,
+                    "size": len(cache),
+                }
+                for method, cache in self.__caches.items()
+            }
+
+    def __cached(self, method: str, key, load):
+        cache = self.__caches[method]
+        with self.__lock:
+            value = cache.get(key)
+        if value is not _MISSING:
+            return value
+
+        value = load()
+        with self.__lock:
+            cache.put(key, value)
+        return value
+
+    #
+    # Cached reads, dictionaries are copied because the API modifies them.
+    #
+
+    def get_election_by_title(self, election_title: str) -> Optional[Dict]:
+        election = self.__cached("get_election_by_title", election_title,
+                                 lambda: self.backend_io.get_election_by_title(election_title))
+        return dict(election) if election is not None else None
+
+    def get_elections_by_titles(self, election_titles: Sequence[str]) -> Dict[str, Dict]:
+        # Shares the get_election_by_title cache, only the misses are fetched (in one call).
+        cache = self.__caches["get_election_by_title"]
+        output, missing = {}, []
+        with self.__lock:
+            for election_title in election_titles:
+                election = cache.get(election_title)
+                if election is _MISSING:
+                    missing.append(election_title)
+                elif election is not None:
+                    output[election_title] = election
+
+        if missing:
+            found = self.backend_io.get_elections_by_titles(missing)
+            with self.__lock:
+                for election_title in missing:
+                    cache.put(election_title, found.get(election_title))
+            output.update(found)
+
+        return {election_title: dict(election) for election_title, election in output.items()}
+
+    def get_ballot_by_voter_uuid(self, voter_uuid: str) -> Optional[Dict]:
+        ballot = self.__cached("get_ballot_by_voter_uuid", voter_uuid,
+                               lambda: self.backend_io.get_ballot_by_voter_uuid(voter_uuid))
+        return dict(ballot) if ballot is not None else None
+
+    def has_user_participated_in_election(self, username: str, election_title: str) -> bool:
+        return self.__cached("has_user_participated_in_election", (username, election_title),
+                             lambda: self.backend_io.has_user_participated_in_election(username, election_title))
+
+    #
+    # Writes go straight through to the wrapped backend and invalidate what they affect.
+    #
+
+    def create_election(self, master_ballot: Dict = None, *args, **kwargs):
+        try:
+            return self.backend_io.create_election(master_ballot, *args, **kwargs)
+        finally:
+            with self.__lock:
+                self.__caches["get_election_by_title"].invalidate(master_ballot['election_title'])
+
+    def create_elections(self, elections: Sequence[Dict]):
+        try:
+            return self.backend_io.create_elections(elections)
+        finally:
+            with self.__lock:
+                for election in elections:
+                    self.__caches["get_election_by_title"].invalidate(election['master_ballot']['election_title'])
+
+    def create_ballot(self, ballot: str, *args, **kwargs):
+        try:
+            return self.backend_io.create_ballot(ballot, *args, **kwargs)
+        finally:
+            with self.__lock:
+                self.__caches["get_ballot_by_voter_uuid"].invalidate(kwargs.get('voter_uuid'))
+
+    def create_ballots(self, election_title: str, ballots: Sequence[Dict]):
+        try:
+            return self.backend_io.create_ballots(election_title, ballots)
+        finally:
+            with self.__lock:
+                for ballot in ballots:
+                    self.__caches["get_ballot_by_voter_uuid"].invalidate(ballot['voter_uuid'])
+                    self.__caches["has_user_participated_in_election"].invalidate((ballot['username'], election_title))
+
+    def register_user_as_participated_in_election(self, username: str, election_title: str):
+        result = self.backend_io.register_user_as_participated_in_election(username, election_title)
+        with self.__lock:
+            self.__caches["has_user_participated_in_election"].put((username, election_title), True)
+        return result
+
+    def nuke(self):
+        try:
+            self.backend_io.nuke()
+        finally:
+            with self.__lock:
+                for cache in self.__caches.values():
+                    cache.clear()
+
+    #
+    # Uncached
+    #
+
+    def get_all_ballots(self, election_title) -> List[Dict]:
+        return self.backend_io.get_all_ballots(election_title)
+
+    def iter_ballots(self, election_title: str):
+        return self.backend_io.iter_ballots(election_title)
+
+    def count_ballots(self, election_title: str) -> int:
+        return self.backend_io.count_ballots(election_title)
+
+    def get_ballots_page(self, election_title: str, after_voter_uuid: str = None, limit: int = None) -> List[Dict]:
+        return self.backend_io.get_ballots_page(election_title, after_voter_uuid, limit)
+
+    def get_all_elections(self) -> List[Dict]:
+        return self.backend_io.get_all_elections()
+
+    def get_elections_page(self, after_election_title: str = None, limit: int = None) -> List[Dict]:
+        return self.backend_io.get_elections_page(after_election_title, limit)
+
+    def get_elections_in_phase(self, phase, now: int, after_election_title: str = None,
+                               limit: int = None, fields: Sequence[str] = None) -> List[Dict]:
+        return self.backend_io.get_elections_in_phase(phase, now, after_election_title, limit, fields)
+
+    def search_elections(self, query: str, offset: int = 0, limit: int = None,
+                         fields: Sequence[str] = None) -> List[Dict]:
+        return self.backend_io.search_elections(query, offset, limit, fields)
+
+    def get_next_phase_transition(self, now: int) -> Optional[int]:
+        return self.backend_io.get_next_phase_transition(now)
+
+    def get_catalog_version(self, now: int) -> Optional[str]:
+        return self.backend_io.get_catalog_version(now)
+
+    def get_election_version(self, election_title: str) -> Optional[str]:
+        return self.backend_io.get_election_version(election_title)
+
+    def get_changes(self, since: int, now: int, limit: int = None) -> List[Dict]:
+        return self.backend_io.get_changes(since, now, limit)
+
+    def __getattr__(self, item):
+        # Backend specific extras like ElectionPhaseIndex.add_listener() or SQLiteBackendIO.close()
+        if item == 'backend_io':
+            raise AttributeError(item)
+        return getattr(self.backend_io, item)
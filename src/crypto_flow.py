@@ -6,9 +6,9 @@
 #
 
 import base64
-from ecdsa import SigningKey, VerifyingKey, BadSignatureError
-from typing import Dict
-from src.crypto_suite import ECDSAKeyPair, RSAKeyPair, FernetCrypt, ECDSA_CURVE
+from functools import lru_cache
+from typing import Callable, Dict, Tuple
+from src.crypto_suite import ECDSAKeyPair, RSAKeyPair, FernetCrypt, get_ecdsa_curve
 
 
 class CryptoFlow:
@@ -40,12 +40,32 @@ class CryptoFlow:
         fernet_crypt = FernetCrypt(use_fernet_key_bytes=decrypted_fernet_key)
         return fernet_crypt.encrypt_to_b64(ballot_str.encode('utf-8')).decode('utf-8')
 
+    @staticmethod
+    def get_ballot_encryptor(
+            rsa_public_key_b64: str = None,
+            rsa_private_key_b64: str = None,
+            encrypted_fernet_key: str = None) -> Callable[[str], str]:
+        """
+        Returns a function that encrypts a single ballot string the same way as
+        encrypt_vote_with_election_creator_rsa_keys_and_encrypted_fernet_key.
+
+        The fernet key is only decrypted (the slow RSA part) the first time an
+        election's keys are seen, the result is cached for the following calls.
+        """
+        fernet = _get_election_fernet(rsa_public_key_b64, rsa_private_key_b64, encrypted_fernet_key)
+
+        def encrypt(ballot_str: str) -> str:
+            return fernet.encrypt_to_b64(ballot_str.encode('utf-8')).decode('utf-8')
+
+        return encrypt
+
     @staticmethod
     def verify_data_is_signed_ecdsa(
             data: bytes = None,
             string_signature_b64: bytes = None,
             user_public_key_ecdsa_b64: bytes = None) -> bool:
-        public_key = VerifyingKey.from_string(base64.b64decode(user_public_key_ecdsa_b64), curve=ECDSA_CURVE)
+        from ecdsa import VerifyingKey, BadSignatureError
+        public_key = VerifyingKey.from_string(base64.b64decode(user_public_key_ecdsa_b64), curve=get_ecdsa_curve())
         try:
             public_key.verify(base64.b64decode(string_signature_b64), data.encode('utf-8'))
         except BadSignatureError:
@@ -60,6 +80,23 @@ class CryptoFlow:
             election_rsa_private_key_b64: str = None,
             election_encrypted_fernet_key_b64: str = None) -> str:
 
+        return CryptoFlow.get_ballot_decryptor(
+            election_rsa_public_key_b64=election_rsa_public_key_b64,
+            election_rsa_private_key_b64=election_rsa_private_key_b64,
+            election_encrypted_fernet_key_b64=election_encrypted_fernet_key_b64
+        )(encrypted_ballot_str)
+
+    @staticmethod
+    def get_ballot_decryptor(
+            election_rsa_public_key_b64: str = None,
+            election_rsa_private_key_b64: str = None,
+            election_encrypted_fernet_key_b64: str = None) -> Callable[[str], str]:
+        """
+        Decrypts the election's fernet key once and returns a function that decrypts
+        a single encrypted ballot string with it. Prefer this over decrypt_ballot when
+        decrypting many ballots from the same election, the RSA decryption is the slow part.
+        """
+
         election_rsa = RSAKeyPair(
             use_public_pkcs1_b64_key=election_rsa_public_key_b64,
             use_private_pkcs1_b64_key=election_rsa_private_key_b64,
@@ -67,4 +104,36 @@ class CryptoFlow:
 
         decrypted_fernet_key = election_rsa.decrypt_b64_to_bytes(election_encrypted_fernet_key_b64.encode('utf-8'))
         fernet = FernetCrypt(decrypted_fernet_key)
-        return fernet.decrypt_b64_to_bytes(encrypted_ballot_str.encode('utf-8')).decode('utf-8')
+
+        def decrypt(encrypted_ballot_str: str) -> str:
+            return fernet.decrypt_b64_to_bytes(encrypted_ballot_str.encode('utf-8')).decode('utf-8')
+
+        return decrypt
+
+
+@lru_cache(maxsize=64)
+def _get_election_fernet(rsa_public_key_b64: str, rsa_private_key_b64: str, encrypted_fernet_key: str) -> FernetCrypt:
+    election_rsa = RSAKeyPair(
+        use_public_pkcs1_b64_key=rsa_public_key_b64,
+        use_private_pkcs1_b64_key=rsa_private_key_b64
+    )
+    return FernetCrypt(use_fernet_key_bytes=election_rsa.decrypt_b64_to_bytes(encrypted_fernet_key.encode('utf-8')))
+
+
+def verify_signature(item: Tuple[str, str, str]) -> bool:
+    """
+    verify_data_is_signed_ecdsa for worker_pool.parallel_map, 'item' is (data, signature_b64, public_key_b64).
+    A malformed key / signature counts as a bad signature.
+    """
+    data, signature_b64, public_key_b64 = item
+    try:
+        return CryptoFlow.verify_data_is_signed_ecdsa(data, signature_b64, public_key_b64)
+    except (ValueError, AssertionError, TypeError):
+        return False
+
+
+def generate_election_keys(_=None) -> Dict:
+    """
+    generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict for worker_pool.parallel_map.
+    """
+    return CryptoFlow.generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict()
@@ -5,19 +5,32 @@
 #   Samuel Vargas
 #
 
-from typing import NamedTuple
-from ecdsa import SigningKey, VerifyingKey
-from cryptography.fernet import Fernet
+from typing import NamedTuple, TYPE_CHECKING
 import base64
-import ecdsa
-import rsa
 import os
 
-ECDSA_CURVE = ecdsa.SECP256k1
+# ecdsa, rsa and cryptography are imported by the first key that needs them
+# rather than here, so importing the API (a worker process, a test) doesn't
+# load all three. ECDSA_CURVE is looked up the same way (see __getattr__).
+
+if TYPE_CHECKING:
+    from ecdsa import SigningKey, VerifyingKey
+
+
+def get_ecdsa_curve():
+    from ecdsa import SECP256k1
+    return SECP256k1
+
+
+def __getattr__(name: str):
+    if name == "ECDSA_CURVE":
+        return get_ecdsa_curve()
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
 
 
 class FernetCrypt:
     def __init__(self, use_fernet_key_bytes: bytes = None):
+        from cryptography.fernet import Fernet
         if use_fernet_key_bytes is not None:
             self.__key = use_fernet_key_bytes
         else:
@@ -41,6 +54,7 @@ class RSAKeyPair:
     def __init__(self, use_public_pkcs1_b64_key: bytes = None,
                  use_private_pkcs1_b64_key: bytes = None,
                  AES_KEY_SIZE=2048):
+        import rsa
         if (bool(use_public_pkcs1_b64_key) and not bool(use_private_pkcs1_b64_key)) \
                 or (not bool(use_public_pkcs1_b64_key) and bool(use_private_pkcs1_b64_key)):
             raise ValueError("Provide a RSA public private key string pair for both parameters.")
@@ -60,23 +74,26 @@ class RSAKeyPair:
         return base64.b64encode(self.__private.save_pkcs1())
 
     def encrypt_message_as_b64(self, data: bytes):
+        import rsa
         return base64.b64encode(rsa.encrypt(data, self.__public))
 
     def decrypt_b64_to_bytes(self, ciphertext_b64: bytes) -> bytes:
+        import rsa
         return rsa.decrypt(base64.b64decode(ciphertext_b64), self.__private)
 
 class ECDSAKeyPair:
     def __init__(self, use_private_key_b64: bytes = None):
+        from ecdsa import SigningKey
         if use_private_key_b64:
-            self.__private = SigningKey.from_string(base64.b64decode(use_private_key_b64), curve=ECDSA_CURVE)
+            self.__private = SigningKey.from_string(base64.b64decode(use_private_key_b64), curve=get_ecdsa_curve())
         else:
-            self.__private = SigningKey.generate(curve=ECDSA_CURVE)
+            self.__private = SigningKey.generate(curve=get_ecdsa_curve())
         self.__public = self.__private.get_verifying_key()
 
-    def get_public_key(self) -> VerifyingKey:
+    def get_public_key(self) -> 'VerifyingKey':
         return self.__public
 
-    def get_private_key(self) -> SigningKey:
+    def get_private_key(self) -> 'SigningKey':
         return self.__private
 
     def get_public_key_b64(self) -> bytes:
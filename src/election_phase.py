@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+#
+# src/election_phase.py
+# Authors:
+#   Samuel Vargas
+#
+
+from enum import Enum, unique
+
+
+@unique
+class ElectionPhase(Enum):
+    past = "past"          # now > end_date, the election_private_key is public.
+    present = "present"    # start_date <= now <= end_date
+    future = "future"      # now < start_date
+
+
+# Recorded in the change feed and passed to ElectionPhaseIndex listeners
+ELECTION_CREATED = "election_created"
+ELECTION_OPENED = "election_opened"   # now reached start_date
+ELECTION_CLOSED = "election_closed"   # now passed end_date
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+#
+# src/election_phase_index.py
+# Authors:
+#   Samuel Vargas
+#
+# ElectionPhaseIndex wraps any BackendIO and keeps every election in an
+# in-memory past / present / future bucket so that the listing endpoints
+# don't have to scan all elections on each request.
+#
+# Each bucket is a sorted list of election titles (so keyset pagination is a
+# bisect + slice). Elections move between buckets as the wall-clock crosses
+# their start / end dates, the pending moves are kept in a heap ordered by
+# the time they happen and are applied lazily whenever the index is read
+# (or when advance() is called explicitly).
+#
+# If the wrapped backend can't search (search_elections raises
+# NotImplementedError) an ElectionSearchIndex is built from the same
+# in-memory elections and kept up to date as elections are created.
+#
+# When several processes share one backend (src/prefork_server.py) each
+# has its own index, pass 'sync_interval' so that every so many seconds
+# a read first picks up the elections created by the other processes
+# from the backend's change feed (get_changes), or by reading every
+# election again (get_elections_page) if the backend keeps no change feed.
+# The listeners are told about those elections too (ELECTION_CREATED) on
+# the read that syncs them.
+#
+# The versions (ETags) are derived from the indexed elections themselves
+# rather than a per-process counter, so every process that has synced the
+# same elections answers with the same version and any of them can reply
+# 304 Not Modified to a tag another one issued.
+#
+
+from typing import Callable, Dict, List, Optional, Sequence
+from bisect import bisect_left, bisect_right, insort
+from src.interfaces.backend_io import BackendIO
+from src.election_phase import ElectionPhase, ELECTION_CREATED, ELECTION_OPENED, ELECTION_CLOSED
+from src.time_manager import TimeManager
+from src.fieldsets import ELECTION_FIELDS, PUBLIC_ELECTION_FIELDS
+from src.election_search_index import ElectionSearchIndex
+import hashlib
+import heapq
+import threading
+import time
+
+# Changes read from the backend's change feed per request while syncing
+_SYNC_PAGE_SIZE = 500
+
+# An election only ever moves forward through the phases, so for the same elections
+# the sum of their phases tells two points in time apart.
+_PHASE_ORDER = {ElectionPhase.future: 0, ElectionPhase.present: 1, ElectionPhase.past: 2}
+
+
+class ElectionPhaseIndex(BackendIO):
+
+    def __init__(self, backend_io: BackendIO, sync_interval: float = None):
+        """
+        :param backend_io: The backend to index.
+        :param sync_interval: Seconds between two reads of the backend's change feed (or of every election
+                              without one) for elections created by other processes, None if this process
+                              is the only writer.
+        """
+        super().__init__()
+        self.backend_io = backend_io
+        self.sync_interval = sync_interval
+        self.__lock = threading.RLock()
+        self.__listeners = []
+        self.__backend_can_search = True
+        self.__has_change_feed = True
+        self.__reset(seeded=False)
+
+    def __reset(self, seeded: bool):
+        self.__seeded = seeded
+        self.__now = None
+        self.__elections = {}    # election_title -> election dict
+        self.__versions = {}     # election_title -> _election_digest of the election
+        self.__catalog_digest = 0  # XOR of every election's digest
+        self.__phase_sum = 0     # sum of _PHASE_ORDER over every election, only ever grows
+        self.__windows = {}      # election_title -> ElectionWindow
+        self.__phases = {}       # election_title -> ElectionPhase
+        self.__buckets = {phase: [] for phase in ElectionPhase}
+        self.__transitions = []  # heap of (epoch, election_title)
+        self.__search_index = None
+        self.__change_seq = 0    # last change of the backend's change feed that was synced
+        self.__synced_at = None  # time.monotonic() of the last sync
+        self.__synced_events = []  # ELECTION_CREATED of the synced elections, returned by the next __advance
+
+    def add_listener(self, listener: Callable[[str, Dict], None]):
+        """
+        'listener' is called with (event, election) whenever an election is created,
+        opens or closes. 'event' is one of ELECTION_CREATED, ELECTION_OPENED or ELECTION_CLOSED.
+
+        Listeners are called on whichever thread triggered the change and must not block.
+        """
+        self.__listeners.append(listener)
+
+    def advance(self, now: int = None):
+        """
+        Moves every election whose start / end date is <= 'now' to its new bucket
+        and notifies the listeners. 'now' defaults to the current time.
+        """
+        if now is None:
+            now = TimeManager.get_current_time_as_epoch()
+
+        with self.__lock:
+            self.__seed()
+            events = self.__advance(now)
+
+        self.__notify(events)
+
+    def get_next_phase_transition(self, now: int) -> Optional[int]:
+        with self.__lock:
+            self.__seed()
+            if self.__now is not None and now < self.__now:
+                return self.backend_io.get_next_phase_transition(now)
+            events = self.__advance(now)
+            transition = self.__transitions[0][0] if self.__transitions else None
+
+        self.__notify(events)
+        return transition
+
+    def get_catalog_version(self, now: int) -> Optional[str]:
+        with self.__lock:
+            self.__seed()
+            if self.__now is not None and now < self.__now:
+                return None
+            events = self.__advance(now)
+            version = "{0}.{1:016x}.{2}".format(len(self.__elections), self.__catalog_digest, self.__phase_sum)
+
+        self.__notify(events)
+        return version
+
+    def get_election_version(self, election_title: str) -> Optional[str]:
+        with self.__lock:
+            self.__seed()
+            if election_title not in self.__versions:
+                return None
+            return "{0:016x}".format(self.__versions[election_title])
+
+    #
+    # BackendIO
+    #
+
+    def create_election(self, master_ballot: Dict = None, *args, **kwargs):
+        self.backend_io.create_election(master_ballot, *args, **kwargs)
+        election = self.backend_io.get_election_by_title(master_ballot['election_title'])
+
+        events = []
+        with self.__lock:
+            if self.__seeded:
+                events = self.__advance(TimeManager.get_current_time_as_epoch())
+                self.__add(election, self.__now)
+
+        self.__notify([(ELECTION_CREATED, election)] + events)
+
+    def create_elections(self, elections: Sequence[Dict]):
+        self.backend_io.create_elections(elections)
+        created = self.backend_io.get_elections_by_titles(
+            [election['master_ballot']['election_title'] for election in elections])
+
+        events = []
+        with self.__lock:
+            if self.__seeded:
+                events = self.__advance(TimeManager.get_current_time_as_epoch())
+                for election in created.values():
+                    self.__add(election, self.__now)
+
+        self.__notify([(ELECTION_CREATED, election) for election in created.values()] + events)
+
+    def get_elections_in_phase(self, phase: ElectionPhase, now: int,
+                               after_election_title: str = None,
+                               limit: int = None,
+                               fields: Sequence[str] = None) -> List[Dict]:
+        with self.__lock:
+            self.__seed()
+
+            # The buckets only ever move forward in time.
+            if self.__now is not None and now < self.__now:
+                return self.backend_io.get_elections_in_phase(phase, now, after_election_title, limit, fields)
+
+            events = self.__advance(now)
+            bucket = self.__buckets[phase]
+            start = 0 if after_election_title is None else bisect_right(bucket, after_election_title)
+            titles = bucket[start:] if limit is None else bucket[start:start + limit]
+
+            if fields is None:
+                fields = ELECTION_FIELDS
+            if phase != ElectionPhase.past:
+                fields = [field for field in fields if field != 'election_private_key']
+
+            output = []
+            for election_title in titles:
+                election = self.__elections[election_title]
+                output.append({field: election[field] for field in fields})
+
+        self.__notify(events)
+        return output
+
+    def search_elections(self, query: str, offset: int = 0, limit: int = None,
+                         fields: Sequence[str] = None) -> List[Dict]:
+        if self.__backend_can_search:
+            try:
+                return self.backend_io.search_elections(query, offset, limit, fields)
+            except NotImplementedError:
+                self.__backend_can_search = False
+
+        with self.__lock:
+            self.__seed()
+            if self.__search_index is None:
+                self.__search_index = ElectionSearchIndex()
+                for election in self.__elections.values():
+                    self.__search_index.add(election)
+
+            if fields is None:
+                fields = PUBLIC_ELECTION_FIELDS
+            fields = [field for field in fields if field != 'election_private_key']
+            return [
+                {field: self.__elections[election_title][field] for field in fields}
+                for election_title in self.__search_index.search(query, offset, limit)
+            ]
+
+    def nuke(self):
+        self.backend_io.nuke()
+        with self.__lock:
+            self.__reset(seeded=True)
+
+    # Everything else is read straight from the wrapped backend.
+
+    def create_ballot(self, ballot: str, *args, **kwargs):
+        return self.backend_io.create_ballot(ballot, *args, **kwargs)
+
+    def create_ballots(self, election_title: str, ballots: Sequence[Dict]):
+        return self.backend_io.create_ballots(election_title, ballots)
+
+    def get_election_by_title(self, election_title: str) -> Optional[Dict]:
+        return self.backend_io.get_election_by_title(election_title)
+
+    def get_elections_by_titles(self, election_titles: Sequence[str]) -> Dict[str, Dict]:
+        return self.backend_io.get_elections_by_titles(election_titles)
+
+    def get_ballot_by_voter_uuid(self, voter_uuid: str) -> Optional[Dict]:
+        return self.backend_io.get_ballot_by_voter_uuid(voter_uuid)
+
+    def register_user_as_participated_in_election(self, username: str, election_title: str):
+        return self.backend_io.register_user_as_participated_in_election(username, election_title)
+
+    def has_user_participated_in_election(self, username: str, election_title: str) -> bool:
+        return self.backend_io.has_user_participated_in_election(username, election_title)
+
+    def get_all_ballots(self, election_title) -> List[Dict]:
+        return self.backend_io.get_all_ballots(election_title)
+
+    def iter_ballots(self, election_title: str):
+        return self.backend_io.iter_ballots(election_title)
+
+    def count_ballots(self, election_title: str) -> int:
+        return self.backend_io.count_ballots(election_title)
+
+    def get_ballots_page(self, election_title: str, after_voter_uuid: str = None, limit: int = None) -> List[Dict]:
+        return self.backend_io.get_ballots_page(election_title, after_voter_uuid, limit)
+
+    def get_all_elections(self) -> List[Dict]:
+        return self.backend_io.get_all_elections()
+
+    def get_elections_page(self, after_election_title: str = None, limit: int = None) -> List[Dict]:
+        return self.backend_io.get_elections_page(after_election_title, limit)
+
+    def get_changes(self, since: int, now: int, limit: int = None) -> List[Dict]:
+        return self.backend_io.get_changes(since, now, limit)
+
+    def __getattr__(self, item):
+        # Backend specific extras like SQLiteBackendIO.close()
+        if item == 'backend_io':
+            raise AttributeError(item)
+        return getattr(self.backend_io, item)
+
+    #
+    # Internals, the caller must hold self.__lock
+    #
+
+    def __seed(self):
+        if self.__seeded:
+            self.__sync()
+            return
+
+        now = TimeManager.get_current_time_as_epoch()
+        for election in self.backend_io.get_all_elections():
+            self.__add(election, now)
+        self.__seeded = True
+        self.__now = now
+        self.__sync()
+
+    def __sync(self):
+        if self.sync_interval is None:
+            return
+        if self.__synced_at is not None and time.monotonic() - self.__synced_at < self.sync_interval:
+            return
+        self.__synced_at = time.monotonic()
+
+        now = TimeManager.get_current_time_as_epoch()
+        if not self.__has_change_feed:
+            self.__sync_elections(now)
+            return
+
+        created = []
+        while True:
+            try:
+                changes = self.backend_io.get_changes(self.__change_seq, now, _SYNC_PAGE_SIZE)
+            except NotImplementedError:
+                self.__has_change_feed = False
+                self.__sync_elections(now)
+                return
+            for change in changes:
+                self.__change_seq = change['seq']
+                if change['event'] == ELECTION_CREATED and change['election_title'] not in self.__elections:
+                    created.append(change['election_title'])
+            if len(changes) < _SYNC_PAGE_SIZE:
+                break
+
+        if not created:
+            return
+
+        # Added as of the index's time, reading it moves them along like any other election
+        for election in self.backend_io.get_elections_by_titles(created).values():
+            self.__add(election, self.__now if self.__now is not None else now)
+            self.__synced_events.append((ELECTION_CREATED, election))
+
+    def __sync_elections(self, now: int):
+        # No change feed to follow, every election is read again to find the new ones
+        after_election_title = None
+        while True:
+            elections = self.backend_io.get_elections_page(after_election_title, _SYNC_PAGE_SIZE)
+            for election in elections:
+                if election['election_title'] not in self.__elections:
+                    self.__add(election, self.__now if self.__now is not None else now)
+                    self.__synced_events.append((ELECTION_CREATED, election))
+            if len(elections) < _SYNC_PAGE_SIZE:
+                return
+            after_election_title = elections[-1]['election_title']
+
+    def __add(self, election: Dict, now: int):
+        election_title = election['election_title']
+        if election_title in self.__elections:
+            _remove_sorted(self.__buckets[self.__phases[election_title]], election_title)
+            self.__catalog_digest ^= self.__versions[election_title]
+            self.__phase_sum -= _PHASE_ORDER[self.__phases[election_title]]
+
+        digest = _election_digest(election)
+        self.__versions[election_title] = digest
+        self.__catalog_digest ^= digest
+
+        window = TimeManager.get_election_window(election['start_date'], election['end_date'])
+        phase = window.phase(now)
+        self.__elections[election_title] = election
+        if self.__search_index is not None:
+            self.__search_index.add(election)
+        self.__windows[election_title] = window
+        self.__phases[election_title] = phase
+        self.__phase_sum += _PHASE_ORDER[phase]
+        insort(self.__buckets[phase], election_title)
+
+        if phase == ElectionPhase.future:
+            heapq.heappush(self.__transitions, (window.start, election_title))
+        elif phase == ElectionPhase.present:
+            heapq.heappush(self.__transitions, (window.end + 1, election_title))
+
+    def __advance(self, now: int) -> List:
+        events, self.__synced_events = self.__synced_events, []
+        while self.__transitions and self.__transitions[0][0] <= now:
+            _, election_title = heapq.heappop(self.__transitions)
+
+            # Stale entry, the election was deleted or replaced.
+            if election_title not in self.__elections:
+                continue
+
+            old_phase = self.__phases[election_title]
+            window = self.__windows[election_title]
+            new_phase = window.phase(now)
+            if new_phase == old_phase:
+                continue
+
+            _remove_sorted(self.__buckets[old_phase], election_title)
+            insort(self.__buckets[new_phase], election_title)
+            self.__phases[election_title] = new_phase
+            self.__phase_sum += _PHASE_ORDER[new_phase] - _PHASE_ORDER[old_phase]
+
+            election = self.__elections[election_title]
+            if new_phase == ElectionPhase.present:
+                heapq.heappush(self.__transitions, (window.end + 1, election_title))
+                events.append((ELECTION_OPENED, election))
+            else:
+                # A future election may skip the present bucket entirely if it
+                # both started and ended since the index was last read.
+                if old_phase == ElectionPhase.future:
+                    events.append((ELECTION_OPENED, election))
+                events.append((ELECTION_CLOSED, election))
+
+        if self.__now is None or now > self.__now:
+            self.__now = now
+        return events
+
+    def __notify(self, events: List):
+        for event, election in events:
+            for listener in self.__listeners:
+                listener(event, election)
+
+
+def _remove_sorted(bucket: List[str], election_title: str):
+    del bucket[bisect_left(bucket, election_title)]
+
+
+def _election_digest(election: Dict) -> int:
+    # The election key pair is generated per election, a recreated election gets a new digest
+    identity = "\0".join(election[key] for key in ('election_title', 'start_date', 'end_date', 'election_public_key'))
+    return int.from_bytes(hashlib.sha1(identity.encode('utf-8')).digest()[:8], 'big')
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+#
+# src/election_search_index.py
+# Authors:
+#   Samuel Vargas
+#
+# In-memory inverted index over the election titles and descriptions,
+# used by ElectionPhaseIndex to answer search_elections for backends
+# that can't search themselves (SQLiteBackendIO uses FTS5 instead).
+#
+# Every word of a query has to match the start of a word in the title or
+# the description ("pres elec" matches "Presidential Election"). Matches
+# are ranked by how often the words appear, title matches count more
+# than description matches and whole words more than prefixes.
+#
+
+from typing import Dict, List
+from bisect import bisect_left
+import re
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+PREFIX_PENALTY = 0.5
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+class ElectionSearchIndex:
+
+    def __init__(self):
+        self.__postings = {}  # word -> {election_title: score}
+        self.__words = []     # sorted list of every word, for prefix lookups
+
+    def add(self, election: Dict):
+        election_title = election['election_title']
+        for text, weight in ((election_title, TITLE_WEIGHT), (election['description'], DESCRIPTION_WEIGHT)):
+            for word in tokenize(text):
+                postings = self.__postings.get(word)
+                if postings is None:
+                    postings = self.__postings[word] = {}
+                    self.__words.insert(bisect_left(self.__words, word), word)
+                postings[election_title] = postings.get(election_title, 0.0) + weight
+
+    def clear(self):
+        self.__postings.clear()
+        self.__words.clear()
+
+    def search(self, query: str, offset: int = 0, limit: int = None) -> List[str]:
+        """
+        :return: The titles of the matching elections, best match first
+                 (ties are ordered by title), skipping the first 'offset'.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        scores = None
+        for term in terms:
+            term_scores = self.__match(term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {title: scores[title] + score for title, score in term_scores.items() if title in scores}
+            if not scores:
+                return []
+
+        ranked = sorted(scores, key=lambda title: (-scores[title], title))
+        return ranked[offset:] if limit is None else ranked[offset:offset + limit]
+
+    def __match(self, term: str) -> Dict[str, float]:
+        scores = {}
+        start = bisect_left(self.__words, term)
+        for word in self.__words[start:]:
+            if not word.startswith(term):
+                break
+            factor = 1.0 if word == term else PREFIX_PENALTY
+            for election_title, score in self.__postings[word].items():
+                scores[election_title] = scores.get(election_title, 0.0) + score * factor
+        return scores
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+#
+# src/etag.py
+# Authors:
+#   Samuel Vargas
+#
+# Helpers for answering conditional GET requests (If-None-Match) with 304 Not Modified.
+# The ETags are built from the versions kept by the BackendIO layer
+# (see BackendIO.get_catalog_version / get_election_version) so checking them
+# never requires reading from storage or serializing a response.
+#
+
+from typing import Optional
+from flask import Response, request
+
+# Results of a closed election can never change, but /api/election/tally is the same
+# URL for every election (the title is in the body), so a client may keep them only
+# as long as it revalidates with the ETag every time.
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(version: Optional[str], *variant) -> Optional[str]:
+    """
+    :param version: A version returned by the BackendIO, None if the backend doesn't keep one.
+    :param variant: Anything else that changes the representation for the same version.
+    :return: A strong (unquoted) ETag or None if version is None.
+    """
+    if version is None:
+        return None
+    return "-".join([version] + [str(part) for part in variant])
+
+
+def is_not_modified(etag: Optional[str], current_request=None) -> bool:
+    """
+    :param current_request: The request to check, Flask's current request if None.
+    """
+    if current_request is None:
+        current_request = request
+    return etag is not None and current_request.if_none_match.contains(etag)
+
+
+def not_modified(etag: str, cache_control: str = None) -> Response:
+    return with_etag(Response(status=304), etag, cache_control)
+
+
+def with_etag(response: Response, etag: Optional[str], cache_control: str = None) -> Response:
+    if etag is not None:
+        response.set_etag(etag)
+    if cache_control is not None:
+        response.headers['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+#
+# src/event_publisher.py
+# Authors:
+#   Samuel Vargas
+#
+# EventPublisher pushes election created / opened / closed events and
+# turnout counters to every client subscribed to /api/election/events
+# (server-sent events).
+#
+# There is a single publisher per process. Each event is serialized once
+# and the same string is queued for every subscriber, so the cost of an
+# event doesn't depend on how many clients are listening. A single
+# background thread wakes up when the next election opens / closes
+# (ElectionPhaseIndex.advance emits the events) and when a turnout update
+# is due. Turnout is throttled to one update per election per
+# 'turnout_interval' no matter how many ballots are cast. If reading the
+# backend fails the error is logged and the thread tries again, waiting
+# longer after each failure in a row (up to 'max_sleep').
+#
+# When other processes write to the same backend (shared=True) the ballots
+# they take aren't seen by ballot_cast, the publisher then also counts the
+# ballots of every open election each 'turnout_interval' and publishes the
+# counts that changed.
+#
+# Subscribers that don't keep up are disconnected rather than slowing down
+# the publisher, EventSource clients reconnect on their own and can use
+# /api/election/changes to catch up on what they missed.
+#
+
+from typing import Callable, Dict, Optional
+from src.interfaces.backend_io import BackendIO
+from src.election_phase import ElectionPhase, ELECTION_CREATED
+from src.time_manager import TimeManager
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+
+TURNOUT = "turnout"
+
+# Seconds the publisher thread waits after poll() first fails, doubled for every failure in a row
+_RETRY_DELAY = 0.5
+
+# Fields of an election sent along with the created / opened / closed events
+_ELECTION_EVENT_FIELDS = ("election_title", "description", "start_date", "end_date")
+
+
+class Subscription:
+
+    def __init__(self, publisher: 'EventPublisher', max_queued: int, on_message: Callable[[], None] = None):
+        self.__publisher = publisher
+        self.__queue = queue.Queue(max_queued)
+        self.__on_message = on_message
+        self.overflowed = False
+        self.stopped = False    # the publisher stopped, nothing more will be queued
+
+    @property
+    def ended(self) -> bool:
+        """
+        :return: True once the stream should end, the subscriber fell behind or the publisher stopped.
+        """
+        return self.overflowed or self.stopped
+
+    def get(self, timeout: float) -> Optional[str]:
+        """
+        :return: The next message formatted as a server-sent event,
+                 None if nothing was published within 'timeout' seconds.
+        """
+        try:
+            return self.__queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_nowait(self) -> Optional[str]:
+        """
+        :return: The next message, None if there's none queued.
+        """
+        try:
+            return self.__queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def put(self, message: str):
+        try:
+            self.__queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+            self.close()
+        if self.__on_message is not None:
+            self.__on_message()
+
+    def stop(self):
+        self.stopped = True
+        self.close()
+        # Wakes up get() right away, a full queue already does
+        try:
+            self.__queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.__on_message is not None:
+            self.__on_message()
+
+    def close(self):
+        self.__publisher.unsubscribe(self)
+
+
+class EventPublisher:
+
+    def __init__(self, backend_io: BackendIO,
+                 turnout_interval: float = 2.0,
+                 keepalive_interval: float = 15.0,
+                 max_queued: int = 256,
+                 max_sleep: float = 60.0,
+                 autostart: bool = True,
+                 count_ballots: Callable[[str], int] = None,
+                 shared: bool = False):
+        """
+        :param backend_io: Phase transitions are only published if the backend is (or wraps)
+                           an ElectionPhaseIndex, turnout is published for any backend.
+        :param turnout_interval: Minimum seconds between two turnout updates of the same election.
+        :param keepalive_interval: Seconds of silence after which a comment is sent to keep the connection open.
+        :param max_queued: Messages a subscriber may fall behind before it's disconnected.
+        :param max_sleep: Upper bound on how long the publisher thread sleeps between polls.
+        :param autostart: Start the publisher thread when the first client subscribes,
+                          tests pass False and call poll() themselves.
+        :param count_ballots: Counts an election's ballots for the turnout updates (on the publisher
+                              thread), backend_io.count_ballots if None.
+        :param shared: Other processes cast ballots on the same backend, count the ballots
+                       of every open election rather than only those voted on here.
+        """
+        self.backend_io = backend_io
+        self.turnout_interval = turnout_interval
+        self.keepalive_interval = keepalive_interval
+        self.max_queued = max_queued
+        self.max_sleep = max_sleep
+        self.autostart = autostart
+        self.count_ballots = count_ballots or backend_io.count_ballots
+        self.shared = shared
+
+        self.__lock = threading.Lock()
+        self.__subscribers = set()
+        self.__ids = itertools.count(1)
+        self.__pending_turnout = set()
+        self.__next_turnout = 0.0
+        self.__ballot_counts = {}  # open election_title -> last ballot count, shared only
+        self.__thread = None
+        self.__wake = threading.Event()
+        self.__stopped = threading.Event()
+
+        # ElectionPhaseIndex (or a wrapper around it) emits the phase events
+        self.__advance = getattr(backend_io, 'advance', None)
+        add_listener = getattr(backend_io, 'add_listener', None)
+        if add_listener is not None:
+            add_listener(self.__on_election_event)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self.__lock:
+            return len(self.__subscribers)
+
+    def subscribe(self, on_message: Callable[[], None] = None) -> Subscription:
+        """
+        :param on_message: Called on the publishing thread after every message queued (or dropped
+                           because the subscriber overflowed), so a coroutine can wait for them.
+        """
+        subscription = Subscription(self, self.max_queued, on_message)
+        with self.__lock:
+            self.__subscribers.add(subscription)
+            if self.autostart and self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name="EventPublisher", daemon=True)
+                self.__thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.__lock:
+            self.__subscribers.discard(subscription)
+
+    def publish(self, event: str, data: Dict):
+        with self.__lock:
+            message = "id: {0}\nevent: {1}\ndata: {2}\n\n".format(next(self.__ids), event, json.dumps(data))
+            subscribers = list(self.__subscribers)
+
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def ballot_cast(self, election_title: str):
+        """
+        Called after every successful vote, the turnout update itself
+        is published by the publisher thread once it's due.
+        """
+        with self.__lock:
+            if not self.__subscribers:
+                return
+            first = not self.__pending_turnout
+            self.__pending_turnout.add(election_title)
+
+        if first:
+            self.__wake.set()
+
+    def poll(self, now: int = None) -> float:
+        """
+        Publishes every phase transition up to 'now' and the turnout updates that are due.
+        :return: Seconds until poll needs to be called again.
+        """
+        if now is None:
+            now = TimeManager.get_current_time_as_epoch()
+
+        if self.__advance is not None:
+            self.__advance(now)
+
+        with self.__lock:
+            titles = []
+            watching = self.shared and bool(self.__subscribers)
+            due = time.monotonic() >= self.__next_turnout
+            if (self.__pending_turnout or watching) and due:
+                titles = sorted(self.__pending_turnout)
+                self.__pending_turnout.clear()
+                self.__next_turnout = time.monotonic() + self.turnout_interval
+            pending = bool(self.__pending_turnout)
+
+        counts = {}
+        try:
+            for election_title in titles:
+                counts[election_title] = self.count_ballots(election_title)
+        except Exception:
+            # Counted again on the next poll
+            with self.__lock:
+                self.__pending_turnout.update(titles)
+            raise
+
+        if watching and due:
+            # An election's first count is only kept to compare the next one with
+            last_counts, self.__ballot_counts = self.__ballot_counts, {}
+            for election_title in self.__open_elections(now):
+                if election_title in counts:
+                    count = counts[election_title]
+                else:
+                    count = self.count_ballots(election_title)
+                    if election_title in last_counts and last_counts[election_title] != count:
+                        counts[election_title] = count
+                self.__ballot_counts[election_title] = count
+
+        for election_title in sorted(counts):
+            self.publish(TURNOUT, {
+                "election_title": election_title,
+                "ballot_count": counts[election_title]
+            })
+
+        timeout = self.max_sleep
+        if pending or watching:
+            timeout = min(timeout, max(self.__next_turnout - time.monotonic(), 0.0))
+        if self.__advance is not None:
+            transition = self.backend_io.get_next_phase_transition(now)
+            if transition is not None:
+                timeout = min(timeout, max(transition - now, 0))
+        return timeout
+
+    def stop(self):
+        """
+        Stops the publisher thread and ends every subscriber's stream.
+        """
+        self.__stopped.set()
+        self.__wake.set()
+        with self.__lock:
+            subscribers = list(self.__subscribers)
+        for subscription in subscribers:
+            subscription.stop()
+
+    def __run(self):
+        failures = 0
+        while not self.__stopped.is_set():
+            # Cleared before polling so a wake up during poll() isn't lost.
+            self.__wake.clear()
+            try:
+                timeout = self.poll()
+                failures = 0
+            except Exception:
+                logging.getLogger(__name__).exception("Couldn't publish the election events")
+                # Waits longer after every failure in a row, up to max_sleep
+                timeout = min(_RETRY_DELAY * 2 ** failures, self.max_sleep)
+                failures += 1
+            self.__wake.wait(timeout)
+
+    def __open_elections(self, now: int):
+        elections = self.backend_io.get_elections_in_phase(ElectionPhase.present, now, fields=['election_title'])
+        return [election['election_title'] for election in elections]
+
+    def __on_election_event(self, event: str, election: Dict):
+        self.publish(event, {key: election[key] for key in _ELECTION_EVENT_FIELDS})
+
+        # A new election may open / close before whatever the thread is waiting for.
+        if event == ELECTION_CREATED:
+            self.__wake.set()
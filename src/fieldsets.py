@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+#
+# src/fieldsets.py
+# Authors:
+#     Samuel Vargas
+#
+# Sparse fieldsets for the election listings.
+#
+# Clients pick the election fields they need with a 'fields' query
+# parameter (?fields=election_title,start_date). The backend turns the
+# list into a column projection so the multi-kilobyte keys are neither read
+# nor sent unless asked for. Without 'fields' the listings return
+# SUMMARY_FIELDS, '?fields=all' returns every field.
+#
+
+from typing import Dict, Tuple
+from src.time_manager import TimeManager
+
+# Every field of an election in the order the backends store them.
+ELECTION_FIELDS = (
+    "election_title",
+    "description",
+    "start_date",
+    "end_date",
+    "questions",
+    "creator_username",
+    "master_ballot_signature",
+    "creator_public_key",
+    "election_public_key",
+    "election_private_key",
+    "election_encrypted_fernet_key",
+)
+
+# Everything but the election_private_key, which is only public once the election is over.
+PUBLIC_ELECTION_FIELDS = tuple(field for field in ELECTION_FIELDS if field != "election_private_key")
+
+SUMMARY_FIELDS = ("election_title", "description", "start_date", "end_date")
+
+ALL = "all"
+
+
+def get_fields(args) -> Tuple[str, ...]:
+    """
+    Reads 'fields' from the request arguments.
+
+    The election_title is always included (it's the pagination key) and the
+    fields are returned in ELECTION_FIELDS order so that two requests for the
+    same fields in a different order share their cached response.
+
+    :raises ValueError: If an unknown field was requested.
+    """
+    fields = args.get('fields')
+    if fields is None:
+        return SUMMARY_FIELDS
+    if fields == ALL:
+        return ELECTION_FIELDS
+
+    requested = set(field.strip() for field in fields.split(",") if field.strip())
+    unknown = requested.difference(ELECTION_FIELDS)
+    if unknown:
+        raise ValueError("Unknown fields: {0}".format(", ".join(sorted(unknown))))
+
+    requested.add("election_title")
+    return tuple(field for field in ELECTION_FIELDS if field in requested)
+
+
+def is_redacted(end_date: str, now: int) -> bool:
+    """
+    :return: True if the election_private_key has to be left out at 'now',
+             it's only sent once the election has ended.
+    """
+    return not TimeManager.election_in_past(end_date, now)
+
+
+def redact(election: Dict, now: int) -> Dict:
+    """
+    Removes the election_private_key from 'election' (in place) unless the election has ended.
+    """
+    if is_redacted(election['end_date'], now):
+        election.pop('election_private_key', None)
+    return election
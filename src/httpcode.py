@@ -7,102 +7,170 @@
 
 from typing import NamedTuple
 from collections import namedtuple
-from flask_api import status
+from http import HTTPStatus
 
 HttpCode = NamedTuple("httpcode", [("message", str), ("code", int)])
 
 # General
 SIGNUP_OK = \
-    HttpCode("Signup successfully completed.", status.HTTP_201_CREATED)
+    HttpCode("Signup successfully completed.", HTTPStatus.CREATED)
 
 LOGIN_SUCCESSFUL = \
-    HttpCode("Login successful. You are now authenticated.", status.HTTP_200_OK)
+    HttpCode("Login successful. You are now authenticated.", HTTPStatus.OK)
 
 # General
 MISSING_OR_MALFORMED_JSON = \
-    HttpCode("JSON was not provided or is non parseable", status.HTTP_400_BAD_REQUEST)
+    HttpCode("JSON was not provided or is non parseable", HTTPStatus.BAD_REQUEST)
 
 MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE = \
-    HttpCode("The server expects a cookie from the registration server to be sent on each request. ", status.HTTP_400_BAD_REQUEST)
+    HttpCode("The server expects a cookie from the registration server to be sent on each request. ", HTTPStatus.BAD_REQUEST)
 
 VALID_AUTHENTICATION_COOKIE = \
-    HttpCode("The server can verify your authentication cookie", status.HTTP_200_OK)
+    HttpCode("The server can verify your authentication cookie", HTTPStatus.OK)
 
 MISSING_LOGIN_PARAMETERS = \
-    HttpCode("Missing 'username', 'password', or 'account_type'", status.HTTP_400_BAD_REQUEST)
+    HttpCode("Missing 'username', 'password', or 'account_type'", HTTPStatus.BAD_REQUEST)
 
 USER_NOT_REGISTERED = \
-    HttpCode("Register with the Registration server prior to signing-in", status.HTTP_400_BAD_REQUEST)
+    HttpCode("Register with the Registration server prior to signing-in", HTTPStatus.BAD_REQUEST)
 
 USER_ALREADY_AUTHENTICATED = \
-    HttpCode("You have already logged in. Log out first before logging back in.", status.HTTP_400_BAD_REQUEST)
+    HttpCode("You have already logged in. Log out first before logging back in.", HTTPStatus.BAD_REQUEST)
 
 LOG_IN_FIRST = \
-    HttpCode("You are not logged in. Login with /api/login/ first", status.HTTP_403_FORBIDDEN)
+    HttpCode("You are not logged in. Login with /api/login/ first", HTTPStatus.FORBIDDEN)
 
 #
 # Election Creation
 #
 
 ELECTION_WITH_TITLE_ALREADY_EXISTS = \
-    HttpCode("You cannot create an election with this title because one already exists", status.HTTP_400_BAD_REQUEST)
+    HttpCode("You cannot create an election with this title because one already exists", HTTPStatus.BAD_REQUEST)
 
 ELECTION_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE = \
-    HttpCode("This election is missing a ballot, public_key, or signature", status.HTTP_400_BAD_REQUEST)
+    HttpCode("This election is missing a ballot, public_key, or signature", HTTPStatus.BAD_REQUEST)
 
 ELECTION_BALLOT_MISSING_TITLE_DESCRIPTION_DATE_OR_QUESTIONS = \
     HttpCode("The election ballot is missing an election_title, description, start_date, end_date, or questions",
-             status.HTTP_400_BAD_REQUEST)
+             HTTPStatus.BAD_REQUEST)
 
 ELECTION_BALLOT_SIGNING_MISMATCH = \
     HttpCode("The server could not verify that the ballot was signed using the public key based off the signature",
-             status.HTTP_400_BAD_REQUEST)
+             HTTPStatus.BAD_REQUEST)
 
 ELECTION_BALLOT_JSON_MALFORMED = \
-    HttpCode("Election json is malformed", status.HTTP_400_BAD_REQUEST)
+    HttpCode("Election json is malformed", HTTPStatus.BAD_REQUEST)
+
+ELECTION_BALLOT_DATE_MALFORMED = \
+    HttpCode("The election ballot's start_date or end_date isn't an ISO 8601 date", HTTPStatus.BAD_REQUEST)
 
 ELECTION_CREATED_SUCCESSFULLY = \
-    HttpCode("Election successfully created.", status.HTTP_201_CREATED)
+    HttpCode("Election successfully created.", HTTPStatus.CREATED)
 
 VOTER_CANNOT_CREATE_ELECTION = \
-    HttpCode("Voters are not allowed to create an election.", status.HTTP_400_BAD_REQUEST)
+    HttpCode("Voters are not allowed to create an election.", HTTPStatus.BAD_REQUEST)
+
+ELECTION_BULK_CREATE_MISSING_ELECTIONS = \
+    HttpCode("Couldn't find a list of 'elections'", HTTPStatus.BAD_REQUEST)
+
+ELECTION_BULK_CREATE_TOO_LARGE = \
+    HttpCode("Too many 'elections', send at most 100 at a time", HTTPStatus.BAD_REQUEST)
 
 #
 # Election Searching
 #
 
 ELECTION_SEARCH_BY_TITLE_MISSING_ELECTION_TITLE = \
-    HttpCode("You forgot to specify the 'election_title' key", status.HTTP_400_BAD_REQUEST)
+    HttpCode("You forgot to specify the 'election_title' key", HTTPStatus.BAD_REQUEST)
 
 ELECTION_NOT_FOUND = \
-    HttpCode("Couldn't find an election with this name.", status.HTTP_404_NOT_FOUND)
+    HttpCode("Couldn't find an election with this name.", HTTPStatus.NOT_FOUND)
+
+ELECTION_BATCH_MISSING_ELECTION_TITLES = \
+    HttpCode("You forgot to specify the 'election_titles' key or it isn't a list of titles",
+             HTTPStatus.BAD_REQUEST)
+
+ELECTION_BATCH_TOO_LARGE = \
+    HttpCode("Too many 'election_titles', send at most 100 at a time", HTTPStatus.BAD_REQUEST)
+
+ELECTION_SEARCH_MISSING_QUERY = \
+    HttpCode("You forgot to specify what to search for with '?q='", HTTPStatus.BAD_REQUEST)
+
+ELECTION_SEARCH_NOT_SUPPORTED = \
+    HttpCode("The backend can't search elections", HTTPStatus.NOT_IMPLEMENTED)
 
 #
 # Voting
 #
 
 ELECTION_VOTER_VOTED_ALREADY = \
-    HttpCode("Voter has participated in this election already", status.HTTP_400_BAD_REQUEST)
+    HttpCode("Voter has participated in this election already", HTTPStatus.BAD_REQUEST)
 
 ELECTION_VOTER_BALLOT_MISSING_TITLE_OR_ANSWERS = \
-    HttpCode("Couldn't find 'election_title' or 'answers'", status.HTTP_400_BAD_REQUEST)
+    HttpCode("Couldn't find 'election_title' or 'answers'", HTTPStatus.BAD_REQUEST)
 
 ELECTION_VOTER_BALLOT_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE = \
-    HttpCode("Couldn't find 'ballot', 'voter_public_key', or 'ballot_signature'", status.HTTP_400_BAD_REQUEST)
+    HttpCode("Couldn't find 'ballot', 'voter_public_key', or 'ballot_signature'", HTTPStatus.BAD_REQUEST)
 
 ELECTION_VOTER_BALLOT_JSON_IS_MALFORMED = \
-    HttpCode("Voter ballot json is malformed", status.HTTP_400_BAD_REQUEST)
+    HttpCode("Voter ballot json is malformed", HTTPStatus.BAD_REQUEST)
 
 ELECTION_VOTER_BALLOT_SIGNING_MISMATCH = \
     HttpCode("Could not verify that this voter ballot was signed using the provided signature, text, and publickey",
-             status.HTTP_400_BAD_REQUEST)
+             HTTPStatus.BAD_REQUEST)
 
 ELECTION_IS_INACTIVE = \
-    HttpCode("You cannot vote in this election, it has already ended", status.HTTP_400_BAD_REQUEST)
+    HttpCode("You cannot vote in this election, it has already ended", HTTPStatus.BAD_REQUEST)
+
+ELECTION_BULK_VOTE_MISSING_TITLE_OR_BALLOTS = \
+    HttpCode("Couldn't find 'election_title' or a list of 'ballots'", HTTPStatus.BAD_REQUEST)
+
+ELECTION_BULK_VOTE_TOO_LARGE = \
+    HttpCode("Too many 'ballots', send at most 500 at a time", HTTPStatus.BAD_REQUEST)
+
+ELECTION_BULK_VOTE_BALLOT_FOR_OTHER_ELECTION = \
+    HttpCode("This ballot's 'election_title' doesn't match the bulk vote's 'election_title'",
+             HTTPStatus.BAD_REQUEST)
 
 #
 # Result Tallying
 #
 
 ELECTION_CANT_TALLY_VOTING_STILL_IN_PROGRESS = \
-    HttpCode("Cannot tally up all the votes. The election is still in progress.", status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+    HttpCode("Cannot tally up all the votes. The election is still in progress.", HTTPStatus.BAD_REQUEST)
+
+#
+# Pagination
+#
+
+INVALID_PAGINATION_PARAMETERS = \
+    HttpCode("'limit' must be an integer between 1 and 500 and 'after' must be a cursor returned by the server",
+             HTTPStatus.BAD_REQUEST)
+
+#
+# Sparse Fieldsets
+#
+
+INVALID_ELECTION_FIELDS = \
+    HttpCode("'fields' must be 'all' or a comma separated list of election fields, e.g. 'election_title,end_date'",
+             HTTPStatus.BAD_REQUEST)
+
+#
+# Change Feed
+#
+
+INVALID_CHANGE_FEED_PARAMETERS = \
+    HttpCode("'since' must be a non negative integer and 'limit' an integer between 1 and 500",
+             HTTPStatus.BAD_REQUEST)
+
+CHANGE_FEED_NOT_SUPPORTED = \
+    HttpCode("The backend doesn't keep a change feed, list the elections instead",
+             HTTPStatus.NOT_IMPLEMENTED)
+
+#
+# Server
+#
+
+WORKER_STATS_NOT_AVAILABLE = \
+    HttpCode("Worker statistics are only kept when served by src/prefork_server.py",
+             HTTPStatus.NOT_IMPLEMENTED)
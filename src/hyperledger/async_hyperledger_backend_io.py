@@ -0,0 +1,691 @@
+#
+# src/hyperledger/async_hyperledger_backend_io.py
+# Authors:
+#     Samuel Vargas
+#
+# AsyncHyperledgerBackendIO implements every BackendIO method as a
+# coroutine over the Hyperledger Composer rest server, HyperledgerBackendIO
+# runs it on a background event loop for the (synchronous) Flask app.
+# The asyncio API (src/async_intermediary.py) awaits it directly.
+#
+# Calls that need several independent requests (batch lookups, bulk
+# writes, nuke) issue them concurrently with asyncio.gather instead of
+# one after the other, so their latency is that of the slowest request
+# rather than the sum of all of them.
+#
+# The requests themselves are sent through one pooled keep-alive
+# requests.Session, each on a thread of an executor sized to the pool, so
+# there is never more in flight than there are pooled connections.
+# That's the limit of this backend: a coroutine awaiting the ledger holds
+# no thread, but the request it waits for holds one thread and one
+# connection, so at most 'pool_size' ledger requests are in flight per
+# process and the rest queue for a free thread. Size it to the concurrency
+# the rest server can take (src/async_intermediary.py --pool-size,
+# SETTINGS['HYPERLEDGER_POOL_SIZE']), each thread costs its stack.
+#
+# The business network stores three assets, each identified by the
+# BackendIO key (see the *_ASSET_FIELDS mappings below):
+#   elections      (electionId = election_title)
+#   ballots        (ballotId = voter_uuid)
+#   participations (participationId = participation_id(username, election_title))
+#
+# With write_batch_size > 1 the ballots and participations are committed
+# in batches (see WriteBatcher), as one castBallots transaction each:
+#   {"$class": "...castBallots", "ballots": [...], "participations": [...]}
+# The business network has to define that transaction.
+#
+# Reads (GETs, which are idempotent) are also hedged and retried:
+#   - every request's latency is recorded per endpoint ("GET elections/{id}",
+#     "GET ballots?filter", ...), see get_latency_stats
+#   - once an endpoint has HEDGE_MIN_SAMPLES latencies, a read still waiting
+#     after that endpoint's 'hedge_percentile' latency gets a second,
+#     identical request and whichever answers first is used
+#   - a read failing with a connection error, a timeout or a 502/503/504 is
+#     retried up to 'max_retries' times, after a random ("full jitter")
+#     backoff so clients that failed together don't retry together
+#   - 'read_budget' (or within_budget for one call) bounds the seconds all of
+#     a call's attempts may take, past it the read fails with requests.Timeout
+#
+
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from src.interfaces import AsyncBackendIO
+from src.election_phase import ElectionPhase
+from src.fieldsets import ELECTION_FIELDS
+from src.time_manager import TimeManager
+from .filter import Filter, phase_clause
+from .latency_histogram import LatencyHistogram
+from .write_batcher import WriteBatcher
+import asyncio
+import contextvars
+import random
+import threading
+import time
+import requests
+
+NAMESPACE = "org.hyperledger_composer.ballots"
+
+# Most connections kept open to the rest server (and requests in flight), size it
+# to the number of threads serving the API. Calls wait for a free connection past this.
+# The asyncio API uses SETTINGS['HYPERLEDGER_POOL_SIZE'] instead.
+DEFAULT_POOL_SIZE = 10
+
+# (connect, read) timeouts in seconds, override them per call with 'timeout'
+DEFAULT_TIMEOUT = (3.05, 30.0)
+
+# Ballots / participations per castBallots transaction and the most seconds one waits
+# for its batch to fill up, a batch size of 1 posts every asset on its own.
+DEFAULT_WRITE_BATCH_SIZE = 1
+DEFAULT_WRITE_BATCH_DELAY = 0.01
+
+BATCH_TRANSACTION = "castBallots"
+
+# Reads still waiting after this percentile of their endpoint's latency are hedged,
+# once the endpoint has HEDGE_MIN_SAMPLES latencies to go by. None never hedges.
+DEFAULT_HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+
+# Retries of a failed read, the n-th waits a random 0 to RETRY_BACKOFF * 2 ** n seconds first
+DEFAULT_MAX_RETRIES = 2
+RETRY_BACKOFF = 0.05
+RETRY_STATUS_CODES = (502, 503, 504)
+
+# Assets fetched per request by the paging generators
+DEFAULT_PAGE_SIZE = 100
+
+# Most ids in one {"inq": [...]} filter, longer lists are split into concurrent requests
+MAX_IDS_PER_FILTER = 100
+
+# BackendIO key -> Composer asset property
+ELECTION_ASSET_FIELDS = {
+    "election_title": "electionId",
+    "description": "description",
+    "start_date": "startDate",
+    "end_date": "endDate",
+    "questions": "questions",
+    "creator_username": "organizer",
+    "master_ballot_signature": "masterBallotSignature",
+    "creator_public_key": "creatorPublicKey",
+    "election_public_key": "electionPublicKey",
+    "election_private_key": "electionPrivateKey",
+    "election_encrypted_fernet_key": "electionEncryptedFernetKey",
+}
+
+BALLOT_ASSET_FIELDS = {
+    "voter_uuid": "ballotId",
+    "ballot": "ballot",
+    "ballot_signature": "ballotSignature",
+    "election_title": "electionId",
+}
+
+
+# loop.time() the reads of the current call have to be answered by, see within_budget
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class ComposerError(Exception):
+    """
+    The rest server answered with an unexpected status code
+    """
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__("{0}: {1}".format(status_code, message))
+        self.status_code = status_code
+
+
+def participation_id(username: str, election_title: str) -> str:
+    # Both halves are quoted so the separator can't appear inside either of them
+    return quote(username, safe="") + ":" + quote(election_title, safe="")
+
+
+def _election_from_asset(asset: Dict) -> Dict:
+    return {key: asset[field] for key, field in ELECTION_ASSET_FIELDS.items() if field in asset}
+
+
+def _election_asset(master_ballot: Dict = None,
+                    creator_username: str = None,
+                    creator_master_ballot_signature: str = None,
+                    creator_public_key_b64: str = None,
+                    election_public_rsa_key: str = None,
+                    election_private_rsa_key: str = None,
+                    election_encrypted_fernet_key: str = None) -> Dict:
+    return {
+        "electionId": master_ballot['election_title'],
+        "description": master_ballot['description'],
+        "startDate": master_ballot['start_date'],
+        "endDate": master_ballot['end_date'],
+        "questions": master_ballot['questions'],
+        "organizer": creator_username,
+        "masterBallotSignature": creator_master_ballot_signature,
+        "creatorPublicKey": creator_public_key_b64,
+        "electionPublicKey": election_public_rsa_key,
+        "electionPrivateKey": election_private_rsa_key,
+        "electionEncryptedFernetKey": election_encrypted_fernet_key,
+        # Sortable copies of the dates, the listing filters compare these (see phase_clause)
+        "startEpoch": TimeManager.iso_8601_str_to_epoch(master_ballot['start_date']),
+        "endEpoch": TimeManager.iso_8601_str_to_epoch(master_ballot['end_date']),
+    }
+
+
+def _ballot_from_asset(asset: Dict) -> Dict:
+    return {key: asset[field] for key, field in BALLOT_ASSET_FIELDS.items()}
+
+
+def _participation_from_asset(asset: Dict) -> Dict:
+    return {"username": asset["username"], "election_title": asset["electionId"]}
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that counts the TCP connections it opens (reconnects included)
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.connections_opened = 0
+        self.__lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def __on_connect(self):
+        with self.__lock:
+            self.connections_opened += 1
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_connect = self.__on_connect
+
+        class CountingHTTPConnection(HTTPConnection):
+            def connect(self):
+                on_connect()
+                super().connect()
+
+        class CountingHTTPSConnection(HTTPSConnection):
+            def connect(self):
+                on_connect()
+                super().connect()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("CountingHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": CountingHTTPConnection}),
+            "https": type("CountingHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": CountingHTTPSConnection}),
+        }
+
+
+class AsyncHyperledgerBackendIO(AsyncBackendIO):
+
+    def __init__(self, url: str, pool_size: int = DEFAULT_POOL_SIZE, keep_alive: bool = True,
+                 timeout=DEFAULT_TIMEOUT,
+                 write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE,
+                 write_batch_delay: float = DEFAULT_WRITE_BATCH_DELAY,
+                 hedge_percentile: Optional[float] = DEFAULT_HEDGE_PERCENTILE,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 read_budget: Optional[float] = None):
+        """
+        :param url: The rest server's api root, e.g. http://localhost:3000/api/
+        :param pool_size: Connections kept open to the rest server (and requests in flight at once).
+        :param keep_alive: False closes the connection after every request (only useful for comparison).
+        :param timeout: Default (connect, read) timeout in seconds, or a single number for both.
+        :param write_batch_size: Ballots / participations committed per castBallots transaction, 1 to not batch.
+        :param write_batch_delay: Most seconds a ballot / participation waits for its batch to fill up.
+        :param hedge_percentile: Reads slower than this percentile of their endpoint's latency are hedged,
+                                 None to never hedge.
+        :param max_retries: Retries of a read failing with a connection error, timeout or 502/503/504.
+        :param read_budget: Default seconds every call's reads may take in total (retries and hedges
+                            included), None for no limit.
+        """
+        self.hyperledger = url
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.max_retries = max_retries
+        self.read_budget = read_budget
+
+        self.adapter = _CountingHTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+        self.write_batcher = None
+        if write_batch_size > 1:
+            self.write_batcher = WriteBatcher(self._submit_batch, write_batch_size, write_batch_delay)
+
+        self.__executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="HyperledgerBackendIO")
+        self.__lock = threading.Lock()
+        self.__requests = 0
+        self.__histograms = {}  # endpoint -> LatencyHistogram
+        self.__read_stats = {}  # endpoint -> {"hedged", "hedge_wins", "retries"}
+
+    def close(self):
+        """
+        Closes every pooled connection
+        """
+        self.__executor.shutdown()
+        self.session.close()
+
+    def get_connection_stats(self) -> Dict:
+        """
+        :return: How well connections are being reused:
+                 {"requests": requests sent to the rest server,
+                  "connections_opened": TCP connections opened to send them,
+                  "connections_reused": requests sent over an already open connection,
+                  "pool_size": the configured pool size}
+        """
+        connections_opened = self.adapter.connections_opened
+        with self.__lock:
+            sent = self.__requests
+        return {
+            "requests": sent,
+            "connections_opened": connections_opened,
+            "connections_reused": max(sent - connections_opened, 0),
+            "pool_size": self.pool_size,
+        }
+
+    def get_latency_stats(self) -> Dict[str, Dict]:
+        """
+        :return: {endpoint: LatencyHistogram.get_stats() plus "hedged": reads that were hedged,
+                  "hedge_wins": hedged reads the second request answered first,
+                  "retries": reads sent again after failing}
+        """
+        with self.__lock:
+            histograms = dict(self.__histograms)
+            read_stats = {endpoint: dict(stats) for endpoint, stats in self.__read_stats.items()}
+        return {endpoint: dict(histogram.get_stats(),
+                               **read_stats.get(endpoint, {"hedged": 0, "hedge_wins": 0, "retries": 0}))
+                for endpoint, histogram in histograms.items()}
+
+    async def within_budget(self, budget: Optional[float], coroutine):
+        """
+        Awaits 'coroutine', every read it makes has to be answered within 'budget'
+        seconds from now (None for no limit).
+        """
+        _deadline.set(asyncio.get_event_loop().time() + budget if budget is not None else None)
+        return await coroutine
+
+    #
+    # HTTP
+    #
+
+    def __histogram(self, endpoint: str) -> LatencyHistogram:
+        with self.__lock:
+            if endpoint not in self.__histograms:
+                self.__histograms[endpoint] = LatencyHistogram()
+                self.__read_stats[endpoint] = {"hedged": 0, "hedge_wins": 0, "retries": 0}
+            return self.__histograms[endpoint]
+
+    def __count(self, endpoint: str, stat: str):
+        self.__histogram(endpoint)
+        with self.__lock:
+            self.__read_stats[endpoint][stat] += 1
+
+    async def _request(self, method: str, path: str, data: Dict = None, timeout=None) -> requests.Response:
+        with self.__lock:
+            self.__requests += 1
+        histogram = self.__histogram(_endpoint(method, path))
+
+        def send():
+            # Timed on the executor thread so requests that lost a hedge are recorded too
+            start = time.perf_counter()
+            try:
+                return self.session.request(method, self.hyperledger + path, json=data,
+                                            timeout=timeout or self.timeout)
+            finally:
+                histogram.record(time.perf_counter() - start)
+
+        return await asyncio.get_event_loop().run_in_executor(self.__executor, send)
+
+    async def _read(self, path: str, timeout=None) -> requests.Response:
+        endpoint = _endpoint("GET", path)
+        loop = asyncio.get_event_loop()
+        deadline = _deadline.get()
+        if deadline is None and self.read_budget is not None:
+            deadline = loop.time() + self.read_budget
+
+        attempt = 0
+        while True:
+            attempt_timeout = timeout or self.timeout
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise requests.Timeout("The read budget for {0} ran out".format(endpoint))
+                attempt_timeout = _cap_timeout(attempt_timeout, remaining)
+
+            try:
+                response = await self.__hedged_request(endpoint, path, attempt_timeout)
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+            if error is None and response.status_code not in RETRY_STATUS_CODES:
+                return response
+
+            backoff = random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+            if attempt >= self.max_retries or (deadline is not None and loop.time() + backoff >= deadline):
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            self.__count(endpoint, "retries")
+            await asyncio.sleep(backoff)
+
+    async def __hedged_request(self, endpoint: str, path: str, timeout) -> requests.Response:
+        histogram = self.__histogram(endpoint)
+        first = asyncio.ensure_future(self._request("GET", path, timeout=timeout))
+        if self.hedge_percentile is None or histogram.count < HEDGE_MIN_SAMPLES:
+            return await first
+
+        done, _ = await asyncio.wait([first], timeout=histogram.percentile(self.hedge_percentile))
+        if done:
+            return first.result()
+
+        self.__count(endpoint, "hedged")
+        second = asyncio.ensure_future(self._request("GET", path, timeout=timeout))
+        pending = {first, second}
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            answered = [task for task in done if task.exception() is None]
+            if answered:
+                # The loser's thread still finishes its request, its answer is dropped
+                for task in pending:
+                    task.cancel()
+                if first not in answered:
+                    self.__count(endpoint, "hedge_wins")
+                return answered[0].result()
+            if not pending:
+                # Both failed, the retries decide what's next
+                return done.pop().result()
+
+    async def _get_asset(self, collection: str, asset_id: str, timeout=None) -> Optional[Dict]:
+        response = await self._read(collection + "/" + quote(asset_id, safe=""), timeout=timeout)
+        if response.status_code == 404:
+            return None
+        _raise_for_status(response)
+        return response.json()
+
+    async def _query(self, collection: str, loopback_filter: Filter = None, timeout=None) -> List[Dict]:
+        path = collection
+        if loopback_filter is not None:
+            path += "?filter=" + quote(loopback_filter.to_json())
+        response = await self._read(path, timeout=timeout)
+        _raise_for_status(response)
+        return response.json()
+
+    async def _query_ids(self, collection: str, field: str, ids: Sequence[str], timeout=None) -> List[Dict]:
+        chunks = [ids[i:i + MAX_IDS_PER_FILTER] for i in range(0, len(ids), MAX_IDS_PER_FILTER)]
+        results = await asyncio.gather(*(
+            self._query(collection, Filter().where({field: {"inq": list(chunk)}}), timeout) for chunk in chunks
+        ))
+        return [asset for result in results for asset in result]
+
+    async def _add_asset(self, collection: str, asset: Dict, timeout=None):
+        response = await self._request("POST", collection, dict(asset, **{"$class": NAMESPACE + "." + collection}),
+                                       timeout)
+        _raise_for_status(response)
+
+    async def _write_asset(self, collection: str, asset: Dict):
+        # Ballots and participations go through the batcher when batching is enabled
+        if self.write_batcher is None:
+            await self._add_asset(collection, asset)
+        else:
+            await self.write_batcher.add((collection, asset))
+
+    async def _submit_batch(self, writes: Sequence) -> List[Optional[Exception]]:
+        transaction = {"ballots": [], "participations": []}
+        for collection, asset in writes:
+            transaction[collection].append(dict(asset, **{"$class": NAMESPACE + "." + collection}))
+
+        response = await self._request("POST", BATCH_TRANSACTION, dict(transaction, **{
+            "$class": NAMESPACE + "." + BATCH_TRANSACTION
+        }))
+        if response.status_code < 400:
+            return [None] * len(writes)
+        if len(writes) == 1:
+            try:
+                _raise_for_status(response)
+            except ComposerError as e:
+                return [e]
+
+        # The transaction is all or nothing, don't fail every write because of one (a duplicate
+        # ballot...), commit them one by one instead.
+        return await asyncio.gather(*(self._add_asset(collection, asset) for collection, asset in writes),
+                                    return_exceptions=True)
+
+    def get_write_batch_stats(self) -> Optional[Dict]:
+        """
+        :return: WriteBatcher.get_stats(), None if writes aren't batched.
+        """
+        return self.write_batcher.get_stats() if self.write_batcher is not None else None
+
+    async def _delete_asset(self, collection: str, asset_id: str, timeout=None):
+        response = await self._request("DELETE", collection + "/" + quote(asset_id, safe=""), timeout=timeout)
+        if response.status_code != 404:
+            _raise_for_status(response)
+
+    #
+    # BackendIO
+    #
+
+    async def create_election(self, master_ballot: Dict = None,
+                              creator_username: str = None,
+                              creator_master_ballot_signature: str = None,
+                              creator_public_key_b64: str = None,
+                              election_public_rsa_key: str = None,
+                              election_private_rsa_key: str = None,
+                              election_encrypted_fernet_key: str = None):
+
+        assert creator_username and creator_master_ballot_signature and creator_public_key_b64 and \
+               election_private_rsa_key and election_public_rsa_key and election_encrypted_fernet_key
+
+        if await self.get_election_by_title(master_ballot['election_title']) is not None:
+            raise ValueError("Can't create duplicate election.")
+
+        await self._add_asset("elections", _election_asset(
+            master_ballot, creator_username, creator_master_ballot_signature, creator_public_key_b64,
+            election_public_rsa_key, election_private_rsa_key, election_encrypted_fernet_key))
+
+    async def create_elections(self, elections: Sequence[Dict]):
+        election_titles = [election['master_ballot']['election_title'] for election in elections]
+        if len(set(election_titles)) != len(election_titles) or await self.get_elections_by_titles(election_titles):
+            raise ValueError("Can't create duplicate election.")
+
+        await asyncio.gather(*(self._add_asset("elections", _election_asset(**election)) for election in elections))
+
+    async def create_ballot(self, ballot: str,
+                            election_title: str = None,
+                            voter_uuid: str = None,
+                            ballot_signature: str = None,
+                            voter_public_key_b64: str = None):
+
+        assert election_title and voter_uuid and ballot_signature and voter_public_key_b64
+
+        if await self.get_election_by_title(election_title) is None:
+            raise ValueError("Can't create ballot for non-existent election")
+
+        await self._write_asset("ballots", {
+            "ballotId": voter_uuid,
+            "electionId": election_title,
+            "ballot": ballot,
+            "ballotSignature": ballot_signature,
+            "voterPublicKey": voter_public_key_b64,
+        })
+
+    async def create_ballots(self, election_title: str, ballots: Sequence[Dict]):
+        if await self.get_election_by_title(election_title) is None:
+            raise ValueError("Can't create ballots for non-existent election")
+
+        # The ballots and the participations don't depend on each other
+        await asyncio.gather(*(self._write_asset("ballots", {
+            "ballotId": ballot['voter_uuid'],
+            "electionId": election_title,
+            "ballot": ballot['ballot'],
+            "ballotSignature": ballot['ballot_signature'],
+            "voterPublicKey": ballot['voter_public_key_b64'],
+        }) for ballot in ballots), *(self._write_asset("participations", {
+            "participationId": participation_id(ballot['username'], election_title),
+            "username": ballot['username'],
+            "electionId": election_title,
+        }) for ballot in ballots))
+
+    async def get_election_by_title(self, election_title: str) -> Optional[Dict]:
+        asset = await self._get_asset("elections", election_title)
+        return _election_from_asset(asset) if asset is not None else None
+
+    async def get_elections_by_titles(self, election_titles: Sequence[str]) -> Dict[str, Dict]:
+        assets = await self._query_ids("elections", "electionId", list(dict.fromkeys(election_titles)))
+        return {asset["electionId"]: _election_from_asset(asset) for asset in assets}
+
+    async def get_ballot_by_voter_uuid(self, voter_uuid: str) -> Optional[Dict]:
+        asset = await self._get_asset("ballots", voter_uuid)
+        return _ballot_from_asset(asset) if asset is not None else None
+
+    async def register_user_as_participated_in_election(self, username: str, election_title: str):
+        if await self.get_election_by_title(election_title) is None:
+            raise ValueError("Can't register user as having participated in non-existent election")
+
+        await self._write_asset("participations", {
+            "participationId": participation_id(username, election_title),
+            "username": username,
+            "electionId": election_title,
+        })
+
+    async def has_user_participated_in_election(self, username: str, election_title: str) -> bool:
+        # Both lookups are needed, send them together
+        election, participation = await asyncio.gather(
+            self._get_asset("elections", election_title),
+            self._get_asset("participations", participation_id(username, election_title))
+        )
+        if election is None:
+            raise ValueError("Can't check if user has participated in non-existent election")
+        return participation is not None
+
+    async def get_all_ballots(self, election_title) -> List[Dict]:
+        assets = await self._query("ballots", Filter().where({"electionId": election_title}))
+        return [_ballot_from_asset(asset) for asset in assets]
+
+    async def count_ballots(self, election_title: str) -> int:
+        # The rest server doesn't expose /count, fetch the ids only.
+        assets = await self._query("ballots", Filter().where({"electionId": election_title}).fields("ballotId"))
+        return len(assets)
+
+    async def get_all_elections(self) -> List[Dict]:
+        return [_election_from_asset(asset) for asset in await self._query("elections")]
+
+    #
+    # Listings, ordered by id and paged with {"where": {id: {"gt": last id of the previous page}}}
+    # rather than 'skip' so a page costs the same however deep it is.
+    #
+
+    async def _page(self, collection: str, id_field: str, loopback_filter: Filter,
+                    after: str = None, limit: int = None) -> List[Dict]:
+        loopback_filter = loopback_filter.order(id_field + " ASC")
+        if after is not None:
+            loopback_filter = loopback_filter.where({id_field: {"gt": after}})
+        if limit is not None:
+            loopback_filter = loopback_filter.limit(limit)
+        return await self._query(collection, loopback_filter)
+
+    async def _iter_pages(self, collection: str, id_field: str, loopback_filter: Filter,
+                          after: str = None, page_size: int = DEFAULT_PAGE_SIZE) -> AsyncIterator[Dict]:
+        while True:
+            page = await self._page(collection, id_field, loopback_filter, after, page_size)
+            for asset in page:
+                yield asset
+            if len(page) < page_size:
+                return
+            after = page[-1][id_field]
+
+    async def get_ballots_page(self, election_title: str, after_voter_uuid: str = None,
+                               limit: int = None) -> List[Dict]:
+        assets = await self._page("ballots", "ballotId", Filter().where({"electionId": election_title}),
+                                  after_voter_uuid, limit)
+        return [_ballot_from_asset(asset) for asset in assets]
+
+    async def iter_ballots(self, election_title: str, page_size: int = DEFAULT_PAGE_SIZE) -> AsyncIterator[Dict]:
+        async for asset in self._iter_pages("ballots", "ballotId", Filter().where({"electionId": election_title}),
+                                            page_size=page_size):
+            yield _ballot_from_asset(asset)
+
+    async def get_participations_page(self, after_participation_id: str = None, limit: int = None) -> List[Dict]:
+        """
+        :return: [{"username", "election_title"}] of every user having voted
+        """
+        assets = await self._page("participations", "participationId", Filter(), after_participation_id, limit)
+        return [_participation_from_asset(asset) for asset in assets]
+
+    async def iter_participations(self, page_size: int = DEFAULT_PAGE_SIZE) -> AsyncIterator[Dict]:
+        async for asset in self._iter_pages("participations", "participationId", Filter(), page_size=page_size):
+            yield _participation_from_asset(asset)
+
+    async def get_elections_page(self, after_election_title: str = None, limit: int = None) -> List[Dict]:
+        assets = await self._page("elections", "electionId", Filter(), after_election_title, limit)
+        return [_election_from_asset(asset) for asset in assets]
+
+    async def get_elections_in_phase(self, phase: ElectionPhase, now: int,
+                                     after_election_title: str = None,
+                                     limit: int = None,
+                                     fields: Sequence[str] = None) -> List[Dict]:
+        assets = await self._page("elections", "electionId", _phase_filter(phase, now, fields),
+                                  after_election_title, limit)
+        return [_election_from_asset(asset) for asset in assets]
+
+    async def iter_elections_in_phase(self, phase: ElectionPhase, now: int, fields: Sequence[str] = None,
+                                      page_size: int = DEFAULT_PAGE_SIZE) -> AsyncIterator[Dict]:
+        async for asset in self._iter_pages("elections", "electionId", _phase_filter(phase, now, fields),
+                                            page_size=page_size):
+            yield _election_from_asset(asset)
+
+    async def get_next_phase_transition(self, now: int) -> Optional[int]:
+        # The earliest start after 'now' and the earliest end at or after it, both at once
+        opening, closing = await asyncio.gather(
+            self._query("elections", Filter().where({"startEpoch": {"gt": now}})
+                        .order("startEpoch ASC").limit(1).fields("startEpoch")),
+            self._query("elections", Filter().where({"endEpoch": {"gte": now}})
+                        .order("endEpoch ASC").limit(1).fields("endEpoch"))
+        )
+        transitions = [asset["startEpoch"] for asset in opening] + [asset["endEpoch"] + 1 for asset in closing]
+        return min(transitions) if transitions else None
+
+    async def nuke(self):
+        collections = {"ballots": "ballotId", "participations": "participationId", "elections": "electionId"}
+        assets = await asyncio.gather(*(
+            self._query(collection, Filter().fields(field)) for collection, field in collections.items()
+        ))
+        await asyncio.gather(*(
+            self._delete_asset(collection, asset[field])
+            for (collection, field), result in zip(collections.items(), assets) for asset in result
+        ))
+
+
+def _phase_filter(phase: ElectionPhase, now: int, fields: Sequence[str] = None) -> Filter:
+    # The election_private_key is only listed once the election is over
+    if fields is None:
+        fields = ELECTION_FIELDS
+    if phase != ElectionPhase.past:
+        fields = [field for field in fields if field != "election_private_key"]
+    fields = ["election_title"] + [field for field in fields if field != "election_title"]
+    return Filter().where(phase_clause(phase, now)).fields(*(ELECTION_ASSET_FIELDS[field] for field in fields))
+
+
+def _endpoint(method: str, path: str) -> str:
+    # "elections/Some%20Title" -> "GET elections/{id}", "ballots?filter=..." -> "GET ballots?filter"
+    resource, _, query = path.partition("?")
+    collection, _, asset_id = resource.partition("/")
+    return method + " " + collection + ("/{id}" if asset_id else "") + ("?filter" if query else "")
+
+
+def _cap_timeout(timeout, most: float):
+    if isinstance(timeout, tuple):
+        return tuple(min(part, most) for part in timeout)
+    return min(timeout, most)
+
+
+def _raise_for_status(response: requests.Response):
+    if response.status_code >= 400:
+        try:
+            message = response.json()["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = response.text
+        raise ComposerError(response.status_code, message)
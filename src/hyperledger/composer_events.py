@@ -0,0 +1,156 @@
+#
+# src/hyperledger/composer_events.py
+# Authors:
+#     Samuel Vargas
+#
+# LedgerEventSubscriber follows the event stream of the Composer rest
+# server (started with websockets enabled, e.g. ws://localhost:3000) and
+# hands every event it understands to a callback, so LedgerCacheBackendIO
+# can apply new elections and votes as they're committed instead of
+# polling the ledger for them.
+#
+# The business network has to emit these events (their transactions add
+# the asset and emit the event), each carrying the asset it added:
+#   {"$class": "org.hyperledger_composer.ballots.ElectionCreated", "election": {...}}
+#   {"$class": "org.hyperledger_composer.ballots.BallotCast", "ballot": {...}}
+#   {"$class": "org.hyperledger_composer.ballots.UserParticipated", "participation": {...}}
+#
+# Events aren't replayed, whatever was committed while disconnected is
+# missed: 'on_connect' runs every time the stream is (re)connected, before
+# any event is read, so the subscriber can resynchronize first. Events
+# committed while it runs wait in the socket and are handled afterwards.
+#
+# The websocket itself is websocket-client's, it's only imported once a
+# subscriber connects so the ledger backends work without it.
+#
+
+from typing import Callable, Dict, NamedTuple, Optional
+from .async_hyperledger_backend_io import NAMESPACE, _election_from_asset, _ballot_from_asset, \
+    _participation_from_asset
+import json
+import logging
+import threading
+
+ELECTION_CREATED = NAMESPACE + ".ElectionCreated"
+BALLOT_CAST = NAMESPACE + ".BallotCast"
+USER_PARTICIPATED = NAMESPACE + ".UserParticipated"
+
+# Seconds between two attempts to (re)connect to the event stream
+DEFAULT_RECONNECT_DELAY = 1.0
+
+# Seconds the connection waits for the rest server's upgrade response
+_CONNECT_TIMEOUT = 5.0
+
+# Seconds waited for the rest server to acknowledge closing the stream, nothing is lost without it
+_CLOSE_TIMEOUT = 0.2
+
+
+class LedgerEvent(NamedTuple):
+    kind: str     # "election", "ballot" or "participation"
+    record: Dict  # the election / ballot as BackendIO returns them, {"username", "election_title"} otherwise
+
+
+def parse_event(event: Dict) -> Optional[LedgerEvent]:
+    """
+    :return: The LedgerEvent for a Composer event, None for events of other types.
+    """
+    event_class = event.get("$class")
+    if event_class == ELECTION_CREATED:
+        return LedgerEvent("election", _election_from_asset(event["election"]))
+    if event_class == BALLOT_CAST:
+        return LedgerEvent("ballot", _ballot_from_asset(event["ballot"]))
+    if event_class == USER_PARTICIPATED:
+        return LedgerEvent("participation", _participation_from_asset(event["participation"]))
+    return None
+
+
+class LedgerEventSubscriber:
+
+    def __init__(self, url: str,
+                 on_event: Callable[[LedgerEvent], None],
+                 on_connect: Callable[[], None] = None,
+                 on_disconnect: Callable[[], None] = None,
+                 reconnect_delay: float = DEFAULT_RECONNECT_DELAY):
+        """
+        :param url: The rest server's websocket, e.g. ws://localhost:3000
+        :param on_event: Called with every ledger event, in the order they were received.
+        :param on_connect: Called each time the stream is (re)connected, before any of its events.
+        :param on_disconnect: Called each time the stream is lost.
+        :param reconnect_delay: Seconds between two connection attempts.
+        """
+        self.url = url
+        self.on_event = on_event
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.reconnect_delay = reconnect_delay
+        self.events = 0
+        self.connects = 0
+
+        self.__stopped = threading.Event()
+        self.__connected = threading.Event()
+        self.__thread = None
+
+    def start(self) -> 'LedgerEventSubscriber':
+        self.__thread = threading.Thread(target=self.__run, name="LedgerEventSubscriber", daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def wait_until_connected(self, timeout: float = None) -> bool:
+        return self.__connected.wait(timeout)
+
+    @property
+    def connected(self) -> bool:
+        return self.__connected.is_set()
+
+    def __run(self):
+        import websocket
+
+        logger = logging.getLogger(__name__)
+        while not self.__stopped.is_set():
+            try:
+                connection = websocket.create_connection(self.url, timeout=_CONNECT_TIMEOUT)
+            except (OSError, websocket.WebSocketException):
+                self.__stopped.wait(self.reconnect_delay)
+                continue
+
+            try:
+                if self.on_connect is not None:
+                    self.on_connect()
+                self.connects += 1
+                self.__connected.set()
+
+                # Wake up now and then to notice stop()
+                connection.settimeout(0.1)
+                while not self.__stopped.is_set():
+                    try:
+                        # Pings are answered by recv_data, the close frame is acknowledged
+                        opcode, message = connection.recv_data()
+                    except websocket.WebSocketTimeoutException:
+                        continue
+                    if opcode == websocket.ABNF.OPCODE_CLOSE:
+                        break
+                    self.__handle(json.loads(message.decode("utf-8")))
+            except websocket.WebSocketConnectionClosedException:
+                pass
+            except Exception:
+                logger.exception("Lost the ledger event stream")
+            finally:
+                was_connected = self.__connected.is_set()
+                self.__connected.clear()
+                connection.close(timeout=_CLOSE_TIMEOUT)
+                if was_connected and self.on_disconnect is not None:
+                    self.on_disconnect()
+            self.__stopped.wait(self.reconnect_delay)
+
+    def __handle(self, message):
+        # The rest server may send one event or a list of them
+        for event in message if isinstance(message, list) else [message]:
+            ledger_event = parse_event(event)
+            if ledger_event is not None:
+                self.events += 1
+                self.on_event(ledger_event)
@@ -1,84 +1,144 @@
 #
-# src/users/filter.py
+# src/hyperledger/filter.py
 # Authors:
 #     Alex Gao
+#     Samuel Vargas
 #
-import datetime
 import json
+from typing import Dict, Optional, Sequence
+from src.election_phase import ElectionPhase
+from src.time_manager import TimeManager
 
 # this class is for generating filters to use in querying data through Hyperledger Composer REST API
 # this follows LoopBack filter syntax
+#
+# Filters are immutable, every method returns a new Filter so a base
+# filter can be shared and refined per call:
+#
+#   current = Filter().where(phase_clause(ElectionPhase.present, now)).order("electionId ASC")
+#   first_page = current.limit(25).fields("electionId", "startDate")
+#   next_page = first_page.where({"electionId": {"gt": "Last title of the first page"}})
+#
 class Filter() :
 
-    def current_filter():
+    def __init__(self, where: Dict = None, order: Sequence[str] = (), skip: int = None, limit: int = None,
+                 fields: Sequence[str] = ()):
+        self.__where = where
+        self.__order = tuple(order)
+        self.__skip = skip
+        self.__limit = limit
+        self.__fields = tuple(fields)
+
+    def __copy(self, **changes) -> 'Filter':
+        arguments = dict(where=self.__where, order=self.__order, skip=self.__skip,
+                         limit=self.__limit, fields=self.__fields)
+        arguments.update(changes)
+        return Filter(**arguments)
+
+    def where(self, clause: Dict) -> 'Filter':
+        """
+        Adds a LoopBack where clause ({"endEpoch": {"lt": 1521507388}}),
+        every clause has to match.
+        """
+        if self.__where is None:
+            return self.__copy(where=clause)
+        if list(self.__where) == ["and"]:
+            return self.__copy(where={"and": self.__where["and"] + [clause]})
+        return self.__copy(where={"and": [self.__where, clause]})
+
+    def order(self, *clauses: str) -> 'Filter':
+        """
+        Sorts by one or more "property ASC" / "property DESC" clauses, replacing any previous order
+        """
+        return self.__copy(order=clauses)
+
+    def skip(self, skip: int) -> 'Filter':
+        return self.__copy(skip=skip)
+
+    def limit(self, limit: int) -> 'Filter':
+        return self.__copy(limit=limit)
+
+    def fields(self, *fields: str) -> 'Filter':
+        """
+        Only returns these properties of every asset, replacing any previous projection
+        """
+        return self.__copy(fields=fields)
+
+    def to_dict(self) -> Dict:
+        loopback_filter = {}
+        if self.__fields:
+            loopback_filter["fields"] = {field: True for field in self.__fields}
+        if self.__where is not None:
+            loopback_filter["where"] = self.__where
+        if self.__order:
+            loopback_filter["order"] = list(self.__order)
+        if self.__skip:
+            loopback_filter["skip"] = self.__skip
+        if self.__limit is not None:
+            loopback_filter["limit"] = self.__limit
+        return loopback_filter
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def __str__(self):
+        return self.to_json()
+
+    def __eq__(self, other):
+        return isinstance(other, Filter) and self.to_dict() == other.to_dict()
+
+    #
+    # Ready made filters, kept for existing callers
+    #
+
+    @staticmethod
+    def current_filter(now: int = None) -> str:
         """
         Generates a filter query parameter to retrieve all current elections
         These filters are submitted are submitted through the Hyperledger Composer Rest API
         Only the electionIds are returned to keep messages smaller
         Example of generated string:
-        {"fields": {"electionId": true}, "where": {"and": [{"endDate": {"gt": "2018-03-21T22:17:06.852272"}}, {"startDate": {"lt": "2018-03-21T22:17:06.852272"}}]}}
+        {"fields": {"electionId": true}, "where": {"and": [{"startEpoch": {"lte": 1521670626}}, {"endEpoch": {"gte": 1521670626}}]}}
         """
-        current_date = datetime.datetime.now().isoformat();
-
-        filter = {
-            "fields": {"electionId" : True},
-            "where" : {
-                   "and": [
-                       {"endDate":{
-                           "gt":current_date
-                           }},
-                       {"startDate": {
-                           "lt":current_date
-                           }}
-                       ]
-                }
-            }
-        return json.dumps(filter);
-
-    def past_filter():
+        return Filter().where(phase_clause(ElectionPhase.present, now)).fields("electionId").to_json()
+
+    @staticmethod
+    def past_filter(now: int = None) -> str:
         """
         Generates a filter query parameter to retrieve all past elections
         These filters are submitted are submitted through the Hyperledger Composer Rest API
         Only the electionIds are returned to keep messages smaller
         """
-        current_date = datetime.datetime.now().isoformat();
-        
-        filter = {
-            "fields":{"electionId":True},
-            "where": {
-                "endDate":{
-                    "lt":current_date
-                    }
-                }
-            }
-        return json.dumps(filter);
-
-    def upcomming_filter():
+        return Filter().where(phase_clause(ElectionPhase.past, now)).fields("electionId").to_json()
+
+    @staticmethod
+    def upcomming_filter(now: int = None) -> str:
         """
         Generates a filter query parameter to retrieve all upcomming elections
         These filters are submitted are submitted through the Hyperledger Composer Rest API
         Only the electionIds are returned to keep messages smaller
         """
-        current_date = datetime.datetime.now().isoformat();
-        
-        filter = {
-            "fields":{"electionId":True},
-            "where": {
-                "startDate":{
-                    "gt":current_date
-                    }
-                }
-            }
-        return json.dumps(filter);
-    
-    def ballot_filter():
+        return Filter().where(phase_clause(ElectionPhase.future, now)).fields("electionId").to_json()
+
+    @staticmethod
+    def ballot_filter() -> str:
         """
         Returns only the selections
         """
-        filter = { "fields" : {"selections" : True}};
-        return json.dumps(filter);
-
-
+        return Filter().fields("selections").to_json()
 
 
+def phase_clause(phase: ElectionPhase, now: Optional[int] = None) -> Dict:
+    """
+    Where clause matching the elections in 'phase' at 'now' (seconds since the UTC epoch,
+    the current time if None). Compares the startEpoch / endEpoch properties of the
+    election assets, the same rules as ElectionWindow.phase.
+    """
+    if now is None:
+        now = TimeManager.get_current_time_as_epoch()
 
+    if phase == ElectionPhase.past:
+        return {"endEpoch": {"lt": now}}
+    if phase == ElectionPhase.future:
+        return {"startEpoch": {"gt": now}}
+    return {"and": [{"startEpoch": {"lte": now}}, {"endEpoch": {"gte": now}}]}
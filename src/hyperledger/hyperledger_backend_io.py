@@ -1,135 +1,193 @@
 
 # HyperledgerBackendIO is responsible for interactiong with a deployed
-# hyperledger composer rest server that is tied to a hyperledger blockchain 
+# hyperledger composer rest server that is tied to a hyperledger blockchain
 # platform of your choice
 #
 # The Hyperledger Composer Rest server is created independently as a separate backend,
 # in this specific backend choice a fabric network is used and a specific peer channel
-# in the network is mapped to the business network defined in the hyperledger composer 
-# model. Due to the fact that python was choosen, integration is done using a 
+# in the network is mapped to the business network defined in the hyperledger composer
+# model. Due to the fact that python was choosen, integration is done using a
 # rest server. Note that there are other SDKs that can be used to interact with composer
 # not using the composer rest server
 #
-# Due to the fact that hyperledger is meant to be a private permissioned 
-# blockchain, this particular interface implementation will not use any 
+# Due to the fact that hyperledger is meant to be a private
+# blockchain, this particular interface implementation will not use any
 # outside signatures or encryption as this is managed in the deployment process
 # and within the hyperledger network itself
+#
+# The requests are made by AsyncHyperledgerBackendIO, this class is the
+# synchronous BackendIO the Flask app uses: every call is scheduled on an
+# event loop that runs in a background thread and the calling thread
+# waits for its result. Any number of Flask threads can share one instance.
+#
+# Reads are hedged and retried (see AsyncHyperledgerBackendIO), bound how
+# long one call may take with latency_budget:
+#
+#   with backend.latency_budget(0.25):
+#       election = backend.get_election_by_title(election_title)
 
 
-import requests
-from urllib.parse import quote
-from flask import json
-from .filter import Filter
-
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+from src.interfaces.backend_io import BackendIO
+from src.election_phase import ElectionPhase
+from .async_hyperledger_backend_io import AsyncHyperledgerBackendIO, DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, \
+    DEFAULT_WRITE_BATCH_SIZE, DEFAULT_WRITE_BATCH_DELAY, DEFAULT_PAGE_SIZE, DEFAULT_HEDGE_PERCENTILE, \
+    DEFAULT_MAX_RETRIES, participation_id
+import asyncio
+import threading
 
-class HyperledgerBackendIO() :
-    def __init__(self,url):
-        self.hyperledger = url
-    
-    def create_election(creator,electionTitle,propositions,startDate,endDate):
-        raise NotImplementedError
 
-    def create_ballot(self,voter,electionId,answer):
-        """
-        Lets a user vote in an election by creating a ballot
-        The following parameters are:
-            - voter : a voters voterId , it can be same as the username
-            - electionId : the title of an election
-            - answer: an array of integers, each integer corresponding to a specific 
-            choice in a proposition for the election
-        """
-        url = self.hyperledger + "vote"
-        voter = "org.hyperledger_composer.ballots.voters#" + voter
-        election = "org.hyperledger_composer.ballots.elections#" + electionId
-        data = {
-            "$class": "org.hyperledger_composer.ballots.vote",
-            "voter": voter,
-            "election":election,
-            "answers": answer
-            }
-
-        result = requests.post(url,data)
-        return result.json(),result.status_code
-
-    def get_election_by_title(self,voter,electionId):
+class HyperledgerBackendIO(BackendIO):
+    def __init__(self, url, pool_size=DEFAULT_POOL_SIZE, keep_alive=True, timeout=DEFAULT_TIMEOUT,
+                 write_batch_size=DEFAULT_WRITE_BATCH_SIZE, write_batch_delay=DEFAULT_WRITE_BATCH_DELAY,
+                 hedge_percentile=DEFAULT_HEDGE_PERCENTILE, max_retries=DEFAULT_MAX_RETRIES, read_budget=None):
         """
-        Lets a user retrieve the details of an election and their involvement
         The following parameters are:
-            - voter: a voters voterId
-            - electionId: title of the elction
-
-        Returns a voter's selections in their ballot for the election if 
-        that ballot exists. The ballot exists if they have voted for that election.
-
-        It then returns all the details of the election including:
-        - startDate 
-        - endDate
-        - organizer : the creator of the election
-        - propositions: a list of questions, each question has a sublist of choices
-        """
-        url = self.hyperledger + "elections/" + electionId
-        result = requests.get(url)
-
-        ballotId = voter +"_" + electionId;
-        url2 = hyperledger + "ballots/" + ballotId + "?filter=" + Filter.ballot_filter();
-        result2 = requests.get(url2);
-
-        if(result2.status_code == 200):
-            response = {
-                "election":result.json(),
-                "ballot":result2.json()
-                }
-        else:
-            response = {
-                "election":result.json(),
-                "ballot": False
-                }
-        return response, result.status_code
-
-    def get_current_elections(self) :
+            - url : the rest server's api root, e.g. http://localhost:3000/api/
+            - pool_size : connections kept open to the rest server
+            - keep_alive : False closes the connection after every request (only useful for comparison)
+            - timeout : default (connect, read) timeout in seconds, or a single number for both
+            - write_batch_size : ballots / participations committed per castBallots transaction, 1 to not batch
+            - write_batch_delay : most seconds a ballot / participation waits for its batch to fill up
+            - hedge_percentile : reads slower than this percentile of their endpoint are sent twice, None to never hedge
+            - max_retries : retries of a read failing with a connection error, timeout or 502/503/504
+            - read_budget : default seconds the reads of one call may take in total, None for no limit
         """
-        Returns the current elections in the hyperledger backend
-        Only the electionId(s) are returned to limit packet size
+        super().__init__()
+        self.async_backend_io = AsyncHyperledgerBackendIO(url, pool_size, keep_alive, timeout,
+                                                          write_batch_size, write_batch_delay,
+                                                          hedge_percentile, max_retries, read_budget)
+        self.__budget = threading.local()
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__loop.run_forever, name="HyperledgerBackendIO", daemon=True)
+        self.__thread.start()
+
+    def __run(self, coroutine):
+        budget = getattr(self.__budget, "seconds", None)
+        if budget is not None:
+            coroutine = self.async_backend_io.within_budget(budget, coroutine)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.__loop).result()
+
+    @contextmanager
+    def latency_budget(self, seconds: Optional[float]):
         """
-        url = self.hyperledger + "elections?filter="  + Filter.current_filter();
-        result = requests.get(url)
-        return result.json(), result.status_code
-
-    def get_past_elections(self):
-         """
-        Returns the past elections in the hyperledger backend
-        """
-
-        url = hyperledger + "elections?filter="  + Filter.past_filter();
-        result = requests.get(url)
-        return result.json(), result.status_code
-
-
-    def get_upcomming_elections(self):
-       """
-        Returns the upcomming elections in the hyperledger backend
+        Every call made by this thread inside the block has 'seconds' for its reads
+        (retries and hedges included), past it the call raises requests.Timeout.
         """
-
-        url = hyperledger + "elections?filter="  + Filter.upcomming_filter();
-        result = requests.get(url)
-        return result.json(), result.status_code
-
-    def get_election_results(self,electionId):
+        previous = getattr(self.__budget, "seconds", None)
+        self.__budget.seconds = seconds
+        try:
+            yield
+        finally:
+            self.__budget.seconds = previous
+
+    def close(self):
         """
-        Parameters are :
-        - electionId : the title essentially for an election
-
-        ToDo:
-        - retrieve the elections object, check if the endDate has passed
-        - check to see if results has been tallied
-        - if not tallied, retrieve all the ballots for that election
-        - loop through and get the results
-        - update the election object using put command on hyperledger
-        - return the election object to the requesting client
+        Stops the event loop and closes every pooled connection
         """
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__loop.close()
+        self.async_backend_io.close()
+
+    def get_connection_stats(self) -> Dict:
+        return self.async_backend_io.get_connection_stats()
+
+    def get_latency_stats(self) -> Dict[str, Dict]:
+        return self.async_backend_io.get_latency_stats()
+
+    def get_write_batch_stats(self) -> Optional[Dict]:
+        return self.__run(self.__get_write_batch_stats())
+
+    async def __get_write_batch_stats(self):
+        # Read on the loop, the batcher isn't thread safe
+        return self.async_backend_io.get_write_batch_stats()
+
+    def create_election(self, master_ballot: Dict = None, *args, **kwargs):
+        return self.__run(self.async_backend_io.create_election(master_ballot, *args, **kwargs))
+
+    def create_elections(self, elections: Sequence[Dict]):
+        return self.__run(self.async_backend_io.create_elections(elections))
+
+    def create_ballot(self, ballot: str, *args, **kwargs):
+        return self.__run(self.async_backend_io.create_ballot(ballot, *args, **kwargs))
+
+    def create_ballots(self, election_title: str, ballots: Sequence[Dict]):
+        return self.__run(self.async_backend_io.create_ballots(election_title, ballots))
+
+    def get_election_by_title(self, election_title: str) -> Optional[Dict]:
+        return self.__run(self.async_backend_io.get_election_by_title(election_title))
+
+    def get_elections_by_titles(self, election_titles: Sequence[str]) -> Dict[str, Dict]:
+        return self.__run(self.async_backend_io.get_elections_by_titles(election_titles))
+
+    def get_ballot_by_voter_uuid(self, voter_uuid: str) -> Optional[Dict]:
+        return self.__run(self.async_backend_io.get_ballot_by_voter_uuid(voter_uuid))
+
+    def register_user_as_participated_in_election(self, username: str, election_title: str):
+        return self.__run(self.async_backend_io.register_user_as_participated_in_election(username, election_title))
+
+    def has_user_participated_in_election(self, username: str, election_title: str) -> bool:
+        return self.__run(self.async_backend_io.has_user_participated_in_election(username, election_title))
+
+    def get_all_ballots(self, election_title) -> List[Dict]:
+        return self.__run(self.async_backend_io.get_all_ballots(election_title))
+
+    def count_ballots(self, election_title: str) -> int:
+        return self.__run(self.async_backend_io.count_ballots(election_title))
+
+    def get_all_elections(self) -> List[Dict]:
+        return self.__run(self.async_backend_io.get_all_elections())
+
+    #
+    # The generators fetch one page per step, so a caller that stops early
+    # never pulls the rest from the ledger.
+    #
+
+    def get_ballots_page(self, election_title: str, after_voter_uuid: str = None, limit: int = None) -> List[Dict]:
+        return self.__run(self.async_backend_io.get_ballots_page(election_title, after_voter_uuid, limit))
+
+    def iter_ballots(self, election_title: str, page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[Dict]:
+        after_voter_uuid = None
+        while True:
+            page = self.get_ballots_page(election_title, after_voter_uuid, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            after_voter_uuid = page[-1]['voter_uuid']
+
+    def get_participations_page(self, after_participation_id: str = None, limit: int = None) -> List[Dict]:
+        return self.__run(self.async_backend_io.get_participations_page(after_participation_id, limit))
+
+    def iter_participations(self, page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[Dict]:
+        after_participation_id = None
+        while True:
+            page = self.get_participations_page(after_participation_id, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            after_participation_id = participation_id(page[-1]['username'], page[-1]['election_title'])
+
+    def get_elections_page(self, after_election_title: str = None, limit: int = None) -> List[Dict]:
+        return self.__run(self.async_backend_io.get_elections_page(after_election_title, limit))
+
+    def get_elections_in_phase(self, phase: ElectionPhase, now: int,
+                               after_election_title: str = None,
+                               limit: int = None,
+                               fields: Sequence[str] = None) -> List[Dict]:
+        return self.__run(self.async_backend_io.get_elections_in_phase(
+            phase, now, after_election_title, limit, fields))
+
+    def iter_elections_in_phase(self, phase: ElectionPhase, now: int, fields: Sequence[str] = None,
+                                page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[Dict]:
+        after_election_title = None
+        while True:
+            page = self.get_elections_in_phase(phase, now, after_election_title, page_size, fields)
+            yield from page
+            if len(page) < page_size:
+                return
+            after_election_title = page[-1]['election_title']
 
-        raise NotImplementedError;
-
-
-
-                                                        )
+    def nuke(self):
+        return self.__run(self.async_backend_io.nuke())
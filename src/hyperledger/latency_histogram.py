@@ -0,0 +1,86 @@
+#
+# src/hyperledger/latency_histogram.py
+# Authors:
+#     Samuel Vargas
+#
+# LatencyHistogram counts request latencies in fixed, geometrically
+# growing buckets (each 25% wider than the previous one, from half a
+# millisecond to about a minute), so recording is O(1), memory is constant
+# however many requests are recorded and any percentile is known to
+# within one bucket.
+#
+# Thread safe, requests are timed on the executor threads.
+#
+
+from typing import Dict, List, Optional, Tuple
+import bisect
+import threading
+
+# Upper bound (seconds) of every bucket, anything slower lands in the last one
+BUCKET_BOUNDS = tuple(0.0005 * 1.25 ** i for i in range(53))
+
+
+class LatencyHistogram:
+
+    def __init__(self):
+        self.__counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.__count = 0
+        self.__total = 0.0
+        self.__max = 0.0
+        self.__lock = threading.Lock()
+
+    def record(self, seconds: float):
+        bucket = bisect.bisect_left(BUCKET_BOUNDS, seconds)
+        with self.__lock:
+            self.__counts[bucket] += 1
+            self.__count += 1
+            self.__total += seconds
+            self.__max = max(self.__max, seconds)
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """
+        :param fraction: e.g. 0.99 for the p99
+        :return: Seconds at most 'fraction' of the recorded latencies took (the upper bound
+                 of the bucket holding it, never more than the slowest one), None if empty.
+        """
+        with self.__lock:
+            if not self.__count:
+                return None
+            rank = max(1, int(round(fraction * self.__count)))
+            seen = 0
+            for bucket, count in enumerate(self.__counts):
+                seen += count
+                if seen >= rank:
+                    break
+            bound = BUCKET_BOUNDS[bucket] if bucket < len(BUCKET_BOUNDS) else self.__max
+            return min(bound, self.__max)
+
+    def buckets(self) -> List[Tuple[float, int]]:
+        """
+        :return: [(upper bound in seconds, count)] of every non empty bucket, the last
+                 bucket's bound is infinite.
+        """
+        with self.__lock:
+            counts = list(self.__counts)
+        bounds = BUCKET_BOUNDS + (float("inf"),)
+        return [(bound, count) for bound, count in zip(bounds, counts) if count]
+
+    def get_stats(self) -> Dict:
+        """
+        :return: {"count", "mean", "p50", "p90", "p99", "max", "buckets"}, times in seconds
+        """
+        with self.__lock:
+            count, total, slowest = self.__count, self.__total, self.__max
+        return {
+            "count": count,
+            "mean": total / count if count else 0.0,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "max": slowest,
+            "buckets": self.buckets(),
+        }
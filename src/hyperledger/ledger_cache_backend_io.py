@@ -0,0 +1,484 @@
+#
+# src/hyperledger/ledger_cache_backend_io.py
+# Authors:
+#     Samuel Vargas
+#
+# LedgerCacheBackendIO is a read-through cache in front of the (slow)
+# ledger, stored in a local SQLite database: a file that survives restarts
+# or ":memory:".
+#
+# Nothing on the ledger is ever modified, so whatever can't change any
+# more is kept permanently:
+#   * elections,
+#   * single ballots,
+#   * a user having participated in an election,
+#   * every ballot of a closed election, fetched once after it closes.
+#
+# What can still change (the election listing, the ballots and turnout of
+# elections that are still open) is kept for 'listing_ttl' seconds.
+#
+# warm_up() loads every election and the ballots of the closed ones, by
+# default in a background thread started by the constructor, so the API
+# doesn't wait on the ledger after a restart.
+#
+# Writes go to the ledger first and are then copied to the local database.
+#
+# With 'events_url' the cache also follows the ledger's event stream (see
+# LedgerEventSubscriber) and applies new elections, ballots and
+# participations as they're committed. On every (re)connection it first
+# copies every election, ballot and participation (the ledger backend has
+# to list participations, HyperledgerBackendIO.iter_participations), then
+# goes "live": until the stream is lost, every read is answered from the
+# local database and a miss means the asset doesn't exist. A vote that
+# slips past a stale "hasn't voted yet" is still refused by the ledger,
+# the participation already exists there.
+#
+# HyperledgerBackendIO(url) -> LedgerCacheBackendIO -> (ElectionPhaseIndex, CachingBackendIO)
+#
+
+from typing import Dict, List, Optional, Sequence
+from src.interfaces.backend_io import BackendIO
+from src.election_phase import ElectionPhase
+from src.time_manager import TimeManager
+from .composer_events import LedgerEvent, LedgerEventSubscriber
+from .async_hyperledger_backend_io import _election_asset, _election_from_asset
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+CREATE_CACHED_ELECTION_TABLE = """
+CREATE TABLE IF NOT EXISTS CachedElection
+(election_title  TEXT NOT NULL PRIMARY KEY,
+ election        TEXT NOT NULL)
+"""
+
+CREATE_CACHED_BALLOT_TABLE = """
+CREATE TABLE IF NOT EXISTS CachedBallot
+(voter_uuid      TEXT NOT NULL PRIMARY KEY,
+ election_title  TEXT NOT NULL,
+ ballot          TEXT NOT NULL)
+"""
+
+CREATE_CACHED_BALLOT_ELECTION_TITLE_INDEX = """
+CREATE INDEX IF NOT EXISTS CachedBallotElectionTitle
+ON CachedBallot(election_title)
+"""
+
+CREATE_CACHED_PARTICIPATION_TABLE = """
+CREATE TABLE IF NOT EXISTS CachedParticipation
+(username        TEXT NOT NULL,
+ election_title  TEXT NOT NULL,
+                 PRIMARY KEY(username, election_title))
+"""
+
+# Closed elections whose ballots have all been copied to CachedBallot
+CREATE_CACHED_CLOSED_ELECTION_TABLE = """
+CREATE TABLE IF NOT EXISTS CachedClosedElection
+(election_title  TEXT NOT NULL PRIMARY KEY)
+"""
+
+INSERT_CACHED_ELECTION = "INSERT OR IGNORE INTO CachedElection VALUES (?, ?)"
+INSERT_CACHED_BALLOT = "INSERT OR IGNORE INTO CachedBallot VALUES (?, ?, ?)"
+INSERT_CACHED_PARTICIPATION = "INSERT OR IGNORE INTO CachedParticipation VALUES (?, ?)"
+INSERT_CACHED_CLOSED_ELECTION = "INSERT OR IGNORE INTO CachedClosedElection VALUES (?)"
+
+SELECT_CACHED_ELECTION = "SELECT election FROM CachedElection WHERE election_title = (?)"
+SELECT_CACHED_ELECTIONS = "SELECT election FROM CachedElection ORDER BY rowid"
+SELECT_CACHED_BALLOT = "SELECT ballot FROM CachedBallot WHERE voter_uuid = (?)"
+SELECT_CACHED_BALLOTS = "SELECT ballot FROM CachedBallot WHERE election_title = (?)"
+COUNT_CACHED_BALLOTS = "SELECT COUNT(*) FROM CachedBallot WHERE election_title = (?)"
+SELECT_CACHED_PARTICIPATION = \
+    "SELECT 1 FROM CachedParticipation WHERE username = (?) AND election_title = (?)"
+SELECT_CACHED_CLOSED_ELECTION = "SELECT 1 FROM CachedClosedElection WHERE election_title = (?)"
+
+DELETE_CACHE = (
+    "DELETE FROM CachedElection",
+    "DELETE FROM CachedBallot",
+    "DELETE FROM CachedParticipation",
+    "DELETE FROM CachedClosedElection",
+)
+
+# Seconds the election listing and open elections' ballots / turnout are kept
+DEFAULT_LISTING_TTL = 2.0
+
+_MISSING = object()
+
+
+class LedgerCacheBackendIO(BackendIO):
+
+    def __init__(self, backend_io: BackendIO, db_path: str = ":memory:",
+                 listing_ttl: float = DEFAULT_LISTING_TTL, warm_up: bool = True, events_url: str = None):
+        """
+        :param backend_io: The ledger backend (HyperledgerBackendIO).
+        :param db_path: Where the cache is stored, a file path or ":memory:".
+        :param listing_ttl: Seconds the listings that can still change are kept.
+        :param warm_up: Start warm_up() in a background thread.
+        :param events_url: The rest server's event stream (ws://localhost:3000), None to not subscribe.
+        """
+        super().__init__()
+        self.backend_io = backend_io
+        self.listing_ttl = listing_ttl
+        self.hits = 0
+        self.misses = 0
+
+        self.__lock = threading.RLock()
+        self.__listings = {}  # key -> (value, expires_at)
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        for query in (CREATE_CACHED_ELECTION_TABLE, CREATE_CACHED_BALLOT_TABLE,
+                      CREATE_CACHED_BALLOT_ELECTION_TITLE_INDEX, CREATE_CACHED_PARTICIPATION_TABLE,
+                      CREATE_CACHED_CLOSED_ELECTION_TABLE):
+            self.connection.execute(query)
+        self.connection.commit()
+
+        self.__warm = threading.Event()
+        self.__live = threading.Event()
+        self.subscriber = None
+        if events_url is not None:
+            # Warms up on every connection
+            self.subscriber = LedgerEventSubscriber(events_url, self.apply_ledger_event,
+                                                    on_connect=self.__resynchronize,
+                                                    on_disconnect=self.__live.clear).start()
+        elif warm_up:
+            threading.Thread(target=self.__warm_up_in_background, name="LedgerCacheWarmUp", daemon=True).start()
+        else:
+            self.__warm.set()
+
+    #
+    # Local database
+    #
+
+    def __select(self, query: str, parameters: Sequence):
+        with self.__lock:
+            return self.connection.execute(query, parameters).fetchall()
+
+    def __insert(self, query: str, rows: Sequence[Sequence]):
+        with self.__lock:
+            self.connection.executemany(query, rows)
+            self.connection.commit()
+
+    def __store_elections(self, elections: Sequence[Dict]):
+        self.__insert(INSERT_CACHED_ELECTION, [
+            (election['election_title'], json.dumps(election)) for election in elections
+        ])
+
+    def __store_ballots(self, ballots: Sequence[Dict]):
+        self.__insert(INSERT_CACHED_BALLOT, [
+            (ballot['voter_uuid'], ballot['election_title'], json.dumps(ballot)) for ballot in ballots
+        ])
+
+    def __listing(self, key, load):
+        with self.__lock:
+            value, expires_at = self.__listings.get(key, (_MISSING, 0.0))
+            if value is not _MISSING and expires_at > time.monotonic():
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = load()
+        with self.__lock:
+            self.__listings[key] = (value, time.monotonic() + self.listing_ttl)
+        return value
+
+    def __invalidate_listing(self, key):
+        with self.__lock:
+            self.__listings.pop(key, None)
+
+    def __is_closed(self, election_title: str) -> Optional[bool]:
+        """
+        :return: Whether the election is over, None if it doesn't exist.
+        """
+        election = self.get_election_by_title(election_title)
+        if election is None:
+            return None
+        window = TimeManager.get_election_window(election['start_date'], election['end_date'])
+        return window.phase(TimeManager.get_current_time_as_epoch()) == ElectionPhase.past
+
+    def __closed_ballots(self, election_title: str) -> Optional[List[Dict]]:
+        """
+        :return: Every ballot of the election if it's over (fetched once from the ledger),
+                 None if it's still open.
+        """
+        if self.__select(SELECT_CACHED_CLOSED_ELECTION, (election_title,)):
+            with self.__lock:
+                self.hits += 1
+            return [json.loads(row[0]) for row in self.__select(SELECT_CACHED_BALLOTS, (election_title,))]
+        if not self.__is_closed(election_title):
+            return None
+
+        with self.__lock:
+            self.misses += 1
+        ballots = self.backend_io.get_all_ballots(election_title)
+        self.__store_ballots(ballots)
+        self.__insert(INSERT_CACHED_CLOSED_ELECTION, [(election_title,)])
+        return ballots
+
+    #
+    # Warm up
+    #
+
+    def warm_up(self):
+        """
+        Copies every election and the ballots of every closed election to the local database.
+        """
+        elections = self.backend_io.get_all_elections()
+        self.__store_elections(elections)
+        with self.__lock:
+            self.__listings["get_all_elections"] = (elections, time.monotonic() + self.listing_ttl)
+
+        for election in elections:
+            self.__closed_ballots(election['election_title'])
+
+    def __warm_up_in_background(self):
+        try:
+            self.warm_up()
+        except Exception:
+            # The cache still works without it, every read just goes to the ledger first
+            logging.getLogger(__name__).exception("Couldn't warm up the ledger cache")
+        finally:
+            self.__warm.set()
+
+    def wait_until_warm(self, timeout: float = None) -> bool:
+        return self.__warm.wait(timeout)
+
+    #
+    # Ledger events
+    #
+
+    def __resynchronize(self):
+        # Events missed while disconnected are lost, copy everything again
+        self.__live.clear()
+        try:
+            self.warm_up()
+            # warm_up copied the ballots of the closed elections, copy the open ones' too
+            iter_ballots = getattr(self.backend_io, 'iter_ballots', self.backend_io.get_all_ballots)
+            for row in self.__select(SELECT_CACHED_ELECTIONS, ()):
+                election_title = json.loads(row[0])['election_title']
+                if not self.__select(SELECT_CACHED_CLOSED_ELECTION, (election_title,)):
+                    self.__store_ballots(list(iter_ballots(election_title)))
+            self.__insert(INSERT_CACHED_PARTICIPATION, [
+                (participation['username'], participation['election_title'])
+                for participation in self.backend_io.iter_participations()
+            ])
+        finally:
+            self.__warm.set()
+        self.__live.set()
+
+    def apply_ledger_event(self, event: LedgerEvent):
+        """
+        Copies the election / ballot / participation of a ledger event to the local database.
+        """
+        if event.kind == "election":
+            self.__store_elections([event.record])
+            self.__invalidate_listing("get_all_elections")
+        elif event.kind == "ballot":
+            self.__store_ballots([event.record])
+            self.__invalidate_listing(("get_all_ballots", event.record['election_title']))
+            self.__invalidate_listing(("count_ballots", event.record['election_title']))
+        elif event.kind == "participation":
+            self.__insert(INSERT_CACHED_PARTICIPATION, [(event.record['username'], event.record['election_title'])])
+
+    def is_live(self) -> bool:
+        """
+        :return: Whether the event stream is connected and applied, every read is local while it is.
+        """
+        return self.__live.is_set()
+
+    def wait_until_live(self, timeout: float = None) -> bool:
+        return self.__live.wait(timeout)
+
+    def __hit(self):
+        with self.__lock:
+            self.hits += 1
+
+    def get_cache_stats(self) -> Dict:
+        with self.__lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0,
+                "warm": self.__warm.is_set(),
+                "live": self.__live.is_set(),
+                "events": self.subscriber.events if self.subscriber is not None else 0,
+            }
+
+    #
+    # Permanently cached
+    #
+
+    def get_election_by_title(self, election_title: str) -> Optional[Dict]:
+        rows = self.__select(SELECT_CACHED_ELECTION, (election_title,))
+        with self.__lock:
+            if rows:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if rows:
+            return json.loads(rows[0][0])
+        if self.__live.is_set():
+            return None
+
+        election = self.backend_io.get_election_by_title(election_title)
+        if election is not None:
+            self.__store_elections([election])
+        return election
+
+    def get_elections_by_titles(self, election_titles: Sequence[str]) -> Dict[str, Dict]:
+        output, missing = {}, []
+        for election_title in election_titles:
+            rows = self.__select(SELECT_CACHED_ELECTION, (election_title,))
+            if rows:
+                output[election_title] = json.loads(rows[0][0])
+            else:
+                missing.append(election_title)
+
+        with self.__lock:
+            self.hits += len(output)
+            self.misses += len(missing)
+        if missing and not self.__live.is_set():
+            found = self.backend_io.get_elections_by_titles(missing)
+            self.__store_elections(list(found.values()))
+            output.update(found)
+        return output
+
+    def get_ballot_by_voter_uuid(self, voter_uuid: str) -> Optional[Dict]:
+        rows = self.__select(SELECT_CACHED_BALLOT, (voter_uuid,))
+        with self.__lock:
+            if rows:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if rows:
+            return json.loads(rows[0][0])
+        if self.__live.is_set():
+            return None
+
+        ballot = self.backend_io.get_ballot_by_voter_uuid(voter_uuid)
+        if ballot is not None:
+            self.__store_ballots([ballot])
+        return ballot
+
+    def has_user_participated_in_election(self, username: str, election_title: str) -> bool:
+        # Only True is permanent, the user may still vote otherwise.
+        if self.__select(SELECT_CACHED_PARTICIPATION, (username, election_title)):
+            with self.__lock:
+                self.hits += 1
+            return True
+        if self.__live.is_set():
+            if self.get_election_by_title(election_title) is None:
+                raise ValueError("Can't check if user has participated in non-existent election")
+            return False
+
+        with self.__lock:
+            self.misses += 1
+        participated = self.backend_io.has_user_participated_in_election(username, election_title)
+        if participated:
+            self.__insert(INSERT_CACHED_PARTICIPATION, [(username, election_title)])
+        return participated
+
+    #
+    # Permanently cached once closed, short lived while open
+    #
+
+    def get_all_ballots(self, election_title) -> List[Dict]:
+        if self.__live.is_set():
+            self.__hit()
+            return [json.loads(row[0]) for row in self.__select(SELECT_CACHED_BALLOTS, (election_title,))]
+        ballots = self.__closed_ballots(election_title)
+        if ballots is not None:
+            return ballots
+        return self.__listing(("get_all_ballots", election_title),
+                              lambda: self.backend_io.get_all_ballots(election_title))
+
+    def count_ballots(self, election_title: str) -> int:
+        if self.__live.is_set() or self.__select(SELECT_CACHED_CLOSED_ELECTION, (election_title,)):
+            self.__hit()
+            return self.__select(COUNT_CACHED_BALLOTS, (election_title,))[0][0]
+        return self.__listing(("count_ballots", election_title),
+                              lambda: self.backend_io.count_ballots(election_title))
+
+    def get_all_elections(self) -> List[Dict]:
+        if self.__live.is_set():
+            self.__hit()
+            return [json.loads(row[0]) for row in self.__select(SELECT_CACHED_ELECTIONS, ())]
+        elections = self.__listing("get_all_elections", self.__load_all_elections)
+        return [dict(election) for election in elections]
+
+    def __load_all_elections(self) -> List[Dict]:
+        # Only stored when the listing is actually read from the ledger, not on every cache hit
+        elections = self.backend_io.get_all_elections()
+        self.__store_elections(elections)
+        return elections
+
+    #
+    # Writes go to the ledger, then to the local database.
+    #
+
+    def create_election(self, master_ballot: Dict = None, *args, **kwargs):
+        self.backend_io.create_election(master_ballot, *args, **kwargs)
+        # Not left to the ElectionCreated event, a live read would miss the election until it arrives
+        self.__store_elections([_election_from_asset(_election_asset(master_ballot, *args, **kwargs))])
+        self.__invalidate_listing("get_all_elections")
+
+    def create_elections(self, elections: Sequence[Dict]):
+        self.backend_io.create_elections(elections)
+        self.__store_elections([_election_from_asset(_election_asset(**election)) for election in elections])
+        self.__invalidate_listing("get_all_elections")
+
+    def create_ballot(self, ballot: str,
+                      election_title: str = None,
+                      voter_uuid: str = None,
+                      ballot_signature: str = None,
+                      voter_public_key_b64: str = None):
+        self.backend_io.create_ballot(ballot, election_title=election_title, voter_uuid=voter_uuid,
+                                      ballot_signature=ballot_signature, voter_public_key_b64=voter_public_key_b64)
+        self.__store_ballots([{
+            "voter_uuid": voter_uuid,
+            "ballot": ballot,
+            "ballot_signature": ballot_signature,
+            "election_title": election_title,
+        }])
+        self.__invalidate_listing(("get_all_ballots", election_title))
+        self.__invalidate_listing(("count_ballots", election_title))
+
+    def create_ballots(self, election_title: str, ballots: Sequence[Dict]):
+        self.backend_io.create_ballots(election_title, ballots)
+        self.__store_ballots([{
+            "voter_uuid": ballot['voter_uuid'],
+            "ballot": ballot['ballot'],
+            "ballot_signature": ballot['ballot_signature'],
+            "election_title": election_title,
+        } for ballot in ballots])
+        self.__insert(INSERT_CACHED_PARTICIPATION, [(ballot['username'], election_title) for ballot in ballots])
+        self.__invalidate_listing(("get_all_ballots", election_title))
+        self.__invalidate_listing(("count_ballots", election_title))
+
+    def register_user_as_participated_in_election(self, username: str, election_title: str):
+        result = self.backend_io.register_user_as_participated_in_election(username, election_title)
+        self.__insert(INSERT_CACHED_PARTICIPATION, [(username, election_title)])
+        return result
+
+    def nuke(self):
+        try:
+            self.backend_io.nuke()
+        finally:
+            with self.__lock:
+                for query in DELETE_CACHE:
+                    self.connection.execute(query)
+                self.connection.commit()
+                self.__listings.clear()
+
+    def close(self):
+        if self.subscriber is not None:
+            self.subscriber.stop()
+        self.connection.close()
+        close = getattr(self.backend_io, 'close', None)
+        if close is not None:
+            close()
+
+    def __getattr__(self, item):
+        # Backend specific extras like HyperledgerBackendIO.get_connection_stats()
+        if item == 'backend_io':
+            raise AttributeError(item)
+        return getattr(self.backend_io, item)
@@ -0,0 +1,104 @@
+#
+# src/hyperledger/write_batcher.py
+# Authors:
+#     Samuel Vargas
+#
+# WriteBatcher groups writes that arrive close together so they can be
+# committed to the ledger in one transaction instead of one each.
+#
+# A write waits at most 'max_delay' seconds for others to join its batch,
+# a batch is submitted as soon as it holds 'max_batch_size' writes. Every
+# caller is only answered once the batch holding its write has been
+# committed (or has failed), so an acknowledged vote is on the ledger.
+#
+# The tradeoff: a larger max_delay / max_batch_size means fewer, larger
+# transactions (more votes per second under load) but a longer wait for
+# the first voter of every batch when there is little traffic.
+#
+# Must be used from a single event loop.
+#
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+import asyncio
+import time
+
+
+class WriteBatcher:
+
+    def __init__(self, submit: Callable[[Sequence[Any]], Awaitable[List[Optional[Exception]]]],
+                 max_batch_size: int, max_delay: float):
+        """
+        :param submit: Coroutine function committing a batch of writes, returns one
+                       entry per write: None if it was committed, the exception otherwise.
+        :param max_batch_size: Most writes in one batch.
+        :param max_delay: Most seconds a write waits for the batch to fill up.
+        """
+        self.submit = submit
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self.__pending = []  # (write, future, added_at)
+        self.__timer = None
+        self.__batches = 0
+        self.__writes = 0
+        self.__largest_batch = 0
+        self.__total_wait = 0.0
+
+    async def add(self, write: Any):
+        """
+        Waits until 'write' has been committed.
+        :raises Exception: Whatever prevented this write from being committed.
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self.__pending.append((write, future, time.monotonic()))
+
+        if len(self.__pending) >= self.max_batch_size:
+            self.__flush()
+        elif self.__timer is None:
+            self.__timer = loop.call_later(self.max_delay, self.__flush)
+
+        await future
+
+    def get_stats(self) -> Dict:
+        """
+        :return: {"batches": transactions submitted, "writes": writes committed or failed,
+                  "mean_batch_size": ..., "largest_batch": ...,
+                  "mean_wait": average seconds between a write being added and its answer}
+        """
+        return {
+            "batches": self.__batches,
+            "writes": self.__writes,
+            "mean_batch_size": self.__writes / self.__batches if self.__batches else 0.0,
+            "largest_batch": self.__largest_batch,
+            "mean_wait": self.__total_wait / self.__writes if self.__writes else 0.0,
+        }
+
+    def __flush(self):
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+        if not self.__pending:
+            return
+
+        batch, self.__pending = self.__pending, []
+        asyncio.ensure_future(self.__submit(batch))
+
+    async def __submit(self, batch):
+        try:
+            errors = await self.submit([write for write, _, _ in batch])
+        except Exception as e:
+            errors = [e] * len(batch)
+
+        now = time.monotonic()
+        self.__batches += 1
+        self.__writes += len(batch)
+        self.__largest_batch = max(self.__largest_batch, len(batch))
+        for (_, future, added_at), error in zip(batch, errors):
+            self.__total_wait += now - added_at
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
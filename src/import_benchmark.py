@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+#
+# src/import_benchmark.py
+# Authors:
+#   Samuel Vargas
+#
+# Measures how long importing the lightweight modules takes, each in a
+# fresh interpreter, and flags the ones that got slow again: over their
+# time budget, or loading one of the heavy packages they're meant to
+# defer (Flask, ecdsa, rsa, cryptography, dateutil).
+#
+# The servers run it once in the background at startup and log a warning
+# per regression, it's also a command:
+#
+#   python -m src.import_benchmark
+#
+# which prints every import time and exits with 1 if anything regressed.
+#
+
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages that are only imported once they're actually used
+DEFERRED_PACKAGES = ("flask", "flask_api", "flask_cors", "ecdsa", "rsa", "cryptography", "dateutil")
+
+# module -> most milliseconds its import may take, generous so a slow machine doesn't flag it
+IMPORT_BUDGETS = {
+    "src": 50.0,
+    "src.httpcode": 50.0,
+    "src.time_manager": 50.0,
+    "src.crypto_suite": 50.0,
+    "src.crypto_flow": 50.0,
+}
+
+# Runs in the fresh interpreter, prints {"seconds": ..., "loaded": [deferred packages now imported]}
+_MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+
+class ImportMeasurement(NamedTuple):
+    module: str
+    milliseconds: float
+    loaded: Tuple[str, ...]  # the DEFERRED_PACKAGES importing 'module' loaded
+
+
+def measure(module: str, deferred: Sequence[str] = DEFERRED_PACKAGES) -> ImportMeasurement:
+    """
+    Imports 'module' in a new interpreter, so nothing is already loaded.
+    """
+    output = subprocess.check_output(
+        [sys.executable, "-c", _MEASURE.format(module=module, deferred=tuple(deferred))],
+        cwd=ROOT, universal_newlines=True, timeout=60)
+    result = json.loads(output.splitlines()[-1])
+    return ImportMeasurement(module, result["seconds"] * 1000, tuple(result["loaded"]))
+
+
+def find_regressions(measurements: Sequence[ImportMeasurement], budgets: Dict[str, float] = None) -> List[str]:
+    """
+    :return: A message for every module over its budget or loading a deferred package.
+    """
+    if budgets is None:
+        budgets = IMPORT_BUDGETS
+
+    regressions = []
+    for measurement in measurements:
+        budget = budgets.get(measurement.module)
+        if budget is not None and measurement.milliseconds > budget:
+            regressions.append("Importing {0} took {1:.1f} ms, its budget is {2:.1f} ms".format(
+                measurement.module, measurement.milliseconds, budget))
+        if measurement.loaded:
+            regressions.append("Importing {0} loads {1}, which should be imported on first use".format(
+                measurement.module, ", ".join(measurement.loaded)))
+    return regressions
+
+
+def run(budgets: Dict[str, float] = None) -> List[str]:
+    """
+    Measures every module of 'budgets' (IMPORT_BUDGETS if None) and logs a warning per regression.
+    :return: The regressions
+    """
+    if budgets is None:
+        budgets = IMPORT_BUDGETS
+
+    regressions = find_regressions([measure(module) for module in budgets], budgets)
+    for regression in regressions:
+        logging.getLogger(__name__).warning(regression)
+    return regressions
+
+
+def run_in_background() -> threading.Thread:
+    """
+    Runs the benchmark on a daemon thread so the server starts without waiting for it.
+    """
+    def benchmark():
+        try:
+            run()
+        except (OSError, subprocess.SubprocessError, ValueError):
+            logging.getLogger(__name__).exception("Couldn't run the import benchmark")
+
+    thread = threading.Thread(target=benchmark, name="ImportBenchmark", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    measurements = [measure(module) for module in IMPORT_BUDGETS]
+    for measurement in measurements:
+        print("{0:<20} {1:>8.1f} ms  (budget {2:.1f} ms){3}".format(
+            measurement.module, measurement.milliseconds, IMPORT_BUDGETS[measurement.module],
+            "  loads " + ", ".join(measurement.loaded) if measurement.loaded else ""))
+
+    regressions = find_regressions(measurements)
+    for regression in regressions:
+        print(regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
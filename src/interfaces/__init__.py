@@ -1,2 +1,3 @@
 from .backend_io import BackendIO
-from .json_validator import *
\ No newline at end of file
+from .async_backend_io import AsyncBackendIO
+from .json_validator import *
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+#
+# src/interfaces/async_backend_io.py
+# Authors:
+#     Samuel Vargas
+#
+# AsyncBackendIO is BackendIO with coroutines, for the asyncio API
+# (src/async_intermediary.py): a call waiting on the backend doesn't hold a
+# thread, so one process can have as many calls in flight as the backend
+# accepts. The methods, their arguments and their results are the same as
+# BackendIO's, see there for the formats.
+#
+# AsyncHyperledgerBackendIO implements it natively, ThreadedBackendIO
+# (src/threaded_backend_io.py) adapts any synchronous BackendIO.
+#
+
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+from src.election_phase import ElectionPhase
+from src.time_manager import TimeManager
+import abc
+import asyncio
+
+# Ballots fetched per get_ballots_page call by the default iter_ballots
+_ITER_BALLOTS_PAGE_SIZE = 100
+
+
+class AsyncBackendIO(abc.ABC):
+
+    @abc.abstractmethod
+    async def create_election(self, master_ballot: Dict = None,
+                              creator_username: str = None,
+                              creator_master_ballot_signature: str = None,
+                              creator_public_key_b64: str = None,
+                              election_public_rsa_key: str = None,
+                              election_private_rsa_key: str = None,
+                              election_encrypted_fernet_key: str = None):
+        raise NotImplementedError
+
+    async def create_elections(self, elections: Sequence[Dict]):
+        """
+        See BackendIO.create_elections, the default implementation calls create_election for each election.
+        """
+        for election in elections:
+            await self.create_election(**election)
+
+    @abc.abstractmethod
+    async def create_ballot(self, ballot: str,
+                            election_title: str = None,
+                            voter_uuid: str = None,
+                            ballot_signature: str = None,
+                            voter_public_key_b64: str = None):
+        raise NotImplementedError
+
+    async def create_ballots(self, election_title: str, ballots: Sequence[Dict]):
+        """
+        See BackendIO.create_ballots, the default implementation calls create_ballot
+        and register_user_as_participated_in_election for each ballot.
+        """
+        for ballot in ballots:
+            await self.create_ballot(
+                ballot['ballot'],
+                election_title=election_title,
+                voter_uuid=ballot['voter_uuid'],
+                ballot_signature=ballot['ballot_signature'],
+                voter_public_key_b64=ballot['voter_public_key_b64']
+            )
+            await self.register_user_as_participated_in_election(ballot['username'], election_title)
+
+    @abc.abstractmethod
+    async def get_election_by_title(self, election_title: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def get_elections_by_titles(self, election_titles: Sequence[str]) -> Dict[str, Dict]:
+        """
+        See BackendIO.get_elections_by_titles, the default implementation looks
+        every title up with get_election_by_title, concurrently.
+        """
+        election_titles = list(dict.fromkeys(election_titles))
+        elections = await asyncio.gather(*(self.get_election_by_title(title) for title in election_titles))
+        return {title: election for title, election in zip(election_titles, elections) if election is not None}
+
+    @abc.abstractmethod
+    async def get_ballot_by_voter_uuid(self, voter_uuid: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def register_user_as_participated_in_election(self, username: str, election_title: str):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def has_user_participated_in_election(self, username: str, election_title: str) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_all_ballots(self, election_title) -> List[Dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_all_elections(self) -> List[Dict]:
+        raise NotImplementedError
+
+    async def iter_ballots(self, election_title: str) -> AsyncIterator[Dict]:
+        """
+        See BackendIO.iter_ballots, the default implementation reads
+        the ballots one get_ballots_page at a time.
+        """
+        after_voter_uuid = None
+        while True:
+            page = await self.get_ballots_page(election_title, after_voter_uuid, _ITER_BALLOTS_PAGE_SIZE)
+            for ballot in page:
+                yield ballot
+            if len(page) < _ITER_BALLOTS_PAGE_SIZE:
+                return
+            after_voter_uuid = page[-1]['voter_uuid']
+
+    async def count_ballots(self, election_title: str) -> int:
+        """
+        See BackendIO.count_ballots, the default implementation counts get_all_ballots.
+        """
+        return len(await self.get_all_ballots(election_title))
+
+    async def get_ballots_page(self, election_title: str,
+                               after_voter_uuid: str = None,
+                               limit: int = None) -> List[Dict]:
+        """
+        See BackendIO.get_ballots_page, the default implementation sorts get_all_ballots in memory.
+        """
+        ballots = sorted(await self.get_all_ballots(election_title), key=lambda b: b['voter_uuid'])
+        if after_voter_uuid is not None:
+            ballots = [b for b in ballots if b['voter_uuid'] > after_voter_uuid]
+        return ballots if limit is None else ballots[:limit]
+
+    async def get_elections_page(self, after_election_title: str = None, limit: int = None) -> List[Dict]:
+        """
+        See BackendIO.get_elections_page, the default implementation sorts get_all_elections in memory.
+        """
+        elections = sorted(await self.get_all_elections(), key=lambda e: e['election_title'])
+        if after_election_title is not None:
+            elections = [e for e in elections if e['election_title'] > after_election_title]
+        return elections if limit is None else elections[:limit]
+
+    async def get_elections_in_phase(self, phase: ElectionPhase, now: int,
+                                     after_election_title: str = None,
+                                     limit: int = None,
+                                     fields: Sequence[str] = None) -> List[Dict]:
+        """
+        See BackendIO.get_elections_in_phase, the default implementation filters get_elections_page in memory.
+        """
+        output = []
+        for election in await self.get_elections_page(after_election_title):
+            window = TimeManager.get_election_window(election['start_date'], election['end_date'])
+            if window.phase(now) != phase:
+                continue
+
+            if phase != ElectionPhase.past:
+                election.pop('election_private_key')
+            if fields is not None:
+                election = {field: election[field] for field in fields if field in election}
+            output.append(election)
+            if len(output) == limit:
+                break
+
+        return output
+
+    async def search_elections(self, query: str, offset: int = 0, limit: int = None,
+                               fields: Sequence[str] = None) -> List[Dict]:
+        """
+        See BackendIO.search_elections.
+        :raises NotImplementedError: If the backend can't search.
+        """
+        raise NotImplementedError
+
+    async def get_next_phase_transition(self, now: int) -> Optional[int]:
+        """
+        See BackendIO.get_next_phase_transition, the default implementation scans get_all_elections.
+        """
+        transitions = []
+        for election in await self.get_all_elections():
+            window = TimeManager.get_election_window(election['start_date'], election['end_date'])
+            transitions.extend(t for t in (window.start, window.end + 1) if t > now)
+
+        return min(transitions) if transitions else None
+
+    #
+    # The versions must be cheap to compute (no storage access),
+    # so unlike every other method they aren't coroutines.
+    #
+
+    def get_catalog_version(self, now: int) -> Optional[str]:
+        """
+        See BackendIO.get_catalog_version.
+        """
+        return None
+
+    def get_election_version(self, election_title: str) -> Optional[str]:
+        """
+        See BackendIO.get_election_version.
+        """
+        return None
+
+    async def get_changes(self, since: int, now: int, limit: int = None) -> List[Dict]:
+        """
+        See BackendIO.get_changes.
+        :raises NotImplementedError: If the backend doesn't keep a change log.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def nuke(self):
+        raise NotImplementedError
@@ -4,7 +4,9 @@
 # Authors:
 #     Samuel Vargas
 
-from typing import Optional, List, Dict
+from typing import Optional, Iterator, List, Dict, Sequence
+from src.election_phase import ElectionPhase
+from src.time_manager import TimeManager
 import abc
 
 
@@ -57,6 +59,27 @@ class BackendIO(abc.ABC):
         """
         raise NotImplementedError
 
+    def create_elections(self, elections: Sequence[Dict]):
+        """
+        Creates many elections at once, as a single transaction if the backend can.
+
+        :param elections: A list of dictionaries holding the keyword arguments of
+                          create_election (as passed by /api/election/create):
+                          {
+                              "master_ballot": { ... },
+                              "creator_username": "...",
+                              "creator_master_ballot_signature": "...",
+                              "creator_public_key_b64": "...",
+                              "election_private_rsa_key": "...",
+                              "election_public_rsa_key": "...",
+                              "election_encrypted_fernet_key": "..."
+                          }
+
+        The default implementation calls create_election for each election.
+        """
+        for election in elections:
+            self.create_election(**election)
+
     @abc.abstractmethod
     def create_ballot(self, ballot: str,
                             ballot_signature_b64: str = None,
@@ -74,10 +97,54 @@ class BackendIO(abc.ABC):
         """
         raise NotImplementedError
 
+    def create_ballots(self, election_title: str, ballots: Sequence[Dict]):
+        """
+        Stores many ballots of the same election and registers their voters as
+        having participated in it, as a single transaction if the backend can.
+
+        :param ballots: A list of dictionaries with the following format
+                        {
+                            "ballot": "Encrypted ballot",
+                            "voter_uuid": "...",
+                            "ballot_signature": "...",
+                            "voter_public_key_b64": "...",
+                            "username": "The voter that cast this ballot"
+                        }
+
+        The default implementation calls create_ballot and
+        register_user_as_participated_in_election for each ballot.
+        """
+        for ballot in ballots:
+            self.create_ballot(
+                ballot['ballot'],
+                election_title=election_title,
+                voter_uuid=ballot['voter_uuid'],
+                ballot_signature=ballot['ballot_signature'],
+                voter_public_key_b64=ballot['voter_public_key_b64']
+            )
+            self.register_user_as_participated_in_election(ballot['username'], election_title)
+
     @abc.abstractmethod
     def get_election_by_title(self, election_title: str) -> Optional[Dict]:
         raise NotImplementedError
 
+    def get_elections_by_titles(self, election_titles: Sequence[str]) -> Dict[str, Dict]:
+        """
+        Looks up many elections at once.
+
+        :return: {election_title: election} (same format as get_election_by_title)
+                 for each of the 'election_titles' that exist, missing titles are left out.
+
+        The default implementation calls get_election_by_title for each title,
+        backends that can fetch them in a single query should override it.
+        """
+        output = {}
+        for election_title in election_titles:
+            election = self.get_election_by_title(election_title)
+            if election is not None:
+                output[election_title] = election
+        return output
+
     @abc.abstractmethod
     def get_ballot_by_voter_uuid(self, voter_uuid: str) -> Optional[Dict]:
         raise NotImplementedError
@@ -128,6 +195,172 @@ class BackendIO(abc.ABC):
     def get_all_elections(self) -> List[Dict]:
         raise NotImplementedError
 
+    def iter_ballots(self, election_title: str) -> Iterator[Dict]:
+        """
+        Same as get_all_ballots but returns an iterator so the ballots
+        can be streamed to the client without holding all of them in memory.
+
+        The default implementation simply iterates over get_all_ballots,
+        backends that can fetch rows incrementally should override it.
+        """
+        return iter(self.get_all_ballots(election_title))
+
+    def count_ballots(self, election_title: str) -> int:
+        """
+        :return: The number of ballots cast in the given election.
+
+        The default implementation counts get_all_ballots,
+        backends that can count without reading the ballots should override it.
+        """
+        return len(self.get_all_ballots(election_title))
+
+    def get_ballots_page(self, election_title: str,
+                         after_voter_uuid: str = None,
+                         limit: int = None) -> List[Dict]:
+        """
+        Keyset pagination over the ballots of a given election.
+
+        Should return at most 'limit' ballots (same format as get_all_ballots)
+        ordered by 'voter_uuid', starting with the first ballot whose
+        'voter_uuid' is strictly greater than 'after_voter_uuid'.
+
+        The default implementation sorts the result of get_all_ballots in memory,
+        backends with an index on (election_title, voter_uuid) should override it.
+        """
+        ballots = sorted(self.get_all_ballots(election_title), key=lambda b: b['voter_uuid'])
+        if after_voter_uuid is not None:
+            ballots = [b for b in ballots if b['voter_uuid'] > after_voter_uuid]
+        return ballots if limit is None else ballots[:limit]
+
+    def get_elections_page(self, after_election_title: str = None, limit: int = None) -> List[Dict]:
+        """
+        Keyset pagination over all elections.
+
+        Should return at most 'limit' elections (same format as get_all_elections)
+        ordered by 'election_title', starting with the first election whose
+        'election_title' is strictly greater than 'after_election_title'.
+
+        The default implementation sorts the result of get_all_elections in memory,
+        backends with an index on election_title should override it.
+        """
+        elections = sorted(self.get_all_elections(), key=lambda e: e['election_title'])
+        if after_election_title is not None:
+            elections = [e for e in elections if e['election_title'] > after_election_title]
+        return elections if limit is None else elections[:limit]
+
+    def get_elections_in_phase(self, phase: ElectionPhase, now: int,
+                               after_election_title: str = None,
+                               limit: int = None,
+                               fields: Sequence[str] = None) -> List[Dict]:
+        """
+        Returns the elections that are in 'phase' at the time 'now'
+        (seconds since the UTC epoch) ordered by 'election_title'.
+
+        'after_election_title' and 'limit' work the same as in get_elections_page.
+
+        'fields' is the subset of src.fieldsets.ELECTION_FIELDS each returned election
+        should contain (always including 'election_title'), None for every field.
+        Backends should only read the requested columns from storage.
+
+        The 'election_private_key' of past elections should be included,
+        it should be left out for present and future elections.
+
+        The default implementation filters get_elections_page in memory,
+        backends that store start_date / end_date as sortable timestamps should override it.
+        """
+        output = []
+        for election in self.get_elections_page(after_election_title):
+            window = TimeManager.get_election_window(election['start_date'], election['end_date'])
+            if window.phase(now) != phase:
+                continue
+
+            if phase != ElectionPhase.past:
+                election.pop('election_private_key')
+            if fields is not None:
+                election = {field: election[field] for field in fields if field in election}
+            output.append(election)
+            if len(output) == limit:
+                break
+
+        return output
+
+    def search_elections(self, query: str, offset: int = 0, limit: int = None,
+                         fields: Sequence[str] = None) -> List[Dict]:
+        """
+        Full text search over the election titles and descriptions.
+
+        Every word in 'query' should match the start of a word in the title or
+        description (prefix match). Results are ordered best match first, matches
+        in the title ranking above matches in the description.
+
+        'fields' works the same as in get_elections_in_phase, the
+        'election_private_key' is never returned by a search.
+
+        :raises NotImplementedError: If the backend can't search, ElectionPhaseIndex
+                                     then answers from an in-memory index instead.
+        """
+        raise NotImplementedError
+
+    def get_next_phase_transition(self, now: int) -> Optional[int]:
+        """
+        :return: The first UTC epoch after 'now' at which any election
+                 opens (its start) or closes (one second past its end),
+                 None if every election has already closed.
+
+        The default implementation scans get_all_elections.
+        """
+        transitions = []
+        for election in self.get_all_elections():
+            window = TimeManager.get_election_window(election['start_date'], election['end_date'])
+            transitions.extend(t for t in (window.start, window.end + 1) if t > now)
+
+        return min(transitions) if transitions else None
+
+    def get_catalog_version(self, now: int) -> Optional[str]:
+        """
+        :return: An opaque version that changes whenever an election is created
+                 or opens / closes at or before 'now'. Used as an HTTP ETag for the listings,
+                 so it must be cheap to compute (no storage access), and the same in every
+                 process serving the backend so that any of them can answer If-None-Match.
+
+        Backends that can't track this return None and the API won't send an ETag.
+        """
+        return None
+
+    def get_election_version(self, election_title: str) -> Optional[str]:
+        """
+        :return: An opaque version that changes whenever the election with this title is
+                 (re)created, None if it isn't known. Same requirements as get_catalog_version.
+        """
+        return None
+
+    def get_changes(self, since: int, now: int, limit: int = None) -> List[Dict]:
+        """
+        Change feed of the election catalog. Every election creation and every
+        election opening / closing is recorded with a sequence number that
+        only ever increases.
+
+        Opening / closing happens as time passes rather than on a write, so the backend
+        should record every transition at or before 'now' (seconds since the UTC epoch)
+        before reading. Transitions that happened before an election was created
+        aren't recorded, the election_created change already describes its state.
+
+        :return: At most 'limit' changes with a 'seq' greater than 'since', ordered by 'seq':
+                 [
+                    {
+                      "seq": 12,
+                      "election_title": "Title of the election",
+                      "event": "election_created" / "election_opened" / "election_closed",
+                      "epoch": 1521507388
+                    },
+                    ...
+                 ]
+
+        :raises NotImplementedError: If the backend doesn't keep a change log,
+                                     there is no way to derive one after the fact.
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def nuke(self):
         """
@@ -8,8 +8,13 @@
 from flask_cors import CORS, cross_origin
 from flask import Flask, request, jsonify
 from src.interfaces import BackendIO
+from src.election_phase_index import ElectionPhaseIndex
+from src.caching_backend_io import CachingBackendIO
+from src.response_cache import ResponseCache
+from src.event_publisher import EventPublisher
 from src.settings import SETTINGS
-from src.api import authentication, election, vote, tally
+from src.api import authentication, election, vote, tally, server
+from src import import_benchmark
 import uuid
 
 app = Flask(__name__)
@@ -20,16 +25,38 @@ app.register_blueprint(authentication)
 app.register_blueprint(election)
 app.register_blueprint(vote)
 app.register_blueprint(tally)
+app.register_blueprint(server)
 
 app.config['SECRET_KEY'] = str(uuid.uuid4())
 app.config['PROPAGATE_EXCEPTIONS'] = True
 app.config['PRESERVE_CONTEXT_ON_EXCEPTION'] = False
 
 
-def start(backend_io: BackendIO, shared_password: str = None, url: str = None, port: int = None):
+def wrap_backend_io(backend_io: BackendIO, sync_interval: float = None) -> BackendIO:
+    """
+    Puts the in-memory election phase index and lookup cache in front of a
+    plain BackendIO. Callers that already built their own stack
+    (backend_io is one of the wrappers) get it back untouched.
+
+    'sync_interval' is passed to the ElectionPhaseIndex, set it when other
+    processes write to the same backend.
+    """
+    if isinstance(backend_io, (CachingBackendIO, ElectionPhaseIndex)):
+        return backend_io
+
+    return CachingBackendIO(ElectionPhaseIndex(backend_io, sync_interval))
+
+
+def configure(backend_io: BackendIO, shared_password: str = None, url: str = None, port: int = None,
+              sync_interval: float = None):
+    """
+    Sets up SETTINGS for serving with 'backend_io', without starting a server.
+    """
     assert backend_io, "'backend_io' cannot be None"
 
-    SETTINGS['BACKEND_IO'] = backend_io
+    SETTINGS['BACKEND_IO'] = wrap_backend_io(backend_io, sync_interval)
+    SETTINGS['RESPONSE_CACHE'] = ResponseCache()
+    SETTINGS['EVENT_PUBLISHER'] = EventPublisher(SETTINGS['BACKEND_IO'], shared=sync_interval is not None)
 
     if shared_password:
         SETTINGS['SHARED_PASSWORD'] = shared_password
@@ -40,6 +67,14 @@ def start(backend_io: BackendIO, shared_password: str = None, url: str = None, p
     if port:
         SETTINGS['PORT'] = port
 
+
+def start(backend_io: BackendIO, shared_password: str = None, url: str = None, port: int = None):
+    """
+    Serves the API from this process with Flask's development server,
+    see src/prefork_server.py to serve from several processes.
+    """
+    configure(backend_io, shared_password, url, port)
+    import_benchmark.run_in_background()
     app.run(SETTINGS['URL'], SETTINGS['PORT'])
 
 
@@ -47,6 +82,10 @@ def start_test(backend_io: BackendIO, shared_password: str = None):
     assert backend_io, "'backend_io' cannot be None"
 
     SETTINGS['BACKEND_IO'] = backend_io
+    SETTINGS['RESPONSE_CACHE'] = ResponseCache()
+
+    # Tests drive the publisher with EventPublisher.poll() instead of a background thread.
+    SETTINGS['EVENT_PUBLISHER'] = EventPublisher(backend_io, autostart=False)
 
     if shared_password:
         SETTINGS['SHARED_PASSWORD'] = shared_password
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# src/pagination.py
+# Authors:
+#     Samuel Vargas
+#
+# Keyset (cursor) pagination helpers shared by the listing endpoints.
+#
+# Clients opt into pagination by sending a 'limit' and / or an 'after'
+# query parameter. 'after' is an opaque cursor that the server hands back
+# in the 'next' field of the previous page, internally it's just the
+# indexed column value of the last row that was returned.
+#
+
+from typing import Dict, List, Optional, Tuple
+import base64
+import binascii
+import json
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+
+def encode_cursor(key: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('utf-8')
+
+
+def decode_cursor(cursor: str) -> str:
+    """
+    :raises ValueError: If the cursor was not created by encode_cursor
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Malformed pagination cursor")
+
+    if not isinstance(key, str):
+        raise ValueError("Malformed pagination cursor")
+
+    return key
+
+
+def is_paginated(args) -> bool:
+    return 'limit' in args or 'after' in args
+
+
+def get_page_parameters(args) -> Tuple[int, Optional[str]]:
+    """
+    Reads 'limit' and 'after' from the request arguments.
+
+    :raises ValueError: If 'limit' isn't an integer between 1 and MAX_PAGE_LIMIT
+                        or 'after' isn't a valid cursor.
+    :return: (limit, after) where after is the decoded key or None.
+    """
+    limit = int(args.get('limit', DEFAULT_PAGE_LIMIT))
+    if limit < 1 or limit > MAX_PAGE_LIMIT:
+        raise ValueError("'limit' must be between 1 and {0}".format(MAX_PAGE_LIMIT))
+
+    after = args.get('after')
+    if after is not None:
+        after = decode_cursor(after)
+
+    return limit, after
+
+
+def get_change_feed_parameters(args) -> Tuple[int, int]:
+    """
+    Reads 'since' and 'limit' from the request arguments of the change feed,
+    'since' is the last sequence number the client has seen (0 for everything).
+
+    :raises ValueError: If 'since' isn't a non negative integer
+                        or 'limit' isn't an integer between 1 and MAX_PAGE_LIMIT.
+    :return: (since, limit)
+    """
+    since = int(args.get('since', 0))
+    if since < 0:
+        raise ValueError("'since' must be >= 0")
+
+    limit = int(args.get('limit', DEFAULT_PAGE_LIMIT))
+    if limit < 1 or limit > MAX_PAGE_LIMIT:
+        raise ValueError("'limit' must be between 1 and {0}".format(MAX_PAGE_LIMIT))
+
+    return since, limit
+
+
+def make_page(rows: List[Dict], limit: int, key: str) -> Dict:
+    """
+    :param rows: Up to limit + 1 rows, the extra row (if present) only signals
+                 that another page exists and isn't returned to the client.
+    :param limit: The page size requested by the client.
+    :param key: The column the rows are ordered by.
+    """
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(items[-1][key])
+
+    return {
+        "items": items,
+        "next": next_cursor
+    }
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+#
+# src/prefork_server.py
+# Authors:
+#   Samuel Vargas
+#
+# PreforkServer serves the API from several processes, unlike
+# intermediary.start (Flask's development server, one process).
+#
+# The master process opens the listening socket and forks 'workers'
+# processes that all accept connections from it, each serving its
+# connections on threads of its own. Every worker builds its own BackendIO by calling
+# 'backend_io_factory' after the fork, so no connection (SQLite,
+# pooled HTTP...) is ever shared between processes. Workers that die are
+# replaced.
+#
+# Each worker has its own in-memory election index, the indexes follow
+# the backend's change feed (see ElectionPhaseIndex.sync_interval) to
+# pick up the elections created through the other workers. With SQLite,
+# use a database file in WAL mode:
+#
+#   python -m src.prefork_server --workers 4 --db ballotblock.db
+#
+# An /api/election/events stream holds one thread of its worker for as
+# long as the client listens, not the whole worker. Threads aren't capped,
+# so every open stream costs a thread (and its stack) until the client
+# leaves. Stopping a worker ends its streams, EventSource clients reconnect
+# to the other workers on their own.
+#
+# Signals sent to the master:
+#   SIGHUP          graceful reload: a new set of workers (and BackendIOs) is
+#                   started, then the old ones finish their requests and exit.
+#   SIGTERM/SIGINT  graceful stop.
+#
+# GET /api/server/workers returns the worker count and each worker's
+# request rate, kept in shared memory: workers count their requests, the
+# master turns the counts into rates once per STATS_INTERVAL.
+#
+# POSIX only (os.fork).
+#
+
+from typing import Callable, Dict
+from multiprocessing.sharedctypes import RawArray
+from werkzeug.serving import make_server
+from src.interfaces import BackendIO
+from src.settings import SETTINGS
+from src.intermediary import app, configure
+from src import import_benchmark
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# Seconds between two reads of the backend's change feed by each worker's election index
+DEFAULT_SYNC_INTERVAL = 1.0
+
+# Seconds a stopping worker gets to finish its requests before it's killed
+DEFAULT_GRACEFUL_TIMEOUT = 30.0
+
+# Seconds between two updates of the request rates
+STATS_INTERVAL = 1.0
+
+# How often a worker stops waiting for a connection to check whether it should exit
+_WORKER_POLL_INTERVAL = 0.5
+
+
+class PreforkServer:
+
+    def __init__(self, backend_io_factory: Callable[[], BackendIO],
+                 workers: int = DEFAULT_WORKERS,
+                 url: str = None,
+                 port: int = None,
+                 shared_password: str = None,
+                 sync_interval: float = DEFAULT_SYNC_INTERVAL,
+                 graceful_timeout: float = DEFAULT_GRACEFUL_TIMEOUT):
+        """
+        :param backend_io_factory: Called once in every worker (and once in the master before
+                                   forking, for one-time setup like creating the SQLite tables).
+        :param workers: Worker processes.
+        :param url: Address to listen on, SETTINGS['URL'] if None.
+        :param port: Port to listen on, SETTINGS['PORT'] if None, 0 picks a free port.
+        :param shared_password: See intermediary.start.
+        :param sync_interval: See ElectionPhaseIndex, None if the workers never create elections.
+        :param graceful_timeout: Seconds a stopping worker gets to finish its requests.
+        """
+        assert workers >= 1, "'workers' must be at least 1"
+        self.backend_io_factory = backend_io_factory
+        self.workers = workers
+        self.url = url or SETTINGS['URL']
+        self.port = port if port is not None else SETTINGS['PORT']
+        self.shared_password = shared_password
+        self.sync_interval = sync_interval
+        self.graceful_timeout = graceful_timeout
+        self.socket = None
+
+        # Shared with the workers, one slot per worker
+        self.__pids = RawArray('l', workers)
+        self.__requests = RawArray('Q', workers)  # only written by the slot's worker
+        self.__rates = RawArray('d', workers)     # only written by the master
+
+        self.__workers = {}   # pid -> slot of the current workers
+        self.__retiring = {}  # pid -> time.monotonic() it gets killed at
+        self.__reload_requested = False
+        self.__stop_requested = False
+
+    def get_stats(self) -> Dict:
+        """
+        :return: See GET /api/server/workers, from any process.
+        """
+        processes = [{
+            "worker": slot,
+            "pid": self.__pids[slot],
+            "requests": self.__requests[slot],
+            "requests_per_second": self.__rates[slot],
+        } for slot in range(self.workers)]
+        return {
+            "workers": self.workers,
+            "requests_per_second": sum(process["requests_per_second"] for process in processes),
+            "worker_processes": processes,
+        }
+
+    def reload(self):
+        """
+        Graceful reload, the same as sending SIGHUP to the master.
+        """
+        self.__reload_requested = True
+
+    def stop(self):
+        """
+        Graceful stop, the same as sending SIGTERM to the master.
+        """
+        self.__stop_requested = True
+
+    #
+    # Master
+    #
+
+    def serve_forever(self):
+        self.socket = socket.socket(socket.AF_INET6 if ":" in self.url else socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.url, self.port))
+        self.socket.listen(128)
+        # Every worker waits on this socket, the ones that lose the race for a connection must not block
+        self.socket.setblocking(False)
+        self.port = self.socket.getsockname()[1]
+
+        # One-time setup (creating tables, migrations) done here so the workers don't race each other
+        _close(self.backend_io_factory())
+
+        signal.signal(signal.SIGHUP, lambda *_: self.reload())
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        signal.signal(signal.SIGINT, lambda *_: self.stop())
+
+        logging.getLogger(__name__).info("Serving on http://%s:%d with %d workers (master pid %d)",
+                                         self.url, self.port, self.workers, os.getpid())
+
+        for slot in range(self.workers):
+            self.__spawn(slot)
+
+        # Once for the whole server rather than once per worker
+        import_benchmark.run_in_background()
+
+        counted = list(self.__requests)
+        counted_at = time.monotonic()
+        try:
+            while not self.__stop_requested:
+                time.sleep(0.05)
+                self.__reap()
+                if self.__reload_requested:
+                    self.__reload_requested = False
+                    self.__reload()
+
+                now = time.monotonic()
+                if now - counted_at >= STATS_INTERVAL:
+                    for slot in range(self.workers):
+                        requests = self.__requests[slot]
+                        self.__rates[slot] = (requests - counted[slot]) / (now - counted_at)
+                        counted[slot] = requests
+                    counted_at = now
+        finally:
+            self.__stop_workers()
+            self.socket.close()
+
+    def __spawn(self, slot: int):
+        # Don't let the worker inherit (and print again) anything still buffered
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                self.__run_worker(slot)
+            except BaseException:
+                logging.getLogger(__name__).exception("Worker %d failed", slot)
+                status = 1
+            finally:
+                os._exit(status)
+
+        self.__workers[pid] = slot
+        self.__pids[slot] = pid
+
+    def __reload(self):
+        for pid in self.__workers:
+            self.__retire(pid)
+        self.__workers = {}
+        for slot in range(self.workers):
+            self.__spawn(slot)
+
+    def __retire(self, pid: int):
+        self.__retiring[pid] = time.monotonic() + self.graceful_timeout
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def __reap(self):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in self.__workers:
+                slot = self.__workers.pop(pid)
+                if not self.__stop_requested:
+                    logging.getLogger(__name__).warning("Worker %d (pid %d) died, replacing it", slot, pid)
+                    self.__spawn(slot)
+            self.__retiring.pop(pid, None)
+
+        now = time.monotonic()
+        for pid, deadline in list(self.__retiring.items()):
+            if now >= deadline:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    self.__retiring.pop(pid)
+
+    def __stop_workers(self):
+        self.__stop_requested = True
+        for pid in list(self.__workers):
+            self.__retire(pid)
+        self.__workers = {}
+        while self.__retiring:
+            self.__reap()
+            time.sleep(0.05)
+
+    #
+    # Worker
+    #
+
+    def __run_worker(self, slot: int):
+        master = os.getppid()
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+        signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        # Connections are only opened after the fork, no two processes share one
+        backend_io = self.backend_io_factory()
+        configure(backend_io, self.shared_password, sync_interval=self.sync_interval)
+        SETTINGS['WORKER_STATS'] = self.get_stats
+
+        requests = self.__requests
+        # The requests are handled on threads, += on the shared counter isn't atomic
+        counting = threading.Lock()
+
+        def application(environ, start_response):
+            with counting:
+                requests[slot] += 1
+            return app(environ, start_response)
+
+        server = make_server(self.url, self.port, application, threaded=True, fd=self.socket.fileno())
+        # server_close() then waits for the requests in progress
+        server.daemon_threads = False
+        # Bounds both the wait for a connection and accept() after losing the race for one
+        server.socket.settimeout(_WORKER_POLL_INTERVAL)
+        server.timeout = _WORKER_POLL_INTERVAL
+        try:
+            # A worker whose master died (was killed) exits on its own.
+            while not stopping and os.getppid() == master:
+                server.handle_request()
+        finally:
+            # The event streams never finish on their own, the other requests are waited for
+            SETTINGS['EVENT_PUBLISHER'].stop()
+            server.server_close()
+            _close(SETTINGS['BACKEND_IO'])
+
+
+def _close(backend_io: BackendIO):
+    close = getattr(backend_io, 'close', None)
+    if close is not None:
+        close()
+
+
+def serve(backend_io_factory: Callable[[], BackendIO], workers: int = DEFAULT_WORKERS, **kwargs):
+    """
+    Serves the API from 'workers' processes until SIGTERM / SIGINT, see PreforkServer.
+    """
+    PreforkServer(backend_io_factory, workers, **kwargs).serve_forever()
+
+
+def main():
+    from src.sqlite import SQLiteBackendIO
+
+    parser = argparse.ArgumentParser(description="Serves the API from several processes over a SQLite database")
+    parser.add_argument("--db", required=True, help="SQLite database file, opened in WAL mode")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--url", default=SETTINGS['URL'])
+    parser.add_argument("--port", type=int, default=SETTINGS['PORT'])
+    parser.add_argument("--shared-password", default=None)
+    arguments = parser.parse_args()
+
+    # The workers inherit it, the pid tells them apart
+    logging.basicConfig(level=logging.INFO, format="[%(process)d] %(levelname)s %(name)s: %(message)s")
+    serve(lambda: SQLiteBackendIO(arguments.db, journal_mode="wal"), arguments.workers,
+          url=arguments.url, port=arguments.port, shared_password=arguments.shared_password)
+
+
+if __name__ == '__main__':
+    main()
@@ -28,10 +28,18 @@ REQUIRED_ELECTION_KEYS = (
     "master_ballot_signature"
 )
 
+REQUIRED_ELECTION_BULK_CREATE_KEYS = (
+    "elections",
+)
+
 REQUIRED_ELECTION_SEARCH_BY_TITLE_KEYS = (
     "election_title",  # DO NOT remove this comma
 )
 
+REQUIRED_ELECTION_GET_BY_TITLES_KEYS = (
+    "election_titles",
+)
+
 REQUIRED_ELECTION_VOTE_BALLOT_KEYS = (
     "election_title",
     "answers"
@@ -43,6 +51,16 @@ REQUIRED_ELECTION_VOTE_KEYS = (
     "ballot_signature"
 )
 
+REQUIRED_ELECTION_BULK_VOTE_KEYS = (
+    "election_title",
+    "ballots"
+)
+
+# Each ballot in a bulk vote also carries the voter's authentication cookie ("token")
+REQUIRED_ELECTION_BULK_VOTE_BALLOT_KEYS = REQUIRED_ELECTION_VOTE_KEYS + (
+    "token",
+)
+
 #
 # Tallying
 #
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# src/response_cache.py
+# Authors:
+#   Samuel Vargas
+#
+# ResponseCache holds ready to send JSON bodies for the election read endpoints.
+#
+# A single election is cached once per redaction state (with / without the
+# election_private_key) so the cached body never has to be checked for a
+# phase change, the caller picks the variant matching the current phase.
+#
+# Listings are cached until the next time an election opens or closes
+# (valid_until) and are dropped whenever an election is created. Elections
+# created by another process don't go through invalidate_election, so the
+# election views also put the backend's catalog version in the listing key.
+#
+
+from typing import Hashable, Optional, Tuple
+from collections import OrderedDict
+import threading
+
+
+class ResponseCache:
+
+    def __init__(self, max_elections: int = 4096, max_listings: int = 256):
+        self.max_elections = max_elections
+        self.max_listings = max_listings
+        self.__lock = threading.Lock()
+        self.__elections = OrderedDict()  # election_title -> (start_date, end_date, {redacted: body})
+        self.__listings = OrderedDict()   # key -> (valid_until or None, body)
+
+    def get_election_dates(self, election_title: str) -> Optional[Tuple[str, str]]:
+        with self.__lock:
+            entry = self.__elections.get(election_title)
+            return None if entry is None else (entry[0], entry[1])
+
+    def get_election(self, election_title: str, redacted: bool) -> Optional[bytes]:
+        with self.__lock:
+            entry = self.__elections.get(election_title)
+            if entry is None:
+                return None
+            self.__elections.move_to_end(election_title)
+            return entry[2].get(redacted)
+
+    def put_election(self, election_title: str, start_date: str, end_date: str, redacted: bool, body: bytes):
+        with self.__lock:
+            entry = self.__elections.get(election_title)
+            if entry is None or entry[0] != start_date or entry[1] != end_date:
+                entry = (start_date, end_date, {})
+                self.__elections[election_title] = entry
+            entry[2][redacted] = body
+            self.__elections.move_to_end(election_title)
+            while len(self.__elections) > self.max_elections:
+                self.__elections.popitem(last=False)
+
+    def get_listing(self, key: Hashable, now: int) -> Optional[bytes]:
+        with self.__lock:
+            entry = self.__listings.get(key)
+            if entry is None:
+                return None
+
+            valid_until, body = entry
+            if valid_until is not None and now >= valid_until:
+                del self.__listings[key]
+                return None
+
+            self.__listings.move_to_end(key)
+            return body
+
+    def put_listing(self, key: Hashable, body: bytes, valid_until: Optional[int]):
+        """
+        :param valid_until: The UTC epoch at which an election next opens / closes,
+                            None if the listing can't change until an election is created.
+        """
+        with self.__lock:
+            self.__listings[key] = (valid_until, body)
+            self.__listings.move_to_end(key)
+            while len(self.__listings) > self.max_listings:
+                self.__listings.popitem(last=False)
+
+    def invalidate_election(self, election_title: str):
+        """
+        Call whenever an election is created, every listing may contain it.
+        """
+        with self.__lock:
+            self.__elections.pop(election_title, None)
+            self.__listings.clear()
+
+    def clear(self):
+        with self.__lock:
+            self.__elections.clear()
+            self.__listings.clear()
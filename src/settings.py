@@ -7,5 +7,6 @@
 SETTINGS = {
     'URL': '127.0.0.1', # Change to 0.0.0.0 to expose to internet.
     'PORT': 8080,
-    'SHARED_PASSWORD': "BallotBlockDefaultPassword" # Change this prior to deploying
+    'SHARED_PASSWORD': "BallotBlockDefaultPassword", # Change this prior to deploying
+    'HYPERLEDGER_POOL_SIZE': 256 # Ledger requests in flight at once in src/async_intermediary.py, a thread each
 }
\ No newline at end of file
@@ -15,30 +15,144 @@
 #  [*] Verifying that the data itself is valid
 #
 # These tasks are the responsibility of the host application.
+#
+# One connection is shared by every thread (the request threads, the
+# EventPublisher thread...), each call holds a lock for as long as it uses it.
 
 # TODO
 #   * Verify that all types are correct (strings and ints) when data is passed in
 #   * Verify that dictionaries do not contain extra keys
 
 
-from typing import Optional, Dict, List
+from typing import Optional, Dict, Iterator, List, Sequence
 from src.interfaces.backend_io import BackendIO
+from src.election_phase import ElectionPhase, ELECTION_CREATED, ELECTION_OPENED, ELECTION_CLOSED
+from src.time_manager import TimeManager
+from src.fieldsets import ELECTION_FIELDS, PUBLIC_ELECTION_FIELDS
+from src.election_search_index import tokenize
 from .sqlite_queries import *
+import functools
 import sqlite3
+import threading
 import json
 
+# Values accepted for SQLiteBackendIO's journal_mode
+JOURNAL_MODES = ("delete", "truncate", "persist", "memory", "wal", "off")
+
+# Number of rows fetched from SQLite at a time by iter_ballots
+_ITER_BALLOTS_BATCH_SIZE = 256
+
+# Stays below SQLITE_MAX_VARIABLE_NUMBER (999 on older SQLite builds)
+_MAX_QUERY_PARAMETERS = 900
+
+
+def _serialized(method):
+    # Runs 'method' holding the backend's lock, the connection and self.cursor are shared
+    @functools.wraps(method)
+    def serialized(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return serialized
+
 
 class SQLiteBackendIO(BackendIO):
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, journal_mode: str = None):
+        """
+        :param db_path: A file path or ":memory:".
+        :param journal_mode: One of JOURNAL_MODES, None keeps the database's. Use "wal" when several
+                             processes share the file (src/prefork_server.py): readers then don't
+                             block the writer and the writer doesn't block readers.
+        """
         super().__init__()
-        self.connection = sqlite3.connect(db_path)
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
         self.cursor = self.connection.cursor()
+        if journal_mode is not None:
+            if journal_mode.lower() not in JOURNAL_MODES:
+                raise ValueError("Unknown SQLite journal mode: {0}".format(journal_mode))
+            self.cursor.execute("PRAGMA journal_mode={0}".format(journal_mode.lower()))
+            if journal_mode.lower() == "wal":
+                # Durable at every checkpoint rather than every commit, the usual pairing with WAL
+                self.cursor.execute("PRAGMA synchronous=NORMAL")
         self.cursor.execute(CREATE_ELECTION_TABLE)
         self.cursor.execute(CREATE_ELECTION_PARTICIPATION_TABLE)
         self.cursor.execute(CREATE_BALLOT_TABLE)
+        self.cursor.execute(CREATE_BALLOT_ELECTION_TITLE_INDEX)
+        self._add_missing_epoch_columns()
+        self.cursor.execute(CREATE_ELECTION_START_EPOCH_INDEX)
+        self.cursor.execute(CREATE_ELECTION_END_EPOCH_INDEX)
+        self.cursor.execute(CREATE_ELECTION_CHANGE_TABLE)
+        self.cursor.execute(CREATE_ELECTION_CHANGE_WATERMARK_TABLE)
+        self._add_missing_change_watermark()
+        self.can_search = self._create_search_index()
         self.connection.commit()
 
+    def _add_missing_epoch_columns(self):
+        self.cursor.execute(SELECT_ELECTION_TABLE_INFO)
+        columns = [column[1] for column in self.cursor.fetchall()]
+        if 'start_epoch' in columns:
+            return
+
+        self.cursor.execute(ADD_ELECTION_START_EPOCH_COLUMN)
+        self.cursor.execute(ADD_ELECTION_END_EPOCH_COLUMN)
+        self.cursor.execute(SELECT_ALL_ELECTION_DATES)
+        for election_title, start_date, end_date in self.cursor.fetchall():
+            self.cursor.execute(UPDATE_ELECTION_EPOCHS, (
+                TimeManager.iso_8601_str_to_epoch(start_date),
+                TimeManager.iso_8601_str_to_epoch(end_date),
+                election_title
+            ))
+
+    def _add_missing_change_watermark(self):
+        self.cursor.execute(SELECT_ELECTION_CHANGE_WATERMARK)
+        if self.cursor.fetchone() is not None:
+            return
+
+        now = TimeManager.get_current_time_as_epoch()
+        self.cursor.execute(INSERT_ALL_ELECTIONS_CREATED_CHANGES, (ELECTION_CREATED, now))
+        self.cursor.execute(INSERT_ELECTION_CHANGE_WATERMARK, (now,))
+
+    def _create_search_index(self) -> bool:
+        """
+        :return: False if SQLite was built without FTS5, search_elections
+                 then leaves searching to ElectionPhaseIndex.
+        """
+        self.cursor.execute(SELECT_ELECTION_SEARCH_TABLE)
+        existed = self.cursor.fetchone() is not None
+        try:
+            self.cursor.execute(CREATE_ELECTION_SEARCH_TABLE)
+        except sqlite3.OperationalError:
+            return False
+
+        self.cursor.execute(CREATE_ELECTION_SEARCH_INSERT_TRIGGER)
+        self.cursor.execute(CREATE_ELECTION_SEARCH_DELETE_TRIGGER)
+        if not existed:
+            self.cursor.execute(REBUILD_ELECTION_SEARCH)
+        return True
+
+    def _record_phase_changes(self, now: int):
+        """
+        Records every election opening / closing since the watermark up to 'now'.
+        The caller is responsible for committing.
+        """
+        while True:
+            self.cursor.execute(SELECT_ELECTION_CHANGE_WATERMARK)
+            watermark = self.cursor.fetchone()[0]
+            if now <= watermark:
+                return
+
+            # Another connection to the same database may be doing the same thing,
+            # whoever moves the watermark first records the changes.
+            self.cursor.execute(UPDATE_ELECTION_CHANGE_WATERMARK, (now, watermark))
+            if self.cursor.rowcount == 1:
+                self.cursor.execute(INSERT_ELECTION_PHASE_CHANGES, (
+                    ELECTION_OPENED, watermark, now,
+                    ELECTION_CLOSED, watermark, now
+                ))
+                return
+
+    @_serialized
     def create_election(self, master_ballot: Dict = None,
                         creator_username: str = None,
                         creator_master_ballot_signature: str = None,
@@ -54,6 +168,11 @@ class SQLiteBackendIO(BackendIO):
         if self.get_election_by_title(master_ballot['election_title']) is not None:
             raise ValueError("Can't create duplicate election.")
 
+        # Anything that opened / closed before this election existed comes first in the feed,
+        # the new election's own past transitions are implied by its creation.
+        now = TimeManager.get_current_time_as_epoch()
+        self._record_phase_changes(now)
+
         self.cursor.execute(INSERT_ELECTION, (
             master_ballot['election_title'],
             master_ballot['description'],
@@ -65,11 +184,49 @@ class SQLiteBackendIO(BackendIO):
             creator_public_key_b64,
             election_public_rsa_key,
             election_private_rsa_key,
-            election_encrypted_fernet_key
+            election_encrypted_fernet_key,
+            TimeManager.iso_8601_str_to_epoch(master_ballot['start_date']),
+            TimeManager.iso_8601_str_to_epoch(master_ballot['end_date'])
         ))
 
+        self.cursor.execute(INSERT_ELECTION_CHANGE, (master_ballot['election_title'], ELECTION_CREATED, now))
+
+        self.connection.commit()
+
+    @_serialized
+    def create_elections(self, elections: Sequence[Dict]):
+        election_titles = [election['master_ballot']['election_title'] for election in elections]
+        if len(set(election_titles)) != len(election_titles) or self.get_elections_by_titles(election_titles):
+            raise ValueError("Can't create duplicate election.")
+
+        now = TimeManager.get_current_time_as_epoch()
+        try:
+            self._record_phase_changes(now)
+            self.cursor.executemany(INSERT_ELECTION, [(
+                election['master_ballot']['election_title'],
+                election['master_ballot']['description'],
+                election['master_ballot']['start_date'],
+                election['master_ballot']['end_date'],
+                election['master_ballot']['questions'],
+                election['creator_username'],
+                election['creator_master_ballot_signature'],
+                election['creator_public_key_b64'],
+                election['election_public_rsa_key'],
+                election['election_private_rsa_key'],
+                election['election_encrypted_fernet_key'],
+                TimeManager.iso_8601_str_to_epoch(election['master_ballot']['start_date']),
+                TimeManager.iso_8601_str_to_epoch(election['master_ballot']['end_date'])
+            ) for election in elections])
+            self.cursor.executemany(INSERT_ELECTION_CHANGE, [
+                (election_title, ELECTION_CREATED, now) for election_title in election_titles
+            ])
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+
         self.connection.commit()
 
+    @_serialized
     def create_ballot(self, ballot: str,
                       election_title: str = None,
                       voter_uuid: str = None,
@@ -92,47 +249,65 @@ class SQLiteBackendIO(BackendIO):
 
         self.connection.commit()
 
+    @_serialized
+    def create_ballots(self, election_title: str, ballots: Sequence[Dict]):
+        if self.get_election_by_title(election_title) is None:
+            raise ValueError("Can't create ballots for non-existent election")
+
+        try:
+            self.cursor.executemany(INSERT_BALLOT, [(
+                ballot['voter_uuid'],
+                ballot['ballot'],
+                ballot['ballot_signature'],
+                election_title
+            ) for ballot in ballots])
+            self.cursor.executemany(INSERT_ELECTION_PARTICIPATION, [
+                (election_title, ballot['username']) for ballot in ballots
+            ])
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+
+        self.connection.commit()
+
+    @_serialized
     def get_election_by_title(self, election_title: str) -> Optional[Dict]:
         self.cursor.execute(SELECT_ELECTION_BY_TITLE, (election_title,))
         result = self.cursor.fetchone()
         if result is None:
             return None
 
-        output = {
-            "election_title": result[0],
-            "description": result[1],
-            "start_date": result[2],
-            "end_date": result[3],
-            "questions": result[4],
-            "creator_username": result[5],
-            "master_ballot_signature": result[6],
-            "creator_public_key": result[7],
-            "election_public_key": result[8],
-            "election_private_key": result[9],
-            "election_encrypted_fernet_key": result[10]
-        }
+        return _election_row_to_dict(result)
 
+    @_serialized
+    def get_elections_by_titles(self, election_titles: Sequence[str]) -> Dict[str, Dict]:
+        election_titles = list(election_titles)
+        output = {}
+        for start in range(0, len(election_titles), _MAX_QUERY_PARAMETERS):
+            chunk = election_titles[start:start + _MAX_QUERY_PARAMETERS]
+            self.cursor.execute(SELECT_ELECTIONS_BY_TITLES.format(placeholders=", ".join("?" * len(chunk))), chunk)
+            for result in self.cursor.fetchall():
+                election = _election_row_to_dict(result)
+                output[election['election_title']] = election
         return output
 
+    @_serialized
     def get_ballot_by_voter_uuid(self, voter_uuid: str):
         self.cursor.execute(SELECT_BALLOT_BY_VOTER_UUID, (voter_uuid,))
         result = self.cursor.fetchone()
         if result is None:
             return None
 
-        return {
-            "voter_uuid": result[0],
-            "ballot": result[1],
-            "ballot_signature": result[2],
-            "election_title": result[3]
-        }
+        return _ballot_row_to_dict(result)
 
+    @_serialized
     def register_user_as_participated_in_election(self, username: str, election_title: str):
         if self.get_election_by_title(election_title) is None:
             raise ValueError("Can't register user as having participated in non-existent election")
         self.cursor.execute(INSERT_ELECTION_PARTICIPATION, (election_title, username,))
         self.connection.commit()
 
+    @_serialized
     def has_user_participated_in_election(self, username: str, election_title: str) -> bool:
         if self.get_election_by_title(election_title) is None:
             raise ValueError("Can't check if user has participated in non-existent election")
@@ -140,44 +315,172 @@ class SQLiteBackendIO(BackendIO):
         result = self.cursor.fetchone()
         return result is not None
 
+    @_serialized
     def get_all_ballots(self, election_title) -> List[Dict]:
         assert self.get_election_by_title(election_title) is not None
         self.cursor.execute(SELECT_ALL_BALLOTS, (election_title,))
-        output = []
-        for result in self.cursor.fetchall():
-            output.append({
-                "voter_uuid": result[0],
-                "ballot": result[1],
-                "ballot_signature": result[2],
-                "election_title": result[3]
-            })
+        return [_ballot_row_to_dict(result) for result in self.cursor.fetchall()]
 
-        return output
+    @_serialized
+    def iter_ballots(self, election_title: str) -> Iterator[Dict]:
+        # Checked here rather than in the generator, a streamed response
+        # would otherwise have already started when it fails.
+        assert self.get_election_by_title(election_title) is not None
 
+        # Use a dedicated cursor, self.cursor may be reused before the caller is done iterating.
+        cursor = self.connection.cursor()
+        cursor.execute(SELECT_ALL_BALLOTS, (election_title,))
+        return _iter_ballot_rows(cursor, self._lock)
+
+    @_serialized
+    def count_ballots(self, election_title: str) -> int:
+        self.cursor.execute(COUNT_BALLOTS, (election_title,))
+        return self.cursor.fetchone()[0]
+
+    @_serialized
+    def get_ballots_page(self, election_title: str,
+                         after_voter_uuid: str = None,
+                         limit: int = None) -> List[Dict]:
+        self.cursor.execute(SELECT_BALLOTS_PAGE, (
+            election_title,
+            after_voter_uuid if after_voter_uuid is not None else "",
+            limit if limit is not None else -1
+        ))
+        return [_ballot_row_to_dict(result) for result in self.cursor.fetchall()]
+
+    @_serialized
+    def get_elections_page(self, after_election_title: str = None, limit: int = None) -> List[Dict]:
+        self.cursor.execute(SELECT_ELECTIONS_PAGE, (
+            after_election_title if after_election_title is not None else "",
+            limit if limit is not None else -1
+        ))
+        return [_election_row_to_dict(result) for result in self.cursor.fetchall()]
+
+    @_serialized
+    def get_elections_in_phase(self, phase: ElectionPhase, now: int,
+                               after_election_title: str = None,
+                               limit: int = None,
+                               fields: Sequence[str] = None) -> List[Dict]:
+        after_election_title = after_election_title if after_election_title is not None else ""
+        limit = limit if limit is not None else -1
+
+        # The column names are checked against ELECTION_FIELDS, they're formatted into the query.
+        if fields is None:
+            fields = ELECTION_FIELDS
+        elif not set(fields).issubset(ELECTION_FIELDS):
+            raise ValueError("Unknown election fields: {0}".format(fields))
+        if phase != ElectionPhase.past:
+            fields = [field for field in fields if field != "election_private_key"]
+        columns = ", ".join(fields)
+
+        if phase == ElectionPhase.past:
+            self.cursor.execute(SELECT_PAST_ELECTIONS_PAGE.format(columns=columns),
+                                (now, after_election_title, limit))
+        elif phase == ElectionPhase.present:
+            self.cursor.execute(SELECT_PRESENT_ELECTIONS_PAGE.format(columns=columns),
+                                (now, now, after_election_title, limit))
+        else:
+            self.cursor.execute(SELECT_FUTURE_ELECTIONS_PAGE.format(columns=columns),
+                                (now, after_election_title, limit))
+
+        return [dict(zip(fields, result)) for result in self.cursor.fetchall()]
+
+    @_serialized
+    def search_elections(self, query: str, offset: int = 0, limit: int = None,
+                         fields: Sequence[str] = None) -> List[Dict]:
+        if not self.can_search:
+            raise NotImplementedError
+
+        # Each word becomes a quoted prefix query so FTS5 syntax in 'query' is never interpreted.
+        words = tokenize(query)
+        if not words:
+            return []
+        match = " ".join('"{0}"*'.format(word) for word in words)
+
+        if fields is None:
+            fields = PUBLIC_ELECTION_FIELDS
+        elif not set(fields).issubset(ELECTION_FIELDS):
+            raise ValueError("Unknown election fields: {0}".format(fields))
+        fields = [field for field in fields if field != "election_private_key"]
+
+        columns = ", ".join("Election." + field for field in fields)
+        self.cursor.execute(SEARCH_ELECTIONS_PAGE.format(columns=columns), (
+            match,
+            limit if limit is not None else -1,
+            offset
+        ))
+        return [dict(zip(fields, result)) for result in self.cursor.fetchall()]
+
+    @_serialized
+    def get_next_phase_transition(self, now: int) -> Optional[int]:
+        self.cursor.execute(SELECT_NEXT_PHASE_TRANSITION, (now, now))
+        return self.cursor.fetchone()[0]
+
+    @_serialized
     def get_all_elections(self):
         self.cursor.execute(SELECT_ALL_ELECTIONS)
-        output = []
-        for result in self.cursor.fetchall():
-            output.append({
-                "election_title": result[0],
-                "description": result[1],
-                "start_date": result[2],
-                "end_date": result[3],
-                "questions": result[4],
-                "creator_username": result[5],
-                "master_ballot_signature": result[6],
-                "creator_public_key": result[7],
-                "election_public_key": result[8],
-                "election_private_key": result[9],
-                "election_encrypted_fernet_key": result[10]
-            })
-        return output
+        return [_election_row_to_dict(result) for result in self.cursor.fetchall()]
+
+    @_serialized
+    def get_changes(self, since: int, now: int, limit: int = None) -> List[Dict]:
+        self._record_phase_changes(now)
+        self.connection.commit()
+
+        self.cursor.execute(SELECT_ELECTION_CHANGES_PAGE, (since, limit if limit is not None else -1))
+        return [{
+            "seq": result[0],
+            "election_title": result[1],
+            "event": result[2],
+            "epoch": result[3]
+        } for result in self.cursor.fetchall()]
 
+    @_serialized
     def nuke(self):
         self.cursor.execute(DELETE_ALL_BALLOT)
         self.cursor.execute(DELETE_ALL_ELECTION)
         self.cursor.execute(DELETE_ALL_ELECTION_PARTICIPATION)
+        self.cursor.execute(DELETE_ALL_ELECTION_CHANGE)
         self.connection.commit()
 
+    @_serialized
     def close(self):
         self.connection.close()
+
+
+def _ballot_row_to_dict(result) -> Dict:
+    return {
+        "voter_uuid": result[0],
+        "ballot": result[1],
+        "ballot_signature": result[2],
+        "election_title": result[3]
+    }
+
+
+def _iter_ballot_rows(cursor: sqlite3.Cursor, lock: threading.RLock) -> Iterator[Dict]:
+    try:
+        while True:
+            with lock:
+                rows = cursor.fetchmany(_ITER_BALLOTS_BATCH_SIZE)
+            if not rows:
+                return
+            for result in rows:
+                yield _ballot_row_to_dict(result)
+    finally:
+        with lock:
+            cursor.close()
+
+
+def _election_row_to_dict(result) -> Dict:
+    return {
+        "election_title": result[0],
+        "description": result[1],
+        "start_date": result[2],
+        "end_date": result[3],
+        "questions": result[4],
+        "creator_username": result[5],
+        "master_ballot_signature": result[6],
+        "creator_public_key": result[7],
+        "election_public_key": result[8],
+        "election_private_key": result[9],
+        "election_encrypted_fernet_key": result[10]
+    }
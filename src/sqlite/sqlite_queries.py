@@ -10,6 +10,8 @@
 
 # List of all elections in the system.
 # private_key should only be returned to the api caller if start_date >= end_date
+# start_date / end_date are the ISO 8601 strings sent by the election creator,
+# start_epoch / end_epoch are the same instants in seconds since the UTC epoch.
 CREATE_ELECTION_TABLE = """
 CREATE TABLE IF NOT EXISTS Election
 (election_title                 TEXT NOT NULL UNIQUE,
@@ -23,9 +25,20 @@ CREATE TABLE IF NOT EXISTS Election
  election_public_key            TEXT NOT NULL UNIQUE,
  election_private_key           TEXT NOT NULL UNIQUE,
  election_encrypted_fernet_key  TEXT NOT NULL UNIQUE,
+ start_epoch                    INT NOT NULL DEFAULT 0,
+ end_epoch                      INT NOT NULL DEFAULT 0,
                                 PRIMARY KEY(election_title))
 """
 
+# The past / present / future listings filter on these
+CREATE_ELECTION_START_EPOCH_INDEX = """
+CREATE INDEX IF NOT EXISTS ElectionStartEpoch ON Election(start_epoch)
+"""
+
+CREATE_ELECTION_END_EPOCH_INDEX = """
+CREATE INDEX IF NOT EXISTS ElectionEndEpoch ON Election(end_epoch)
+"""
+
 # Records which elections a user has participated in.
 # Used to prevent a user from voting in the same election twice.
 CREATE_ELECTION_PARTICIPATION_TABLE = """
@@ -47,6 +60,54 @@ CREATE TABLE IF NOT EXISTS Ballot
                      PRIMARY KEY(voter_uuid))
 """
 
+# Keyset pagination over the ballots of an election walks this index
+CREATE_BALLOT_ELECTION_TITLE_INDEX = """
+CREATE INDEX IF NOT EXISTS BallotElectionTitleVoterUUID
+ON Ballot(election_title, voter_uuid)
+"""
+
+# Change feed of the election catalog, seq only ever increases.
+# epoch is when the change happened in seconds since the UTC epoch.
+CREATE_ELECTION_CHANGE_TABLE = """
+CREATE TABLE IF NOT EXISTS ElectionChange
+(seq             INTEGER PRIMARY KEY AUTOINCREMENT,
+ election_title  TEXT NOT NULL,
+ event           TEXT NOT NULL,
+ epoch           INT NOT NULL)
+"""
+
+# Single row, every election opening / closing at or before 'epoch'
+# has already been recorded in ElectionChange.
+CREATE_ELECTION_CHANGE_WATERMARK_TABLE = """
+CREATE TABLE IF NOT EXISTS ElectionChangeWatermark
+(id     INTEGER PRIMARY KEY CHECK (id = 0),
+ epoch  INT NOT NULL)
+"""
+
+# Full text index over the election titles / descriptions. The text itself is only
+# stored in Election (external content table), the triggers keep both in sync.
+CREATE_ELECTION_SEARCH_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS ElectionSearch USING fts5(
+    election_title,
+    description,
+    content='Election',
+    content_rowid='rowid')
+"""
+
+CREATE_ELECTION_SEARCH_INSERT_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS ElectionSearchInsert AFTER INSERT ON Election BEGIN
+    INSERT INTO ElectionSearch(rowid, election_title, description)
+    VALUES (new.rowid, new.election_title, new.description);
+END
+"""
+
+CREATE_ELECTION_SEARCH_DELETE_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS ElectionSearchDelete AFTER DELETE ON Election BEGIN
+    INSERT INTO ElectionSearch(ElectionSearch, rowid, election_title, description)
+    VALUES ('delete', old.rowid, old.election_title, old.description);
+END
+"""
+
 #
 # Insertion
 #
@@ -63,8 +124,10 @@ INSERT INTO Election (
      creator_public_key,
      election_public_key,
      election_private_key,
-     election_encrypted_fernet_key)
-VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+     election_encrypted_fernet_key,
+     start_epoch,
+     end_epoch)
+VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
 """
 
 INSERT_ELECTION_PARTICIPATION = """
@@ -83,6 +146,37 @@ INSERT INTO Ballot (
 VALUES(?, ?, ?, ?)
 """
 
+INSERT_ELECTION_CHANGE = """
+INSERT INTO ElectionChange (
+     election_title,
+     event,
+     epoch)
+VALUES(?, ?, ?)
+"""
+
+# Records the elections that opened / closed in (watermark, now], in the order it happened.
+# An election closes one second after its end_epoch.
+INSERT_ELECTION_PHASE_CHANGES = """
+INSERT INTO ElectionChange (election_title, event, epoch)
+SELECT election_title, event, epoch FROM (
+    SELECT election_title, (?) AS event, start_epoch AS epoch, 0 AS ordering from Election WHERE
+        start_epoch > (?) AND start_epoch <= (?)
+    UNION ALL
+    SELECT election_title, (?) AS event, end_epoch + 1 AS epoch, 1 AS ordering from Election WHERE
+        end_epoch >= (?) AND end_epoch < (?)
+)
+ORDER BY epoch, ordering, election_title
+"""
+
+INSERT_ELECTION_CHANGE_WATERMARK = """
+INSERT INTO ElectionChangeWatermark (id, epoch) VALUES(0, ?)
+"""
+
+# Only succeeds (rowcount 1) if nobody else advanced the watermark in the meantime
+UPDATE_ELECTION_CHANGE_WATERMARK = """
+UPDATE ElectionChangeWatermark SET epoch = (?) WHERE id = 0 AND epoch = (?)
+"""
+
 #
 # Searching / Retrieval
 #
@@ -92,6 +186,12 @@ SELECT * from Election WHERE
     election_title = (?)
 """
 
+# {placeholders} is one (?) per title
+SELECT_ELECTIONS_BY_TITLES = """
+SELECT * from Election WHERE
+    election_title IN ({placeholders})
+"""
+
 SELECT_ALL_ELECTIONS = """
 SELECT * from ELECTION
 """
@@ -101,6 +201,78 @@ SELECT * from BALLOT WHERE
     election_title = (?)
 """
 
+COUNT_BALLOTS = """
+SELECT COUNT(*) from Ballot WHERE
+    election_title = (?)
+"""
+
+# A LIMIT of -1 means no limit in SQLite
+SELECT_BALLOTS_PAGE = """
+SELECT * from Ballot WHERE
+    election_title = (?) AND voter_uuid > (?)
+    ORDER BY voter_uuid
+    LIMIT (?)
+"""
+
+SELECT_ELECTIONS_PAGE = """
+SELECT * from Election WHERE
+    election_title > (?)
+    ORDER BY election_title
+    LIMIT (?)
+"""
+
+# {columns} is filled in by SQLiteBackendIO with the requested projection,
+# election_private_key is only ever selected from past elections.
+SELECT_PAST_ELECTIONS_PAGE = """
+SELECT {columns} from Election WHERE
+    end_epoch < (?) AND election_title > (?)
+    ORDER BY election_title
+    LIMIT (?)
+"""
+
+SELECT_PRESENT_ELECTIONS_PAGE = """
+SELECT {columns} from Election WHERE
+    start_epoch <= (?) AND end_epoch >= (?) AND election_title > (?)
+    ORDER BY election_title
+    LIMIT (?)
+"""
+
+SELECT_FUTURE_ELECTIONS_PAGE = """
+SELECT {columns} from Election WHERE
+    start_epoch > (?) AND election_title > (?)
+    ORDER BY election_title
+    LIMIT (?)
+"""
+
+SELECT_NEXT_PHASE_TRANSITION = """
+SELECT MIN(transition) FROM (
+    SELECT MIN(start_epoch) AS transition from Election WHERE start_epoch > (?)
+    UNION ALL
+    SELECT MIN(end_epoch) + 1 AS transition from Election WHERE end_epoch >= (?)
+)
+"""
+
+# Title matches weigh 10 times more than description matches (bm25 is lower for better matches).
+# {columns} is filled in by SQLiteBackendIO and prefixed with 'Election.'
+SEARCH_ELECTIONS_PAGE = """
+SELECT {columns} from ElectionSearch
+    JOIN Election ON Election.rowid = ElectionSearch.rowid
+    WHERE ElectionSearch MATCH (?)
+    ORDER BY bm25(ElectionSearch, 10.0, 1.0), Election.election_title
+    LIMIT (?) OFFSET (?)
+"""
+
+SELECT_ELECTION_CHANGES_PAGE = """
+SELECT seq, election_title, event, epoch from ElectionChange WHERE
+    seq > (?)
+    ORDER BY seq
+    LIMIT (?)
+"""
+
+SELECT_ELECTION_CHANGE_WATERMARK = """
+SELECT epoch from ElectionChangeWatermark WHERE id = 0
+"""
+
 SELECT_BALLOT_BY_VOTER_UUID = """
 SELECT * from Ballot WHERE
     voter_uuid = (?)
@@ -111,6 +283,28 @@ SELECT * from ElectionParticipation WHERE
     username = (?)
 """
 
+#
+# Migration
+#
+
+# Databases created before the epoch columns existed
+ADD_ELECTION_START_EPOCH_COLUMN = "ALTER TABLE Election ADD COLUMN start_epoch INT NOT NULL DEFAULT 0"
+ADD_ELECTION_END_EPOCH_COLUMN = "ALTER TABLE Election ADD COLUMN end_epoch INT NOT NULL DEFAULT 0"
+SELECT_ELECTION_TABLE_INFO = "PRAGMA table_info(Election)"
+SELECT_ALL_ELECTION_DATES = "SELECT election_title, start_date, end_date from Election"
+UPDATE_ELECTION_EPOCHS = "UPDATE Election SET start_epoch = (?), end_epoch = (?) WHERE election_title = (?)"
+
+SELECT_ELECTION_SEARCH_TABLE = "SELECT name from sqlite_master WHERE type = 'table' AND name = 'ElectionSearch'"
+
+# Indexes the elections stored before ElectionSearch existed
+REBUILD_ELECTION_SEARCH = "INSERT INTO ElectionSearch(ElectionSearch) VALUES('rebuild')"
+
+# Databases created before the change feed existed, every election is recorded as created
+INSERT_ALL_ELECTIONS_CREATED_CHANGES = """
+INSERT INTO ElectionChange (election_title, event, epoch)
+SELECT election_title, (?), (?) from Election ORDER BY start_epoch, election_title
+"""
+
 #
 # Deletion (Testing)
 #
@@ -118,3 +312,4 @@ SELECT * from ElectionParticipation WHERE
 DELETE_ALL_ELECTION = "DELETE from ELECTION;"
 DELETE_ALL_ELECTION_PARTICIPATION = "DELETE from ElectionParticipation"
 DELETE_ALL_BALLOT = "DELETE from Ballot"
+DELETE_ALL_ELECTION_CHANGE = "DELETE from ElectionChange"
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#
+# src/threaded_backend_io.py
+# Authors:
+#   Samuel Vargas
+#
+# ThreadedBackendIO is the AsyncBackendIO of a synchronous BackendIO
+# (usually the wrapped stack of intermediary.wrap_backend_io): every call is
+# run on a thread of its own executor so it never blocks the event loop.
+#
+# With max_workers=1 (the default) every call runs on the same thread, one
+# at a time. SQLiteBackendIO serializes its calls anyway, more workers
+# only help backends that can run several calls at once.
+#
+# get_catalog_version / get_election_version are answered directly, they
+# never touch storage.
+#
+
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from src.interfaces import AsyncBackendIO, BackendIO
+from src.election_phase import ElectionPhase
+import asyncio
+import functools
+
+
+class ThreadedBackendIO(AsyncBackendIO):
+
+    def __init__(self, backend_io: BackendIO, max_workers: int = 1):
+        self.backend_io = backend_io
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ThreadedBackendIO")
+
+    def close(self):
+        """
+        Waits for the running calls and closes the wrapped backend if it can be closed
+        """
+        self.__executor.shutdown()
+        close = getattr(self.backend_io, 'close', None)
+        if close is not None:
+            close()
+
+    async def __call(self, method: str, *args, **kwargs):
+        call = functools.partial(getattr(self.backend_io, method), *args, **kwargs)
+        return await asyncio.get_event_loop().run_in_executor(self.__executor, call)
+
+    async def create_election(self, master_ballot: Dict = None, *args, **kwargs):
+        return await self.__call('create_election', master_ballot, *args, **kwargs)
+
+    async def create_elections(self, elections: Sequence[Dict]):
+        return await self.__call('create_elections', elections)
+
+    async def create_ballot(self, ballot: str, *args, **kwargs):
+        return await self.__call('create_ballot', ballot, *args, **kwargs)
+
+    async def create_ballots(self, election_title: str, ballots: Sequence[Dict]):
+        return await self.__call('create_ballots', election_title, ballots)
+
+    async def get_election_by_title(self, election_title: str) -> Optional[Dict]:
+        return await self.__call('get_election_by_title', election_title)
+
+    async def get_elections_by_titles(self, election_titles: Sequence[str]) -> Dict[str, Dict]:
+        return await self.__call('get_elections_by_titles', election_titles)
+
+    async def get_ballot_by_voter_uuid(self, voter_uuid: str) -> Optional[Dict]:
+        return await self.__call('get_ballot_by_voter_uuid', voter_uuid)
+
+    async def register_user_as_participated_in_election(self, username: str, election_title: str):
+        return await self.__call('register_user_as_participated_in_election', username, election_title)
+
+    async def has_user_participated_in_election(self, username: str, election_title: str) -> bool:
+        return await self.__call('has_user_participated_in_election', username, election_title)
+
+    async def get_all_ballots(self, election_title) -> List[Dict]:
+        return await self.__call('get_all_ballots', election_title)
+
+    async def get_all_elections(self) -> List[Dict]:
+        return await self.__call('get_all_elections')
+
+    async def iter_ballots(self, election_title: str) -> AsyncIterator[Dict]:
+        # One page per call rather than the backend's own iterator, whose
+        # cursor would stay open between calls made by other requests.
+        async for ballot in super().iter_ballots(election_title):
+            yield ballot
+
+    async def count_ballots(self, election_title: str) -> int:
+        return await self.__call('count_ballots', election_title)
+
+    async def get_ballots_page(self, election_title: str, after_voter_uuid: str = None,
+                               limit: int = None) -> List[Dict]:
+        return await self.__call('get_ballots_page', election_title, after_voter_uuid, limit)
+
+    async def get_elections_page(self, after_election_title: str = None, limit: int = None) -> List[Dict]:
+        return await self.__call('get_elections_page', after_election_title, limit)
+
+    async def get_elections_in_phase(self, phase: ElectionPhase, now: int,
+                                     after_election_title: str = None,
+                                     limit: int = None,
+                                     fields: Sequence[str] = None) -> List[Dict]:
+        return await self.__call('get_elections_in_phase', phase, now, after_election_title, limit, fields)
+
+    async def search_elections(self, query: str, offset: int = 0, limit: int = None,
+                               fields: Sequence[str] = None) -> List[Dict]:
+        return await self.__call('search_elections', query, offset, limit, fields)
+
+    async def get_next_phase_transition(self, now: int) -> Optional[int]:
+        return await self.__call('get_next_phase_transition', now)
+
+    def get_catalog_version(self, now: int) -> Optional[str]:
+        return self.backend_io.get_catalog_version(now)
+
+    def get_election_version(self, election_title: str) -> Optional[str]:
+        return self.backend_io.get_election_version(election_title)
+
+    async def get_changes(self, since: int, now: int, limit: int = None) -> List[Dict]:
+        return await self.__call('get_changes', since, now, limit)
+
+    async def nuke(self):
+        return await self.__call('nuke')
@@ -5,12 +5,49 @@
 #   Samuel Vargas
 #
 
-from dateutil.parser import *
 from datetime import timezone
-from dateutil import tz
+from functools import lru_cache
+from typing import NamedTuple
+from src.election_phase import ElectionPhase
 import datetime
 
 
+class ElectionWindow(NamedTuple):
+    """
+    The start / end of an election in seconds since the UTC epoch.
+    Classifying an election is a couple of integer comparisons against 'now'.
+    """
+    start: int
+    end: int
+
+    def in_past(self, now: int) -> bool:
+        return now > self.end
+
+    def in_future(self, now: int) -> bool:
+        return now < self.start
+
+    def in_progress(self, now: int) -> bool:
+        return self.start <= now <= self.end
+
+    def phase(self, now: int) -> ElectionPhase:
+        if now > self.end:
+            return ElectionPhase.past
+        if now < self.start:
+            return ElectionPhase.future
+        return ElectionPhase.present
+
+
+@lru_cache(maxsize=8192)
+def _iso_8601_str_to_epoch(iso8601_str: str) -> int:
+    return int(parse(iso8601_str).timestamp())
+
+
+def parse(timestr: str) -> datetime.datetime:
+    # dateutil is only imported once a date has to be parsed
+    from dateutil.parser import parse as dateutil_parse
+    return dateutil_parse(timestr)
+
+
 class TimeManager:
     @staticmethod
     def get_current_time_as_iso_format_string():
@@ -22,22 +59,57 @@ class TimeManager:
         return (datetime.datetime.now(timezone.utc).astimezone() + datetime.timedelta(days=1)).isoformat()
 
     @staticmethod
-    def election_in_past(end_date_iso8601_str: str):
-        now = datetime.datetime.now(timezone.utc).astimezone()
-        end = parse(end_date_iso8601_str)
-        end = end.astimezone(timezone.utc)
-        return now > end
+    def get_current_time_as_epoch() -> int:
+        return int(datetime.datetime.now(timezone.utc).timestamp())
+
+    @staticmethod
+    def iso_8601_str_to_epoch(iso8601_str: str) -> int:
+        """
+        Converts an ISO 8601 string into seconds since the UTC epoch.
+        Strings without a UTC offset are assumed to be in the server's local time.
+
+        Each distinct string is only parsed once, the result is cached.
+        """
+        return _iso_8601_str_to_epoch(iso8601_str)
+
+    @staticmethod
+    def is_iso_8601_str(iso8601_str) -> bool:
+        """
+        :return: True if 'iso8601_str' is a string iso_8601_str_to_epoch can convert.
+        """
+        if not isinstance(iso8601_str, str):
+            return False
+        try:
+            TimeManager.iso_8601_str_to_epoch(iso8601_str)
+        except (ValueError, OverflowError):
+            return False
+        return True
+
+    @staticmethod
+    def get_election_window(start_date_iso8601_str: str, end_date_iso8601_str: str) -> ElectionWindow:
+        return ElectionWindow(
+            TimeManager.iso_8601_str_to_epoch(start_date_iso8601_str),
+            TimeManager.iso_8601_str_to_epoch(end_date_iso8601_str)
+        )
+
+    # The election_in_* methods accept an optional 'now' (seconds since the UTC epoch)
+    # so a request can classify many elections against the same instant.
+
+    @staticmethod
+    def election_in_past(end_date_iso8601_str: str, now: int = None):
+        if now is None:
+            now = TimeManager.get_current_time_as_epoch()
+        return now > TimeManager.iso_8601_str_to_epoch(end_date_iso8601_str)
 
     @staticmethod
-    def election_in_future(start_date_iso8601_str: str):
-        now = datetime.datetime.now(timezone.utc).astimezone()
-        start = parse(start_date_iso8601_str)
-        start = start.astimezone(timezone.utc)
-        return now < start
+    def election_in_future(start_date_iso8601_str: str, now: int = None):
+        if now is None:
+            now = TimeManager.get_current_time_as_epoch()
+        return now < TimeManager.iso_8601_str_to_epoch(start_date_iso8601_str)
 
     @staticmethod
-    def election_in_progress(start_date_iso8601_str: str, end_date_iso8601_str: str):
-        now = datetime.datetime.now(timezone.utc).astimezone()
-        end = parse(end_date_iso8601_str)
-        return not TimeManager.election_in_past(end_date_iso8601_str) and \
-               not TimeManager.election_in_future(start_date_iso8601_str)
+    def election_in_progress(start_date_iso8601_str: str, end_date_iso8601_str: str, now: int = None):
+        if now is None:
+            now = TimeManager.get_current_time_as_epoch()
+        return not TimeManager.election_in_past(end_date_iso8601_str, now) and \
+               not TimeManager.election_in_future(start_date_iso8601_str, now)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+#
+# src/worker_pool.py
+# Authors:
+#   Samuel Vargas
+#
+# A process pool shared by the bulk endpoints for CPU bound crypto
+# (ECDSA signature verification, RSA key generation). The ecdsa package
+# is pure Python so threads wouldn't run it in parallel.
+#
+# The pool is only started the first time a batch is large enough to
+# benefit from it, small batches run inline in the calling thread.
+#
+# The asyncio API (src/async_api) must not run any of it on the event
+# loop: run_in_pool sends a single call to the pool, parallel_map_async
+# waits for parallel_map on a thread and run_in_thread is for the crypto
+# that's cheap enough for a thread (Fernet, the cached election keys).
+#
+
+from typing import Callable, Iterable, List, TypeVar
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import functools
+import os
+import threading
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+# Batches smaller than this aren't worth sending to another process
+MIN_PARALLEL_ITEMS = 8
+
+_lock = threading.Lock()
+_pool = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _pool
+
+
+def parallel_map(function: Callable[[T], R], items: Iterable[T], min_items: int = MIN_PARALLEL_ITEMS) -> List[R]:
+    """
+    Same as list(map(function, items)) but spread over the process pool
+    if there are at least 'min_items' items. 'function' and the items
+    must be picklable (a module level function, plain data).
+    """
+    items = list(items)
+    workers = os.cpu_count() or 1
+    if len(items) < min_items or workers == 1:
+        return [function(item) for item in items]
+
+    chunksize = max(1, len(items) // (workers * 4))
+    return list(get_pool().map(function, items, chunksize=chunksize))
+
+
+async def run_in_pool(function: Callable[[T], R], item: T = None) -> R:
+    """
+    function(item) on the process pool, same requirements as parallel_map.
+    """
+    return await asyncio.wrap_future(get_pool().submit(function, item))
+
+
+async def parallel_map_async(function: Callable[[T], R], items: Iterable[T],
+                             min_items: int = MIN_PARALLEL_ITEMS) -> List[R]:
+    """
+    parallel_map for coroutines, small batches run on a thread rather than inline.
+    """
+    return await run_in_thread(parallel_map, function, list(items), min_items)
+
+
+async def run_in_thread(function: Callable[..., R], *args, **kwargs) -> R:
+    """
+    function(*args, **kwargs) on the event loop's default thread executor.
+    """
+    return await asyncio.get_event_loop().run_in_executor(None, functools.partial(function, *args, **kwargs))
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
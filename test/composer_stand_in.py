@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+#
+# test/composer_stand_in.py
+# Authors:
+#   Samuel Vargas
+#
+# A local stand-in for the Hyperledger Composer rest server, good enough
+# to test and benchmark HyperledgerBackendIO without a fabric network.
+#
+# It serves the assets of the ballots business network (elections,
+# ballots, participations) from memory over HTTP/1.1 keep-alive and
+# understands the subset of the LoopBack filter syntax the backend
+# generates. 'connect_latency' and 'latency' simulate the cost of opening
+# a connection (TCP + TLS handshake) and of a ledger round trip,
+# 'tail_latency' a slow peer answering every 'tail_every'-th request and
+# 'failures' the next requests answered with a 503. Given an
+# 'event_emitter' (test/fake_event_emitter.py) it also emits the events
+# the business network would for every election, ballot and participation.
+#
+# Run it directly to benchmark pooled against unpooled connections,
+# concurrent against sequential requests, batched against single writes
+# and hedged against plain reads:
+#
+#   python -m test.composer_stand_in
+#
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+import json
+import sys
+import threading
+import time
+
+NAMESPACE = "org.hyperledger_composer.ballots"
+
+# Collection -> the property identifying its assets
+ID_FIELDS = {
+    "elections": "electionId",
+    "ballots": "ballotId",
+    "participations": "participationId",
+}
+
+# Collection -> (event class, property holding the asset) emitted when an asset is added
+EVENTS = {
+    "elections": (NAMESPACE + ".ElectionCreated", "election"),
+    "ballots": (NAMESPACE + ".BallotCast", "ballot"),
+    "participations": (NAMESPACE + ".UserParticipated", "participation"),
+}
+
+
+def _matches(asset, where):
+    for key, condition in where.items():
+        if key == "and":
+            if not all(_matches(asset, clause) for clause in condition):
+                return False
+        elif key == "or":
+            if not any(_matches(asset, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = asset.get(key)
+            for operator, operand in condition.items():
+                if value is None:
+                    return False
+                if operator == "gt" and not value > operand:
+                    return False
+                if operator == "gte" and not value >= operand:
+                    return False
+                if operator == "lt" and not value < operand:
+                    return False
+                if operator == "lte" and not value <= operand:
+                    return False
+                if operator == "inq" and value not in operand:
+                    return False
+        elif asset.get(key) != condition:
+            return False
+    return True
+
+
+def apply_filter(assets, loopback_filter):
+    """
+    Applies a LoopBack filter ({"where", "order", "skip", "limit", "fields"}) to a list of assets
+    """
+    assets = [asset for asset in assets if _matches(asset, loopback_filter.get("where", {}))]
+
+    order = loopback_filter.get("order")
+    if order:
+        for clause in reversed([order] if isinstance(order, str) else order):
+            field, _, direction = clause.partition(" ")
+            assets.sort(key=lambda asset: asset.get(field), reverse=direction.upper() == "DESC")
+
+    skip = loopback_filter.get("skip", loopback_filter.get("offset", 0))
+    limit = loopback_filter.get("limit")
+    assets = assets[skip:] if limit is None else assets[skip:skip + limit]
+
+    fields = loopback_filter.get("fields")
+    if fields:
+        included = [field for field, include in fields.items() if include]
+        assets = [{field: asset[field] for field in included if field in asset} for asset in assets]
+    return assets
+
+
+class ComposerStandIn:
+
+    def __init__(self, latency: float = 0.0, connect_latency: float = 0.0, commit_latency: float = 0.0,
+                 tail_latency: float = 0.0, tail_every: int = 0, event_emitter=None):
+        """
+        :param latency: Seconds every request takes to answer.
+        :param connect_latency: Seconds added to the first request of every new connection.
+        :param commit_latency: Seconds added to every write (POST), the time the ledger takes to commit it.
+        :param tail_latency: Seconds added to every 'tail_every'-th request.
+        :param tail_every: See tail_latency, 0 for no slow requests.
+        :param event_emitter: A FakeEventEmitter to emit ledger events on, None to not emit any.
+        """
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.commit_latency = commit_latency
+        self.tail_latency = tail_latency
+        self.tail_every = tail_every
+        self.failures = 0          # the next 'failures' requests are answered with a 503
+        self.event_emitter = event_emitter
+        self.collections = {collection: {} for collection in ID_FIELDS}  # collection -> {id: asset}
+        self.elections = self.collections["elections"]
+        self.ballots = self.collections["ballots"]
+        self.participations = self.collections["participations"]
+        self.transactions = []     # every castBallots transaction committed
+        self.connections = 0       # TCP connections accepted
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.__handler())
+        self.server.daemon_threads = True
+        self.server.handle_error = self.__handle_error
+        self.url = "http://127.0.0.1:{0}/api/".format(self.server.server_address[1])
+        self.__thread = None
+
+    def __handle_error(self, request, client_address):
+        # Clients that gave up waiting (timeouts) aren't errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(self.server, request, client_address)
+
+    def add_election(self, electionId, startDate, endDate, **fields):
+        self.elections[electionId] = dict({
+            "$class": NAMESPACE + ".elections",
+            "electionId": electionId,
+            "startDate": startDate,
+            "endDate": endDate,
+        }, **fields)
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def added(self, collection, asset):
+        self.collections[collection][asset[ID_FIELDS[collection]]] = asset
+        if self.event_emitter is not None:
+            event_class, field = EVENTS[collection]
+            self.event_emitter.emit({"$class": event_class, "eventId": "{0}#{1}".format(
+                collection, asset[ID_FIELDS[collection]]), field: asset})
+
+    def cast_ballots(self, transaction):
+        # All or nothing, like every Composer transaction
+        new = [(collection, asset) for collection in ("ballots", "participations")
+               for asset in transaction.get(collection, [])]
+        ids = [(collection, asset[ID_FIELDS[collection]]) for collection, asset in new]
+        duplicates = [asset_id for collection, asset_id in ids if asset_id in self.collections[collection]]
+        if duplicates or len(set(ids)) != len(ids):
+            return 500, {"error": {"statusCode": 500, "message": "Failed to add object with ID '{0}' "
+                                                                 "as the object already exists".format(
+                (duplicates or ["?"])[0])}}
+
+        for collection, asset in new:
+            self.added(collection, asset)
+        transaction = dict(transaction, transactionId="{0:064x}".format(len(self.transactions) + 1))
+        self.transactions.append(transaction)
+        return 200, transaction
+
+    def route(self, method, path, query, body):
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+        if method == "POST" and parts[1:] == ["castBallots"]:
+            return self.cast_ballots(body)
+        if parts[0] != "api" or len(parts) < 2 or parts[1] not in self.collections:
+            return 404, {"error": {"statusCode": 404, "message": "Unknown path"}}
+
+        loopback_filter = json.loads(query["filter"][0]) if "filter" in query else {}
+        collection = self.collections[parts[1]]
+        id_field = ID_FIELDS[parts[1]]
+
+        if method == "GET" and len(parts) == 2:
+            return 200, apply_filter(list(collection.values()), loopback_filter)
+        if method == "POST" and len(parts) == 2:
+            if body[id_field] in collection:
+                return 500, {"error": {"statusCode": 500, "message": "Failed to add object with ID '{0}' "
+                                                                     "as the object already exists".format(body[id_field])}}
+            self.added(parts[1], body)
+            return 200, body
+        if len(parts) == 3 and parts[2] not in collection:
+            return 404, {"error": {"statusCode": 404, "message": "Object with ID '{0}' not found".format(parts[2])}}
+        if method == "GET" and len(parts) == 3:
+            return 200, apply_filter([collection[parts[2]]], loopback_filter)[0]
+        if method == "DELETE" and len(parts) == 3:
+            del collection[parts[2]]
+            return 204, None
+        return 404, {"error": {"statusCode": 404, "message": "Unknown path"}}
+
+    def __handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stand_in.lock:
+                    stand_in.connections += 1
+                self.__first = True
+
+            def log_message(self, *args):
+                pass
+
+            def __respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length).decode("utf-8")) if length else None
+                with stand_in.lock:
+                    stand_in.requests += 1
+                    number = stand_in.requests
+                    fail = stand_in.failures > 0
+                    stand_in.failures -= fail
+
+                delay = stand_in.latency + (stand_in.connect_latency if self.__first else 0.0) + \
+                    (stand_in.commit_latency if method == "POST" else 0.0)
+                if stand_in.tail_every and number % stand_in.tail_every == 0:
+                    delay += stand_in.tail_latency
+                self.__first = False
+                if delay:
+                    time.sleep(delay)
+
+                url = urlsplit(self.path)
+                if fail:
+                    status, payload = 503, {"error": {"statusCode": 503, "message": "Service Unavailable"}}
+                else:
+                    with stand_in.lock:
+                        status, payload = stand_in.route(method, url.path, parse_qs(url.query), body)
+
+                data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if self.close_connection:
+                    self.send_header("Connection", "close")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.__respond("GET")
+
+            def do_POST(self):
+                self.__respond("POST")
+
+            def do_DELETE(self):
+                self.__respond("DELETE")
+
+        return Handler
+
+
+def benchmark(calls: int = 200, connect_latency: float = 0.005, latency: float = 0.005):
+    """
+    Times get_election_by_title with and without connection reuse, then
+    create_ballots (one request per ballot and participation) with one and
+    with ten requests in flight at a time.
+    """
+    from src.hyperledger.hyperledger_backend_io import HyperledgerBackendIO
+
+    with ComposerStandIn(connect_latency=connect_latency) as stand_in:
+        stand_in.add_election("Benchmark", "2018-01-01T00:00:00", "2099-01-01T00:00:00")
+        for keep_alive in (False, True):
+            backend = HyperledgerBackendIO(stand_in.url, keep_alive=keep_alive)
+            start = time.perf_counter()
+            for _ in range(calls):
+                backend.get_election_by_title("Benchmark")
+            elapsed = time.perf_counter() - start
+            stats = backend.get_connection_stats()
+            backend.close()
+            print("keep_alive={0!s:5}  {1:7.3f} ms/call  {2} requests over {3} connections".format(
+                keep_alive, elapsed / calls * 1000, stats["requests"], stats["connections_opened"]))
+
+    with ComposerStandIn(latency=latency) as stand_in:
+        stand_in.add_election("Benchmark", "2018-01-01T00:00:00", "2099-01-01T00:00:00")
+        for pool_size in (1, 10):
+            backend = HyperledgerBackendIO(stand_in.url, pool_size=pool_size)
+            ballots = [{
+                "ballot": "Encrypted", "voter_uuid": "{0}-{1}".format(pool_size, i), "ballot_signature": "Signature",
+                "voter_public_key_b64": "Key", "username": "Voter {0}-{1}".format(pool_size, i)
+            } for i in range(50)]
+            start = time.perf_counter()
+            backend.create_ballots("Benchmark", ballots)
+            elapsed = time.perf_counter() - start
+            backend.close()
+            print("pool_size={0:<2}     {1:7.3f} ms for create_ballots of {2} ballots".format(
+                pool_size, elapsed * 1000, len(ballots)))
+
+
+def benchmark_write_batching(votes: int = 400, voters: int = 50, commit_latency: float = 0.05):
+    """
+    Casts 'votes' ballots from 'voters' threads against a ledger taking 'commit_latency'
+    seconds per transaction, for several write batch sizes.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from src.hyperledger.hyperledger_backend_io import HyperledgerBackendIO
+
+    for write_batch_size, write_batch_delay in ((1, 0.0), (10, 0.005), (50, 0.005), (50, 0.02)):
+        with ComposerStandIn() as stand_in:
+            backend = HyperledgerBackendIO(stand_in.url, write_batch_size=write_batch_size,
+                                           write_batch_delay=write_batch_delay)
+            stand_in.add_election("Benchmark", "2018-01-01T00:00:00", "2099-01-01T00:00:00")
+            stand_in.commit_latency = commit_latency
+
+            def cast(i):
+                start = time.perf_counter()
+                backend.register_user_as_participated_in_election("Voter {0}".format(i), "Benchmark")
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=voters) as executor:
+                latencies = sorted(executor.map(cast, range(votes)))
+            elapsed = time.perf_counter() - start
+            stats = backend.get_write_batch_stats() or {"batches": votes}
+            backend.close()
+            print("write_batch_size={0:<3} delay={1:.3f}s  {2:6.0f} votes/s  p50 {3:6.1f} ms  "
+                  "p99 {4:6.1f} ms  {5} transactions".format(
+                write_batch_size, write_batch_delay, votes / elapsed,
+                latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000,
+                stats["batches"]))
+
+
+def benchmark_hedging(calls: int = 400, latency: float = 0.002, tail_latency: float = 0.1, tail_every: int = 20):
+    """
+    Times get_election_by_title against a rest server answering every 'tail_every'-th
+    request 'tail_latency' seconds late, with and without hedged reads.
+    """
+    from src.hyperledger.hyperledger_backend_io import HyperledgerBackendIO
+
+    for hedge_percentile in (None, 0.9):
+        with ComposerStandIn(latency=latency, tail_latency=tail_latency, tail_every=tail_every) as stand_in:
+            stand_in.add_election("Benchmark", "2018-01-01T00:00:00", "2099-01-01T00:00:00")
+            backend = HyperledgerBackendIO(stand_in.url, hedge_percentile=hedge_percentile)
+            latencies = []
+            for _ in range(calls):
+                start = time.perf_counter()
+                backend.get_election_by_title("Benchmark")
+                latencies.append(time.perf_counter() - start)
+            stats = backend.get_latency_stats()["GET elections/{id}"]
+            backend.close()
+            latencies.sort()
+            print("hedge_percentile={0!s:4}  p50 {1:6.1f} ms  p99 {2:6.1f} ms  {3} hedged, {4} won by the hedge".format(
+                hedge_percentile, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000,
+                stats["hedged"], stats["hedge_wins"]))
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark_write_batching()
+    benchmark_hedging()
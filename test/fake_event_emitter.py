@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#
+# test/fake_event_emitter.py
+# Authors:
+#   Samuel Vargas
+#
+# A local websocket server standing in for the Composer rest server's
+# event stream. Tests emit() ledger events to every connected subscriber
+# themselves, or hand the emitter to ComposerStandIn(event_emitter=...)
+# which emits the events of the business network for every asset added.
+#
+
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+import time
+
+_WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _frame(opcode, payload, fin=True):
+    # Server frames aren't masked
+    header = bytes([(0x80 if fin else 0) | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 1 << 16:
+        header += bytes([126]) + struct.pack("!H", len(payload))
+    else:
+        header += bytes([127]) + struct.pack("!Q", len(payload))
+    return header + payload
+
+
+class FakeEventEmitter:
+
+    def __init__(self):
+        self.subscribers = []   # sockets of the connected subscribers
+        self.emitted = 0
+        self.lock = threading.Lock()
+
+        self.server = ThreadingTCPServer(("127.0.0.1", 0), self.__handler())
+        self.server.daemon_threads = True
+        self.url = "ws://127.0.0.1:{0}".format(self.server.server_address[1])
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.disconnect_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def emit(self, event, fragments: int = 1):
+        """
+        Sends 'event' (a dict, or a list of them) to every subscriber, split in 'fragments' frames
+        """
+        payload = json.dumps(event).encode("utf-8")
+        size = -(-len(payload) // fragments)
+        parts = [payload[start:start + size] for start in range(0, len(payload), size)]
+        frame = b"".join(_frame(0x1 if index == 0 else 0x0, part, fin=index == len(parts) - 1)
+                         for index, part in enumerate(parts))
+        with self.lock:
+            self.emitted += 1
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber.sendall(frame)
+                except OSError:
+                    self.subscribers.remove(subscriber)
+
+    def ping(self):
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.sendall(_frame(0x9, b"ping"))
+
+    def disconnect_all(self):
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for subscriber in subscribers:
+            try:
+                subscriber.sendall(_frame(0x8, b""))
+                subscriber.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def wait_for_subscribers(self, count: int = 1, timeout: float = 5.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if len(self.subscribers) >= count:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def __handler(self):
+        emitter = self
+
+        class Handler(StreamRequestHandler):
+            def handle(self):
+                headers = {}
+                self.rfile.readline()
+                for line in iter(self.rfile.readline, b"\r\n"):
+                    if not line:
+                        return
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                accept = base64.b64encode(hashlib.sha1(headers["sec-websocket-key"].encode("ascii") +
+                                                       _WEBSOCKET_GUID).digest())
+                with emitter.lock:
+                    self.connection.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                                            b"Connection: Upgrade\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+                    emitter.subscribers.append(self.connection)
+
+                # Pongs and the close frame are read and ignored until the subscriber leaves
+                try:
+                    while self.connection.recv(4096):
+                        pass
+                except OSError:
+                    pass
+                with emitter.lock:
+                    if self.connection in emitter.subscribers:
+                        emitter.subscribers.remove(self.connection)
+
+        return Handler
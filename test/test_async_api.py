@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+#
+# test/test_async_api.py
+# Authors:
+#   Samuel Vargas
+#
+
+import asyncio
+import http.client
+import json
+import threading
+import unittest
+import requests
+from http.cookies import SimpleCookie
+from unittest.mock import patch
+from test.composer_stand_in import ComposerStandIn
+from test.test_util import generate_election_post_data, generate_voter_post_data, ELECTION_DUMMY_RSA_FERNET
+from src.asgi_server import AsgiServer
+from src.sqlite import SQLiteBackendIO
+from src.hyperledger.async_hyperledger_backend_io import AsyncHyperledgerBackendIO
+from src.hyperledger.hyperledger_backend_io import HyperledgerBackendIO
+from test.test_hyperledger_backend_io import election_kwargs
+from src.crypto_suite import ECDSAKeyPair
+from src.cookie_encryptor import CookieEncryptor
+from src.time_manager import TimeManager
+from src.account_types import AccountType
+from src.settings import SETTINGS
+from src.httpcode import *
+import src.async_intermediary
+
+
+def _election_keys(_=None):
+    # Stands in for generate_election_keys on the worker processes, so it has to be picklable
+    return ELECTION_DUMMY_RSA_FERNET
+
+
+@patch("src.async_api.election.generate_election_keys", _election_keys)
+class AsyncApiTest(unittest.TestCase):
+    keeps_versions = True  # The backend answers get_election_version, so responses get an ETag
+
+    def make_backend(self):
+        return SQLiteBackendIO(":memory:")
+
+    def setUp(self):
+        self.password = "Secret"
+        src.async_intermediary.configure(self.make_backend(), self.password)
+
+        # The server runs on its own event loop, the test talks to it over HTTP
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = AsgiServer(src.async_intermediary.app, port=0)
+        asyncio.run_coroutine_threadsafe(self.server.start(), self.loop).result()
+        self.url = "http://127.0.0.1:{0}".format(self.server.port)
+
+        self.election_title = "AsyncElection"
+        self.election = generate_election_post_data(
+            election_title=self.election_title,
+            description="Served by the event loop",
+            start_date=TimeManager.get_current_time_as_iso_format_string(),
+            end_date=TimeManager.get_current_time_plus_time_delta_in_days_as_iso_8601_str(days=1),
+            creator_keys=ECDSAKeyPair(),
+            questions=[["Red or Blue?", ["Red", "Blue"]]],
+        )
+
+    def tearDown(self):
+        SETTINGS['EVENT_PUBLISHER'].stop()
+        asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        close = getattr(SETTINGS['ASYNC_BACKEND_IO'], 'close', None)
+        if close is not None:
+            close()
+
+    def cookies(self, username, account_type=AccountType.voter):
+        return {"token": json.dumps({
+            'username': username,
+            'account_type': account_type.value,
+            'authentication': CookieEncryptor(self.password).encrypt(b"ABC").decode('utf-8')
+        })}
+
+    def request(self, method, path, content=None, username="ElectionCreator",
+                account_type=AccountType.election_creator, **kwargs):
+        return requests.request(method, self.url + path, data=json.dumps(content) if content is not None else None,
+                                cookies=self.cookies(username, account_type), timeout=10, **kwargs)
+
+    def create_election(self):
+        response = self.request("POST", "/api/election/create", self.election)
+        assert (response.text, response.status_code) == ELECTION_CREATED_SUCCESSFULLY
+
+    def vote(self, username, answers, voter_keys=None):
+        ballot = generate_voter_post_data(self.election_title, voter_keys or ECDSAKeyPair(), answers)
+        return self.request("POST", "/api/election/vote", ballot, username, AccountType.voter)
+
+    def test_authentication(self):
+        response = self.request("POST", "/api/authentication")
+        assert (response.text, response.status_code) == VALID_AUTHENTICATION_COOKIE
+        assert response.headers['Access-Control-Allow-Origin'] == '*'
+
+        self.password = "Wrong"
+        response = self.request("POST", "/api/authentication")
+        assert (response.text, response.status_code) == MISSING_OR_MALFORMED_AUTHENTICATION_COOKIE
+
+    def test_create_and_get_election(self):
+        self.create_election()
+        response = self.request("POST", "/api/election/create", self.election)
+        assert (response.text, response.status_code) == ELECTION_WITH_TITLE_ALREADY_EXISTS
+
+        response = self.request("GET", "/api/election/get_by_title", {"election_title": self.election_title})
+        assert response.status_code == 200
+        election = response.json()
+        assert election['election_title'] == self.election_title
+        assert 'election_private_key' not in election
+
+        # Nothing changed since, the client keeps its copy
+        if self.keeps_versions:
+            tag = response.headers['ETag']
+            response = self.request("GET", "/api/election/get_by_title", {"election_title": self.election_title},
+                                    headers={"If-None-Match": tag})
+            assert response.status_code == 304
+
+        response = self.request("GET", "/api/election/present")
+        assert [e['election_title'] for e in response.json()] == [self.election_title]
+        assert self.request("GET", "/api/election/future").json() == []
+
+        response = self.request("POST", "/api/election/get_by_titles", {"election_titles": [self.election_title, "?"]})
+        assert response.json()["?"] is None
+        assert response.json()[self.election_title]['description'] == "Served by the event loop"
+
+    def test_vote(self):
+        self.create_election()
+        response = self.vote("Voter", ["Red"])
+        assert response.status_code == 201
+        voter_uuid = response.text
+
+        response = self.vote("Voter", ["Blue"])
+        assert (response.text, response.status_code) == ELECTION_VOTER_VOTED_ALREADY
+
+        response = self.request("POST", "/api/ballot/get", {"voter_uuid": voter_uuid}, "Voter", AccountType.voter)
+        assert response.status_code == 200
+        assert response.json()['election_title'] == self.election_title
+
+    def test_bulk_vote(self):
+        self.create_election()
+        ballots = []
+        for username in ("A", "B", "A"):
+            ballot = generate_voter_post_data(self.election_title, ECDSAKeyPair(), ["Red"])
+            ballot['token'] = self.cookies(username)["token"]
+            ballots.append(ballot)
+        ballots[1]['ballot_signature'] = ballots[0]['ballot_signature']
+
+        response = self.request("POST", "/api/election/vote/bulk",
+                                {"election_title": self.election_title, "ballots": ballots})
+        results = response.json()["results"]
+        assert "voter_uuid" in results[0]
+        assert results[1]["code"] == ELECTION_BALLOT_SIGNING_MISMATCH.code
+        assert results[2]["error"] == ELECTION_VOTER_VOTED_ALREADY.message
+
+        response = self.vote("B", ["Blue"])
+        assert response.status_code == 201
+
+    def test_stream_ballots_and_tally(self):
+        self.create_election()
+        for index, answer in enumerate(["Red", "Red", "Blue"]):
+            assert self.vote("Voter {0}".format(index), [answer]).status_code == 201
+
+        with patch.object(TimeManager, "election_in_progress", return_value=False):
+            response = self.request("GET", "/api/ballot/all?stream=1", {"election_title": self.election_title})
+            assert response.headers['Transfer-Encoding'] == 'chunked'
+            answers = sorted(json.loads(ballot['ballot'])['answers'][0] for ballot in response.json())
+            assert answers == ["Blue", "Red", "Red"]
+
+            response = self.request("GET", "/api/election/tally", {"election_title": self.election_title})
+            assert response.status_code == 200
+            tally_results = response.json()
+            assert tally_results['participant_count'] == 3
+            assert tally_results['questions'][0]["Red or Blue?"] == {"Red": 2, "Blue": 1}
+
+    def test_election_events(self):
+        response = self.request("GET", "/api/election/events", stream=True)
+        assert response.headers['Content-Type'].startswith('text/event-stream')
+        self.create_election()
+
+        lines = response.iter_lines(decode_unicode=True)
+        assert next(line for line in lines if line.startswith("event:")) == "event: election_created"
+        assert json.loads(next(lines)[len("data: "):])['election_title'] == self.election_title
+        response.close()
+
+    def test_keep_alive_and_chunked_request(self):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=10)
+        headers = {"Cookie": SimpleCookie(self.cookies("ElectionCreator"))["token"].OutputString()}
+        self.create_election()
+
+        # The body is sent chunked, the response over the same connection as the next request
+        body = iter([json.dumps({"election_title": self.election_title}).encode("utf-8")])
+        connection.request("GET", "/api/election/get_by_title", body, headers, encode_chunked=True)
+        response = connection.getresponse()
+        assert response.status == 200
+        assert json.loads(response.read())['election_title'] == self.election_title
+        sock = connection.sock
+
+        connection.request("PUT", "/api/election/get_by_title", headers=headers)
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 405 and response.getheader("Allow") == "GET"
+        assert connection.sock is sock
+
+        connection.request("GET", "/api/nothing")
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 404
+        connection.close()
+
+
+@patch("src.async_api.election.generate_election_keys", _election_keys)
+class AsyncApiHyperledgerTest(AsyncApiTest):
+    """
+    The same routes awaiting the Hyperledger backend directly rather than through ThreadedBackendIO
+    """
+    keeps_versions = False
+
+    def make_backend(self):
+        self.stand_in = ComposerStandIn().start()
+        return AsyncHyperledgerBackendIO(self.stand_in.url)
+
+    def tearDown(self):
+        super().tearDown()
+        self.stand_in.stop()
+
+    def test_election_events(self):
+        response = self.request("GET", "/api/election/events", stream=True)
+        # Loads the publisher's election index before the election exists
+        SETTINGS['EVENT_PUBLISHER'].backend_io.get_catalog_version(TimeManager.get_current_time_as_epoch())
+        self.create_election()
+
+        # Found by the publisher re-reading the elections, the turnout is counted through the event loop
+        lines = response.iter_lines(decode_unicode=True)
+        assert next(line for line in lines if line.startswith("event:")) == "event: election_created"
+        assert json.loads(next(lines)[len("data: "):])['election_title'] == self.election_title
+
+        assert self.vote("Voter", ["Red"]).status_code == 201
+        assert next(line for line in lines if line.startswith("event:")) == "event: turnout"
+        assert json.loads(next(lines)[len("data: "):]) == {"election_title": self.election_title, "ballot_count": 1}
+        response.close()
+
+    def test_elections_of_other_instances_are_listed_and_published(self):
+        self.create_election()
+        response = self.request("GET", "/api/election/present")
+        assert [election['election_title'] for election in response.json()] == [self.election_title]
+
+        events = self.request("GET", "/api/election/events", stream=True)
+        SETTINGS['EVENT_PUBLISHER'].backend_io.get_catalog_version(TimeManager.get_current_time_as_epoch())
+
+        other_instance = HyperledgerBackendIO(self.stand_in.url)
+        other_instance.create_election(**election_kwargs("Theirs"))
+        other_instance.close()
+
+        response = self.request("GET", "/api/election/present")
+        assert [election['election_title'] for election in response.json()] == [self.election_title, "Theirs"]
+
+        lines = events.iter_lines(decode_unicode=True)
+        assert next(line for line in lines if line.startswith("event:")) == "event: election_created"
+        assert json.loads(next(lines)[len("data: "):])['election_title'] == "Theirs"
+        events.close()
+
+    def test_next_phase_transition(self):
+        self.create_election()
+        backend_io = SETTINGS['ASYNC_BACKEND_IO']
+        now = TimeManager.get_current_time_as_epoch()
+        end = TimeManager.get_election_window(*[json.loads(self.election['master_ballot'])[key]
+                                                for key in ('start_date', 'end_date')]).end
+        transition = asyncio.run_coroutine_threadsafe(backend_io.get_next_phase_transition(now), self.loop).result()
+        assert transition == end + 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+#
+# test/test_bulk_election.py
+# Authors:
+#   Samuel Vargas
+#
+
+import unittest
+from test.config import test_backend
+from unittest.mock import MagicMock, patch
+from test.test_util import generate_election_post_data, ELECTION_DUMMY_RSA_FERNET, JSON_HEADERS
+from src.crypto_suite import ECDSAKeyPair
+from src.cookie_encryptor import CookieEncryptor
+from src.validator.election_json_validator import ElectionJsonValidator
+from src.crypto_flow import CryptoFlow
+from src.time_manager import TimeManager
+from src.account_types import AccountType
+from src.httpcode import *
+from src import worker_pool
+import itertools
+import json
+import src.intermediary
+
+
+class BulkElectionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.backend = test_backend()
+        self.password = "Secret"
+        self.app = src.intermediary.start_test(self.backend, self.password)
+        self.creator_keys = ECDSAKeyPair()
+        self.key_ids = itertools.count()
+        # The keys are UNIQUE columns, give every election its own copy
+        CryptoFlow.generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict = MagicMock(
+            side_effect=lambda: {key: "{0}{1}".format(value, next(self.key_ids))
+                                 for key, value in ELECTION_DUMMY_RSA_FERNET.items()})
+        ElectionJsonValidator.is_valid = MagicMock(return_value=(True, ""))
+
+    @classmethod
+    def tearDownClass(self):
+        worker_pool.shutdown()
+
+    def token(self, username, account_type=AccountType.election_creator):
+        return json.dumps({
+            'username': username,
+            'account_type': account_type.value,
+            'authentication': CookieEncryptor(self.password).encrypt(b"ABC").decode('utf-8')
+        })
+
+    def setUp(self):
+        self.backend.nuke()
+        self.app.set_cookie('localhost', 'token', self.token("ElectionCreator"))
+
+    def election(self, election_title):
+        return generate_election_post_data(
+            election_title=election_title,
+            description="Test Bulk Election",
+            start_date=TimeManager.get_current_time_as_iso_format_string(),
+            end_date=TimeManager.get_current_time_plus_time_delta_in_days_as_iso_8601_str(days=1),
+            creator_keys=self.creator_keys,
+            questions=[["Red or Blue?", ["Red", "Blue"]]],
+        )
+
+    def bulk_create(self, elections):
+        response = self.app.post("/api/election/create/bulk", headers=JSON_HEADERS,
+                                 data=json.dumps({"elections": elections}))
+        assert response.status_code == 200
+        return json.loads(response.data.decode('utf-8'))['results']
+
+    def test_every_election_is_created_in_one_call(self):
+        titles = ["Bulk Election {0}".format(i) for i in range(5)]
+        with patch.object(self.backend, "create_election") as single:
+            results = self.bulk_create([self.election(title) for title in titles])
+            single.assert_not_called()
+
+        assert [result['election_title'] for result in results] == titles
+        for title, result in zip(titles, results):
+            assert result['code'] == ELECTION_CREATED_SUCCESSFULLY.code
+            election = self.backend.get_election_by_title(title)
+            assert election['creator_username'] == "ElectionCreator"
+            assert json.loads(election['questions']) == [["Red or Blue?", ["Red", "Blue"]]]
+
+    def test_invalid_elections_are_rejected_individually(self):
+        self.bulk_create([self.election("Existing")])
+
+        forged = self.election("Forged")
+        forged['master_ballot_signature'] = self.election("Other")['master_ballot_signature']
+        missing_key = self.election("Missing Key")
+        del missing_key['creator_public_key']
+        malformed = self.election("Malformed")
+        malformed['master_ballot'] = "{"
+        bad_date = generate_election_post_data(
+            election_title="Bad Date",
+            description="Test Bulk Election",
+            start_date="Soon",
+            end_date=TimeManager.get_current_time_plus_time_delta_in_days_as_iso_8601_str(days=1),
+            creator_keys=self.creator_keys,
+            questions=[["Red or Blue?", ["Red", "Blue"]]],
+        )
+
+        results = self.bulk_create([
+            self.election("Existing"),
+            self.election("Twice"),
+            self.election("Twice"),
+            forged,
+            missing_key,
+            malformed,
+            bad_date,
+            self.election("Valid"),
+        ])
+
+        assert [result['code'] for result in results] == [
+            ELECTION_WITH_TITLE_ALREADY_EXISTS.code,
+            ELECTION_CREATED_SUCCESSFULLY.code,
+            ELECTION_WITH_TITLE_ALREADY_EXISTS.code,
+            ELECTION_BALLOT_SIGNING_MISMATCH.code,
+            ELECTION_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE.code,
+            ELECTION_BALLOT_JSON_MALFORMED.code,
+            ELECTION_BALLOT_DATE_MALFORMED.code,
+            ELECTION_CREATED_SUCCESSFULLY.code,
+        ]
+        assert results[4]['election_title'] is None
+        assert results[6]['election_title'] == "Bad Date"
+        assert self.backend.get_election_by_title("Twice") is not None
+        assert self.backend.get_election_by_title("Forged") is None
+        assert self.backend.get_election_by_title("Bad Date") is None
+        assert self.backend.get_election_by_title("Valid") is not None
+
+    def test_voter_cannot_create_elections(self):
+        self.app.set_cookie('localhost', 'token', self.token("Voter", AccountType.voter))
+        response = self.app.post("/api/election/create/bulk", headers=JSON_HEADERS,
+                                 data=json.dumps({"elections": [self.election("Nope")]}))
+        assert response.status_code == VOTER_CANNOT_CREATE_ELECTION.code
+
+    def test_missing_or_oversized_election_list(self):
+        response = self.app.post("/api/election/create/bulk", headers=JSON_HEADERS, data=json.dumps({}))
+        assert response.status_code == ELECTION_BULK_CREATE_MISSING_ELECTIONS.code
+
+        from src.api.election_checks import MAX_BULK_ELECTIONS
+        response = self.app.post("/api/election/create/bulk", headers=JSON_HEADERS,
+                                 data=json.dumps({"elections": [{}] * (MAX_BULK_ELECTIONS + 1)}))
+        assert response.status_code == ELECTION_BULK_CREATE_TOO_LARGE.code
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+#
+# test/test_bulk_voting.py
+# Authors:
+#   Samuel Vargas
+#
+
+import unittest
+from test.config import test_backend
+from unittest.mock import MagicMock, patch
+from test.test_util import generate_election_post_data, generate_voter_post_data, ELECTION_DUMMY_RSA_FERNET, \
+    JSON_HEADERS
+from src.crypto_suite import ECDSAKeyPair
+from src.cookie_encryptor import CookieEncryptor
+from src.validator.election_json_validator import ElectionJsonValidator
+from src.crypto_flow import CryptoFlow
+from src.time_manager import TimeManager
+from src.account_types import AccountType
+from src.httpcode import *
+from src import worker_pool
+import json
+import src.intermediary
+import uuid
+
+
+class BulkVotingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.election_title = "TestBulkVoting"
+        self.backend = test_backend()
+        self.password = "Secret"
+        self.app = src.intermediary.start_test(self.backend, self.password)
+        CryptoFlow.generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict = MagicMock(
+            return_value=ELECTION_DUMMY_RSA_FERNET)
+        ElectionJsonValidator.is_valid = MagicMock(return_value=(True, ""))
+
+    @classmethod
+    def tearDownClass(self):
+        worker_pool.shutdown()
+
+    def token(self, username, account_type=AccountType.voter):
+        return json.dumps({
+            'username': username,
+            'account_type': account_type.value,
+            'authentication': CookieEncryptor(self.password).encrypt(b"ABC").decode('utf-8')
+        })
+
+    def setUp(self):
+        self.backend.nuke()
+        self.app.set_cookie('localhost', 'token', self.token("ElectionCreator", AccountType.election_creator))
+        election = generate_election_post_data(
+            election_title=self.election_title,
+            description="Test Bulk Voting",
+            start_date=TimeManager.get_current_time_as_iso_format_string(),
+            end_date=TimeManager.get_current_time_plus_time_delta_in_days_as_iso_8601_str(days=1),
+            creator_keys=ECDSAKeyPair(),
+            questions=[["Red or Blue?", ["Red", "Blue"]]],
+        )
+        response = self.app.post("/api/election/create", headers=JSON_HEADERS, data=json.dumps(election))
+        assert response.status_code == ELECTION_CREATED_SUCCESSFULLY.code
+
+        # The kiosk forwarding the ballots
+        self.app.set_cookie('localhost', 'token', self.token("Kiosk"))
+
+    def ballot(self, username, answer="Red", election_title=None):
+        ballot = generate_voter_post_data(election_title=election_title or self.election_title,
+                                          voter_keys=ECDSAKeyPair(), answers=[answer])
+        ballot['token'] = self.token(username)
+        return ballot
+
+    def bulk_vote(self, ballots):
+        response = self.app.post("/api/election/vote/bulk", headers=JSON_HEADERS, data=json.dumps({
+            "election_title": self.election_title,
+            "ballots": ballots
+        }))
+        assert response.status_code == 200
+        return json.loads(response.data.decode('utf-8'))['results']
+
+    def test_every_valid_ballot_is_stored_and_counted(self):
+        ballots = [self.ballot("Voter {0}".format(i), "Red" if i % 3 else "Blue") for i in range(9)]
+        with patch.object(self.backend, "create_ballot") as single:
+            results = self.bulk_vote(ballots)
+            single.assert_not_called()
+
+        for result in results:
+            uuid.UUID(result['voter_uuid'], version=4)
+            assert self.backend.get_ballot_by_voter_uuid(result['voter_uuid']) is not None
+        assert self.backend.count_ballots(self.election_title) == 9
+        assert self.backend.has_user_participated_in_election("Voter 0", self.election_title)
+
+    def test_rejected_ballots_are_reported_per_item(self):
+        forged = self.ballot("Forger")
+        forged['ballot_signature'] = self.ballot("Someone")['ballot_signature']
+        missing_token = self.ballot("Anonymous")
+        del missing_token['token']
+
+        results = self.bulk_vote([
+            self.ballot("Alice"),
+            forged,
+            self.ballot("Alice"),
+            missing_token,
+            self.ballot("Bob", election_title="Another Election"),
+            "not a ballot",
+        ])
+
+        assert 'voter_uuid' in results[0]
+        assert [result.get('code') for result in results[1:]] == [
+            ELECTION_BALLOT_SIGNING_MISMATCH.code,
+            ELECTION_VOTER_VOTED_ALREADY.code,
+            ELECTION_VOTER_BALLOT_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE.code,
+            ELECTION_BULK_VOTE_BALLOT_FOR_OTHER_ELECTION.code,
+            ELECTION_VOTER_BALLOT_MISSING_BALLOT_PUBLIC_KEY_OR_SIGNATURE.code,
+        ]
+        assert results[2]['error'] == ELECTION_VOTER_VOTED_ALREADY.message
+        assert self.backend.count_ballots(self.election_title) == 1
+
+        # A voter that already voted can't vote again in a later batch
+        assert self.bulk_vote([self.ballot("Alice")])[0]['code'] == ELECTION_VOTER_VOTED_ALREADY.code
+
+    def test_bulk_ballots_decrypt_like_single_ballots(self):
+        result = self.bulk_vote([self.ballot("Alice", "Blue")])[0]
+        election = self.backend.get_election_by_title(self.election_title)
+        ballot = self.backend.get_ballot_by_voter_uuid(result['voter_uuid'])
+        decrypted = CryptoFlow.decrypt_ballot(ballot['ballot'], election['election_public_key'],
+                                              election['election_private_key'],
+                                              election['election_encrypted_fernet_key'])
+        assert json.loads(decrypted)['answers'] == ["Blue"]
+
+    def test_batch_must_target_an_open_election(self):
+        response = self.app.post("/api/election/vote/bulk", headers=JSON_HEADERS, data=json.dumps({
+            "election_title": "Missing", "ballots": [self.ballot("Alice")]
+        }))
+        assert response.status_code == ELECTION_NOT_FOUND.code
+
+        with patch("src.time_manager.TimeManager.election_in_progress", return_value=False):
+            response = self.app.post("/api/election/vote/bulk", headers=JSON_HEADERS, data=json.dumps({
+                "election_title": self.election_title, "ballots": [self.ballot("Alice")]
+            }))
+        assert response.status_code == ELECTION_IS_INACTIVE.code
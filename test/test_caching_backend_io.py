@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# test/test_caching_backend_io.py
+# Authors:
+#   Samuel Vargas
+#
+
+import json
+import unittest
+from test.config import test_backend
+from test.test_util import ELECTION_DUMMY_RSA_FERNET
+from src.caching_backend_io import CachingBackendIO, CachePolicy
+from unittest.mock import patch
+
+
+class CachingBackendIOTest(unittest.TestCase):
+    def setUp(self):
+        self.inner = test_backend()
+        self.backend = CachingBackendIO(self.inner, policies={
+            "get_election_by_title": CachePolicy(max_size=2, negative_ttl=60.0),
+        })
+        self.backend.nuke()
+
+    def create_election(self, election_title):
+        self.backend.create_election(
+            {
+                "election_title": election_title,
+                "description": "...",
+                "start_date": "2018-03-30T18:48:21.940478-07:00",
+                "end_date": "2018-03-31T18:50:29.522627-07:00",
+                "questions": json.dumps(["A or B?", ["A", "B"]])
+            },
+            creator_username="ElectionCreator",
+            creator_master_ballot_signature="signature",
+            creator_public_key_b64="public key",
+            election_private_rsa_key=election_title + ELECTION_DUMMY_RSA_FERNET['election_private_key'],
+            election_public_rsa_key=election_title + ELECTION_DUMMY_RSA_FERNET['election_public_key'],
+            election_encrypted_fernet_key=election_title + ELECTION_DUMMY_RSA_FERNET['election_encrypted_fernet_key']
+        )
+
+    def test_repeated_election_lookups_only_reach_the_backend_once(self):
+        self.create_election("A")
+        with patch.object(self.inner, "get_election_by_title", wraps=self.inner.get_election_by_title) as spy:
+            for _ in range(3):
+                assert self.backend.get_election_by_title("A")["election_title"] == "A"
+            assert spy.call_count == 1
+
+        stats = self.backend.get_cache_stats()["get_election_by_title"]
+        assert stats["hits"] == 2
+        assert stats["misses"] == 1
+
+    def test_returned_elections_can_be_modified_safely(self):
+        self.create_election("A")
+        self.backend.get_election_by_title("A").pop("election_private_key")
+        assert "election_private_key" in self.backend.get_election_by_title("A")
+
+    def test_creating_an_election_invalidates_a_cached_miss(self):
+        assert self.backend.get_election_by_title("A") is None
+        self.create_election("A")
+        assert self.backend.get_election_by_title("A") is not None
+
+    def test_batch_lookup_only_fetches_the_misses(self):
+        self.create_election("A")
+        self.create_election("B")
+        assert self.backend.get_election_by_title("A") is not None
+
+        with patch.object(self.inner, "get_elections_by_titles", wraps=self.inner.get_elections_by_titles) as spy:
+            elections = self.backend.get_elections_by_titles(["A", "B", "C"])
+            spy.assert_called_once_with(["B", "C"])
+        assert sorted(elections) == ["A", "B"]
+
+        # Both the hit and the misses (including "C") are now cached.
+        with patch.object(self.inner, "get_elections_by_titles") as spy:
+            assert sorted(self.backend.get_elections_by_titles(["B", "C"])) == ["B"]
+            spy.assert_not_called()
+
+    def test_least_recently_used_election_is_evicted(self):
+        for election_title in ("A", "B", "C"):
+            self.create_election(election_title)
+            self.backend.get_election_by_title(election_title)
+
+        with patch.object(self.inner, "get_election_by_title", wraps=self.inner.get_election_by_title) as spy:
+            self.backend.get_election_by_title("C")
+            assert spy.call_count == 0
+            self.backend.get_election_by_title("A")
+            assert spy.call_count == 1
+
+    def test_nuke_clears_every_cache(self):
+        self.create_election("A")
+        self.backend.get_election_by_title("A")
+        self.backend.nuke()
+        assert self.backend.get_election_by_title("A") is None
+
+    def test_only_positive_participation_is_cached(self):
+        self.create_election("A")
+        assert not self.backend.has_user_participated_in_election("Alice", "A")
+        self.backend.register_user_as_participated_in_election("Alice", "A")
+        with patch.object(self.inner, "has_user_participated_in_election") as spy:
+            assert self.backend.has_user_participated_in_election("Alice", "A")
+            spy.assert_not_called()
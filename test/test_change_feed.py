@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# test/test_change_feed.py
+# Authors:
+#   Samuel Vargas
+#
+
+import json
+import unittest
+import src.intermediary
+from test.config import test_backend
+from test.dummy_keys import *
+from test.test_util import generate_election_post_data, JSON_HEADERS
+from src.httpcode import *
+from src.crypto_suite import ECDSAKeyPair
+from src.crypto_flow import CryptoFlow
+from src.validator import ElectionJsonValidator
+from src.account_types import AccountType
+from src.cookie_encryptor import CookieEncryptor
+from src.election_phase import ELECTION_CREATED, ELECTION_OPENED, ELECTION_CLOSED
+from unittest.mock import MagicMock
+from datetime import datetime, timezone, timedelta
+
+DAY = 24 * 60 * 60
+
+
+class ChangeFeedTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.password = "Secret"
+        ElectionJsonValidator.is_valid = MagicMock(return_value=(True, ""))
+
+    def setUp(self):
+        self.backend = test_backend()
+        self.app = src.intermediary.start_test(self.backend, self.password)
+        self.app.set_cookie('localhost', 'token', json.dumps({
+            'username': 'ElectionCreator',
+            'account_type': AccountType.election_creator.value,
+            'authentication': CookieEncryptor(self.password).encrypt(b"ABC").decode('utf-8')
+        }))
+
+        now = datetime.now(timezone.utc)
+        self.now = int(now.timestamp())
+        self.create("Past", now - timedelta(days=2), now - timedelta(days=1), ELECTION_DUMMY_RSA_FERNET_ONE)
+        self.create("Present", now - timedelta(days=1), now + timedelta(days=1), ELECTION_DUMMY_RSA_FERNET_TWO)
+        self.create("Future", now + timedelta(days=2), now + timedelta(days=3), ELECTION_DUMMY_RSA_FERNET_THREE)
+
+    def create(self, election_title, start, end, stub):
+        CryptoFlow.generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict = MagicMock(return_value=stub)
+        response = self.app.post("/api/election/create", headers=JSON_HEADERS, data=json.dumps(
+            generate_election_post_data(election_title=election_title, description="...",
+                                        start_date=start.isoformat(), end_date=end.isoformat(),
+                                        creator_keys=ECDSAKeyPair(), questions=[["?", ["A", "B"]]])))
+        assert response.status_code == ELECTION_CREATED_SUCCESSFULLY.code
+
+    def get_changes(self, **query):
+        response = self.app.get("/api/election/changes", query_string=query)
+        assert response.status_code == 200
+        return json.loads(response.data.decode('utf-8'))
+
+    def test_feed_starts_with_every_created_election(self):
+        feed = self.get_changes()
+        assert [(c['seq'], c['event'], c['election_title']) for c in feed['items']] == \
+            [(1, ELECTION_CREATED, "Past"), (2, ELECTION_CREATED, "Present"), (3, ELECTION_CREATED, "Future")]
+        assert feed['since'] == 3 and not feed['more']
+
+        # The private_key is only sent for elections that are over.
+        elections = {c['election_title']: c['election'] for c in feed['items']}
+        assert 'election_private_key' in elections['Past']
+        assert 'election_private_key' not in elections['Present']
+        assert 'election_private_key' not in elections['Future']
+
+    def test_client_only_receives_what_it_hasnt_seen(self):
+        feed = self.get_changes(limit=2)
+        assert [c['election_title'] for c in feed['items']] == ["Past", "Present"]
+        assert feed['since'] == 2 and feed['more']
+
+        feed = self.get_changes(since=feed['since'], limit=2)
+        assert [c['election_title'] for c in feed['items']] == ["Future"]
+        assert feed['since'] == 3 and not feed['more']
+
+        feed = self.get_changes(since=feed['since'])
+        assert feed == {"items": [], "since": 3, "more": False}
+
+    def test_openings_and_closings_are_recorded_in_the_order_they_happen(self):
+        later = self.now + 2 * DAY + 10
+        changes = self.backend.get_changes(3, later)
+        assert [(c['seq'], c['event'], c['election_title']) for c in changes] == \
+            [(4, ELECTION_CLOSED, "Present"), (5, ELECTION_OPENED, "Future")]
+        assert changes[0]['epoch'] < changes[1]['epoch'] <= later
+
+        # Recorded once, asking again (or later) doesn't duplicate them.
+        assert self.backend.get_changes(3, later) == changes
+        assert self.backend.get_changes(5, later + DAY * 2) == [
+            {"seq": 6, "election_title": "Future", "event": ELECTION_CLOSED, "epoch": changes[1]['epoch'] + DAY + 1}
+        ]
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in ({'since': -1}, {'since': 'x'}, {'limit': 0}, {'limit': 501}):
+            response = self.app.get("/api/election/changes", query_string=query)
+            assert response.status_code == INVALID_CHANGE_FEED_PARAMETERS.code
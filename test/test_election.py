@@ -89,11 +89,66 @@ class ElectionTest(unittest.TestCase):
         retrieved_election = json.loads(response.data.decode('utf-8'))
         assert 'election_private_key' not in retrieved_election
 
-    @patch("src.time_manager.TimeManager.election_in_progress")
+    @patch("src.time_manager.TimeManager.election_in_past")
     def test_election_private_key_is_leaked_after_election(self, mock):
-        mock.return_value = False
+        mock.return_value = True
         search = json.dumps({"election_title": self.election_title})
         response = self.app.get("/api/election/get_by_title", headers=JSON_HEADERS, data=search)
         assert response.status_code == 200
         retrieved_election = json.loads(response.data.decode('utf-8'))
         assert 'election_private_key' in retrieved_election
+
+    def test_election_private_key_is_not_leaked_before_election(self):
+        # Every endpoint sending whole elections uses the same rule: only once it has ended
+        with patch("src.time_manager.TimeManager.election_in_progress", return_value=False):
+            search = json.dumps({"election_title": self.election_title})
+            response = self.app.get("/api/election/get_by_title", headers=JSON_HEADERS, data=search)
+            assert 'election_private_key' not in json.loads(response.data.decode('utf-8'))
+
+            search = json.dumps({"election_titles": [self.election_title]})
+            response = self.app.post("/api/election/get_by_titles", headers=JSON_HEADERS, data=search)
+            assert 'election_private_key' not in json.loads(response.data.decode('utf-8'))[self.election_title]
+
+            response = self.app.get("/api/election/changes", headers=JSON_HEADERS)
+            assert 'election_private_key' not in json.loads(response.data.decode('utf-8'))['items'][0]['election']
+
+    def test_many_elections_can_be_retrieved_at_once(self):
+        search = json.dumps({"election_titles": [self.election_title, "Missing", self.election_title]})
+        with patch.object(self.backend, "get_election_by_title") as spy:
+            response = self.app.post("/api/election/get_by_titles", headers=JSON_HEADERS, data=search)
+            spy.assert_not_called()
+        assert response.status_code == 200
+        elections = json.loads(response.data.decode('utf-8'))
+        assert list(elections) == [self.election_title, "Missing"]
+        assert elections["Missing"] is None
+        assert elections[self.election_title]['description'] == self.election_description
+        assert 'election_private_key' not in elections[self.election_title]
+
+    @patch("src.time_manager.TimeManager.election_in_past")
+    def test_batch_only_includes_private_key_of_ended_elections(self, mock):
+        mock.return_value = True
+        search = json.dumps({"election_titles": [self.election_title]})
+        response = self.app.post("/api/election/get_by_titles", headers=JSON_HEADERS, data=search)
+        assert 'election_private_key' in json.loads(response.data.decode('utf-8'))[self.election_title]
+
+    def test_malformed_dates_are_rejected(self):
+        for start_date in ("Tomorrow", 1521507388):
+            election = generate_election_post_data(
+                election_title="Malformed",
+                description=self.election_description,
+                start_date=start_date,
+                end_date=self.end_date,
+                creator_keys=self.election_creator_ecdsa_keys,
+                questions=self.questions)
+            response = self.app.post("/api/election/create", headers=JSON_HEADERS, data=json.dumps(election))
+            assert (response.data.decode('utf-8'), response.status_code) == ELECTION_BALLOT_DATE_MALFORMED
+        assert self.backend.get_election_by_title("Malformed") is None
+
+    def test_batch_requires_a_list_of_titles(self):
+        for search in ({}, {"election_titles": self.election_title}, {"election_titles": [1]}):
+            response = self.app.post("/api/election/get_by_titles", headers=JSON_HEADERS, data=json.dumps(search))
+            assert response.status_code == ELECTION_BATCH_MISSING_ELECTION_TITLES.code
+
+        search = json.dumps({"election_titles": [str(i) for i in range(101)]})
+        response = self.app.post("/api/election/get_by_titles", headers=JSON_HEADERS, data=search)
+        assert response.status_code == ELECTION_BATCH_TOO_LARGE.code
@@ -18,6 +18,7 @@ from src.validator import ElectionJsonValidator
 from src.time_manager import TimeManager
 from src.account_types import AccountType
 from src.cookie_encryptor import CookieEncryptor
+from src.fieldsets import SUMMARY_FIELDS
 from unittest.mock import MagicMock
 from datetime import datetime, timezone, timedelta
 
@@ -136,3 +137,44 @@ class ElectionPastPresentFutureTest(unittest.TestCase):
         future_elections = json.loads(response.data.decode('utf-8'))
         for election in future_elections:
             assert election["election_title"].startswith("Future")
+
+    def test_each_listing_contains_exactly_two_elections(self):
+        for url, prefix in (("/api/election/past", "Past"),
+                            ("/api/election/present", "Present"),
+                            ("/api/election/future", "Future")):
+            response = self.app.get(url, headers=JSON_HEADERS)
+            elections = json.loads(response.data.decode('utf-8'))
+            assert sorted(election["election_title"] for election in elections) == \
+                ["{0} Election 1".format(prefix), "{0} Election 2".format(prefix)]
+
+    def test_private_key_is_only_listed_for_past_elections(self):
+        query = {'fields': 'all'}
+        response = self.app.get("/api/election/past", headers=JSON_HEADERS, query_string=query)
+        for election in json.loads(response.data.decode('utf-8')):
+            assert 'election_private_key' in election
+
+        for url in ("/api/election/present", "/api/election/future"):
+            response = self.app.get(url, headers=JSON_HEADERS, query_string=query)
+            for election in json.loads(response.data.decode('utf-8')):
+                assert 'election_private_key' not in election
+
+    def test_listings_default_to_a_summary(self):
+        for url in ("/api/election/past", "/api/election/present", "/api/election/future"):
+            response = self.app.get(url, headers=JSON_HEADERS)
+            for election in json.loads(response.data.decode('utf-8')):
+                assert tuple(election) == SUMMARY_FIELDS
+
+    def test_listings_only_contain_the_requested_fields(self):
+        query = {'fields': 'end_date,election_private_key'}
+        response = self.app.get("/api/election/past", headers=JSON_HEADERS, query_string=query)
+        for election in json.loads(response.data.decode('utf-8')):
+            assert set(election) == {'election_title', 'end_date', 'election_private_key'}
+
+        # The private key is never listed for an election that hasn't ended
+        response = self.app.get("/api/election/present", headers=JSON_HEADERS, query_string=query)
+        for election in json.loads(response.data.decode('utf-8')):
+            assert set(election) == {'election_title', 'end_date'}
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.app.get("/api/election/past", headers=JSON_HEADERS, query_string={'fields': 'password'})
+        assert response.status_code == INVALID_ELECTION_FIELDS.code
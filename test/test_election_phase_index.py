@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# test/test_election_phase_index.py
+# Authors:
+#   Samuel Vargas
+#
+
+import json
+import os
+import tempfile
+import unittest
+import src.intermediary
+from test.config import test_backend
+from test.dummy_keys import *
+from test.test_util import generate_election_post_data, JSON_HEADERS
+from src.httpcode import *
+from src.crypto_suite import ECDSAKeyPair
+from src.crypto_flow import CryptoFlow
+from src.validator import ElectionJsonValidator
+from src.account_types import AccountType
+from src.cookie_encryptor import CookieEncryptor
+from src.election_phase import ElectionPhase
+from src.election_phase_index import ElectionPhaseIndex, ELECTION_CREATED, ELECTION_OPENED, ELECTION_CLOSED
+from src.time_manager import TimeManager
+from src.sqlite import SQLiteBackendIO
+from test.test_hyperledger_backend_io import election_kwargs
+from unittest.mock import MagicMock
+from datetime import datetime, timezone, timedelta
+
+
+class ElectionPhaseIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.password = "Secret"
+        ElectionJsonValidator.is_valid = MagicMock(return_value=(True, ""))
+
+    def setUp(self):
+        self.inner = test_backend()
+        self.backend = ElectionPhaseIndex(self.inner)
+        self.events = []
+        self.backend.add_listener(lambda event, election: self.events.append((event, election['election_title'])))
+        self.app = src.intermediary.start_test(self.backend, self.password)
+        self.app.set_cookie('localhost', 'token', json.dumps({
+            'username': 'ElectionCreator',
+            'account_type': AccountType.election_creator.value,
+            'authentication': CookieEncryptor(self.password).encrypt(b"ABC").decode('utf-8')
+        }))
+
+        self.now = datetime.now(timezone.utc)
+        self.create("Past", self.now - timedelta(days=2), self.now - timedelta(days=1), ELECTION_DUMMY_RSA_FERNET_ONE)
+        self.create("Present", self.now - timedelta(days=1), self.now + timedelta(days=1),
+                    ELECTION_DUMMY_RSA_FERNET_TWO)
+        self.create("Future", self.now + timedelta(days=1), self.now + timedelta(days=2),
+                    ELECTION_DUMMY_RSA_FERNET_THREE)
+
+    def create(self, election_title, start, end, stub):
+        CryptoFlow.generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict = MagicMock(return_value=stub)
+        response = self.app.post("/api/election/create", headers=JSON_HEADERS, data=json.dumps(
+            generate_election_post_data(election_title=election_title, description="...",
+                                        start_date=start.isoformat(), end_date=end.isoformat(),
+                                        creator_keys=ECDSAKeyPair(), questions=["?", ["A", "B"]])))
+        assert response.status_code == ELECTION_CREATED_SUCCESSFULLY.code
+
+    def titles(self, phase, now):
+        return [election['election_title'] for election in self.backend.get_elections_in_phase(phase, now)]
+
+    def test_index_agrees_with_wrapped_backend(self):
+        now = TimeManager.get_current_time_as_epoch()
+        for phase in ElectionPhase:
+            assert self.backend.get_elections_in_phase(phase, now) == self.inner.get_elections_in_phase(phase, now)
+
+    def test_index_is_seeded_from_existing_elections(self):
+        now = TimeManager.get_current_time_as_epoch()
+        index = ElectionPhaseIndex(self.inner)
+        for phase in ElectionPhase:
+            assert index.get_elections_in_phase(phase, now) == self.inner.get_elections_in_phase(phase, now)
+
+    def test_elections_move_between_buckets_as_time_passes(self):
+        now = TimeManager.get_current_time_as_epoch()
+        assert self.titles(ElectionPhase.present, now) == ["Present"]
+
+        in_three_days = now + 3 * 24 * 60 * 60
+        assert self.titles(ElectionPhase.past, in_three_days) == ["Future", "Past", "Present"]
+        assert self.titles(ElectionPhase.present, in_three_days) == []
+        assert self.titles(ElectionPhase.future, in_three_days) == []
+        assert sorted(self.events[-3:]) == [(ELECTION_CLOSED, "Future"), (ELECTION_CLOSED, "Present"),
+                                            (ELECTION_OPENED, "Future")]
+
+    def test_creation_is_reported_to_listeners(self):
+        assert self.events == [(ELECTION_CREATED, "Past"), (ELECTION_CREATED, "Present"),
+                               (ELECTION_CREATED, "Future")]
+
+    def test_private_key_is_only_listed_for_past_elections(self):
+        now = TimeManager.get_current_time_as_epoch()
+        assert 'election_private_key' in self.backend.get_elections_in_phase(ElectionPhase.past, now)[0]
+        assert 'election_private_key' not in self.backend.get_elections_in_phase(ElectionPhase.present, now)[0]
+
+    def test_elections_created_by_other_processes_are_synced(self):
+        path = os.path.join(tempfile.mkdtemp(), "shared.db")
+        mine, theirs = SQLiteBackendIO(path, journal_mode="wal"), SQLiteBackendIO(path, journal_mode="wal")
+        index = ElectionPhaseIndex(mine, sync_interval=0)
+        now = TimeManager.get_current_time_as_epoch()
+        assert index.get_elections_in_phase(ElectionPhase.present, now) == []
+
+        events = []
+        index.add_listener(lambda event, election: events.append((event, election['election_title'])))
+        theirs.create_election(**election_kwargs("Theirs"))
+        assert [e['election_title'] for e in index.get_elections_in_phase(ElectionPhase.present, now)] == ["Theirs"]
+        assert events == [(ELECTION_CREATED, "Theirs")]
+        mine.close()
+        theirs.close()
+
+    def test_nuke_empties_every_bucket(self):
+        self.backend.nuke()
+        now = TimeManager.get_current_time_as_epoch()
+        for phase in ElectionPhase:
+            assert self.titles(phase, now) == []
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+#
+# test/test_election_search.py
+# Authors:
+#   Samuel Vargas
+#
+
+import json
+import unittest
+import src.intermediary
+from test.config import test_backend
+from test.dummy_keys import *
+from test.test_util import generate_election_post_data, JSON_HEADERS
+from src.httpcode import *
+from src.crypto_suite import ECDSAKeyPair
+from src.crypto_flow import CryptoFlow
+from src.validator import ElectionJsonValidator
+from src.account_types import AccountType
+from src.cookie_encryptor import CookieEncryptor
+from src.election_phase_index import ElectionPhaseIndex
+from unittest.mock import MagicMock
+from datetime import datetime, timezone, timedelta
+
+ELECTIONS = [
+    ("Presidential Election", "Pick the next president", ELECTION_DUMMY_RSA_FERNET_ONE),
+    ("Student Council Election", "Elect your class president", ELECTION_DUMMY_RSA_FERNET_TWO),
+    ("Favorite Color", "Everyone picks red or blue", ELECTION_DUMMY_RSA_FERNET_THREE),
+]
+
+
+class SQLiteElectionSearchTest(unittest.TestCase):
+    """
+    SQLiteBackendIO searches with FTS5.
+    """
+
+    @classmethod
+    def setUpClass(self):
+        self.password = "Secret"
+        ElectionJsonValidator.is_valid = MagicMock(return_value=(True, ""))
+
+    def backend(self):
+        return test_backend()
+
+    def setUp(self):
+        self.app = src.intermediary.start_test(self.backend(), self.password)
+        self.app.set_cookie('localhost', 'token', json.dumps({
+            'username': 'ElectionCreator',
+            'account_type': AccountType.election_creator.value,
+            'authentication': CookieEncryptor(self.password).encrypt(b"ABC").decode('utf-8')
+        }))
+
+        now = datetime.now(timezone.utc)
+        for election_title, description, stub in ELECTIONS:
+            CryptoFlow.generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict = MagicMock(return_value=stub)
+            response = self.app.post("/api/election/create", headers=JSON_HEADERS, data=json.dumps(
+                generate_election_post_data(election_title=election_title, description=description,
+                                            start_date=(now - timedelta(days=2)).isoformat(),
+                                            end_date=(now - timedelta(days=1)).isoformat(),
+                                            creator_keys=ECDSAKeyPair(), questions=[["?", ["A", "B"]]])))
+            assert response.status_code == ELECTION_CREATED_SUCCESSFULLY.code
+
+    def search(self, **query):
+        response = self.app.get("/api/election/search", query_string=query)
+        assert response.status_code == 200
+        return json.loads(response.data.decode('utf-8'))
+
+    def titles(self, q):
+        return [election['election_title'] for election in self.search(q=q)['items']]
+
+    def test_words_match_by_prefix_and_title_matches_rank_first(self):
+        assert self.titles("pres") == ["Presidential Election", "Student Council Election"]
+        assert self.titles("ELEC PRES") == ["Presidential Election", "Student Council Election"]
+        assert self.titles("colo") == ["Favorite Color"]
+        assert self.titles("council blue") == []
+
+    def test_query_syntax_is_not_interpreted(self):
+        assert self.titles('"red* OR (') == ["Favorite Color"]
+
+    def test_pages_cover_every_match_exactly_once(self):
+        titles, query = [], {'q': "e", 'limit': 2}
+        while True:
+            page = self.search(**query)
+            assert len(page['items']) <= 2
+            titles.extend(election['election_title'] for election in page['items'])
+            if page['next'] is None:
+                break
+            query['after'] = page['next']
+
+        assert sorted(titles) == sorted(election[0] for election in ELECTIONS)
+
+    def test_private_key_is_never_returned(self):
+        page = self.search(q="pres", fields="all")
+        assert page['items'] and all('election_private_key' not in election for election in page['items'])
+        assert all(set(election) == {'election_title', 'end_date'}
+                   for election in self.search(q="pres", fields="end_date")['items'])
+
+    def test_missing_query_is_rejected(self):
+        response = self.app.get("/api/election/search", query_string={'q': " "})
+        assert response.status_code == ELECTION_SEARCH_MISSING_QUERY.code
+
+
+class InMemoryElectionSearchTest(SQLiteElectionSearchTest):
+    """
+    ElectionPhaseIndex answers from an ElectionSearchIndex when the backend can't search.
+    """
+
+    def backend(self):
+        inner = test_backend()
+        inner.can_search = False
+        return ElectionPhaseIndex(inner)
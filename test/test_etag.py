@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#
+# test/test_etag.py
+# Authors:
+#   Samuel Vargas
+#
+
+import json
+import unittest
+import src.intermediary
+from test.config import test_backend
+from test.dummy_keys import *
+from test.test_util import generate_election_post_data, JSON_HEADERS
+from src.httpcode import *
+from src.crypto_suite import ECDSAKeyPair
+from src.crypto_flow import CryptoFlow
+from src.validator import ElectionJsonValidator
+from src.account_types import AccountType
+from src.cookie_encryptor import CookieEncryptor
+from src.election_phase_index import ElectionPhaseIndex
+from src.time_manager import TimeManager
+from src.etag import REVALIDATE_CACHE_CONTROL
+from unittest.mock import MagicMock, patch
+from datetime import datetime, timezone, timedelta
+
+
+class ETagTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.password = "Secret"
+        ElectionJsonValidator.is_valid = MagicMock(return_value=(True, ""))
+
+    def setUp(self):
+        self.inner = test_backend()
+        self.app = src.intermediary.start_test(ElectionPhaseIndex(self.inner), self.password)
+        self.app.set_cookie('localhost', 'token', json.dumps({
+            'username': 'ElectionCreator',
+            'account_type': AccountType.election_creator.value,
+            'authentication': CookieEncryptor(self.password).encrypt(b"ABC").decode('utf-8')
+        }))
+
+        self.now = datetime.now(timezone.utc)
+        self.create("Past", self.now - timedelta(days=2), self.now - timedelta(days=1), ELECTION_DUMMY_RSA_FERNET_ONE)
+        self.create("Present", self.now - timedelta(days=1), self.now + timedelta(days=1),
+                    ELECTION_DUMMY_RSA_FERNET_TWO)
+
+    def create(self, election_title, start, end, stub):
+        CryptoFlow.generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict = MagicMock(return_value=stub)
+        response = self.app.post("/api/election/create", headers=JSON_HEADERS, data=json.dumps(
+            generate_election_post_data(election_title=election_title, description="...",
+                                        start_date=start.isoformat(), end_date=end.isoformat(),
+                                        creator_keys=ECDSAKeyPair(), questions=[["?", ["A", "B"]]])))
+        assert response.status_code == ELECTION_CREATED_SUCCESSFULLY.code
+
+    def get(self, url, election_title=None, etag=None):
+        headers = dict(JSON_HEADERS)
+        if etag is not None:
+            headers['If-None-Match'] = '"{0}"'.format(etag)
+        data = json.dumps({"election_title": election_title}) if election_title else None
+        return self.app.get(url, headers=headers, data=data)
+
+    def test_unchanged_election_is_answered_without_the_backend(self):
+        response = self.get("/api/election/get_by_title", "Present")
+        tag = response.headers['ETag'].strip('"')
+
+        with patch.object(self.inner, "get_election_by_title") as spy:
+            response = self.get("/api/election/get_by_title", "Present", tag)
+            assert response.status_code == 304
+            assert response.data == b""
+            spy.assert_not_called()
+
+    def test_election_etag_changes_with_redaction(self):
+        tag = self.get("/api/election/get_by_title", "Present").headers['ETag'].strip('"')
+        with patch("src.time_manager.TimeManager.election_in_past") as mock:
+            mock.return_value = True
+            response = self.get("/api/election/get_by_title", "Present", tag)
+            assert response.status_code == 200
+            assert 'election_private_key' in json.loads(response.data.decode('utf-8'))
+
+    def test_listing_etag_changes_when_an_election_is_created(self):
+        tag = self.get("/api/election/present").headers['ETag'].strip('"')
+        assert self.get("/api/election/present", etag=tag).status_code == 304
+
+        self.create("Present 2", self.now - timedelta(days=1), self.now + timedelta(days=1),
+                    ELECTION_DUMMY_RSA_FERNET_THREE)
+        response = self.get("/api/election/present", etag=tag)
+        assert response.status_code == 200
+        assert len(json.loads(response.data.decode('utf-8'))) == 2
+
+    def test_versions_are_the_same_in_every_process(self):
+        # A second index over the same backend stands in for another prefork worker
+        other = ElectionPhaseIndex(self.inner)
+        tag = self.get("/api/election/present").headers['ETag'].strip('"')
+        assert tag.startswith(other.get_catalog_version(TimeManager.get_current_time_as_epoch()))
+        assert self.get("/api/election/get_by_title", "Present").headers['ETag'].strip('"').startswith(
+            other.get_election_version("Present"))
+
+    def test_closed_election_tally_is_revalidated(self):
+        response = self.get("/api/election/tally", "Past")
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == REVALIDATE_CACHE_CONTROL
+        tag = response.headers['ETag'].strip('"')
+
+        with patch.object(self.inner, "get_all_ballots") as spy:
+            response = self.get("/api/election/tally", "Past", tag)
+            assert response.status_code == 304
+            spy.assert_not_called()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+#
+# test/test_event_publisher.py
+# Authors:
+#   Samuel Vargas
+#
+
+import json
+import os
+import tempfile
+import unittest
+import src.intermediary
+from test.config import test_backend
+from test.dummy_keys import *
+from test.test_util import generate_election_post_data, generate_voter_post_data, JSON_HEADERS
+from src.httpcode import *
+from src.crypto_suite import ECDSAKeyPair
+from src.crypto_flow import CryptoFlow
+from src.validator import ElectionJsonValidator
+from src.account_types import AccountType
+from src.cookie_encryptor import CookieEncryptor
+from src.election_phase import ELECTION_CREATED, ELECTION_OPENED, ELECTION_CLOSED
+from src.election_phase_index import ElectionPhaseIndex
+from src.event_publisher import EventPublisher, TURNOUT
+from src.sqlite import SQLiteBackendIO
+from test.test_hyperledger_backend_io import election_kwargs
+from src.settings import SETTINGS
+from unittest.mock import MagicMock
+from datetime import datetime, timezone, timedelta
+
+DAY = 24 * 60 * 60
+
+
+def parse(message):
+    fields = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+    return fields['event'], json.loads(fields['data'])
+
+
+class EventPublisherTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.password = "Secret"
+        ElectionJsonValidator.is_valid = MagicMock(return_value=(True, ""))
+
+    def setUp(self):
+        self.app = src.intermediary.start_test(ElectionPhaseIndex(test_backend()), self.password)
+        self.publisher = SETTINGS['EVENT_PUBLISHER']
+        self.subscription = self.publisher.subscribe()
+        self.now = datetime.now(timezone.utc)
+
+    def login(self, username, account_type):
+        self.app.set_cookie('localhost', 'token', json.dumps({
+            'username': username,
+            'account_type': account_type.value,
+            'authentication': CookieEncryptor(self.password).encrypt(b"ABC").decode('utf-8')
+        }))
+
+    def create(self, election_title, start, end, stub):
+        self.login("ElectionCreator", AccountType.election_creator)
+        CryptoFlow.generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict = MagicMock(return_value=stub)
+        response = self.app.post("/api/election/create", headers=JSON_HEADERS, data=json.dumps(
+            generate_election_post_data(election_title=election_title, description="...",
+                                        start_date=start.isoformat(), end_date=end.isoformat(),
+                                        creator_keys=ECDSAKeyPair(), questions=[["?", ["A", "B"]]])))
+        assert response.status_code == ELECTION_CREATED_SUCCESSFULLY.code
+
+    def vote(self, username, election_title):
+        self.login(username, AccountType.voter)
+        ballot = generate_voter_post_data(election_title=election_title, voter_keys=ECDSAKeyPair(), answers=["A"])
+        response = self.app.post("/api/election/vote", headers=JSON_HEADERS, data=json.dumps(ballot))
+        assert response.status_code == 201
+
+    def received(self):
+        messages = []
+        while True:
+            message = self.subscription.get(timeout=0)
+            if message is None:
+                return messages
+            messages.append(parse(message))
+
+    def test_phase_transitions_are_pushed_as_they_happen(self):
+        self.create("Future", self.now + timedelta(days=1), self.now + timedelta(days=2),
+                    ELECTION_DUMMY_RSA_FERNET_ONE)
+        events = self.received()
+        assert [(event, data['election_title']) for event, data in events] == [(ELECTION_CREATED, "Future")]
+        assert 'election_private_key' not in events[0][1]
+
+        # The publisher sleeps until the next transition.
+        now = int(self.now.timestamp())
+        assert 0 < self.publisher.poll(now) <= DAY + 1
+
+        self.publisher.poll(now + DAY + 10)
+        assert [event for event, _ in self.received()] == [ELECTION_OPENED]
+        self.publisher.poll(now + 3 * DAY)
+        assert [event for event, _ in self.received()] == [ELECTION_CLOSED]
+
+    def test_turnout_is_throttled(self):
+        self.create("Present", self.now - timedelta(days=1), self.now + timedelta(days=1),
+                    ELECTION_DUMMY_RSA_FERNET_ONE)
+        self.received()
+
+        self.vote("Alice", "Present")
+        self.vote("Bob", "Present")
+        self.publisher.poll()
+        assert self.received() == [(TURNOUT, {"election_title": "Present", "ballot_count": 2})]
+
+        # A third vote right away waits for the next turnout interval.
+        self.vote("Charlie", "Present")
+        assert 0 < self.publisher.poll() <= self.publisher.turnout_interval
+        assert self.received() == []
+
+    def test_slow_subscribers_are_disconnected(self):
+        for i in range(self.publisher.max_queued + 1):
+            self.publisher.publish(TURNOUT, {"election_title": "Present", "ballot_count": i})
+
+        assert self.subscription.overflowed
+        assert self.publisher.subscriber_count == 0
+
+    def test_event_stream_endpoint(self):
+        self.subscription.close()
+        self.publisher.keepalive_interval = 0.01
+        self.login("Alice", AccountType.voter)
+        response = self.app.get("/api/election/events", buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        stream = response.response
+
+        assert next(stream) == b": keep-alive\n\n"
+        self.create("Future", self.now + timedelta(days=1), self.now + timedelta(days=2),
+                    ELECTION_DUMMY_RSA_FERNET_ONE)
+        assert parse(next(stream).decode('utf-8'))[0] == ELECTION_CREATED
+
+        response.close()
+        assert self.publisher.subscriber_count == 0
+
+    def test_stopping_the_publisher_ends_the_streams(self):
+        self.subscription.close()
+        self.publisher.keepalive_interval = 0.01
+        self.login("Alice", AccountType.voter)
+        response = self.app.get("/api/election/events", buffered=False)
+        stream = response.response
+        assert next(stream) == b": keep-alive\n\n"
+
+        # No more keep-alives once the publisher stopped
+        self.publisher.stop()
+        with self.assertRaises(StopIteration):
+            next(stream)
+        assert self.publisher.subscriber_count == 0
+
+
+class EventPublisherThreadTest(unittest.TestCase):
+    """
+    The publisher thread against SQLite opened on the test's thread, like intermediary.start does
+    """
+
+    def setUp(self):
+        self.backend = src.intermediary.wrap_backend_io(SQLiteBackendIO(":memory:"))
+        self.publisher = EventPublisher(self.backend, turnout_interval=0)
+
+    def tearDown(self):
+        self.publisher.stop()
+        self.backend.close()
+
+    def test_publisher_thread_reads_the_backend(self):
+        # Subscribing starts the thread, which loads the election index from SQLite
+        subscription = self.publisher.subscribe()
+        self.publisher.ballot_cast("Present")
+        message = subscription.get(timeout=5)
+        assert message is not None
+        assert parse(message) == (TURNOUT, {"election_title": "Present", "ballot_count": 0})
+
+    def test_publisher_thread_survives_a_failing_backend(self):
+        count_ballots = MagicMock(side_effect=[OSError("Backend unreachable"), 3])
+        self.publisher = EventPublisher(self.backend, turnout_interval=0, count_ballots=count_ballots)
+        subscription = self.publisher.subscribe()
+        with self.assertLogs("src.event_publisher", "ERROR"):
+            self.publisher.ballot_cast("Present")
+            message = subscription.get(timeout=5)
+
+        # The turnout is counted again once the backend answers
+        assert message is not None
+        assert parse(message) == (TURNOUT, {"election_title": "Present", "ballot_count": 3})
+
+
+class SharedEventPublisherTest(unittest.TestCase):
+    """
+    Elections and ballots another process writes to the same database
+    """
+
+    def setUp(self):
+        path = os.path.join(tempfile.mkdtemp(), "shared.db")
+        self.mine, self.theirs = SQLiteBackendIO(path, journal_mode="wal"), SQLiteBackendIO(path, journal_mode="wal")
+        self.publisher = EventPublisher(src.intermediary.wrap_backend_io(self.mine, sync_interval=0),
+                                        turnout_interval=0, autostart=False, shared=True)
+        self.subscription = self.publisher.subscribe()
+
+    def tearDown(self):
+        self.mine.close()
+        self.theirs.close()
+
+    def received(self):
+        messages = []
+        while True:
+            message = self.subscription.get(timeout=0)
+            if message is None:
+                return messages
+            messages.append(parse(message))
+
+    def test_their_elections_and_ballots_are_published(self):
+        self.publisher.poll()
+        self.theirs.create_election(**election_kwargs("Theirs"))
+        self.publisher.poll()
+        assert [(event, data['election_title']) for event, data in self.received()] == [(ELECTION_CREATED, "Theirs")]
+
+        self.theirs.create_ballot("Encrypted", election_title="Theirs", voter_uuid="uuid-1",
+                                  ballot_signature="Signature", voter_public_key_b64="Voter Key")
+        self.publisher.poll()
+        assert self.received() == [(TURNOUT, {"election_title": "Theirs", "ballot_count": 1})]
+
+        # Nothing changed since
+        self.publisher.poll()
+        assert self.received() == []
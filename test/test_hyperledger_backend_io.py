@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+#
+# test/test_hyperledger_backend_io.py
+# Authors:
+#   Samuel Vargas
+#
+
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from test.composer_stand_in import ComposerStandIn
+from src.hyperledger.hyperledger_backend_io import HyperledgerBackendIO
+from src.hyperledger.async_hyperledger_backend_io import ComposerError
+from src.hyperledger.filter import Filter, phase_clause
+from src.hyperledger.latency_histogram import LatencyHistogram
+from src.election_phase import ElectionPhase
+import requests
+import time
+
+
+def master_ballot(election_title):
+    return {
+        "election_title": election_title,
+        "description": "Pick your favorite color",
+        "start_date": "2018-01-01T00:00:00",
+        "end_date": "2099-01-01T00:00:00",
+        "questions": '[["Favorite Color?", ["Red", "Blue"]]]',
+    }
+
+
+def election_kwargs(election_title):
+    return {
+        "master_ballot": master_ballot(election_title),
+        "creator_username": "Creator",
+        "creator_master_ballot_signature": "Signature",
+        "creator_public_key_b64": "Creator Key",
+        "election_public_rsa_key": "Public " + election_title,
+        "election_private_rsa_key": "Private " + election_title,
+        "election_encrypted_fernet_key": "Fernet " + election_title,
+    }
+
+
+class HyperledgerBackendIOTest(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = ComposerStandIn().start()
+        self.backend = HyperledgerBackendIO(self.stand_in.url)
+        self.backend.create_election(**election_kwargs("Current"))
+
+    def tearDown(self):
+        self.backend.close()
+        self.stand_in.stop()
+
+    def test_election_round_trip(self):
+        election = self.backend.get_election_by_title("Current")
+        assert election == {
+            "election_title": "Current",
+            "description": "Pick your favorite color",
+            "start_date": "2018-01-01T00:00:00",
+            "end_date": "2099-01-01T00:00:00",
+            "questions": '[["Favorite Color?", ["Red", "Blue"]]]',
+            "creator_username": "Creator",
+            "master_ballot_signature": "Signature",
+            "creator_public_key": "Creator Key",
+            "election_public_key": "Public Current",
+            "election_private_key": "Private Current",
+            "election_encrypted_fernet_key": "Fernet Current",
+        }
+        assert self.backend.get_election_by_title("Missing") is None
+        assert [e["election_title"] for e in self.backend.get_all_elections()] == ["Current"]
+
+        with self.assertRaises(ValueError):
+            self.backend.create_election(**election_kwargs("Current"))
+
+    def test_ballots_and_participation(self):
+        assert not self.backend.has_user_participated_in_election("Voter", "Current")
+        self.backend.create_ballot("Encrypted", election_title="Current", voter_uuid="uuid-1",
+                                   ballot_signature="Signature", voter_public_key_b64="Voter Key")
+        self.backend.register_user_as_participated_in_election("Voter", "Current")
+
+        assert self.backend.has_user_participated_in_election("Voter", "Current")
+        assert self.backend.get_ballot_by_voter_uuid("uuid-1") == {
+            "voter_uuid": "uuid-1",
+            "ballot": "Encrypted",
+            "ballot_signature": "Signature",
+            "election_title": "Current",
+        }
+        assert self.backend.get_ballot_by_voter_uuid("uuid-2") is None
+        assert self.backend.count_ballots("Current") == 1
+
+        with self.assertRaises(ValueError):
+            self.backend.has_user_participated_in_election("Voter", "Missing")
+        with self.assertRaises(ComposerError):
+            self.backend.create_ballot("Again", election_title="Current", voter_uuid="uuid-1",
+                                       ballot_signature="Signature", voter_public_key_b64="Voter Key")
+
+    def test_bulk_methods(self):
+        self.backend.create_elections([election_kwargs("First"), election_kwargs("Second")])
+        elections = self.backend.get_elections_by_titles(["First", "Second", "Missing"])
+        assert sorted(elections) == ["First", "Second"]
+
+        self.backend.create_ballots("First", [{
+            "ballot": "Encrypted", "voter_uuid": "uuid-{0}".format(i), "ballot_signature": "Signature",
+            "voter_public_key_b64": "Voter Key", "username": "Voter {0}".format(i)
+        } for i in range(3)])
+        assert sorted(b["voter_uuid"] for b in self.backend.get_all_ballots("First")) == ["uuid-0", "uuid-1", "uuid-2"]
+        assert self.backend.has_user_participated_in_election("Voter 2", "First")
+        assert not self.backend.has_user_participated_in_election("Voter 2", "Second")
+
+        self.backend.nuke()
+        assert self.backend.get_all_elections() == []
+        assert self.stand_in.ballots == {} and self.stand_in.participations == {}
+
+    def test_independent_requests_are_sent_concurrently(self):
+        self.stand_in.latency = 0.2
+        start = time.perf_counter()
+        self.backend.has_user_participated_in_election("Voter", "Current")
+        assert time.perf_counter() - start < 0.35
+
+    def test_connection_is_reused_between_calls(self):
+        for _ in range(5):
+            assert self.backend.get_election_by_title("Current") is not None
+
+        stats = self.backend.get_connection_stats()
+        assert stats["requests"] == 7  # create_election checks for a duplicate first
+        assert stats["connections_opened"] == 1
+        assert stats["connections_reused"] == 6
+        assert self.stand_in.connections == 1
+
+    def test_without_keep_alive_every_request_opens_a_connection(self):
+        backend = HyperledgerBackendIO(self.stand_in.url, keep_alive=False)
+        for _ in range(3):
+            backend.get_all_elections()
+        backend.close()
+
+        stats = backend.get_connection_stats()
+        assert stats["connections_opened"] == 3
+        assert stats["connections_reused"] == 0
+
+    def test_concurrent_calls_never_exceed_the_pool_size(self):
+        self.stand_in.latency = 0.02
+        backend = HyperledgerBackendIO(self.stand_in.url, pool_size=2)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for elections in executor.map(lambda _: backend.get_all_elections(), range(16)):
+                assert len(elections) == 1
+        backend.close()
+
+        assert backend.get_connection_stats()["connections_opened"] <= 2
+
+    def test_timeout(self):
+        backend = HyperledgerBackendIO(self.stand_in.url, timeout=0.05)
+        self.stand_in.latency = 0.5
+        with self.assertRaises(requests.Timeout):
+            backend.get_all_elections()
+        backend.close()
+
+
+class FilterTest(unittest.TestCase):
+    def test_builder(self):
+        base = Filter().where({"electionId": "Current"})
+        page = base.where({"ballotId": {"gt": "uuid-1"}}).order("ballotId ASC").limit(10).skip(20).fields("ballotId")
+        assert page.to_dict() == {
+            "fields": {"ballotId": True},
+            "where": {"and": [{"electionId": "Current"}, {"ballotId": {"gt": "uuid-1"}}]},
+            "order": ["ballotId ASC"],
+            "skip": 20,
+            "limit": 10,
+        }
+        # Filters are immutable
+        assert base.to_dict() == {"where": {"electionId": "Current"}}
+        assert Filter().to_json() == "{}"
+
+    def test_phase_filters_use_the_given_time(self):
+        assert phase_clause(ElectionPhase.past, 100) == {"endEpoch": {"lt": 100}}
+        assert phase_clause(ElectionPhase.future, 100) == {"startEpoch": {"gt": 100}}
+        assert Filter.current_filter(100) == Filter().where(
+            {"and": [{"startEpoch": {"lte": 100}}, {"endEpoch": {"gte": 100}}]}).fields("electionId").to_json()
+
+
+class HyperledgerPagingTest(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = ComposerStandIn().start()
+        self.backend = HyperledgerBackendIO(self.stand_in.url)
+        past = election_kwargs("Past")
+        past["master_ballot"].update(end_date="2018-01-02T00:00:00")
+        future = election_kwargs("Future")
+        future["master_ballot"].update(start_date="2098-01-01T00:00:00")
+        self.backend.create_elections([election_kwargs("Current"), election_kwargs("Current 2"), past, future])
+        self.backend.create_ballots("Current", [{
+            "ballot": "Encrypted", "voter_uuid": "uuid-{0:02}".format(i), "ballot_signature": "Signature",
+            "voter_public_key_b64": "Voter Key", "username": "Voter {0}".format(i)
+        } for i in range(25)])
+
+    def tearDown(self):
+        self.backend.close()
+        self.stand_in.stop()
+
+    def test_ballots_are_fetched_one_page_at_a_time(self):
+        requests = self.stand_in.requests
+        ballots = self.backend.iter_ballots("Current", page_size=10)
+        first = [next(ballots)["voter_uuid"] for _ in range(10)]
+        assert first == ["uuid-{0:02}".format(i) for i in range(10)]
+        assert self.stand_in.requests == requests + 1
+
+        rest = [ballot["voter_uuid"] for ballot in ballots]
+        assert first + rest == ["uuid-{0:02}".format(i) for i in range(25)]
+        assert self.stand_in.requests == requests + 3
+
+    def test_elections_in_phase(self):
+        now = int(time.time())
+        current = list(self.backend.iter_elections_in_phase(ElectionPhase.present, now, page_size=1))
+        assert [e["election_title"] for e in current] == ["Current", "Current 2"]
+        assert "election_private_key" not in current[0]
+
+        past = self.backend.get_elections_in_phase(ElectionPhase.past, now)
+        assert [e["election_title"] for e in past] == ["Past"]
+        assert past[0]["election_private_key"] == "Private Past"
+
+        future = self.backend.get_elections_in_phase(ElectionPhase.future, now, fields=["end_date"])
+        assert future == [{"election_title": "Future", "end_date": "2099-01-01T00:00:00"}]
+
+    def test_elections_page(self):
+        page = self.backend.get_elections_page(after_election_title="Current", limit=2)
+        assert [e["election_title"] for e in page] == ["Current 2", "Future"]
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        assert histogram.percentile(0.5) is None
+        for ms in range(1, 101):
+            histogram.record(ms / 1000)
+
+        stats = histogram.get_stats()
+        assert stats["count"] == 100 and stats["max"] == 0.1
+        assert 0.05 <= stats["p50"] <= 0.05 * 1.25
+        assert 0.09 <= stats["p90"] <= 0.1
+        assert sum(count for _, count in stats["buckets"]) == 100
+
+
+class HyperledgerReadHedgingTest(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = ComposerStandIn().start()
+        self.backend = HyperledgerBackendIO(self.stand_in.url)
+        self.backend.create_election(**election_kwargs("Current"))
+
+    def tearDown(self):
+        self.backend.close()
+        self.stand_in.stop()
+
+    def test_latency_stats_per_endpoint(self):
+        self.backend.get_all_ballots("Current")
+        stats = self.backend.get_latency_stats()
+        assert sorted(stats) == ["GET ballots?filter", "GET elections/{id}", "POST elections"]
+        assert stats["GET elections/{id}"]["count"] == 1  # the duplicate check of create_election
+        assert stats["POST elections"]["hedged"] == 0
+
+    def test_slow_read_is_hedged(self):
+        for _ in range(20):
+            self.backend.get_election_by_title("Current")
+
+        # Only the next request is slow, not its hedge
+        self.stand_in.tail_latency = 1.0
+        self.stand_in.tail_every = self.stand_in.requests + 1
+        start = time.perf_counter()
+        assert self.backend.get_election_by_title("Current")["election_title"] == "Current"
+        assert time.perf_counter() - start < 0.5
+
+        stats = self.backend.get_latency_stats()["GET elections/{id}"]
+        assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+    def test_failed_reads_are_retried(self):
+        self.stand_in.failures = 2
+        assert self.backend.get_election_by_title("Current") is not None
+        assert self.backend.get_latency_stats()["GET elections/{id}"]["retries"] == 2
+
+        self.stand_in.failures = 3
+        with self.assertRaises(ComposerError):
+            self.backend.get_election_by_title("Current")
+
+    def test_latency_budget(self):
+        self.stand_in.latency = 0.3
+        start = time.perf_counter()
+        with self.assertRaises(requests.Timeout):
+            with self.backend.latency_budget(0.1):
+                self.backend.get_all_elections()
+        assert time.perf_counter() - start < 0.25
+
+
+class HyperledgerWriteBatchingTest(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = ComposerStandIn(commit_latency=0.05).start()
+        self.backend = HyperledgerBackendIO(self.stand_in.url, write_batch_size=5, write_batch_delay=0.02)
+        self.backend.create_election(**election_kwargs("Current"))
+
+    def tearDown(self):
+        self.backend.close()
+        self.stand_in.stop()
+
+    def vote(self, i):
+        self.backend.create_ballot("Encrypted", election_title="Current", voter_uuid="uuid-{0}".format(i),
+                                   ballot_signature="Signature", voter_public_key_b64="Voter Key")
+        # Acknowledged only once committed
+        assert "uuid-{0}".format(i) in self.stand_in.ballots
+
+    def test_concurrent_writes_share_transactions(self):
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            list(executor.map(self.vote, range(10)))
+
+        assert len(self.stand_in.ballots) == 10
+        stats = self.backend.get_write_batch_stats()
+        assert stats["writes"] == 10
+        assert stats["batches"] == len(self.stand_in.transactions) < 10
+        assert stats["largest_batch"] <= 5
+
+    def test_lone_write_waits_at_most_the_batch_delay(self):
+        start = time.perf_counter()
+        self.vote(0)
+        assert time.perf_counter() - start < 0.2
+        assert self.backend.get_write_batch_stats()["batches"] == 1
+
+    def test_a_rejected_write_does_not_fail_its_batch(self):
+        self.vote(0)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(self.vote, i) for i in (0, 1, 2, 3)]
+        with self.assertRaises(ComposerError):
+            futures[0].result()
+        for future in futures[1:]:
+            future.result()
+        assert sorted(self.stand_in.ballots) == ["uuid-0", "uuid-1", "uuid-2", "uuid-3"]
+
+    def test_create_ballots_is_batched_with_participations(self):
+        self.backend.create_ballots("Current", [{
+            "ballot": "Encrypted", "voter_uuid": "uuid-{0}".format(i), "ballot_signature": "Signature",
+            "voter_public_key_b64": "Voter Key", "username": "Voter {0}".format(i)
+        } for i in range(5)])
+        assert len(self.stand_in.transactions) == 2
+        assert self.backend.has_user_participated_in_election("Voter 4", "Current")
+
+
+if __name__ == "__main__":
+    unittest.main()
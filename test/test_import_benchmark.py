@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+#
+# test/test_import_benchmark.py
+# Authors:
+#   Samuel Vargas
+#
+
+import unittest
+from src.import_benchmark import ImportMeasurement, IMPORT_BUDGETS, measure, find_regressions
+
+
+class ImportBenchmarkTest(unittest.TestCase):
+
+    def test_lightweight_modules_defer_heavy_packages(self):
+        # Only what got loaded, the import times depend on the machine (test_flags_slow_imports covers the budgets)
+        measurements = [measure(module) for module in IMPORT_BUDGETS]
+        assert [measurement.loaded for measurement in measurements] == [()] * len(IMPORT_BUDGETS)
+
+    def test_flags_eager_imports(self):
+        # The Flask app itself needs Flask
+        measurement = measure("src.intermediary")
+        assert "flask" in measurement.loaded
+        assert find_regressions([measurement]) == [
+            "Importing src.intermediary loads {0}, which should be imported on first use".format(
+                ", ".join(measurement.loaded))]
+
+    def test_flags_slow_imports(self):
+        regressions = find_regressions([ImportMeasurement("src.httpcode", 80.0, ())], {"src.httpcode": 50.0})
+        assert regressions == ["Importing src.httpcode took 80.0 ms, its budget is 50.0 ms"]
+        assert find_regressions([ImportMeasurement("src.httpcode", 20.0, ())], {"src.httpcode": 50.0}) == []
+
+    def test_app_is_loaded_on_first_use(self):
+        import src
+        from src.intermediary import app
+        assert src.app is app
+        with self.assertRaises(AttributeError):
+            src.nothing
+
+
+if __name__ == '__main__':
+    unittest.main()
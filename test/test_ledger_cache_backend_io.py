@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+#
+# test/test_ledger_cache_backend_io.py
+# Authors:
+#   Samuel Vargas
+#
+
+import unittest
+from unittest.mock import patch
+from test.composer_stand_in import ComposerStandIn, NAMESPACE
+from test.fake_event_emitter import FakeEventEmitter
+from test.test_hyperledger_backend_io import election_kwargs
+from src.hyperledger.hyperledger_backend_io import HyperledgerBackendIO
+from src.hyperledger.ledger_cache_backend_io import LedgerCacheBackendIO
+from src.hyperledger.composer_events import LedgerEvent, parse_event
+import os
+import tempfile
+import time
+
+
+def closed_election_kwargs(election_title):
+    kwargs = election_kwargs(election_title)
+    kwargs['master_ballot'].update(start_date="2018-01-01T00:00:00", end_date="2018-01-02T00:00:00")
+    return kwargs
+
+
+def ballot(voter_uuid, username):
+    return {"ballot": "Encrypted", "voter_uuid": voter_uuid, "ballot_signature": "Signature",
+            "voter_public_key_b64": "Voter Key", "username": username}
+
+
+class LedgerCacheBackendIOTest(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = ComposerStandIn().start()
+        self.ledger = HyperledgerBackendIO(self.stand_in.url)
+        self.ledger.create_elections([election_kwargs("Open"), closed_election_kwargs("Closed")])
+        self.ledger.create_ballots("Open", [ballot("open-1", "Voter 1")])
+        self.ledger.create_ballots("Closed", [ballot("closed-1", "Voter 1"), ballot("closed-2", "Voter 2")])
+        self.backend = LedgerCacheBackendIO(self.ledger, listing_ttl=0.2, warm_up=False)
+
+    def tearDown(self):
+        self.backend.close()
+        self.stand_in.stop()
+
+    def test_elections_are_cached_permanently(self):
+        assert self.backend.get_election_by_title("Open")["election_title"] == "Open"
+        requests = self.stand_in.requests
+        del self.stand_in.elections["Open"]
+
+        assert self.backend.get_election_by_title("Open")["election_title"] == "Open"
+        assert sorted(self.backend.get_elections_by_titles(["Open", "Closed"])) == ["Closed", "Open"]
+        assert self.stand_in.requests == requests + 1  # only "Closed" was fetched
+
+    def test_closed_election_ballots_are_fetched_once(self):
+        assert len(self.backend.get_all_ballots("Closed")) == 2
+        requests = self.stand_in.requests
+
+        assert sorted(b["voter_uuid"] for b in self.backend.get_all_ballots("Closed")) == ["closed-1", "closed-2"]
+        assert self.backend.count_ballots("Closed") == 2
+        assert self.backend.get_ballot_by_voter_uuid("closed-1")["election_title"] == "Closed"
+        assert self.stand_in.requests == requests
+
+    def test_open_election_listings_expire(self):
+        assert len(self.backend.get_all_ballots("Open")) == 1
+        assert len(self.backend.get_all_elections()) == 2
+
+        self.ledger.create_ballots("Open", [ballot("open-2", "Voter 2")])
+        self.ledger.create_election(**election_kwargs("New"))
+        assert len(self.backend.get_all_ballots("Open")) == 1
+        assert len(self.backend.get_all_elections()) == 2
+
+        time.sleep(0.25)
+        assert len(self.backend.get_all_ballots("Open")) == 2
+        assert len(self.backend.get_all_elections()) == 3
+
+    def test_cached_listing_is_only_stored_once(self):
+        assert len(self.backend.get_all_elections()) == 2
+        with patch.object(self.backend, "_LedgerCacheBackendIO__store_elections") as store:
+            assert len(self.backend.get_all_elections()) == 2
+            store.assert_not_called()
+
+    def test_writes_are_copied_locally(self):
+        self.backend.create_ballots("Open", [ballot("open-2", "Voter 2")])
+        assert len(self.backend.get_all_ballots("Open")) == 2
+
+        requests = self.stand_in.requests
+        assert self.backend.get_ballot_by_voter_uuid("open-2") is not None
+        assert self.backend.has_user_participated_in_election("Voter 2", "Open")
+        assert self.stand_in.requests == requests
+
+        # Not having voted yet is never cached
+        assert not self.backend.has_user_participated_in_election("Voter 3", "Open")
+        self.ledger.register_user_as_participated_in_election("Voter 3", "Open")
+        assert self.backend.has_user_participated_in_election("Voter 3", "Open")
+
+    def test_warm_up_survives_a_restart(self):
+        path = os.path.join(tempfile.mkdtemp(), "ledger_cache.db")
+        backend = LedgerCacheBackendIO(self.ledger, db_path=path)
+        assert backend.wait_until_warm(5)
+        assert backend.get_cache_stats()["warm"]
+        backend.connection.close()
+
+        # Restart while the ledger is unreachable
+        self.stand_in.stop()
+        restarted = LedgerCacheBackendIO(self.ledger, db_path=path, warm_up=False)
+        assert restarted.get_election_by_title("Open")["election_title"] == "Open"
+        assert len(restarted.get_all_ballots("Closed")) == 2
+        restarted.connection.close()
+        self.stand_in = ComposerStandIn().start()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+class LedgerEventSubscriptionTest(unittest.TestCase):
+    def setUp(self):
+        self.emitter = FakeEventEmitter().start()
+        self.stand_in = ComposerStandIn(event_emitter=self.emitter).start()
+        self.ledger = HyperledgerBackendIO(self.stand_in.url)
+        self.ledger.create_elections([election_kwargs("Open"), closed_election_kwargs("Closed")])
+        self.ledger.create_ballots("Open", [ballot("open-1", "Voter 1")])
+        self.ledger.create_ballots("Closed", [ballot("closed-1", "Voter 1")])
+        self.backend = LedgerCacheBackendIO(self.ledger, events_url=self.emitter.url)
+        assert self.backend.wait_until_live(5)
+
+    def tearDown(self):
+        self.backend.close()
+        self.stand_in.stop()
+        self.emitter.stop()
+
+    def test_parse_event(self):
+        assert parse_event({"$class": NAMESPACE + ".UserParticipated", "participation": {
+            "participationId": "Voter:Open", "username": "Voter", "electionId": "Open"
+        }}) == LedgerEvent("participation", {"username": "Voter", "election_title": "Open"})
+        assert parse_event({"$class": NAMESPACE + ".SomethingElse"}) is None
+
+    def test_live_reads_never_go_to_the_ledger(self):
+        requests = self.stand_in.requests
+        assert len(self.backend.get_all_elections()) == 2
+        assert [b["voter_uuid"] for b in self.backend.get_all_ballots("Open")] == ["open-1"]
+        assert self.backend.count_ballots("Closed") == 1
+        assert self.backend.get_ballot_by_voter_uuid("open-1")["election_title"] == "Open"
+        assert self.backend.get_ballot_by_voter_uuid("missing") is None
+        assert self.backend.get_election_by_title("Missing") is None
+        assert self.backend.has_user_participated_in_election("Voter 1", "Open")
+        assert not self.backend.has_user_participated_in_election("Voter 9", "Open")
+        assert self.stand_in.requests == requests
+        assert self.backend.get_cache_stats()["live"]
+
+    def test_ledger_writes_are_applied_from_events(self):
+        # Written by another API server
+        self.ledger.create_ballots("Open", [ballot("open-2", "Voter 2")])
+        self.ledger.create_election(**election_kwargs("New"))
+        requests = self.stand_in.requests
+
+        wait_for(lambda: self.backend.count_ballots("Open") == 2)
+        wait_for(lambda: len(self.backend.get_all_elections()) == 3)
+        assert self.backend.has_user_participated_in_election("Voter 2", "Open")
+        assert self.stand_in.requests == requests
+
+    def test_created_election_is_readable_before_its_event(self):
+        # The ElectionCreated event is late (or lost)
+        self.stand_in.event_emitter = None
+        self.backend.create_election(**election_kwargs("Created"))
+        self.backend.create_elections([election_kwargs("Bulk")])
+
+        requests = self.stand_in.requests
+        assert self.backend.get_election_by_title("Created") == self.ledger.get_election_by_title("Created")
+        assert self.backend.get_election_by_title("Bulk")["election_title"] == "Bulk"
+        assert not self.backend.has_user_participated_in_election("Voter 1", "Created")
+        assert self.stand_in.requests == requests + 1  # only the comparison read the ledger
+
+    def test_emitted_events_are_applied(self):
+        self.emitter.ping()
+        self.emitter.emit([{"$class": NAMESPACE + ".BallotCast", "ballot": {
+            "ballotId": "emitted", "electionId": "Open", "ballot": "Encrypted", "ballotSignature": "Signature"
+        }}, {"$class": NAMESPACE + ".SomethingElse"}])
+        wait_for(lambda: self.backend.get_ballot_by_voter_uuid("emitted") is not None)
+        assert self.backend.get_cache_stats()["events"] >= 1
+
+    def test_large_and_fragmented_events_are_applied(self):
+        large = {"$class": NAMESPACE + ".BallotCast", "ballot": {
+            "ballotId": "large", "electionId": "Open", "ballot": "E" * 100000, "ballotSignature": "Signature"
+        }}
+        fragmented = {"$class": NAMESPACE + ".BallotCast", "ballot": {
+            "ballotId": "fragmented", "electionId": "Open", "ballot": "Encrypted", "ballotSignature": "Signature"
+        }}
+        self.emitter.emit(large)
+        self.emitter.emit(fragmented, fragments=3)
+        wait_for(lambda: self.backend.get_ballot_by_voter_uuid("fragmented") is not None)
+        assert len(self.backend.get_ballot_by_voter_uuid("large")["ballot"]) == 100000
+
+    def test_resynchronizes_after_reconnecting(self):
+        self.emitter.disconnect_all()
+        wait_for(lambda: not self.backend.is_live())
+
+        # Its event is missed
+        self.ledger.create_ballots("Open", [ballot("open-2", "Voter 2")])
+        wait_for(self.backend.is_live)
+        requests = self.stand_in.requests
+        assert self.backend.count_ballots("Open") == 2
+        assert self.stand_in.requests == requests
+
+
+if __name__ == "__main__":
+    unittest.main()
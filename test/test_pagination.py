@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+#
+# test/test_pagination.py
+# Authors:
+#   Samuel Vargas
+#
+
+import json
+import uuid
+import unittest
+import src.intermediary
+from test.config import test_backend
+from test.dummy_keys import *
+from test.test_util import generate_election_post_data, generate_voter_post_data, JSON_HEADERS
+from src.httpcode import *
+from src.crypto_suite import ECDSAKeyPair
+from src.crypto_flow import CryptoFlow
+from src.validator import ElectionJsonValidator
+from src.account_types import AccountType
+from src.cookie_encryptor import CookieEncryptor
+from unittest.mock import MagicMock
+from datetime import datetime, timezone, timedelta
+
+
+class PaginationTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.password = "Secret"
+        self.backend = test_backend()
+        self.app = src.intermediary.start_test(self.backend, self.password)
+        ElectionJsonValidator.is_valid = MagicMock(return_value=(True, ""))
+
+    def login(self, username, account_type):
+        self.app.set_cookie('localhost', 'token', json.dumps({
+            'username': username,
+            'account_type': account_type.value,
+            'authentication': CookieEncryptor(self.password).encrypt(b"ABC").decode('utf-8')
+        }))
+
+    def setUp(self):
+        self.backend.nuke()
+        self.login("ElectionCreator", AccountType.election_creator)
+
+        now = datetime.now(timezone.utc)
+        stubs = [ELECTION_DUMMY_RSA_FERNET_ONE, ELECTION_DUMMY_RSA_FERNET_TWO, ELECTION_DUMMY_RSA_FERNET_THREE,
+                 ELECTION_DUMMY_RSA_FERNET_FOUR, ELECTION_DUMMY_RSA_FERNET_FIVE]
+
+        # Five elections in progress, the first one is voted in below.
+        for index, stub in enumerate(stubs):
+            CryptoFlow.generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict = MagicMock(
+                return_value=stub)
+            response = self.app.post("/api/election/create", headers=JSON_HEADERS, data=json.dumps(
+                generate_election_post_data(
+                    election_title="Present Election {0}".format(index),
+                    description="...",
+                    start_date=now.isoformat(),
+                    end_date=(now + timedelta(days=1)).isoformat(),
+                    creator_keys=ECDSAKeyPair(),
+                    questions=["Red or Blue?", ["Red", "Blue"]])))
+            assert response.status_code == ELECTION_CREATED_SUCCESSFULLY.code
+
+        self.voter_uuids = []
+        for username in ("Alice", "Bob", "Charlie", "Doug", "Eve"):
+            self.login(username, AccountType.voter)
+            ballot = generate_voter_post_data(election_title="Present Election 0",
+                                              voter_keys=ECDSAKeyPair(),
+                                              answers=["Red"])
+            response = self.app.post("/api/election/vote", headers=JSON_HEADERS, data=json.dumps(ballot))
+            self.voter_uuids.append(str(uuid.UUID(response.data.decode('utf-8'), version=4)))
+
+    def get_all_pages(self, url, data=None, limit=2):
+        items = []
+        query = {'limit': limit}
+        while True:
+            response = self.app.get(url, query_string=query, headers=JSON_HEADERS, data=data)
+            assert response.status_code == 200
+            page = json.loads(response.data.decode('utf-8'))
+            assert len(page['items']) <= limit
+            items.extend(page['items'])
+            if page['next'] is None:
+                return items
+            query = {'limit': limit, 'after': page['next']}
+
+    def test_ballot_pages_cover_every_ballot_exactly_once(self):
+        data = json.dumps({'election_title': "Present Election 0"})
+        ballots = self.get_all_pages("/api/ballot/all", data=data)
+        assert [ballot['voter_uuid'] for ballot in ballots] == sorted(self.voter_uuids)
+
+    def test_unpaginated_ballot_request_still_returns_an_array(self):
+        data = json.dumps({'election_title': "Present Election 0"})
+        response = self.app.get("/api/ballot/all", headers=JSON_HEADERS, data=data)
+        assert len(json.loads(response.data.decode('utf-8'))) == len(self.voter_uuids)
+
+    def test_election_pages_cover_every_election_exactly_once(self):
+        elections = self.get_all_pages("/api/election/present")
+        assert [election['election_title'] for election in elections] == \
+            ["Present Election {0}".format(i) for i in range(5)]
+
+    def test_other_phases_return_a_single_empty_page(self):
+        for url in ("/api/election/past", "/api/election/future"):
+            response = self.app.get(url, query_string={'limit': 2})
+            assert json.loads(response.data.decode('utf-8')) == {"items": [], "next": None}
+
+    def test_invalid_limit_or_cursor_is_rejected(self):
+        for query in ({'limit': 0}, {'limit': 'ten'}, {'after': 'not a cursor'}):
+            response = self.app.get("/api/election/present", query_string=query)
+            assert response.status_code == INVALID_PAGINATION_PARAMETERS.code
+            assert response.data.decode('utf-8') == INVALID_PAGINATION_PARAMETERS.message
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+#
+# test/test_prefork_server.py
+# Authors:
+#   Samuel Vargas
+#
+
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from test.test_hyperledger_backend_io import election_kwargs
+from src.sqlite import SQLiteBackendIO
+from src.account_types import AccountType
+from src.cookie_encryptor import CookieEncryptor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "The prefork server needs os.fork")
+class PreforkServerTest(unittest.TestCase):
+    def setUp(self):
+        self.password = "Secret"
+        self.db = os.path.join(tempfile.mkdtemp(), "ballotblock.db")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "src.prefork_server", "--db", self.db, "--workers", "2", "--port", "0",
+             "--shared-password", self.password],
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        # "[pid] INFO src.prefork_server: Serving on http://127.0.0.1:PORT with ..." is logged first
+        self.url = re.search(r"Serving on (http://\S+)", self.process.stderr.readline()).group(1)
+        # The workers log every request, a full pipe would block them
+        threading.Thread(target=self.process.stderr.read, daemon=True).start()
+        self.cookies = {"token": json.dumps({
+            'username': 'ElectionCreator',
+            'account_type': AccountType.election_creator.value,
+            'authentication': CookieEncryptor(self.password).encrypt(b"ABC").decode('utf-8')
+        })}
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process.wait()
+
+    def get(self, path):
+        response = requests.get(self.url + path, cookies=self.cookies, timeout=5)
+        assert response.status_code == 200
+        return response.json()
+
+    def wait_for(self, condition, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, "Timed out"
+            time.sleep(0.05)
+
+    def pids(self):
+        return sorted(process["pid"] for process in self.get("/api/server/workers")["worker_processes"])
+
+    def test_workers_share_the_database(self):
+        stats = self.get("/api/server/workers")
+        assert stats["workers"] == 2 and len(set(self.pids())) == 2
+
+        # Written by another process, every worker picks it up from the change feed
+        writer = SQLiteBackendIO(self.db, journal_mode="wal")
+        writer.create_election(**election_kwargs("Written elsewhere"))
+        writer.close()
+        for _ in range(10):
+            self.wait_for(lambda: [e["election_title"] for e in self.get("/api/election/present")] ==
+                          ["Written elsewhere"])
+
+    def test_cached_listings_show_elections_written_elsewhere(self):
+        # Every worker caches the empty listing first
+        for _ in range(10):
+            assert self.get("/api/election/present") == []
+
+        writer = SQLiteBackendIO(self.db, journal_mode="wal")
+        writer.create_election(**election_kwargs("Written elsewhere"))
+        writer.close()
+        self.wait_for(lambda: all([e["election_title"] for e in self.get("/api/election/present")] ==
+                                  ["Written elsewhere"] for _ in range(10)), timeout=5.0)
+
+    def test_request_rates(self):
+        for _ in range(20):
+            self.get("/api/election/present")
+        stats = self.get("/api/server/workers")
+        assert sum(process["requests"] for process in stats["worker_processes"]) >= 20
+
+        # The rates are only updated once per STATS_INTERVAL
+        self.wait_for(lambda: self.get("/api/server/workers")["requests_per_second"] > 0, timeout=5.0)
+
+    def test_concurrent_requests_are_all_counted(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: self.get("/api/election/present"), range(200)))
+
+        # The stats request counts itself
+        stats = self.get("/api/server/workers")
+        assert sum(process["requests"] for process in stats["worker_processes"]) == 201
+
+    def test_event_streams_dont_hold_the_workers(self):
+        # More streams than workers, each would hold a whole single-threaded worker
+        cookie = requests.Request("GET", self.url, cookies=self.cookies).prepare().headers["Cookie"]
+        host, port = self.url.split("//")[1].split(":")
+        streams = []
+        for _ in range(4):
+            stream = socket.create_connection((host, int(port)), timeout=5)
+            stream.sendall("GET /api/election/events HTTP/1.1\r\nHost: {0}\r\nCookie: {1}\r\n\r\n".format(
+                host, cookie).encode("latin-1"))
+            streams.append(stream)
+        try:
+            for _ in range(10):
+                assert self.get("/api/election/present") == []
+
+            # Stopping ends the streams rather than waiting for the clients to leave
+            self.process.send_signal(signal.SIGTERM)
+            assert self.process.wait(timeout=10) == 0
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def test_graceful_reload_and_stop(self):
+        old = self.pids()
+        self.process.send_signal(signal.SIGHUP)
+        self.wait_for(lambda: not set(self.pids()) & set(old))
+        assert self.get("/api/election/present") == []
+
+        workers = self.pids()
+        self.process.send_signal(signal.SIGTERM)
+        assert self.process.wait(timeout=10) == 0
+        for pid in old + workers:
+            with self.assertRaises(ProcessLookupError):
+                os.kill(pid, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
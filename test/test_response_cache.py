@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# test/test_response_cache.py
+# Authors:
+#   Samuel Vargas
+#
+
+import json
+import unittest
+import src.intermediary
+from test.config import test_backend
+from test.dummy_keys import *
+from test.test_util import generate_election_post_data, JSON_HEADERS
+from src.httpcode import *
+from src.crypto_suite import ECDSAKeyPair
+from src.crypto_flow import CryptoFlow
+from src.validator import ElectionJsonValidator
+from src.account_types import AccountType
+from src.cookie_encryptor import CookieEncryptor
+from src.interfaces import BackendIO
+from src.response_cache import ResponseCache
+from src.time_manager import TimeManager
+from unittest.mock import MagicMock, patch
+from datetime import datetime, timezone, timedelta
+
+
+class ResponseCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.password = "Secret"
+        self.backend = test_backend()
+        self.app = src.intermediary.start_test(self.backend, self.password)
+        ElectionJsonValidator.is_valid = MagicMock(return_value=(True, ""))
+        self.app.set_cookie('localhost', 'token', json.dumps({
+            'username': 'ElectionCreator',
+            'account_type': AccountType.election_creator.value,
+            'authentication': CookieEncryptor(self.password).encrypt(b"ABC").decode('utf-8')
+        }))
+
+    def setUp(self):
+        self.backend.nuke()
+        self.now = datetime.now(timezone.utc)
+        self.create("Present", self.now - timedelta(days=1), self.now + timedelta(days=1),
+                    ELECTION_DUMMY_RSA_FERNET_ONE)
+
+    def create(self, election_title, start, end, stub):
+        CryptoFlow.generate_election_creator_rsa_keys_and_encrypted_fernet_key_dict = MagicMock(return_value=stub)
+        response = self.app.post("/api/election/create", headers=JSON_HEADERS, data=json.dumps(
+            generate_election_post_data(election_title=election_title, description="...",
+                                        start_date=start.isoformat(), end_date=end.isoformat(),
+                                        creator_keys=ECDSAKeyPair(), questions=["?", ["A", "B"]])))
+        assert response.status_code == ELECTION_CREATED_SUCCESSFULLY.code
+
+    def get_election(self, election_title):
+        response = self.app.get("/api/election/get_by_title", headers=JSON_HEADERS,
+                                data=json.dumps({"election_title": election_title}))
+        assert response.status_code == 200
+        return json.loads(response.data.decode('utf-8'))
+
+    def test_cached_election_is_served_without_the_backend(self):
+        first = self.get_election("Present")
+        with patch.object(self.backend, "get_election_by_title") as spy:
+            assert self.get_election("Present") == first
+            spy.assert_not_called()
+
+    def test_cached_election_follows_the_current_phase(self):
+        assert 'election_private_key' not in self.get_election("Present")
+        with patch("src.time_manager.TimeManager.election_in_past") as mock:
+            mock.return_value = True
+            assert 'election_private_key' in self.get_election("Present")
+        assert 'election_private_key' not in self.get_election("Present")
+
+    def test_listing_is_invalidated_when_an_election_is_created(self):
+        response = self.app.get("/api/election/present")
+        assert len(json.loads(response.data.decode('utf-8'))) == 1
+
+        self.create("Present 2", self.now - timedelta(days=1), self.now + timedelta(days=1),
+                    ELECTION_DUMMY_RSA_FERNET_TWO)
+        response = self.app.get("/api/election/present")
+        assert len(json.loads(response.data.decode('utf-8'))) == 2
+
+    def test_listing_expires_at_the_next_phase_transition(self):
+        cache = ResponseCache()
+        cache.put_listing("present", b"[]", valid_until=100)
+        assert cache.get_listing("present", 99) == b"[]"
+        assert cache.get_listing("present", 100) is None
+
+    def test_sqlite_next_phase_transition_matches_default_implementation(self):
+        self.create("Future", self.now + timedelta(days=1), self.now + timedelta(days=2),
+                    ELECTION_DUMMY_RSA_FERNET_TWO)
+        now = TimeManager.get_current_time_as_epoch()
+        for t in (now, now + 24 * 60 * 60, now + 3 * 24 * 60 * 60):
+            assert self.backend.get_next_phase_transition(t) == BackendIO.get_next_phase_transition(self.backend, t)
@@ -145,6 +145,38 @@ class TallyingTest(unittest.TestCase):
             assert uuid_found, "UUID: {0} was returned when this person casted their vote but isn't" \
                                "present in the total list!".format(person['voter_uuid'])
 
+    def test_all_four_ballots_are_streamed_encrypted(self):
+        response = self.app.get("/api/ballot/all", query_string={'stream': 1},
+                                data=json.dumps({'election_title': self.election_title}))
+        assert response.is_streamed
+        all_ballots = json.loads(response.data.decode('utf-8'))
+
+        assert sorted(ballot['voter_uuid'] for ballot in all_ballots) == \
+            sorted(person['voter_uuid'] for person in self.voters)
+        for person in self.voters:
+            for ballot in all_ballots:
+                if ballot['voter_uuid'] == person['voter_uuid']:
+                    assert person['ballot']['ballot'] != ballot['ballot']
+
+    def test_streaming_a_missing_election_fails_before_the_first_ballot(self):
+        # The check can't wait until the stream is read, the response would already be a 200
+        with self.assertRaises(AssertionError):
+            self.backend.iter_ballots("Nothing")
+
+    @patch("src.time_manager.TimeManager.election_in_progress")
+    def test_all_four_ballots_are_streamed_decrypted_after_election_ends(self, mock):
+        mock.return_value = False
+        response = self.app.get("/api/ballot/all", query_string={'stream': 1},
+                                data=json.dumps({'election_title': self.election_title}))
+        assert response.is_streamed
+        all_ballots = json.loads(response.data.decode('utf-8'))
+
+        assert len(all_ballots) == len(self.voters)
+        for person in self.voters:
+            for ballot in all_ballots:
+                if ballot['voter_uuid'] == person['voter_uuid']:
+                    assert person['ballot']['ballot'] == ballot['ballot']
+
     @patch("src.time_manager.TimeManager.election_in_progress")
     def test_tallying_election_adds_answers_correctly(self, mock):
         mock.return_value = False
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+#
+# test/test_time_manager.py
+# Authors:
+#   Samuel Vargas
+#
+
+import unittest
+from unittest.mock import patch
+from src.election_phase import ElectionPhase
+from src.time_manager import TimeManager, ElectionWindow
+
+
+class TimeManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.start = "2018-03-30T18:00:00-07:00"
+        self.end = "2018-03-31T18:00:00-07:00"
+        self.window = TimeManager.get_election_window(self.start, self.end)
+
+    def test_iso_8601_strings_are_converted_to_utc_epoch(self):
+        assert self.window == ElectionWindow(1522458000, 1522544400)
+        assert TimeManager.iso_8601_str_to_epoch("2018-03-31T01:00:00+00:00") == self.window.start
+
+    def test_window_phase_boundaries_are_inclusive(self):
+        assert self.window.phase(self.window.start - 1) == ElectionPhase.future
+        assert self.window.phase(self.window.start) == ElectionPhase.present
+        assert self.window.phase(self.window.end) == ElectionPhase.present
+        assert self.window.phase(self.window.end + 1) == ElectionPhase.past
+
+    def test_election_in_methods_agree_with_window(self):
+        for now in (self.window.start - 1, self.window.start, self.window.end, self.window.end + 1):
+            assert TimeManager.election_in_past(self.end, now=now) == self.window.in_past(now)
+            assert TimeManager.election_in_future(self.start, now=now) == self.window.in_future(now)
+            assert TimeManager.election_in_progress(self.start, self.end, now=now) == self.window.in_progress(now)
+
+    def test_each_string_is_only_parsed_once(self):
+        with patch("src.time_manager.parse") as parse:
+            TimeManager.election_in_progress(self.start, self.end)
+            TimeManager.election_in_past(self.end)
+            parse.assert_not_called()